@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Duration Scaling Benchmark
+========================
+Times re-targeting many cached exercises to a new measure count with the
+vectorized batch scaler, compared with the previous per-note loop.
+
+Usage:
+    python benchmarks/bench_durations.py [--exercises 50000] [--measures 8]
+
+The batch scaler is timed both on flat arrays (scale_durations_flat) and
+on whole exercises (scale_exercises, which includes building the note
+objects). The legacy loop is also checked for totals it got wrong.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib.music_generation.durations import scale_durations_flat, scale_exercises
+
+
+def legacy_scale_json_durations(json_data, target_units):
+    """The per-note loop scale_json_durations used before, kept as the baseline."""
+    durations = [int(item["duration"]) for item in json_data]
+    total = sum(durations)
+    if total == 0:
+        return json_data
+    scaled = []
+    remainder = target_units
+    cumulative = 0
+    for i, item in enumerate(json_data):
+        if i < len(json_data) - 1:
+            portion = max(1, round(item["duration"] * target_units / total))
+            remainder -= portion
+        else:
+            portion = max(1, remainder)
+        cumulative += portion
+        scaled.append({"note": item["note"], "duration": portion, "cumulative_duration": cumulative})
+    return scaled
+
+
+def make_exercises(count, seed=0):
+    """Random exercises of 4-32 notes with durations of 1-8 units."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(4, 33, count)
+    durations = rng.integers(1, 9, int(lengths.sum()))
+    exercises = []
+    start = 0
+    for length in lengths:
+        exercises.append([{"note": "C4", "duration": int(d)} for d in durations[start:start + length]])
+        start += length
+    return exercises, durations, lengths
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exercises", type=int, default=50000, help="Number of exercises to re-target")
+    parser.add_argument("--measures", type=int, default=8, help="New measure count (4/4, 8 units per measure)")
+    args = parser.parse_args()
+
+    exercises, durations, lengths = make_exercises(args.exercises)
+    target = max(args.measures * 8, int(lengths.max()))
+
+    legacy, legacy_time = timed(lambda: [legacy_scale_json_durations(e, target) for e in exercises])
+    wrong = sum(1 for exercise in legacy if sum(item["duration"] for item in exercise) != target)
+    _, flat_time = timed(scale_durations_flat, durations, lengths, target)
+    _, snapped_time = timed(scale_durations_flat, durations, lengths, target, units_per_measure=8)
+    _, objects_time = timed(scale_exercises, exercises, target)
+
+    print(f"{len(exercises)} exercises, {len(durations)} notes, target {target} units")
+    print(f"{'legacy loop':<28} {legacy_time * 1000:10.1f}ms  ({wrong} wrong totals)")
+    print(f"{'scale_durations_flat':<28} {flat_time * 1000:10.1f}ms  {legacy_time / flat_time:6.1f}x")
+    print(f"{'  with measure snapping':<28} {snapped_time * 1000:10.1f}ms  {legacy_time / snapped_time:6.1f}x")
+    print(f"{'scale_exercises':<28} {objects_time * 1000:10.1f}ms  {legacy_time / objects_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+MIDI Writer Benchmark
+===================
+Times batch MIDI export of many exercises with the direct SMF writer,
+compared with building mido messages and saving the MidiFile.
+
+Usage:
+    python benchmarks/bench_midi_writer.py [--exercises 2000] [--measures 16]
+
+Both paths write to in-memory buffers, so the numbers measure encoding
+rather than disk I/O. Every output is checked to be byte-identical.
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib.music_generation.procedural import generate_procedural_exercise
+from lib.music_generation.sequence import NoteSequence
+from processing.midi.converter import json_to_midi
+from processing.midi.writer import json_to_midi_bytes
+
+TIME_SIGNATURES = ["4/4", "3/4", "6/8", "2/4"]
+
+
+def make_sequences(count, measures):
+    """Procedural Advanced-level exercises (many short notes) as NoteSequences."""
+    sequences = []
+    for seed in range(count):
+        time_signature = TIME_SIGNATURES[seed % len(TIME_SIGNATURES)]
+        exercise = generate_procedural_exercise("Violin", "Advanced", "D Major", time_signature, measures, seed)
+        sequences.append((NoteSequence.from_json(exercise), time_signature))
+    return sequences
+
+
+def export_mido(sequences, measures):
+    outputs = []
+    for sequence, time_signature in sequences:
+        buffer = io.BytesIO()
+        json_to_midi(sequence, "Violin", 120, time_signature, measures).save(file=buffer)
+        outputs.append(buffer.getvalue())
+    return outputs
+
+
+def export_direct(sequences, measures):
+    return [json_to_midi_bytes(sequence, "Violin", 120, time_signature, measures)
+            for sequence, time_signature in sequences]
+
+
+def timed(function, *args):
+    random.seed(0)  # Same velocity draws for both paths
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exercises", type=int, default=2000, help="Number of exercises to export")
+    parser.add_argument("--measures", type=int, default=16, help="Measures per exercise")
+    args = parser.parse_args()
+
+    sequences = make_sequences(args.exercises, args.measures)
+    notes = sum(len(sequence) for sequence, _ in sequences)
+
+    expected, mido_time = timed(export_mido, sequences, args.measures)
+    direct, direct_time = timed(export_direct, sequences, args.measures)
+    mismatches = sum(1 for a, b in zip(expected, direct) if a != b)
+
+    print(f"{len(sequences)} exercises, {notes} notes, {sum(map(len, direct)) / 1024:.0f} KiB of MIDI")
+    print(f"{'mido MidiFile.save':<24} {mido_time * 1000:10.1f}ms  {notes / mido_time:12,.0f} notes/s")
+    print(f"{'json_to_midi_bytes':<24} {direct_time * 1000:10.1f}ms  {notes / direct_time:12,.0f} notes/s"
+          f"  {mido_time / direct_time:6.1f}x")
+    print(f"byte-identical: {'yes' if not mismatches else f'NO ({mismatches} differ)'}")
+
+
+if __name__ == "__main__":
+    main()
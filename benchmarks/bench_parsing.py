@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+LLM Output Parsing Benchmark
+==========================
+Times safe_parse_json's scanner on pathological model outputs and compares
+it with the previous regex-based implementation.
+
+Usage:
+    python benchmarks/bench_parsing.py [--max-size 262144] [--legacy-timeout 5]
+
+Each input family is timed at doubling sizes. For a linear parser the time
+roughly doubles from one row to the next (growth ~2x). The legacy parser
+runs in a child process that is killed after the timeout, because its
+nested lazy regex backtracks exponentially on unterminated arrays; once it
+times out it is skipped for the larger sizes.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib.music_generation.parsing import find_note_array
+
+NOTE = '{"note": "C4", "duration": 2, "cumulative_duration": 2}'
+
+# Input families: name -> function building a text with n repetitions
+PATHOLOGICAL_INPUTS = {
+    "unterminated array of objects": lambda n: "[" + "{}, " * n,
+    "unterminated array of notes": lambda n: "[" + (NOTE + ", ") * n,
+    "unterminated array of pairs": lambda n: "[" + '["C4", 2], ' * n,
+    "unbalanced braces": lambda n: "[{" + "} " * n,
+    "nested brackets": lambda n: "[" * n + "]" * n,
+    "prose with apostrophes": lambda n: "It's [the] exercise, isn't it? " * n + "[" + NOTE + "]",
+    "valid array of notes": lambda n: "```json\n[" + ", ".join([NOTE] * n) + "]\n```",
+}
+
+
+def legacy_safe_parse_json(text):
+    """The regex-based safe_parse_json this module replaced, kept as the baseline."""
+    try:
+        text = text.replace("'", '"')
+        match = re.search(r"\[(\s*\{.*?\}\s*,?)*\]", text, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
+        match = re.search(r"\[(\s*\[.*?\]\s*,?)*\]", text, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
+        return json.loads(text)
+    except (json.JSONDecodeError, RecursionError):
+        return None
+
+
+def time_call(function, text, repeat=3):
+    """Best wall-clock time of function(text) over repeat runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _time_legacy(text, results):
+    results.put(time_call(legacy_safe_parse_json, text, repeat=1))
+
+
+def time_legacy(text, timeout):
+    """Time the legacy parser in a child process; returns None if it exceeds timeout."""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_time_legacy, args=(text, results), daemon=True)
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return None
+    return results.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-size", type=int, default=16, help="Smallest repetition count")
+    parser.add_argument("--max-size", type=int, default=262144, help="Largest repetition count")
+    parser.add_argument("--legacy-timeout", type=float, default=5.0,
+                        help="Kill a legacy parser call after this many seconds and skip larger sizes")
+    args = parser.parse_args()
+
+    for name, build in PATHOLOGICAL_INPUTS.items():
+        print(f"\n{name}")
+        print(f"{'size':>8} {'chars':>10} {'scanner':>12} {'growth':>7} {'legacy':>12}")
+        previous = None
+        legacy_enabled = True
+        size = args.min_size
+        while size <= args.max_size:
+            text = build(size)
+            scanner = time_call(find_note_array, text)
+            growth = f"{scanner / previous:.1f}x" if previous else ""
+            previous = scanner
+            if legacy_enabled:
+                legacy = time_legacy(text, args.legacy_timeout)
+                legacy_enabled = legacy is not None
+                legacy_text = f"{legacy * 1000:10.2f}ms" if legacy_enabled else f"> {args.legacy_timeout:g}s".rjust(12)
+            else:
+                legacy_text = f"{'skipped':>12}"
+            print(f"{size:>8} {len(text):>10} {scanner * 1000:10.2f}ms {growth:>7} {legacy_text}", flush=True)
+            size *= 2
+
+
+if __name__ == "__main__":
+    main()
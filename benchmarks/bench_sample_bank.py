@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+Sample Bank Benchmark
+===================
+Times building a sample bank and rendering exercises from it, compared
+with a full synth pass per exercise.
+
+Usage:
+    python benchmarks/bench_sample_bank.py [--instrument Violin] [--tempo 120] [--exercises 200]
+                                           [--measures 8] [--synth auto|sine]
+
+With FluidSynth and a cached soundfont (--synth auto), both the bank and
+the full passes use the real synthesizer. Otherwise a NumPy additive sine
+synth stands in; it is much cheaper than FluidSynth, so the speedup shown
+then understates the real one. The bank is written to a temporary
+directory, and the MP3 encode (the same for both paths) is not timed.
+"""
+
+import io
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+import numpy as np
+from mido import MidiFile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib.music_generation.constants import SAMPLE_RATE
+from lib.music_generation.procedural import generate_procedural_exercise
+from lib.music_generation.sequence import NoteSequence
+from processing.audio.converter import get_soundfont, synthesize_pcm
+from processing.audio.sample_bank import build_sample_bank
+from processing.capabilities import AUDIO_BACKENDS, get_default_capabilities
+from processing.midi.writer import json_to_midi_bytes
+
+RELEASE_SECONDS = 0.3
+
+
+def sine_synth(midi):
+    """Additive sine voices with a linear release (stand-in when FluidSynth is missing)."""
+    if not isinstance(midi, MidiFile):
+        midi = MidiFile(file=io.BytesIO(midi))
+    now = 0.0
+    started = {}
+    notes = []
+    for msg in midi:
+        now += msg.time
+        if msg.type == 'note_on' and msg.velocity > 0:
+            started[msg.note] = (now, msg.velocity)
+        elif msg.type in ('note_on', 'note_off') and msg.note in started:
+            start, velocity = started.pop(msg.note)
+            notes.append((msg.note, start, now, velocity))
+    release = int(RELEASE_SECONDS * SAMPLE_RATE)
+    out = np.zeros(int(now * SAMPLE_RATE) + release + 1, dtype=np.float32)
+    for pitch, start, end, velocity in notes:
+        first, last = int(round(start * SAMPLE_RATE)), int(round(end * SAMPLE_RATE))
+        envelope = np.ones(last - first + release, dtype=np.float32)
+        envelope[last - first:] = np.linspace(1, 0, release, dtype=np.float32)
+        t = np.arange(len(envelope), dtype=np.float32) / SAMPLE_RATE
+        frequency = 440 * 2 ** ((pitch - 69) / 12)
+        out[first:first + len(envelope)] += 0.2 * velocity / 127 * envelope * np.sin(2 * np.pi * frequency * t)
+    pcm = np.int16(np.clip(out * 32767, -32768, 32767))
+    return np.stack([pcm, pcm], axis=1)
+
+
+def choose_renderer(instrument, synth):
+    if synth == "auto" and get_default_capabilities().first_available(AUDIO_BACKENDS):
+        sf2_path = get_soundfont(instrument, download=False) or get_soundfont("Piano", download=False)
+        if sf2_path:
+            return "FluidSynth", lambda midi: synthesize_pcm(midi, sf2_path, instrument)
+    return "NumPy sine", sine_synth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instrument", default="Violin", help="Instrument to render")
+    parser.add_argument("--tempo", type=int, default=120, help="Tempo in BPM")
+    parser.add_argument("--exercises", type=int, default=200, help="Number of exercises to render")
+    parser.add_argument("--measures", type=int, default=8, help="Measures per exercise")
+    parser.add_argument("--synth", choices=["auto", "sine"], default="auto", help="Synthesizer to compare")
+    args = parser.parse_args()
+
+    name, render = choose_renderer(args.instrument, args.synth)
+    exercises = [NoteSequence.from_json(generate_procedural_exercise(
+        args.instrument, "Intermediate", "C Major", "4/4", args.measures, seed)) for seed in range(args.exercises)]
+    midis = [json_to_midi_bytes(sequence, args.instrument, args.tempo, "4/4", args.measures,
+                                velocities=[80] * len(sequence)) for sequence in exercises]
+    audio_seconds = sum(sequence.total_duration for sequence in exercises) * 30.0 / args.tempo
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        bank = build_sample_bank(args.instrument, args.tempo, directory=directory, render=render)
+        build_time = time.perf_counter() - start
+        bank_seconds = len(bank.samples) / bank.sample_rate
+        print(f"Synth: {name}; bank: {len(bank)} notes, {bank.nbytes / 2 ** 20:.1f} MiB")
+        print(f"{'build':<18} {build_time * 1000:10.1f}ms  {len(bank) / build_time:10,.0f} notes/s"
+              f"  {bank_seconds / build_time:8.1f}x realtime")
+
+        uncovered = sum(1 for sequence in exercises if not bank.covers(sequence))
+        start = time.perf_counter()
+        for midi in midis:
+            render(midi)
+        synth_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for sequence in exercises:
+            bank.render(sequence)
+        bank_time = time.perf_counter() - start
+
+    print(f"{len(exercises)} exercises, {audio_seconds:.0f}s of audio"
+          + (f" ({uncovered} not covered by the bank)" if uncovered else ""))
+    print(f"{'full synth pass':<18} {synth_time * 1000:10.1f}ms  {len(exercises) / synth_time:10,.1f} exercises/s"
+          f"  {audio_seconds / synth_time:8.1f}x realtime")
+    print(f"{'sample bank':<18} {bank_time * 1000:10.1f}ms  {len(exercises) / bank_time:10,.1f} exercises/s"
+          f"  {audio_seconds / bank_time:8.1f}x realtime  {synth_time / bank_time:6.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
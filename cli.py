@@ -8,10 +8,13 @@ A command-line interface for generating custom musical exercises with LLM.
 
 import typer
 import json
+import asyncio
 import os
+import time
 import shutil
+import subprocess
 from enum import Enum
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict
 from pathlib import Path
 
 # Import rich for better CLI output
@@ -20,10 +23,30 @@ from rich.table import Table
 from rich import print as rprint
 
 # Import from our modules
-from lib.music_generation.generator import generate_exercise, safe_parse_json
-from lib.music_generation.theory import clean_note_string
+from lib.music_generation.generator import generate_exercise, safe_parse_json, uses_procedural_engine
+from lib.music_generation.batch import ExerciseSpec, generate_exercises_async
+from lib.music_generation.cache import ExerciseCache, configure_cache
+from lib.music_generation.constants import (BATCH_MAX_CONCURRENCY, BREAKER_STATE_PATH, DEFAULT_ENGINE,
+                                             DEFAULT_WIRE_FORMAT, EXERCISE_CACHE_DIR, INVENTORY_PATH,
+                                             STUB_SERVER_PORT, DEADLINE_LLM_MIN_SECONDS,
+                                             DEADLINE_SYNTH_SECONDS, DEADLINE_SINE_AUDIO_SECONDS,
+                                             DEADLINE_ENGRAVING_SECONDS, DEADLINE_QUICK_PDF_SECONDS,
+                                             DEADLINE_SVG_SECONDS, DEADLINE_VISUALIZATION_SECONDS,
+                                             CAPABILITIES_PATH, SAMPLE_BANK_DIR, AUDIO_CACHE_DIR)
+from lib.music_generation.scheduler import get_default_scheduler
+from lib.music_generation.hedging import get_default_hedger
+from lib.music_generation.coalescing import get_default_single_flight
+from lib.music_generation.breaker import CircuitBreaker, get_default_breaker
+from lib.music_generation.inventory import ExerciseInventory
+from lib.music_generation.stub_server import StubServer
+from lib.music_generation.sequence import NoteSequence
+from lib.music_generation.deadline import Deadline
+from processing.capabilities import TOOLS, AUDIO_BACKENDS, PDF_BACKENDS, CapabilityRegistry
 from processing.midi.converter import json_to_midi, create_metronome_midi
-from processing.audio.converter import midi_to_mp3, create_metronome_audio
+from processing.midi.writer import json_to_midi_bytes
+from processing.audio.converter import midi_to_mp3, create_metronome_audio, synth_available, get_soundfont
+from processing.audio.render_cache import AudioCache, configure_audio_cache
+from processing.audio.sample_bank import SampleBank, build_sample_bank, sample_bank_name, sample_bank_to_mp3
 from processing.visualization.visualizer import create_visualization
 from processing.notation.sheet_music import json_to_music21_score, render_score_to_pdf, render_score_to_image
 
@@ -68,6 +91,17 @@ class TimeSignature(str, Enum):
     FOUR_FOUR = "4/4"
 
 
+class Engine(str, Enum):
+    LLM = "llm"
+    PROCEDURAL = "procedural"
+    AUTO = "auto"
+
+
+class WireFormat(str, Enum):
+    JSON = "json"
+    COMPACT = "compact"
+
+
 class OutputFormat(str, Enum):
     JSON = "json"
     MIDI = "midi"
@@ -82,11 +116,20 @@ class OutputFormat(str, Enum):
 # Main orchestration function
 # -----------------------------------------------------------------------------
 def generate_exercise_with_output(instrument: str, level: str, key: str, tempo: int, time_signature: str,
-                      measures: int, custom_prompt: str, mode: str, force_fallback: bool = False) -> Tuple[
-    str, Optional[str], str, Optional[object], str, str, int, Optional[str], Optional[str]]:
+                      measures: int, custom_prompt: str, mode: str, force_fallback: bool = False,
+                      hedge: bool = False, inventory: Optional[ExerciseInventory] = None,
+                      engine: str = DEFAULT_ENGINE, wire_format: str = DEFAULT_WIRE_FORMAT,
+                      deadline_ms: Optional[float] = None, seed: Optional[int] = None) -> Tuple[
+    str, Optional[str], str, Optional[object], str, str, int, Optional[str], Optional[str], Dict[str, str]]:
     """
     Generate an exercise and produce all output formats.
     
+    With a latency budget every stage sees the time left: the LLM query keeps
+    back what the cheapest audio and PDF need (and is replaced by the
+    procedural engine when that leaves too little), audio falls back to sine
+    waves instead of FluidSynth, the PDF to a note list without an engraver,
+    and the SVG and visualization are skipped when time runs out.
+    
     Args:
         instrument: Target instrument
         level: Difficulty level
@@ -97,44 +140,268 @@ def generate_exercise_with_output(instrument: str, level: str, key: str, tempo:
         custom_prompt: Optional custom prompt
         mode: Mode of operation ("Exercise Prompt" or "Exercise Parameters")
         force_fallback: Whether to force using fallback audio generation
+        hedge: Whether to send a backup LLM request when the answer is slow
+        inventory: Optional pool of pre-generated exercises to serve from
+        engine: Exercise engine ("llm", "procedural" or "auto")
+        wire_format: Format the LLM answers in ("json" or "compact")
+        deadline_ms: Optional latency budget for the whole request in milliseconds
+        seed: Optional seed making the exercise reproducible (and replayable by the stub server)
         
     Returns:
-        Tuple of (JSON string, MP3 path, tempo string, MIDI object, duration string, time signature, total duration, PDF path, SVG path)
+        Tuple of (JSON string, MP3 path, tempo string, MIDI object, duration string, time signature, total duration, PDF path, SVG path, degraded outputs)
+        where degraded outputs maps each output that took a cheaper path or was skipped to a description
     """
+    deadline = Deadline.from_ms(deadline_ms)
+    degraded: Dict[str, str] = {}
     try:
+        # Keep back what the cheapest audio and PDF paths need
+        reserve = DEADLINE_SINE_AUDIO_SECONDS + DEADLINE_QUICK_PDF_SECONDS
+        llm_budget = deadline.timeout(reserve)
+        if llm_budget is not None and not uses_procedural_engine(engine, level, custom_prompt):
+            if llm_budget < DEADLINE_LLM_MIN_SECONDS:
+                engine = "procedural"
+                degraded["exercise"] = "procedural (no time for the LLM)"
         # Generate the exercise using the library function
-        parsed_scaled = generate_exercise(instrument, level, key, time_signature, measures, custom_prompt)
-        
-        # Convert to JSON string
-        output_json_str = json.dumps(parsed_scaled, indent=2)
-        
-        # Calculate total duration units
-        total_duration = sum(note_obj['duration'] for note_obj in parsed_scaled)
-        
-        # Generate MIDI
-        midi = json_to_midi(parsed_scaled, instrument, tempo, time_signature, measures)
+        parsed_scaled = generate_exercise(instrument, level, key, time_signature, measures, custom_prompt,
+                                          seed=seed, hedge=hedge, inventory=inventory, engine=engine,
+                                          wire_format=wire_format, deadline=llm_budget)
+        if llm_budget is not None and "exercise" not in degraded and not deadline.remaining(reserve):
+            degraded["exercise"] = "fallback (LLM deadline passed)"
+        return render_exercise_outputs(parsed_scaled, instrument, key, tempo, time_signature, measures,
+                                       force_fallback, deadline, degraded)
+    except Exception as e:
+        return f"Error: {str(e)}", None, str(tempo), None, "0", time_signature, 0, None, None, degraded
+
+
+def render_exercise_outputs(parsed_scaled: List[dict], instrument: str, key: str, tempo: int,
+                            time_signature: str, measures: int, force_fallback: bool = False,
+                            deadline: Optional[Deadline] = None,
+                            degraded: Optional[Dict[str, str]] = None) -> Tuple[
+    str, Optional[str], str, Optional[object], str, str, int, Optional[str], Optional[str], Dict[str, str]]:
+    """
+    Produce JSON, MIDI, audio and sheet music for an already generated exercise.
+    
+    Args:
+        parsed_scaled: Exercise notes as returned by generate_exercise
+        instrument: Target instrument
+        key: Musical key
+        tempo: Tempo in BPM
+        time_signature: Time signature (e.g., "4/4")
+        measures: Number of measures
+        force_fallback: Whether to force using fallback audio generation
+        deadline: Optional deadline the outputs are produced within
+        degraded: Degraded outputs reported so far (updated in place)
         
-        # Generate audio
+    Returns:
+        Same tuple as generate_exercise_with_output
+    """
+    deadline = deadline or Deadline()
+    degraded = {} if degraded is None else degraded
+
+    # Convert to JSON string
+    output_json_str = json.dumps(parsed_scaled, indent=2)
+    
+    # Build the note arrays once and share them between the stages
+    sequence = NoteSequence.from_json(parsed_scaled)
+    total_duration = sequence.total_duration
+    
+    # Generate MIDI
+    midi = json_to_midi(sequence, instrument, tempo, time_signature, measures)
+    
+    # Generate audio (keeping back what the quick PDF needs); a prebuilt sample bank is quickest
+    bank_audio = (None, 0.0) if force_fallback else sample_bank_to_mp3(
+        sequence, instrument, tempo, timeout=deadline.timeout(DEADLINE_QUICK_PDF_SECONDS))
+    if bank_audio[0]:
+        mp3_path, real_duration = bank_audio
+    elif force_fallback or not deadline.bounded:
         mp3_path, real_duration = midi_to_mp3(midi, instrument, force_fallback)
+    elif deadline.allows(DEADLINE_SYNTH_SECONDS, DEADLINE_QUICK_PDF_SECONDS) and synth_available(instrument):
+        mp3_path, real_duration = midi_to_mp3(midi, instrument, timeout=deadline.timeout(DEADLINE_QUICK_PDF_SECONDS))
+        if not deadline.remaining(DEADLINE_QUICK_PDF_SECONDS):
+            degraded["audio"] = "sine fallback (FluidSynth ran out of time)"
+    elif deadline.allows(DEADLINE_SINE_AUDIO_SECONDS, DEADLINE_QUICK_PDF_SECONDS):
+        mp3_path, real_duration = midi_to_mp3(midi, instrument, force_fallback=True)
+        degraded["audio"] = "sine fallback"
+    else:
+        mp3_path, real_duration = None, 0.0
+        degraded["audio"] = "skipped"
+    
+    # Generate sheet music (PDF and SVG)
+    pdf_path = None
+    svg_path = None
+    try:
+        # Create music21 Score from JSON
+        score = json_to_music21_score(sequence, instrument, key, time_signature, tempo, measures)
+        if score:
+            # Generate PDF
+            if not deadline.allows(DEADLINE_QUICK_PDF_SECONDS):
+                degraded["pdf"] = "skipped"
+            else:
+                if not deadline.allows(DEADLINE_ENGRAVING_SECONDS):
+                    degraded["pdf"] = "quick (note list, not engraved)"
+                pdf_path = render_score_to_pdf(score, None, timeout=deadline.timeout())  # Returns temp path
+            # Generate SVG
+            if deadline.allows(DEADLINE_SVG_SECONDS):
+                svg_path = render_score_to_image(score, None, format='svg', timeout=deadline.timeout())
+            else:
+                degraded["svg"] = "skipped"
+    except Exception as e:
+        # Log but don't fail - sheet music is optional
+        console.print(f"[yellow]Warning: Could not generate sheet music: {e}[/yellow]")
+    if not deadline.allows(DEADLINE_VISUALIZATION_SECONDS):
+        degraded["visualization"] = "skipped"
+    
+    return (output_json_str, mp3_path, str(tempo), midi, f"{real_duration:.2f} seconds", time_signature,
+            total_duration, pdf_path, svg_path, degraded)
+
+
+def save_exercise_outputs(output_format: OutputFormat, output_dir: str, base_filename: str, json_data: str,
+                          midi_obj, mp3_path: Optional[str], pdf_path: Optional[str], svg_path: Optional[str],
+                          time_sig_str: str, visualize: bool = True) -> List[Tuple[str, str]]:
+    """
+    Copy the requested outputs of one exercise into the output directory.
+    
+    Args:
+        output_format: Requested output format
+        output_dir: Directory to save output files
+        base_filename: Filename without extension
+        json_data: Exercise JSON string
+        midi_obj: MidiFile object (or None if MIDI generation failed)
+        mp3_path: Path of the rendered MP3, if any
+        pdf_path: Path of the rendered PDF, if any
+        svg_path: Path of the rendered SVG, if any
+        time_sig_str: Time signature used for the visualization
+        visualize: Whether to render the visualization when all formats are requested
         
-        # Generate sheet music (PDF and SVG)
-        pdf_path = None
-        svg_path = None
+    Returns:
+        List of (file type, path) tuples for the files written
+    """
+    output_files = []
+
+    if output_format in [OutputFormat.JSON, OutputFormat.ALL]:
+        json_path = os.path.join(output_dir, f"{base_filename}.json")
+        with open(json_path, "w") as f:
+            f.write(json_data)
+        output_files.append(("JSON", json_path))
+
+    if output_format in [OutputFormat.MIDI, OutputFormat.ALL] and midi_obj is not None:
+        midi_path = os.path.join(output_dir, f"{base_filename}.mid")
+        midi_obj.save(midi_path)
+        output_files.append(("MIDI", midi_path))
+
+    if output_format in [OutputFormat.MP3, OutputFormat.ALL]:
+        if mp3_path:
+            # Copy the MP3 file to the output directory
+            new_mp3_path = os.path.join(output_dir, f"{base_filename}.mp3")
+            if os.path.exists(mp3_path):
+                shutil.copy(mp3_path, new_mp3_path)
+                output_files.append(("MP3", new_mp3_path))
+
+    if output_format in [OutputFormat.PDF, OutputFormat.ALL]:
+        if pdf_path and os.path.exists(pdf_path):
+            # Copy the PDF file to the output directory
+            new_pdf_path = os.path.join(output_dir, f"{base_filename}.pdf")
+            shutil.copy(pdf_path, new_pdf_path)
+            output_files.append(("PDF", new_pdf_path))
+
+    if output_format in [OutputFormat.SVG, OutputFormat.ALL]:
+        if svg_path and os.path.exists(svg_path):
+            # Copy the SVG file to the output directory
+            new_svg_path = os.path.join(output_dir, f"{base_filename}.svg")
+            shutil.copy(svg_path, new_svg_path)
+            output_files.append(("SVG", new_svg_path))
+
+    # Generate visualization if all formats are requested
+    if output_format == OutputFormat.ALL and visualize:
         try:
-            # Create music21 Score from JSON
-            score = json_to_music21_score(output_json_str, instrument, key, time_signature, tempo, measures)
-            if score:
-                # Generate PDF
-                pdf_path = render_score_to_pdf(score, None)  # Returns temp path
-                # Generate SVG
-                svg_path = render_score_to_image(score, None, format='svg')
+            viz_path = create_visualization(json_data, time_sig_str)
+            if viz_path:
+                viz_output = os.path.join(output_dir, f"{base_filename}_viz.png")
+                shutil.copy(viz_path, viz_output)
+                output_files.append(("Visualization", viz_output))
         except Exception as e:
-            # Log but don't fail - sheet music is optional
-            console.print(f"[yellow]Warning: Could not generate sheet music: {e}[/yellow]")
+            console.print(f"[bold red]Error generating visualization: {e}[/bold red]")
+
+    return output_files
+
+
+def generate_batch_with_output(instrument: str, level: str, key: str, tempo: int, time_signature: str,
+                               measures: int, custom_prompt: str, count: int, concurrency: int,
+                               output_format: OutputFormat, output_dir: str, base_filename: str,
+                               force_fallback: bool = False, hedge: bool = False,
+                               engine: str = DEFAULT_ENGINE,
+                               wire_format: str = DEFAULT_WIRE_FORMAT,
+                               seed: Optional[int] = None) -> List[Tuple[str, str]]:
+    """
+    Generate several exercises concurrently and save each one as it completes.
+    
+    Rendering (FluidSynth, ffmpeg, MuseScore, LilyPond) runs in a worker
+    thread, so the requests still in flight keep going while an exercise
+    is rendered.
+    
+    Args:
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        tempo: Tempo in BPM
+        time_signature: Time signature (e.g., "4/4")
+        measures: Number of measures
+        custom_prompt: Optional custom prompt
+        count: Number of exercises to generate
+        concurrency: Maximum number of LLM requests in flight
+        output_format: Requested output format
+        output_dir: Directory to save output files
+        base_filename: Filename prefix; each exercise gets a numeric suffix
+        force_fallback: Whether to force using fallback audio generation
+        hedge: Whether to send a backup LLM request for slow answers
+        engine: Exercise engine ("llm", "procedural" or "auto")
+        wire_format: Format the LLM answers in ("json" or "compact")
+        seed: Optional seed; exercise i uses seed + i, so the batch is
+            reproducible without repeating one exercise
         
-        return output_json_str, mp3_path, str(tempo), midi, f"{real_duration:.2f} seconds", time_signature, total_duration, pdf_path, svg_path
-    except Exception as e:
-        return f"Error: {str(e)}", None, str(tempo), None, "0", time_signature, 0, None, None
+    Returns:
+        List of (file type, path) tuples for all files written
+    """
+    specs = [ExerciseSpec(instrument, level, key, time_signature, measures, custom_prompt,
+                          None if seed is None else seed + index) for index in range(count)]
+    output_files = []
+
+    def render_and_save(exercise: List[dict], name: str) -> List[Tuple[str, str]]:
+        json_data, mp3_path, _, midi_obj, _, _, _, pdf_path, svg_path, _ = render_exercise_outputs(
+            exercise, instrument, key, tempo, time_signature, measures, force_fallback)
+        return save_exercise_outputs(output_format, output_dir, name, json_data, midi_obj,
+                                     mp3_path, pdf_path, svg_path, time_signature)
+
+    async def run() -> None:
+        async for result in generate_exercises_async(specs, max_concurrency=concurrency,
+                                                      hedge=hedge, engine=engine, wire_format=wire_format):
+            name = f"{base_filename}_{result.index + 1:03d}"
+            if result.error is not None:
+                console.print(f"[bold red]Exercise {result.index + 1} failed: {result.error}[/bold red]")
+                continue
+            output_files.extend(await asyncio.to_thread(render_and_save, result.exercise, name))
+            console.print(f"[green]Exercise {result.index + 1}/{count} done[/green]")
+
+    asyncio.run(run())
+    return output_files
+
+
+def print_cache_stats(cache: Optional[ExerciseCache]) -> None:
+    """Print the LLM response cache counters, if caching is enabled."""
+    if cache is None:
+        return
+    stats = cache.stats()
+    console.print(f"[bold]Cache:[/bold] {stats['hits']} hits, {stats['misses']} misses ({cache.cache_dir})")
+
+
+def print_audio_cache_stats(cache: Optional[AudioCache]) -> None:
+    """Print the rendered audio cache counters, if caching is enabled and was used."""
+    if cache is None:
+        return
+    stats = cache.stats()
+    if stats["hits"] or stats["misses"]:
+        console.print(f"[bold]Audio cache:[/bold] {stats['hits']} hits, {stats['misses']} misses, "
+                      f"{stats['entries']} renders in {stats['bytes'] / 2 ** 20:.1f} MiB ({cache.cache_dir})")
 
 
 # -----------------------------------------------------------------------------
@@ -152,10 +419,24 @@ def generate(
         custom_prompt: Optional[str] = typer.Option(None, help="Custom prompt for exercise generation"),
         tempo: int = typer.Option(60, help="Tempo in BPM", min=40, max=200),
         force_fallback: bool = typer.Option(False, help="Force using fallback audio generation instead of soundfonts"),
+        count: int = typer.Option(1, help="Number of exercises to generate", min=1),
+        concurrency: int = typer.Option(BATCH_MAX_CONCURRENCY, help="Maximum concurrent LLM requests when --count > 1", min=1),
+        no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the on-disk LLM response cache"),
+        cache_dir: str = typer.Option(EXERCISE_CACHE_DIR, help="Directory of the LLM response cache"),
+        no_audio_cache: bool = typer.Option(False, "--no-audio-cache", help="Render audio even if an identical render is cached"),
+        audio_cache_dir: str = typer.Option(AUDIO_CACHE_DIR, help="Directory of the rendered audio cache"),
+        hedge: bool = typer.Option(False, "--hedge", help="Send a backup LLM request when an answer is slower than usual"),
+        use_inventory: bool = typer.Option(False, "--inventory", help="Serve from the pre-generated exercise inventory and top it up afterwards"),
+        engine: Engine = typer.Option(Engine.LLM, help="Exercise engine: the LLM, the offline procedural generator, or auto (procedural for Beginner)"),
+        wire_format: WireFormat = typer.Option(WireFormat.JSON, help="Format the LLM answers in: JSON objects, or compact NOTE:DURATION text (fewer output tokens)"),
+        deadline_ms: Optional[int] = typer.Option(None, "--deadline-ms", help="Latency budget in milliseconds; stages short of time take a cheaper path or are skipped", min=1),
+        seed: Optional[int] = typer.Option(None, help="Seed for reproducible exercises (needed to replay recorded runs); with --count, exercise i uses seed + i"),
 ):
     """Generate a musical exercise based on specified parameters."""
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    cache = configure_cache(cache_dir, enabled=not no_cache)
+    audio_cache = configure_audio_cache(audio_cache_dir, enabled=not no_audio_cache)
 
     # Show parameters
     console.print("[bold green]Generating exercise with the following parameters:[/bold green]")
@@ -168,8 +449,50 @@ def generate(
     params_table.add_row("Time Signature", str(time_signature))
     params_table.add_row("Measures", str(measures))
     params_table.add_row("Tempo", f"{tempo} BPM")
+    params_table.add_row("Engine", engine.value)
+    if seed is not None:
+        params_table.add_row("Seed", str(seed))
+    if count > 1:
+        params_table.add_row("Count", f"{count} (concurrency {concurrency})")
     console.print(params_table)
 
+    # Create safe filename components by replacing problematic characters
+    safe_instrument = instrument.value.replace(' ', '_')
+    safe_level = level.value.replace(' ', '_')
+    base_filename = f"exercise_{safe_instrument}_{safe_level}_{measures}m"
+
+    if count > 1:
+        output_files = generate_batch_with_output(
+            instrument.value, level.value, key.value, tempo, time_signature.value, measures,
+            custom_prompt or "", count, concurrency, output_format, output_dir, base_filename, force_fallback,
+            hedge, engine.value, wire_format.value, seed
+        )
+        console.print(f"\n[bold green]Generated {count} exercises![/bold green]")
+        if output_files:
+            console.print(f"[bold]Output Files:[/bold] {len(output_files)} written to {output_dir}")
+        print_cache_stats(cache)
+        print_audio_cache_stats(audio_cache)
+        stats = get_default_scheduler().stats()
+        console.print(f"[bold]Scheduler:[/bold] {stats['requests']} requests, {stats['retries']} retries "
+                      f"({stats['rate_limited']} rate-limited), max queue depth {stats['max_queue_depth']}, "
+                      f"mean wait {stats['mean_wait']:.2f}s")
+        if hedge:
+            stats = get_default_hedger().stats()
+            console.print(f"[bold]Hedging:[/bold] {stats['hedged']} of {stats['requests']} requests hedged "
+                          f"({stats['hedge_rate']:.0%}), {stats['hedge_wins']} won by the hedge, "
+                          f"{stats['hedges_skipped']} skipped at the in-flight cap")
+        stats = get_default_single_flight().stats()
+        if stats["coalesced"]:
+            console.print(f"[bold]Coalescing:[/bold] {stats['coalesced']} of {stats['calls']} requests "
+                          f"joined an identical request already in flight")
+        stats = get_default_breaker().stats()
+        if stats["rejected"]:
+            console.print(f"[bold yellow]Circuit breaker:[/bold yellow] {stats['state']}, {stats['rejected']} "
+                          f"requests served from the fallback without calling the API")
+        return
+
+    inventory = ExerciseInventory() if use_inventory else None
+
     # Generate exercise
     with console.status("[bold green]Generating exercise...[/bold green]"):
         mode = "Exercise Prompt" if custom_prompt else "Exercise Parameters"
@@ -179,66 +502,26 @@ def generate(
         key_str = key.value
         time_sig_str = time_signature.value
 
-        json_data, mp3_path, tempo_str, midi_obj, duration, time_sig, total_duration, pdf_path, svg_path = generate_exercise_with_output(
+        json_data, mp3_path, tempo_str, midi_obj, duration, time_sig, total_duration, pdf_path, svg_path, degraded = generate_exercise_with_output(
             instrument_str, level_str, key_str, tempo, time_sig_str,
-            measures, custom_prompt or "", mode, force_fallback
+            measures, custom_prompt or "", mode, force_fallback, hedge, inventory, engine.value,
+            wire_format.value, deadline_ms, seed
         )
 
     # Save outputs based on format
-    # Create safe filename components by replacing problematic characters
-    safe_instrument = instrument_str.replace(' ', '_')
-    safe_level = level_str.replace(' ', '_')
-    base_filename = f"exercise_{safe_instrument}_{safe_level}_{measures}m"
-    output_files = []
-
-    if output_format in [OutputFormat.JSON, OutputFormat.ALL]:
-        json_path = os.path.join(output_dir, f"{base_filename}.json")
-        with open(json_path, "w") as f:
-            f.write(json_data)
-        output_files.append(("JSON", json_path))
-
-    if output_format in [OutputFormat.MIDI, OutputFormat.ALL]:
-        midi_path = os.path.join(output_dir, f"{base_filename}.mid")
-        midi_obj.save(midi_path)
-        output_files.append(("MIDI", midi_path))
-
-    if output_format in [OutputFormat.MP3, OutputFormat.ALL]:
-        if mp3_path:
-            # Copy the MP3 file to the output directory
-            new_mp3_path = os.path.join(output_dir, f"{base_filename}.mp3")
-            if os.path.exists(mp3_path):
-                shutil.copy(mp3_path, new_mp3_path)
-                output_files.append(("MP3", new_mp3_path))
-
-    if output_format in [OutputFormat.PDF, OutputFormat.ALL]:
-        if pdf_path and os.path.exists(pdf_path):
-            # Copy the PDF file to the output directory
-            new_pdf_path = os.path.join(output_dir, f"{base_filename}.pdf")
-            shutil.copy(pdf_path, new_pdf_path)
-            output_files.append(("PDF", new_pdf_path))
-
-    if output_format in [OutputFormat.SVG, OutputFormat.ALL]:
-        if svg_path and os.path.exists(svg_path):
-            # Copy the SVG file to the output directory
-            new_svg_path = os.path.join(output_dir, f"{base_filename}.svg")
-            shutil.copy(svg_path, new_svg_path)
-            output_files.append(("SVG", new_svg_path))
-
-    # Generate visualization if all formats are requested
-    if output_format == OutputFormat.ALL:
-        try:
-            viz_path = create_visualization(json_data, time_sig_str)
-            if viz_path:
-                viz_output = os.path.join(output_dir, f"{base_filename}_viz.png")
-                shutil.copy(viz_path, viz_output)
-                output_files.append(("Visualization", viz_output))
-        except Exception as e:
-            console.print(f"[bold red]Error generating visualization: {e}[/bold red]")
+    output_files = save_exercise_outputs(output_format, output_dir, base_filename, json_data, midi_obj,
+                                         mp3_path, pdf_path, svg_path, time_sig_str,
+                                         visualize="visualization" not in degraded)
 
     # Display results
     console.print("\n[bold green]Exercise generated successfully![/bold green]")
     console.print(f"[bold]Duration:[/bold] {duration} seconds")
     console.print(f"[bold]Total Duration Units:[/bold] {total_duration} (8th notes)")
+    if degraded:
+        console.print(f"[bold yellow]Degraded to meet the {deadline_ms} ms deadline:[/bold yellow] "
+                      + ", ".join(f"{output} {how}" for output, how in degraded.items()))
+    print_cache_stats(cache)
+    print_audio_cache_stats(audio_cache)
 
     # Show output files
     if output_files:
@@ -257,6 +540,11 @@ def generate(
         except:
             console.print(json_data[:200] + "..." if len(json_data) > 200 else json_data)
 
+    if inventory is not None:
+        with console.status("[bold green]Topping up exercise inventory...[/bold green]"):
+            inventory.refill(limit=inventory.target)
+            inventory.save()
+
 
 @app.command("metronome")
 def metronome(
@@ -298,6 +586,8 @@ def convert(
         tempo: int = typer.Option(60, help="Tempo in BPM", min=40, max=200),
         output_dir: str = typer.Option("./output", help="Directory to save output files"),
         force_fallback: bool = typer.Option(False, help="Force using fallback audio generation instead of soundfonts"),
+        no_audio_cache: bool = typer.Option(False, "--no-audio-cache", help="Render audio even if an identical render is cached"),
+        audio_cache_dir: str = typer.Option(AUDIO_CACHE_DIR, help="Directory of the rendered audio cache"),
 ):
     """Convert a JSON exercise file to MIDI or MP3."""
     # Check if input file exists
@@ -307,6 +597,7 @@ def convert(
 
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    audio_cache = configure_audio_cache(audio_cache_dir, enabled=not no_audio_cache)
 
     # Read JSON file
     try:
@@ -320,28 +611,16 @@ def convert(
         console.print(f"[bold red]Error reading JSON file: {e}[/bold red]")
         raise typer.Exit(1)
 
-    # Clean the note data
-    cleaned_parsed = []
-    for note_item in parsed:
-        # Handle both object format and legacy array format
-        if isinstance(note_item, dict):
-            note_name = note_item['note']
-            dur = note_item['duration']
-            cleaned_note = clean_note_string(note_name)
-            cleaned_parsed.append({"note": cleaned_note, "duration": dur, "cumulative_duration": note_item.get('cumulative_duration', 0)})
-        else:
-            # Legacy format [note, duration]
-            note_name, dur = note_item
-            cleaned_note = clean_note_string(note_name)
-            cleaned_parsed.append([cleaned_note, dur])
+    # Clean the note data (either JSON shape) into note arrays
+    sequence = NoteSequence.from_json(parsed)
+    if not len(sequence):
+        console.print("[bold red]No valid notes in JSON file.[/bold red]")
+        raise typer.Exit(1)
 
     # Generate MIDI
     with console.status("[bold green]Converting to MIDI...[/bold green]"):
-        # Calculate measures from JSON data
-        if isinstance(cleaned_parsed[0], dict):
-            total_units = sum(item['duration'] for item in cleaned_parsed)
-        else:
-            total_units = sum(d for _, d in cleaned_parsed)
+        # Calculate measures from the note data
+        total_units = sequence.total_duration
         # Extract the actual time signature string from the enum
         time_sig_str = time_signature.value
         numerator, denominator = map(int, time_sig_str.split('/'))
@@ -351,8 +630,12 @@ def convert(
         # Extract string values from enums
         instrument_str = instrument.value
 
-        # Generate MIDI
-        midi_obj = json_to_midi(cleaned_parsed, instrument_str, tempo, time_sig_str, measures)
+        # Generate MIDI (MIDI-only output is encoded directly, without mido messages)
+        if output_format == OutputFormat.MIDI:
+            midi_obj = None
+            midi_bytes = json_to_midi_bytes(sequence, instrument_str, tempo, time_sig_str, measures)
+        else:
+            midi_obj = json_to_midi(sequence, instrument_str, tempo, time_sig_str, measures)
     # Base filename
     base_name = os.path.splitext(os.path.basename(input_file))[0]
 
@@ -361,7 +644,11 @@ def convert(
 
     if output_format in [OutputFormat.MIDI, OutputFormat.ALL]:
         midi_path = os.path.join(output_dir, f"{base_name}.mid")
-        midi_obj.save(midi_path)
+        if midi_obj is None:
+            with open(midi_path, "wb") as f:
+                f.write(midi_bytes)
+        else:
+            midi_obj.save(midi_path)
         output_files.append(("MIDI", midi_path))
 
     if output_format in [OutputFormat.MP3, OutputFormat.ALL]:
@@ -388,12 +675,9 @@ def convert(
     if output_format in [OutputFormat.PDF, OutputFormat.ALL]:
         with console.status("[bold green]Converting to PDF...[/bold green]"):
             try:
-                # Convert JSON string back for sheet music generation
-                json_for_sheet = json.dumps(cleaned_parsed) if isinstance(cleaned_parsed[0], dict) else json.dumps([{"note": n, "duration": d} for n, d in cleaned_parsed])
-                
-                # Create music21 Score from JSON
+                # Create music21 Score from the note arrays
                 key_str = "C Major"  # Default key
-                score = json_to_music21_score(json_for_sheet, instrument_str, key_str, time_sig_str, tempo, measures)
+                score = json_to_music21_score(sequence, instrument_str, key_str, time_sig_str, tempo, measures)
                 if score:
                     pdf_path = render_score_to_pdf(score, None)
                     if pdf_path and os.path.exists(pdf_path):
@@ -414,10 +698,165 @@ def convert(
         console.print("\n[bold]Output Files:[/bold]")
         for file_type, file_path in output_files:
             console.print(f"[bold]{file_type}:[/bold] {file_path}")
+        print_audio_cache_stats(audio_cache)
     else:
         console.print("[bold red]No output files were generated.[/bold red]")
 
 
+@app.command("inventory")
+def inventory_command(
+        fill: bool = typer.Option(False, "--fill", help="Generate exercises for every bucket below the low-water mark"),
+        limit: Optional[int] = typer.Option(None, help="Maximum exercises to generate with --fill", min=1),
+        path: str = typer.Option(INVENTORY_PATH, help="Inventory file"),
+):
+    """Show or fill the pre-generated exercise inventory."""
+    inventory = ExerciseInventory(path=path)
+    if fill:
+        planned = len(inventory.refill_plan())
+        if limit is not None:
+            planned = min(planned, limit)
+        with console.status(f"[bold green]Generating up to {planned} exercises...[/bold green]"):
+            added = inventory.refill(limit=limit)
+            inventory.save()
+        console.print(f"[bold green]Added {added} exercises to the inventory.[/bold green]")
+
+    stats = inventory.stats()
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Inventory")
+    table.add_column("Value")
+    table.add_row("File", path)
+    table.add_row("Exercises", str(stats["size"]))
+    table.add_row("Buckets", str(stats["buckets"]))
+    table.add_row("Empty buckets", str(stats["empty_buckets"]))
+    table.add_row("Below low-water mark", str(stats["low_buckets"]))
+    if fill:
+        table.add_row("Refill failures", str(stats["failures"]))
+    console.print(table)
+
+
+@app.command("breaker")
+def breaker_command(
+        reset: bool = typer.Option(False, "--reset", help="Close the breaker so the next request calls the API"),
+        path: str = typer.Option(BREAKER_STATE_PATH, help="Breaker state file"),
+):
+    """Show (or reset) the state of the Mistral API circuit breaker."""
+    breaker = CircuitBreaker(state_path=path)
+    if reset:
+        breaker.reset()
+        console.print("[bold green]Circuit breaker reset.[/bold green]")
+
+    stats = breaker.stats()
+    colors = {"closed": "green", "half_open": "yellow", "open": "red"}
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Circuit breaker")
+    table.add_column("Value")
+    table.add_row("File", path)
+    table.add_row("State", f"[{colors[stats['state']]}]{stats['state']}[/{colors[stats['state']]}]")
+    if stats["state"] == "open":
+        table.add_row("Probing again in", f"{stats['retry_in']:.0f}s")
+    table.add_row("Times opened", str(stats["trips"]))
+    table.add_row("Failure threshold", f"{breaker.failure_rate:.0%} of the last {breaker.window} calls")
+    table.add_row("Slow call threshold", f"{breaker.slow_call_duration:g}s")
+    console.print(table)
+
+
+@app.command("stub-server")
+def stub_server(
+        mode: str = typer.Option("synthetic", help="synthetic, record (proxy to Mistral and save) or replay (serve a cassette)"),
+        cassette: Optional[str] = typer.Option(None, help="JSONL cassette path for record/replay modes"),
+        port: int = typer.Option(STUB_SERVER_PORT, help="Port to listen on"),
+        latency: float = typer.Option(0.0, help="Mean response delay in seconds", min=0.0),
+        latency_jitter: float = typer.Option(0.0, help="Maximum random deviation from the mean delay", min=0.0),
+        error_rate: float = typer.Option(0.0, help="Fraction of requests answered with HTTP 500", min=0.0, max=1.0),
+        rate_limit_rate: float = typer.Option(0.0, help="Fraction of requests answered with HTTP 429", min=0.0, max=1.0),
+        seed: Optional[int] = typer.Option(None, help="Seed for latency and failure injection"),
+):
+    """Run a local Mistral-compatible server for offline benchmarking."""
+    try:
+        server = StubServer(port=port, mode=mode, cassette=cassette, latency=latency,
+                            latency_jitter=latency_jitter, error_rate=error_rate,
+                            rate_limit_rate=rate_limit_rate, seed=seed)
+    except ValueError as e:
+        console.print(f"[bold red]{e}[/bold red]")
+        raise typer.Exit(code=1)
+
+    console.print(f"[bold green]Stub server ({mode}) listening on {server.url}[/bold green]")
+    console.print(f"Use it with: MISTRAL_API_URL={server.url} python cli.py generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        console.print(f"\nServed requests: {server.stats()}")
+
+
+@app.command("sample-bank")
+def sample_bank_command(
+        instrument: Instrument = typer.Option(Instrument.TRUMPET, help="Instrument to render"),
+        tempo: List[int] = typer.Option([60], help="Tempo in BPM (repeat for several)", min=40, max=200),
+        rebuild: bool = typer.Option(False, "--rebuild", help="Render banks again even if they are up to date"),
+        directory: str = typer.Option(SAMPLE_BANK_DIR, help="Directory the banks are kept in"),
+):
+    """Pre-render every note of an instrument so exercise audio is assembled instead of synthesized."""
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Tempo")
+    table.add_column("Notes")
+    table.add_column("Size")
+    table.add_column("Status")
+    for bpm in tempo:
+        path = os.path.join(directory, sample_bank_name(instrument.value, bpm))
+        sf2_path = get_soundfont(instrument.value, download=False) or get_soundfont("Piano", download=False)
+        bank = None if rebuild else SampleBank.load(path, sf2_path)
+        status = "up to date"
+        if bank is None:
+            start = time.perf_counter()
+            try:
+                with console.status(f"[bold green]Rendering {instrument.value} notes at {bpm} BPM...[/bold green]"):
+                    bank = build_sample_bank(instrument.value, bpm, directory=directory)
+            except (OSError, subprocess.SubprocessError, TimeoutError) as e:
+                console.print(f"[bold red]Could not build the {bpm} BPM bank: {e}[/bold red]")
+                raise typer.Exit(code=1)
+            status = f"built in {time.perf_counter() - start:.1f}s"
+        table.add_row(f"{bpm} BPM", str(len(bank)), f"{bank.nbytes / 2 ** 20:.1f} MiB", status)
+    console.print(table)
+
+
+@app.command("doctor")
+def doctor(
+        refresh: bool = typer.Option(False, "--refresh", help="Probe every tool again instead of trusting saved results"),
+        path: str = typer.Option(CAPABILITIES_PATH, help="Capability manifest file"),
+):
+    """Show which audio and notation tools are installed and which backends renders will use."""
+    registry = CapabilityRegistry(manifest_path=path)
+    with console.status("[bold green]Probing tools...[/bold green]"):
+        capabilities = registry.probe_all(refresh=refresh)
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Tool")
+    table.add_column("Used for")
+    table.add_column("Status")
+    table.add_column("Version / problem")
+    table.add_column("Path")
+    for name, capability in capabilities.items():
+        status = "[green]ok[/green]" if capability.available else "[red]missing[/red]"
+        detail = capability.version if capability.available else capability.error
+        table.add_row(name, TOOLS[name].description, status, detail or "", capability.path or "")
+    console.print(table)
+
+    audio = registry.first_available(AUDIO_BACKENDS)
+    pdf = registry.first_available(PDF_BACKENDS)
+    backends = Table(show_header=True, header_style="bold magenta")
+    backends.add_column("Output")
+    backends.add_column("Backend")
+    backends.add_row("Audio synthesis", audio or "[yellow]sine-wave fallback[/yellow]")
+    backends.add_row("MP3 encoding", "ffmpeg" if registry.available("ffmpeg") else "[red]unavailable[/red]")
+    backends.add_row("PDF", pdf or "[yellow]minimal placeholder PDF[/yellow]")
+    console.print(backends)
+    stats = registry.stats()
+    console.print(f"Probes run: {stats['probes']}, reused from {path}: {stats['manifest_hits']}")
+
+
 @app.command("info")
 def info():
     """Display information about available options."""
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+Batch Exercise Generation
+=======================
+Concurrent generation of many exercises on a shared asyncio HTTP client.
+"""
+
+import asyncio
+from typing import Optional, List, Dict, Any, Iterable, Union, NamedTuple, AsyncIterator
+
+from .client import AsyncMistralClient
+from .breaker import get_default_breaker
+from .constants import BATCH_MAX_CONCURRENCY, DEFAULT_ENGINE, DEFAULT_WIRE_FORMAT
+from .generator import generate_exercise_async
+
+
+class ExerciseSpec(NamedTuple):
+    """Parameters of a single exercise request."""
+    instrument: str
+    level: str
+    key: str
+    time_signature: str
+    measures: int
+    custom_prompt: str = ""
+    seed: Optional[int] = None
+
+
+class BatchResult(NamedTuple):
+    """Outcome of one job in a batch run."""
+    index: int
+    spec: ExerciseSpec
+    exercise: Optional[List[Dict[str, Any]]]
+    error: Optional[Exception] = None
+
+
+def _as_spec(spec: Union[ExerciseSpec, Dict[str, Any]]) -> ExerciseSpec:
+    """Accept either an ExerciseSpec or a dict of generate_exercise arguments."""
+    if isinstance(spec, ExerciseSpec):
+        return spec
+    return ExerciseSpec(**spec)
+
+
+async def generate_exercises_async(specs: Iterable[Union[ExerciseSpec, Dict[str, Any]]],
+                                   max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                                   api_key: Optional[str] = None,
+                                   client: Optional[AsyncMistralClient] = None,
+                                   hedge: bool = False,
+                                   engine: str = DEFAULT_ENGINE,
+                                   wire_format: str = DEFAULT_WIRE_FORMAT) -> AsyncIterator[BatchResult]:
+    """
+    Generate many exercises concurrently, yielding each one as it completes.
+    
+    Every job keeps the fallback behaviour of generate_exercise: API errors
+    produce a fallback exercise, and only unexpected failures are reported
+    through BatchResult.error.
+    
+    The first job for each distinct spec is coalesced with identical
+    requests already in flight elsewhere in the process; repeated specs
+    within the batch are generated separately, since the caller asked for
+    that many exercises.
+    
+    Args:
+        specs: Exercise specifications (ExerciseSpec or dicts with the same fields)
+        max_concurrency: Maximum number of requests in flight at once
+        api_key: Optional API key
+        client: Optional async HTTP client (one is opened for the batch if not provided)
+        hedge: Send a backup request for jobs whose LLM answer is slow
+        engine: Exercise engine for every job ("llm", "procedural" or "auto")
+        wire_format: Format the LLM answers in ("json" or "compact")
+        
+    Yields:
+        BatchResult for each job, in completion order
+    """
+    specs = [_as_spec(spec) for spec in specs]
+    if not specs:
+        return
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    own_client = client is None
+    client = client or AsyncMistralClient(pool_maxsize=max_concurrency)
+    breaker = get_default_breaker() if own_client else None
+    semaphore = asyncio.Semaphore(max_concurrency)
+    first_of_spec = {spec: index for index, spec in reversed(list(enumerate(specs)))}
+
+    async def run(index: int, spec: ExerciseSpec) -> BatchResult:
+        async with semaphore:
+            try:
+                exercise = await generate_exercise_async(
+                    spec.instrument, spec.level, spec.key, spec.time_signature,
+                    spec.measures, spec.custom_prompt, api_key, client=client, seed=spec.seed,
+                    hedge=hedge, engine=engine, wire_format=wire_format,
+                    coalesce=first_of_spec[spec] == index, breaker=breaker)
+                return BatchResult(index, spec, exercise)
+            except Exception as e:
+                return BatchResult(index, spec, None, e)
+
+    tasks = [asyncio.ensure_future(run(index, spec)) for index, spec in enumerate(specs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_client:
+            await client.close()
+
+
+def generate_exercises(specs: Iterable[Union[ExerciseSpec, Dict[str, Any]]],
+                       max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                       api_key: Optional[str] = None, hedge: bool = False,
+                       engine: str = DEFAULT_ENGINE,
+                       wire_format: str = DEFAULT_WIRE_FORMAT) -> List[BatchResult]:
+    """
+    Blocking wrapper around generate_exercises_async.
+    
+    Args:
+        specs: Exercise specifications (ExerciseSpec or dicts with the same fields)
+        max_concurrency: Maximum number of requests in flight at once
+        api_key: Optional API key
+        hedge: Send a backup request for jobs whose LLM answer is slow
+        engine: Exercise engine for every job ("llm", "procedural" or "auto")
+        wire_format: Format the LLM answers in ("json" or "compact")
+        
+    Returns:
+        BatchResult list ordered like the input specs
+    """
+    async def collect() -> List[BatchResult]:
+        return [result async for result in generate_exercises_async(specs, max_concurrency, api_key,
+                                                                          hedge=hedge, engine=engine,
+                                                                          wire_format=wire_format)]
+
+    return sorted(asyncio.run(collect()), key=lambda result: result.index)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+"""
+Circuit Breaker
+=============
+Fail-fast protection for the Mistral backend.
+
+The breaker watches the outcome of recent calls. When too many of them
+failed or were slow, it opens, and callers get a CircuitOpenError at once
+instead of waiting for the backend. generate_exercise handles that error by
+serving the local fallback. After a cool-down the breaker turns half-open
+and lets a few probe calls through; if they succeed it closes again, and
+if one fails it reopens.
+
+State transitions are saved to a small JSON file. Later CLI runs then start
+in the same state and can show it.
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+import requests
+
+from .cache import atomic_write
+from .constants import (
+    BREAKER_FAILURE_RATE,
+    BREAKER_SLOW_CALL_DURATION,
+    BREAKER_WINDOW,
+    BREAKER_MIN_CALLS,
+    BREAKER_OPEN_DURATION,
+    BREAKER_HALF_OPEN_PROBES,
+    BREAKER_STATE_PATH,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling the backend while the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe closed/open/half-open circuit breaker.
+
+    A call counts as failed if it raises requests.exceptions.RequestException
+    or takes longer than slow_call_duration. Other exceptions mean the
+    backend answered (e.g. with malformed content) and count as successes.
+    """
+
+    def __init__(self, failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_duration: float = BREAKER_SLOW_CALL_DURATION,
+                 window: int = BREAKER_WINDOW,
+                 min_calls: int = BREAKER_MIN_CALLS,
+                 open_duration: float = BREAKER_OPEN_DURATION,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+                 state_path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Create a breaker, restoring a saved state from state_path if present.
+
+        Args:
+            failure_rate: Share of failed or slow calls in the window that opens the breaker
+            slow_call_duration: Seconds after which a successful call still counts as failed
+            window: Number of recent calls considered
+            min_calls: Calls needed in the window before the breaker can open
+            open_duration: Seconds to reject calls before probing again
+            half_open_probes: Successful probes needed to close (and probes allowed at once)
+            state_path: JSON file the state is saved to (None keeps it in memory only)
+            clock: Wall-clock time source (saved states must survive restarts)
+        """
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.window = window
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+        self.state_path = state_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True for failed or slow calls
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+        self._rejected = 0
+        self._trips = 0
+        self._load()
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+    def _load(self) -> None:
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                saved = json.load(f)
+            if saved.get("state") in (OPEN, HALF_OPEN):
+                self._state = OPEN
+                self._opened_at = float(saved["opened_at"])
+                self._trips = int(saved.get("trips", 0))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save(self) -> None:
+        if not self.state_path:
+            return
+        data = {"state": self._state, "opened_at": self._opened_at, "trips": self._trips}
+        try:
+            atomic_write(self.state_path, json.dumps(data).encode("utf-8"))
+        except OSError as e:
+            print(f"Warning: could not save circuit breaker state: {e}")
+
+    # -------------------------------------------------------------------------
+    # State machine (callers hold the lock)
+    # -------------------------------------------------------------------------
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        return self._state
+
+    def _open(self, reason: str) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._trips += 1
+        self._outcomes.clear()
+        print(f"Mistral circuit breaker opened ({reason}); using fallback exercises for "
+              f"{self.open_duration:g}s")
+        self._save()
+
+    def _close(self) -> None:
+        self._state = CLOSED
+        self._outcomes.clear()
+        print("Mistral circuit breaker closed; backend recovered")
+        self._save()
+
+    def allow(self) -> bool:
+        """
+        Reserve permission for one call; every True must be followed by record or release.
+
+        Returns:
+            False if the call should fail fast
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self) -> None:
+        """Give back a reservation whose call ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def record(self, failed: bool, duration: float = 0.0) -> None:
+        """
+        Record the outcome of an allowed call.
+
+        Args:
+            failed: Whether the call raised a request error
+            duration: Seconds the call took
+        """
+        slow = not failed and duration > self.slow_call_duration
+        bad = failed or slow
+        with self._lock:
+            self._calls += 1
+            self._failures += failed
+            self._slow_calls += slow
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if bad:
+                    self._open("probe failed" if failed else "probe was slow")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self._close()
+                return
+            if state == OPEN:
+                return  # Outcome of a call started before the breaker opened
+            self._outcomes.append(bad)
+            bad_calls = sum(self._outcomes)
+            if len(self._outcomes) >= self.min_calls and bad_calls >= self.failure_rate * len(self._outcomes):
+                self._open(f"{bad_calls} of the last {len(self._outcomes)} calls failed or were slow")
+
+    def reset(self) -> None:
+        """Close the breaker and forget recent outcomes."""
+        with self._lock:
+            self._state = CLOSED
+            self._outcomes.clear()
+            self._save()
+
+    # -------------------------------------------------------------------------
+    # Execution
+    # -------------------------------------------------------------------------
+    def _record_error(self, error: Exception, duration: float, budget: Optional[float]) -> None:
+        # A timeout caused by the caller's own short budget says nothing about the backend
+        if budget is not None and budget < self.slow_call_duration and isinstance(error, requests.exceptions.Timeout):
+            self.release()
+        else:
+            self.record(True, duration)
+
+    def call(self, call: Callable[[], Any], budget: Optional[float] = None) -> Any:
+        """
+        Run a blocking call through the breaker.
+
+        Args:
+            call: Function calling the backend
+            budget: Seconds the caller allowed the call; timeouts within a
+                budget shorter than slow_call_duration are not counted
+
+        Returns:
+            Result of call
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            Exception: Whatever call raises
+        """
+        if not self.allow():
+            raise CircuitOpenError("Mistral API circuit breaker is open")
+        start = time.monotonic()
+        try:
+            value = call()
+        except requests.exceptions.RequestException as e:
+            self._record_error(e, time.monotonic() - start, budget)
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(False, time.monotonic() - start)
+        return value
+
+    async def call_async(self, call: Callable[[], Awaitable[Any]], budget: Optional[float] = None) -> Any:
+        """
+        asyncio counterpart of call; a cancelled call records no outcome.
+
+        Args:
+            call: Coroutine function calling the backend
+            budget: Seconds the caller allowed the call (see call)
+
+        Returns:
+            Result of call
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            Exception: Whatever call raises
+        """
+        if not self.allow():
+            raise CircuitOpenError("Mistral API circuit breaker is open")
+        start = time.monotonic()
+        try:
+            value = await call()
+        except requests.exceptions.RequestException as e:
+            self._record_error(e, time.monotonic() - start, budget)
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(False, time.monotonic() - start)
+        return value
+
+    @property
+    def state(self) -> str:
+        """Current state: "closed", "open" or "half_open"."""
+        with self._lock:
+            return self._current_state()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return breaker state and counters.
+
+        Returns:
+            Dictionary with state, retry_in (seconds until probing, while
+            open), recent_failure_rate, calls, failures, slow_calls,
+            rejected and trips
+        """
+        with self._lock:
+            state = self._current_state()
+            recent = len(self._outcomes)
+            return {
+                "state": state,
+                "retry_in": max(0.0, self._opened_at + self.open_duration - self._clock()) if state == OPEN else 0.0,
+                "recent_failure_rate": sum(self._outcomes) / recent if recent else 0.0,
+                "calls": self._calls,
+                "failures": self._failures,
+                "slow_calls": self._slow_calls,
+                "rejected": self._rejected,
+                "trips": self._trips,
+            }
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared breaker
+# -----------------------------------------------------------------------------
+_default_breaker: Optional[CircuitBreaker] = None
+_default_breaker_lock = threading.Lock()
+
+
+def get_default_breaker() -> CircuitBreaker:
+    """
+    Return the process-wide breaker for the Mistral backend, creating it on first use.
+
+    Returns:
+        Shared CircuitBreaker saving its state to BREAKER_STATE_PATH
+    """
+    global _default_breaker
+    if _default_breaker is None:
+        with _default_breaker_lock:
+            if _default_breaker is None:
+                _default_breaker = CircuitBreaker(state_path=BREAKER_STATE_PATH)
+    return _default_breaker
+
+
+def set_default_breaker(breaker: Optional[CircuitBreaker]) -> Optional[CircuitBreaker]:
+    """
+    Replace the process-wide breaker.
+
+    Args:
+        breaker: New shared breaker, or None to recreate the default lazily
+
+    Returns:
+        The previously installed breaker, if any
+    """
+    global _default_breaker
+    with _default_breaker_lock:
+        previous = _default_breaker
+        _default_breaker = breaker
+    return previous
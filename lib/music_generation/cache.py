@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+"""
+Exercise Response Cache
+=====================
+On-disk, content-addressed cache for LLM-generated exercises.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from .constants import EXERCISE_CACHE_DIR, EXERCISE_CACHE_MAX_BYTES, EXERCISE_CACHE_TTL
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Write a file atomically so concurrent readers never see partial data.
+    
+    The data is written to a temporary file in the same directory and then
+    renamed over the target, which is atomic on POSIX and Windows.
+    
+    Args:
+        path: Destination path
+        data: File contents
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _normalize(value: Any) -> Any:
+    """Normalize a key component so trivially different spellings share an entry."""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, float):
+        return round(value, 4)
+    return value
+
+
+class ExerciseCache:
+    """
+    Content-addressed cache of raw LLM completions.
+    
+    Entries are JSON files sharded by the first two hex digits of their key.
+    Recency is tracked through file modification times, so several processes
+    can share one directory without a common index. Writes are atomic.
+    """
+
+    def __init__(self, cache_dir: str = EXERCISE_CACHE_DIR,
+                 max_bytes: int = EXERCISE_CACHE_MAX_BYTES,
+                 ttl: Optional[float] = EXERCISE_CACHE_TTL):
+        """
+        Create a cache rooted at cache_dir.
+        
+        Args:
+            cache_dir: Directory holding the cache entries
+            max_bytes: Total size above which least recently used entries are evicted
+            ttl: Seconds an entry stays valid, or None for no expiry
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+
+    @staticmethod
+    def make_key(instrument: str, level: str, key: str, time_sig: str, measures: int,
+                 prompt: str, model: str, temperature: float, seed: Optional[int] = None) -> str:
+        """
+        Build the cache key for a set of generation parameters.
+        
+        Args:
+            instrument: Target instrument
+            level: Difficulty level
+            key: Musical key
+            time_sig: Time signature (e.g., "4/4")
+            measures: Number of measures
+            prompt: Custom prompt (empty for the default prompt)
+            model: LLM model name
+            temperature: Sampling temperature
+            seed: Optional random seed
+            
+        Returns:
+            Hex SHA-256 digest identifying the request
+        """
+        parts = [instrument.lower(), level.lower(), key.lower(), time_sig.replace(" ", ""),
+                 int(measures), prompt, model, float(temperature), seed]
+        encoded = json.dumps([_normalize(part) for part in parts], separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached completion.
+        
+        Args:
+            key: Key returned by make_key
+            
+        Returns:
+            Cached completion text, or None on a miss or expired entry
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.ttl is not None and time.time() - entry["created"] > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError, KeyError, TypeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["content"]
+
+    def put(self, key: str, content: str) -> None:
+        """
+        Store a completion, evicting old entries if the cache grows too large.
+        
+        Args:
+            key: Key returned by make_key
+            content: Completion text
+        """
+        data = json.dumps({"created": time.time(), "content": content}).encode("utf-8")
+        try:
+            atomic_write(self._path(key), data)
+        except OSError as e:
+            print(f"Warning: Could not write exercise cache entry: {e}")
+            return
+        with self._lock:
+            self.writes += 1
+            if self._approx_bytes is not None:
+                self._approx_bytes += len(data)
+            over_limit = self._approx_bytes is None or self._approx_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """List (mtime, size, path) for all entries on disk."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove expired entries, then least recently used ones until under max_bytes.
+        
+        Returns:
+            Number of entries removed
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        removed = 0
+        for mtime, size, path in entries:
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self.evictions += removed
+            self._approx_bytes = total
+        return removed
+
+    def clear(self) -> None:
+        """Remove every cache entry."""
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._approx_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters for this process.
+        
+        Returns:
+            Dictionary with hits, misses, writes, evictions and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared cache
+# -----------------------------------------------------------------------------
+_UNSET = object()
+_default_cache: Any = _UNSET
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ExerciseCache]:
+    """
+    Return the process-wide cache, or None if caching is disabled.
+    
+    Returns:
+        Shared ExerciseCache instance or None
+    """
+    global _default_cache
+    if _default_cache is _UNSET:
+        with _default_cache_lock:
+            if _default_cache is _UNSET:
+                _default_cache = ExerciseCache()
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[ExerciseCache]) -> Optional[ExerciseCache]:
+    """
+    Replace the process-wide cache.
+    
+    Args:
+        cache: New shared cache, or None to disable caching
+        
+    Returns:
+        The previously installed cache, if any
+    """
+    global _default_cache
+    with _default_cache_lock:
+        previous = _default_cache
+        _default_cache = cache
+    return None if previous is _UNSET else previous
+
+
+def configure_cache(cache_dir: Optional[str] = None, enabled: bool = True) -> Optional[ExerciseCache]:
+    """
+    Enable or disable the process-wide cache, optionally at a custom location.
+    
+    Args:
+        cache_dir: Cache directory (defaults to EXERCISE_CACHE_DIR)
+        enabled: Whether query_mistral should use the cache
+        
+    Returns:
+        The installed cache, or None if disabled
+    """
+    cache = ExerciseCache(cache_dir or EXERCISE_CACHE_DIR) if enabled else None
+    set_default_cache(cache)
+    return cache
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+"""
+Mistral HTTP Client
+=================
+Pooled, keep-alive HTTP client shared by all Mistral API callers.
+"""
+
+import json
+import asyncio
+import threading
+from typing import Optional, Dict, Any, Tuple, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .constants import (
+    MISTRAL_API_URL,
+    MISTRAL_CONNECT_TIMEOUT,
+    MISTRAL_READ_TIMEOUT,
+    MISTRAL_POOL_CONNECTIONS,
+    MISTRAL_POOL_MAXSIZE,
+)
+
+
+class MistralClient:
+    """
+    HTTP client for the Mistral chat-completions endpoint.
+
+    Wraps a ``requests.Session`` whose connection pool keeps sockets alive
+    between calls, so consecutive exercises reuse one TCP/TLS connection
+    instead of paying a new handshake each time. A single instance is safe
+    to share between threads.
+    """
+
+    def __init__(self, api_url: Optional[str] = None,
+                 connect_timeout: float = MISTRAL_CONNECT_TIMEOUT,
+                 read_timeout: float = MISTRAL_READ_TIMEOUT,
+                 pool_connections: int = MISTRAL_POOL_CONNECTIONS,
+                 pool_maxsize: int = MISTRAL_POOL_MAXSIZE,
+                 pool_block: bool = False):
+        """
+        Create a client with its own connection pool.
+
+        Args:
+            api_url: Chat-completions URL (defaults to MISTRAL_API_URL)
+            connect_timeout: Seconds to wait for a TCP connection
+            read_timeout: Seconds to wait for the server to send data
+            pool_connections: Number of per-host pools to keep
+            pool_maxsize: Maximum open connections kept per host
+            pool_block: Whether callers wait for a free connection when the pool is exhausted
+        """
+        self.api_url = api_url or MISTRAL_API_URL
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        })
+
+    def post(self, payload: Dict[str, Any], api_key: str,
+             timeout: Optional[Tuple[float, float]] = None, **kwargs) -> requests.Response:
+        """
+        POST a chat-completions payload and return the raw response.
+
+        Args:
+            payload: Request body
+            api_key: Mistral API key
+            timeout: Optional (connect, read) timeout overriding the client default
+            **kwargs: Extra arguments forwarded to ``requests.Session.post``
+
+        Returns:
+            The HTTP response
+
+        Raises:
+            requests.exceptions.HTTPError: If the server answers with an error status
+            requests.exceptions.RequestException: On network errors or timeouts
+        """
+        response = self.session.post(
+            self.api_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            json=payload,
+            timeout=timeout or self.timeout,
+            **kwargs,
+        )
+        response.raise_for_status()
+        return response
+
+    def chat_completion(self, payload: Dict[str, Any], api_key: str,
+                        timeout: Optional[Tuple[float, float]] = None) -> str:
+        """
+        Run a chat completion and return the message content.
+
+        Args:
+            payload: Request body
+            api_key: Mistral API key
+            timeout: Optional (connect, read) timeout overriding the client default
+
+        Returns:
+            Content of the first choice's message
+
+        Raises:
+            requests.exceptions.RequestException: On HTTP or network errors, or
+                if the response body is not a chat completion
+        """
+        response = self.post(payload, api_key, timeout=timeout)
+        return _message_content(response.json(), self.api_url)
+
+    def open_stream(self, payload: Dict[str, Any], api_key: str,
+                    timeout: Optional[Tuple[float, float]] = None) -> requests.Response:
+        """
+        Start a streaming chat completion.
+        
+        Args:
+            payload: Request body (``stream`` is enabled automatically)
+            api_key: Mistral API key
+            timeout: Optional (connect, read) timeout overriding the client default
+            
+        Returns:
+            Response whose body is a server-sent event stream; pass it to iter_stream_content
+            
+        Raises:
+            requests.exceptions.RequestException: On HTTP or network errors
+        """
+        return self.post(dict(payload, stream=True), api_key, timeout=timeout, stream=True)
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self) -> "MistralClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class AsyncMistralClient:
+    """
+    asyncio counterpart of MistralClient, built on aiohttp.
+
+    One instance owns one connection pool and must be used from a single
+    event loop. Errors are re-raised as the matching ``requests`` exceptions
+    so callers share one error-handling path with the synchronous client.
+    """
+
+    def __init__(self, api_url: Optional[str] = None,
+                 connect_timeout: float = MISTRAL_CONNECT_TIMEOUT,
+                 read_timeout: float = MISTRAL_READ_TIMEOUT,
+                 pool_maxsize: int = MISTRAL_POOL_MAXSIZE):
+        """
+        Create an async client; the aiohttp session is opened lazily.
+
+        Args:
+            api_url: Chat-completions URL (defaults to MISTRAL_API_URL)
+            connect_timeout: Seconds to wait for a TCP connection
+            read_timeout: Seconds to wait for the server to send data
+            pool_maxsize: Maximum simultaneous connections
+        """
+        self.api_url = api_url or MISTRAL_API_URL
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout),
+                headers={"Content-Type": "application/json"},
+            )
+        return self._session
+
+    async def chat_completion(self, payload: Dict[str, Any], api_key: str) -> str:
+        """
+        Run a chat completion and return the message content.
+
+        Args:
+            payload: Request body
+            api_key: Mistral API key
+
+        Returns:
+            Content of the first choice's message
+
+        Raises:
+            requests.exceptions.RequestException: On HTTP or network errors, or
+                if the response body is not a chat completion
+        """
+        import aiohttp
+
+        session = self._get_session()
+        try:
+            async with session.post(self.api_url, json=payload,
+                                    headers={"Authorization": f"Bearer {api_key}"}) as response:
+                if response.status >= 400:
+                    raise _http_error(response.status, dict(response.headers), self.api_url)
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError as e:
+                    raise requests.exceptions.InvalidJSONError(f"Invalid JSON from {self.api_url}: {e}") from e
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(f"Timed out querying {self.api_url}") from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        return _message_content(data, self.api_url)
+
+    async def close(self) -> None:
+        """Close the underlying aiohttp session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "AsyncMistralClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+def iter_stream_content(response: requests.Response) -> Iterator[str]:
+    """
+    Yield message content deltas from a streaming chat-completions response.
+    
+    The response is closed when the stream ends or the generator is closed,
+    which lets callers abort a completion early by closing the generator.
+    
+    Args:
+        response: Response returned by MistralClient.open_stream
+        
+    Yields:
+        Content fragments in arrival order
+    """
+    if response.encoding is None:
+        response.encoding = "utf-8"
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                choices = json.loads(data).get("choices") or []
+            except (ValueError, AttributeError):
+                continue  # Skip malformed events
+            if choices:
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+    finally:
+        response.close()
+
+
+def _message_content(data: Any, url: str) -> str:
+    """Return the first choice's message content, as a RequestException if the body has another shape."""
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise requests.exceptions.InvalidJSONError(f"Unexpected response body from {url}: {e!r}") from e
+
+
+def _http_error(status: int, headers: Dict[str, str], url: str) -> requests.exceptions.HTTPError:
+    """Build a requests HTTPError carrying the status code and headers of a response."""
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers)
+    response.url = url
+    return requests.exceptions.HTTPError(f"{status} Error for url: {url}", response=response)
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared client
+# -----------------------------------------------------------------------------
+_default_client: Optional[MistralClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> MistralClient:
+    """
+    Return the process-wide client, creating it on first use.
+
+    Returns:
+        Shared MistralClient instance
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = MistralClient()
+    return _default_client
+
+
+def set_default_client(client: Optional[MistralClient]) -> Optional[MistralClient]:
+    """
+    Replace the process-wide client (e.g. to change timeouts or pool size).
+
+    Args:
+        client: New shared client, or None to recreate the default lazily
+
+    Returns:
+        The previously installed client, if any
+    """
+    global _default_client
+    with _default_client_lock:
+        previous = _default_client
+        _default_client = client
+    return previous
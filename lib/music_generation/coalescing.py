@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""
+Request Coalescing
+================
+Single-flight execution of identical in-flight requests.
+
+The first caller for a key runs the work; callers arriving with the same
+key while it is in flight wait for that result instead of repeating the
+work. Waiters can be threads or asyncio tasks (on any event loop), because
+every in-flight call is tracked with a concurrent.futures.Future. Once a
+call finishes its key is released, so later callers start a fresh one.
+"""
+
+import copy
+import asyncio
+import threading
+import concurrent.futures
+from typing import Optional, Dict, Any, Callable, Awaitable, Hashable
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome.
+
+    Errors are shared like results: every waiter of a failed call gets the
+    leader's exception. If the leader is cancelled (or interrupted), the
+    waiters are not failed; they retry and one of them becomes the leader.
+
+    A blocking waiter must not run on the event loop thread that executes
+    the leading coroutine, or it would block the loop it is waiting for.
+    """
+
+    def __init__(self, share: Callable[[Any], Any] = copy.deepcopy):
+        """
+        Create a coalescing group.
+
+        Args:
+            share: Function giving each waiter its own copy of the result
+                (the leader keeps the original), so callers can modify it
+        """
+        self.share = share
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, concurrent.futures.Future] = {}
+        self._calls_total = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    def _join(self, key: Hashable):
+        """Return (future, leader): the in-flight call for key, or a new one this caller leads."""
+        with self._lock:
+            self._calls_total += 1
+            future = self._calls.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future, False
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            self._executions += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    # -------------------------------------------------------------------------
+    # Execution
+    # -------------------------------------------------------------------------
+    def do(self, key: Hashable, call: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a blocking call unless an identical one is already in flight.
+
+        Args:
+            key: Hashable identity of the request
+            call: Function doing the work
+            timeout: Seconds a waiter waits for another caller's result
+                (the leading call itself is not limited)
+
+        Returns:
+            Result of call (a copy for callers that waited)
+
+        Raises:
+            TimeoutError: If this caller waited longer than timeout
+            Exception: The error raised by the leading call
+        """
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return self.share(future.result(timeout))
+                except concurrent.futures.TimeoutError:
+                    raise TimeoutError("Timed out waiting for an identical in-flight request")
+                except concurrent.futures.CancelledError:
+                    continue  # The leader gave up; retry, possibly as the new leader
+            try:
+                value = call()
+            except Exception as e:
+                self._finish(key, future)
+                future.set_exception(e)
+                raise
+            except BaseException:
+                self._finish(key, future)
+                future.cancel()
+                raise
+            self._finish(key, future)
+            future.set_result(value)
+            return value
+
+    async def do_async(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        asyncio counterpart of do; shares calls with blocking callers too.
+
+        Cancelling a waiting task only stops that task. Cancelling the
+        leading task makes the waiters retry.
+
+        Args:
+            key: Hashable identity of the request
+            call: Coroutine function doing the work
+
+        Returns:
+            Result of call (a copy for callers that waited)
+
+        Raises:
+            Exception: The error raised by the leading call
+        """
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    # Shielded so that cancelling this waiter never cancels the shared call
+                    value = await asyncio.shield(asyncio.wrap_future(future))
+                except asyncio.CancelledError:
+                    if future.cancelled():
+                        continue  # The leader gave up; retry, possibly as the new leader
+                    raise
+                return self.share(value)
+            try:
+                value = await call()
+            except Exception as e:
+                self._finish(key, future)
+                future.set_exception(e)
+                raise
+            except BaseException:
+                self._finish(key, future)
+                future.cancel()
+                raise
+            self._finish(key, future)
+            future.set_result(value)
+            return value
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return coalescing counters.
+
+        Returns:
+            Dictionary with calls, executions, coalesced (calls that waited
+            for another caller's result), coalesce_rate and in_flight
+        """
+        with self._lock:
+            return {
+                "calls": self._calls_total,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "coalesce_rate": self._coalesced / self._calls_total if self._calls_total else 0.0,
+                "in_flight": len(self._calls),
+            }
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared coalescing group
+# -----------------------------------------------------------------------------
+_default_single_flight: Optional[SingleFlight] = None
+_default_single_flight_lock = threading.Lock()
+
+
+def get_default_single_flight() -> SingleFlight:
+    """
+    Return the process-wide coalescing group, creating it on first use.
+
+    Returns:
+        Shared SingleFlight
+    """
+    global _default_single_flight
+    if _default_single_flight is None:
+        with _default_single_flight_lock:
+            if _default_single_flight is None:
+                _default_single_flight = SingleFlight()
+    return _default_single_flight
+
+
+def set_default_single_flight(single_flight: Optional[SingleFlight]) -> Optional[SingleFlight]:
+    """
+    Replace the process-wide coalescing group.
+
+    Args:
+        single_flight: New shared group, or None to recreate the default lazily
+
+    Returns:
+        The previously installed group, if any
+    """
+    global _default_single_flight
+    with _default_single_flight_lock:
+        previous = _default_single_flight
+        _default_single_flight = single_flight
+    return previous
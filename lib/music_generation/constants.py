@@ -6,12 +6,52 @@ Music Generation Constants
 Constants and configuration values for music generation.
 """
 
-from typing import Dict
+import os
+from typing import Dict, List, Tuple
 
 # MIDI configuration
 TICKS_PER_BEAT = 480  # Standard MIDI resolution
 TICKS_PER_8TH = TICKS_PER_BEAT // 2  # 240 ticks per 8th note
 SAMPLE_RATE = 44100  # Hz
+RAM_DIR = "/dev/shm"  # in-memory scratch files where memfd_create is unavailable
+
+# ffmpeg filters applied when encoding an instrument's MP3 (single-pole, like pydub's)
+AUDIO_FILTERS: Dict[str, str] = {
+    "Trumpet": "highpass=f=200:poles=1",
+    "Violin": "lowpass=f=5000:poles=1",
+}
+# Streaming renders: PCM frames per block handed from the synth to the encoder (~93ms at 44.1kHz)
+AUDIO_STREAM_BLOCK_FRAMES = 4096
+
+# Wavetable fallback synthesizer (used when FluidSynth is unavailable)
+FALLBACK_WAVETABLE_SIZE = 4096  # samples in the one-cycle sine table (a power of two)
+FALLBACK_BLOCK_FRAMES = 1 << 18  # frames mixed per block when rendering a whole exercise at once
+FALLBACK_ATTACK_SECONDS = 0.01
+FALLBACK_DECAY_SECONDS = 0.08
+FALLBACK_SUSTAIN_LEVEL = 0.7  # fraction of the peak held until the note ends
+FALLBACK_RELEASE_SECONDS = 0.12
+
+# In-process FluidSynth engines (pyFluidSynth)
+SYNTH_POOL_SIZE = 2  # engines kept alive; each holds its own copy of the loaded soundfonts
+SYNTH_GAIN = 1.0  # same master gain as the fluidsynth CLI renders (-g 1.0)
+SYNTH_TAIL_SECONDS = 1.0  # rendered after the last event so releases are not cut off
+
+# Rendered audio cache, keyed by the MIDI and everything else that shapes the MP3
+AUDIO_CACHE_DIR = "cache/audio"
+AUDIO_CACHE_MAX_BYTES = 256 * 1024 * 1024  # evict least recently used renders above this size
+
+# Pre-rendered note sample banks (one per instrument and tempo) for concatenative rendering
+SAMPLE_BANK_DIR = "cache/sample_banks"
+SAMPLE_BANK_DURATIONS: Tuple[int, ...] = (1, 2, 3, 4, 6, 8)  # note values banked, in 8th-note units
+SAMPLE_BANK_VELOCITY = 80  # velocity the notes are rendered at (middle of json_to_midi's 60-100)
+SAMPLE_BANK_RELEASE_SECONDS = 0.5  # tail kept after each note ends
+SAMPLE_BANK_SILENCE = 1e-4  # tail samples quieter than this (full scale 1.0) are trimmed
+SAMPLE_BANK_CROSSFADE_SECONDS = 0.005  # fade-out at the end of each sample, against clicks
+
+# External tool discovery (FluidSynth, MuseScore, LilyPond, ffmpeg, ImageMagick)
+CAPABILITIES_PATH = "cache/capabilities.json"  # probe results shared with later runs
+CAPABILITIES_TTL = 24 * 60 * 60  # seconds a saved probe result is trusted
+CAPABILITY_PROBE_TIMEOUT = 10.0  # seconds allowed for one "--version" probe
 
 # Soundfont URLs
 SOUNDFONT_URLS: Dict[str, str] = {
@@ -28,5 +68,100 @@ INSTRUMENT_PROGRAMS: Dict[str, int] = {
     "Clarinet": 71, "Flute": 73,
 }
 
+# Supported exercise parameters (mirrors the CLI options)
+INSTRUMENTS: List[str] = ["Trumpet", "Piano", "Violin", "Clarinet", "Flute"]
+LEVELS: List[str] = ["Beginner", "Intermediate", "Advanced"]
+KEYS: List[str] = ["C Major", "G Major", "D Major", "F Major", "Bb Major", "A Minor", "E Minor"]
+TIME_SIGNATURES: List[str] = ["3/4", "4/4"]
+MIN_MEASURES = 1
+MAX_MEASURES = 16
+
+# Exercise engines: the LLM, the offline procedural generator, or procedural
+# for the levels below and the LLM otherwise
+ENGINES: List[str] = ["llm", "procedural", "auto"]
+DEFAULT_ENGINE = "llm"
+PROCEDURAL_LEVELS: List[str] = ["Beginner"]
+
+# Comfortable written range of each instrument for generated exercises
+INSTRUMENT_RANGES: Dict[str, Tuple[str, str]] = {
+    "Trumpet": ("F#3", "C6"),
+    "Piano": ("C3", "C6"),
+    "Violin": ("G3", "E6"),
+    "Clarinet": ("E3", "C6"),
+    "Flute": ("C4", "C7"),
+}
+
 # API configuration
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
\ No newline at end of file
+MISTRAL_DEFAULT_API_URL = "https://api.mistral.ai/v1/chat/completions"
+MISTRAL_API_URL = os.environ.get("MISTRAL_API_URL", MISTRAL_DEFAULT_API_URL)  # Override to use a local stub server
+
+# LLM output (wire) formats: verbose JSON objects, or compact "C4:2 E4:2 G4:4 |" text
+WIRE_FORMATS: List[str] = ["json", "compact"]
+DEFAULT_WIRE_FORMAT = "json"
+# Output tokens budgeted per note; max_tokens assumes every note could be an 8th
+WIRE_FORMAT_TOKENS_PER_NOTE: Dict[str, int] = {"json": 40, "compact": 6}
+WIRE_FORMAT_TOKENS_PER_MEASURE = 2  # barline in the compact format
+MAX_TOKENS_OVERHEAD = 50  # code fences and stray prose around the notes
+
+# HTTP client configuration
+MISTRAL_CONNECT_TIMEOUT = 5.0  # seconds
+MISTRAL_READ_TIMEOUT = 60.0  # seconds
+MISTRAL_POOL_CONNECTIONS = 4  # per-host pools kept by the session
+MISTRAL_POOL_MAXSIZE = 16  # keep-alive connections per host
+
+# Batch generation
+BATCH_MAX_CONCURRENCY = 8  # simultaneous LLM requests in batch runs
+
+# Exercise response cache
+EXERCISE_CACHE_DIR = "cache/exercises"
+EXERCISE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # evict least recently used entries above this size
+EXERCISE_CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# Request scheduling (rate limits, retries, deadlines)
+MISTRAL_REQUESTS_PER_SECOND = 5.0
+MISTRAL_REQUEST_BURST = 10
+MISTRAL_TOKENS_PER_MINUTE = 500_000
+MISTRAL_MAX_RETRIES = 5
+MISTRAL_BACKOFF_BASE = 0.5  # seconds, doubled per attempt before jitter
+MISTRAL_BACKOFF_MAX = 8.0  # seconds
+MISTRAL_REQUEST_DEADLINE = 30.0  # seconds before giving up and using the fallback
+
+# Request hedging (opt-in)
+HEDGE_PERCENTILE = 95.0  # hedge requests slower than this percentile of recent latencies
+HEDGE_WINDOW = 200  # recent latencies considered
+HEDGE_MIN_SAMPLES = 20  # samples needed before the percentile is used
+HEDGE_INITIAL_DELAY = 10.0  # seconds, hedge delay until enough samples were seen
+HEDGE_MIN_DELAY = 0.05  # seconds
+HEDGE_MAX_EXTRA_IN_FLIGHT = 2  # hedge requests outstanding at once
+
+# Circuit breaker for the Mistral backend
+BREAKER_FAILURE_RATE = 0.5  # open when this share of recent calls failed or were slow
+BREAKER_SLOW_CALL_DURATION = 20.0  # seconds; slower calls count as failures
+BREAKER_WINDOW = 20  # recent calls considered
+BREAKER_MIN_CALLS = 5  # calls needed in the window before the breaker can open
+BREAKER_OPEN_DURATION = 30.0  # seconds to fail fast before probing the backend again
+BREAKER_HALF_OPEN_PROBES = 2  # successful probes needed to close (also the probe concurrency)
+BREAKER_STATE_PATH = "cache/breaker.json"  # shared with later CLI runs
+
+# Deadline propagation (requests with a latency budget); seconds each stage
+# needs, so a stage short of time takes a cheaper path or is skipped
+DEADLINE_LLM_MIN_SECONDS = 1.0  # below this the procedural engine replaces the LLM
+DEADLINE_SYNTH_SECONDS = 2.0  # FluidSynth render and MP3 encoding
+DEADLINE_SINE_AUDIO_SECONDS = 0.5  # sine-wave fallback audio
+DEADLINE_ENGRAVING_SECONDS = 4.0  # MuseScore / LilyPond PDF
+DEADLINE_QUICK_PDF_SECONDS = 0.5  # note-list PDF without an engraver
+DEADLINE_SVG_SECONDS = 3.0  # SVG export through MuseScore
+DEADLINE_VISUALIZATION_SECONDS = 1.0  # matplotlib piano-roll image
+
+# Pre-generated exercise inventory
+INVENTORY_PATH = "cache/inventory.json"
+INVENTORY_LOW_WATER = 1  # refill a bucket when it holds fewer exercises than this
+INVENTORY_TARGET = 2  # exercises per bucket after a refill
+INVENTORY_REFILL_WORKERS = 4  # concurrent LLM requests made by the refiller
+INVENTORY_REFILL_INTERVAL = 30.0  # seconds between background refill passes
+INVENTORY_SAVE_INTERVAL = 10.0  # seconds between saves of a changed inventory
+
+# Local stub server (offline benchmarking)
+STUB_SERVER_HOST = "127.0.0.1"
+STUB_SERVER_PORT = 8089
+STUB_STREAM_CHUNK_SIZE = 16  # characters of content per streamed event
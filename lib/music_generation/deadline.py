@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""
+Request Deadlines
+===============
+Latency budgets shared by the stages of one request.
+
+A Deadline is created once per request from its budget and passed along.
+Each stage reads the time left and keeps back what the later stages need
+for their cheapest path, so the request finishes within its budget.
+"""
+
+import math
+import time
+from typing import Optional
+
+
+class Deadline:
+    """Point in time by which a request should be finished; unbounded without a budget."""
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Start a deadline.
+
+        Args:
+            seconds: Budget from now in seconds, or None for no limit
+        """
+        self.expires_at = None if seconds is None else time.monotonic() + max(0.0, seconds)
+
+    @classmethod
+    def from_ms(cls, milliseconds: Optional[float]) -> "Deadline":
+        """Start a deadline from a budget in milliseconds (None for no limit)."""
+        return cls(None if milliseconds is None else milliseconds / 1000.0)
+
+    @property
+    def bounded(self) -> bool:
+        """Whether the request has a budget at all."""
+        return self.expires_at is not None
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """
+        Seconds left, minus time reserved for later stages.
+
+        Args:
+            reserve: Seconds to keep back
+
+        Returns:
+            Non-negative seconds (infinity without a budget)
+        """
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic() - reserve)
+
+    def allows(self, seconds: float, reserve: float = 0.0) -> bool:
+        """Whether a step taking seconds still fits, keeping reserve seconds back."""
+        return self.remaining(reserve) >= seconds
+
+    def timeout(self, reserve: float = 0.0) -> Optional[float]:
+        """Time left as a timeout argument: None without a budget, else remaining(reserve)."""
+        return None if self.expires_at is None else self.remaining(reserve)
+
+    def __repr__(self) -> str:
+        return f"Deadline({self.remaining():.3f}s left)" if self.bounded else "Deadline(unbounded)"
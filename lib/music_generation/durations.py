@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""
+Duration Scaling
+==============
+Vectorized rescaling of note durations to an exact total.
+
+Many exercises are scaled at once from ragged duration arrays: the
+durations of all exercises are concatenated into one flat array and
+``lengths`` gives the number of notes of each exercise. Units are
+apportioned with the largest-remainder (Hamilton) method, so every note
+keeps at least one unit and every exercise sums exactly to its target.
+"""
+
+from itertools import accumulate
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Fractional weights are converted to integers of this resolution per
+# exercise so apportionment runs in exact integer arithmetic
+_WEIGHT_RESOLUTION = 1 << 30
+
+# Snapping moves a note boundary by at most this fraction of a measure
+_SNAP_TOLERANCE_DIVISOR = 4
+
+Targets = Union[int, Sequence[int], np.ndarray]
+
+
+def _segment_ids(lengths: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(lengths)), lengths)
+
+
+def _integer_weights(durations: np.ndarray, segments: np.ndarray, count: int) -> np.ndarray:
+    """Non-negative int64 weights; exercises whose durations are all zero get equal weights."""
+    durations = np.nan_to_num(np.asarray(durations, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    durations = np.maximum(durations, 0.0)
+    if np.array_equal(durations, np.floor(durations)) and (durations.size == 0 or durations.max() < 2 ** 31):
+        weights = durations.astype(np.int64)
+    else:
+        peaks = np.zeros(count)
+        np.maximum.at(peaks, segments, durations)
+        scale = np.divide(_WEIGHT_RESOLUTION, peaks, out=np.zeros(count), where=peaks > 0)
+        weights = np.rint(durations * scale[segments]).astype(np.int64)
+    totals = np.bincount(segments, weights=weights, minlength=count).astype(np.int64)
+    return np.where(totals[segments] == 0, 1, weights)
+
+
+def apportion(durations: np.ndarray, lengths: np.ndarray, targets: Targets) -> np.ndarray:
+    """
+    Scale a flat batch of durations so each exercise sums exactly to its target.
+
+    Each note first gets one unit; the remaining units are shared in
+    proportion to the input durations, rounding down, and the units still
+    left over go to the notes with the largest remainders (earlier notes
+    win ties). Negative or missing durations count as zero, and an
+    exercise whose durations are all zero is spread evenly.
+
+    Args:
+        durations: Concatenated durations of all exercises
+        lengths: Number of notes in each exercise
+        targets: Total units per exercise (one value or one per exercise)
+
+    Returns:
+        int64 array of scaled durations, aligned with durations
+
+    Raises:
+        ValueError: If the arrays disagree or a target is smaller than its note count
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    count = len(lengths)
+    targets = np.broadcast_to(np.asarray(targets, dtype=np.int64), (count,))
+    if lengths.sum() != len(durations):
+        raise ValueError("lengths must add up to the number of durations")
+    if np.any(targets < lengths):
+        raise ValueError("every target must be at least the number of notes")
+
+    segments = _segment_ids(lengths)
+    weights = _integer_weights(durations, segments, count)
+    totals = np.bincount(segments, weights=weights, minlength=count).astype(np.int64)
+
+    free = (targets - lengths)[segments]
+    quotas, remainders = np.divmod(free * weights, totals[segments])
+    leftover = (targets - lengths) - np.bincount(segments, weights=quotas, minlength=count).astype(np.int64)
+
+    # Rank notes by remainder within their exercise; stable, so ties keep note order
+    order = np.lexsort((-remainders, segments))
+    starts = np.cumsum(lengths) - lengths
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order)) - starts[segments[order]]
+    return 1 + quotas + (rank < leftover[segments])
+
+
+def _measure_segments(scaled: np.ndarray, lengths: np.ndarray, targets: np.ndarray,
+                      units_per_measure: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Assign each note to the measure holding its midpoint and flag exercises that can snap."""
+    count = len(lengths)
+    segments = _segment_ids(lengths)
+    measures = targets // units_per_measure
+    ends = np.cumsum(scaled)
+    starts = np.cumsum(lengths) - lengths
+    ends -= np.r_[0, ends][starts][segments]  # Ends relative to the start of each exercise
+    midpoints = 2 * ends - scaled  # Twice the midpoint, to stay in integers
+    measure = np.minimum(midpoints // (2 * units_per_measure), measures[segments] - 1)
+
+    first_measure = np.cumsum(measures) - measures
+    cells = first_measure[segments] + measure
+    total_cells = int(measures.sum())
+    counts = np.bincount(cells, minlength=total_cells)
+    # How far each barline would move from the last note boundary before it
+    last_ends = np.zeros(total_cells, dtype=np.int64)
+    np.maximum.at(last_ends, cells, ends)
+    owner = _segment_ids(measures)
+    barlines = (np.arange(total_cells) - first_measure[owner] + 1) * units_per_measure
+    displacement = np.abs(last_ends - barlines)
+    bad_cells = ((counts == 0) | (counts > units_per_measure)
+                 | (displacement > max(1, units_per_measure // _SNAP_TOLERANCE_DIVISOR)))
+    snappable = np.bincount(owner, weights=bad_cells, minlength=count) == 0
+    return cells, counts, snappable
+
+
+def scale_durations_flat(durations: np.ndarray, lengths: np.ndarray, targets: Targets,
+                         units_per_measure: Optional[int] = None) -> np.ndarray:
+    """
+    Scale a flat batch of durations, optionally snapping notes to barlines.
+
+    With units_per_measure set, notes are grouped into the measure that
+    holds their proportional midpoint and each measure is apportioned on
+    its own, so every barline falls on a note boundary. An exercise is
+    scaled without snapping when a barline would have to move more than a
+    quarter measure, some measure would get no note (a note spanning a
+    whole measure) or a measure would get more notes than units.
+
+    Args:
+        durations: Concatenated durations of all exercises
+        lengths: Number of notes in each exercise
+        targets: Total units per exercise (one value or one per exercise)
+        units_per_measure: Units in one measure, or None to skip snapping
+
+    Returns:
+        int64 array of scaled durations, aligned with durations
+
+    Raises:
+        ValueError: If the arrays disagree, a target is smaller than its
+            note count, or a target is not a whole number of measures
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    targets = np.broadcast_to(np.asarray(targets, dtype=np.int64), lengths.shape)
+    scaled = apportion(durations, lengths, targets)
+    if not units_per_measure or not len(scaled):
+        return scaled
+    if np.any(targets % units_per_measure):
+        raise ValueError("targets must be whole numbers of measures to snap to barlines")
+
+    cells, counts, snappable = _measure_segments(scaled, lengths, targets, units_per_measure)
+    weights = np.asarray(durations, dtype=np.float64)
+    # Measures of exercises that cannot snap get a harmless placeholder target
+    cell_targets = np.where(counts > 0, np.maximum(counts, units_per_measure), 0)
+    snapped = apportion(weights, counts, cell_targets)
+    return np.where(snappable[_segment_ids(lengths)], snapped, scaled)
+
+
+def scale_durations(batch: Sequence[Sequence[float]], targets: Targets,
+                    units_per_measure: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Scale the durations of many exercises at once.
+
+    Args:
+        batch: One sequence of durations per exercise
+        targets: Total units per exercise (one value or one per exercise)
+        units_per_measure: Units in one measure to snap notes to barlines,
+            or None to skip snapping
+
+    Returns:
+        One int64 array of scaled durations per exercise
+
+    Raises:
+        ValueError: If a target is smaller than its note count or not a
+            whole number of measures when snapping
+    """
+    lengths = np.fromiter((len(durations) for durations in batch), dtype=np.int64, count=len(batch))
+    flat = np.fromiter((d for durations in batch for d in durations), dtype=np.float64,
+                       count=int(lengths.sum()))
+    scaled = scale_durations_flat(flat, lengths, targets, units_per_measure)
+    if not len(batch):
+        return []
+    return np.split(scaled, np.cumsum(lengths)[:-1])
+
+
+def _is_pairs(exercise: Sequence[Any]) -> bool:
+    return bool(exercise) and isinstance(exercise[0], (list, tuple))
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _flat_durations(exercises: Sequence[Sequence[Any]]) -> np.ndarray:
+    values = []
+    for exercise in exercises:
+        if _is_pairs(exercise):
+            values.extend([item[1] for item in exercise])
+        else:
+            values.extend([item.get("duration", 0) for item in exercise])
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_to_float(value) for value in values], dtype=np.float64)
+
+
+def scale_exercises(exercises: Sequence[Sequence[Any]], targets: Targets,
+                    units_per_measure: Optional[int] = None) -> List[List[Any]]:
+    """
+    Rescale whole exercises to new totals, keeping each exercise's format.
+
+    Exercises of ``[note, duration]`` pairs come back as pairs; exercises
+    of objects come back as objects with note, duration and
+    cumulative_duration. An exercise with more notes than its target is
+    cut to its first ``target`` notes so every note keeps one unit.
+
+    Args:
+        exercises: Exercises as lists of note objects or [note, duration] pairs
+        targets: Total units per exercise (one value or one per exercise)
+        units_per_measure: Units in one measure to snap notes to barlines,
+            or None to skip snapping
+
+    Returns:
+        Rescaled exercises, in the same order
+    """
+    targets = np.broadcast_to(np.asarray(targets, dtype=np.int64), (len(exercises),))
+    kept = [exercise[:max(int(target), 0)] for exercise, target in zip(exercises, targets)]
+    lengths = [len(exercise) for exercise in kept]
+    scaled = scale_durations_flat(_flat_durations(kept), lengths, targets, units_per_measure).tolist()
+
+    results = []
+    position = 0
+    for exercise in kept:
+        durations = scaled[position:position + len(exercise)]
+        position += len(exercise)
+        if _is_pairs(exercise):
+            results.append([[item[0], duration] for item, duration in zip(exercise, durations)])
+        else:
+            results.append([{"note": item["note"], "duration": duration, "cumulative_duration": cumulative}
+                            for item, duration, cumulative in zip(exercise, durations, accumulate(durations))])
+    return results
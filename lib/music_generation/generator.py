@@ -8,93 +8,87 @@ Core functionality for generating music exercises using LLM.
 
 import json
 import random
-import re
 import os
 import requests
-from typing import Optional, List, Tuple, Dict, Any
+from typing import Optional, List, Tuple, Dict, Any, Union, Iterator
+
+from .cache import ExerciseCache, get_default_cache
+from .durations import scale_exercises
+from .client import MistralClient, AsyncMistralClient, iter_stream_content
+from .parsing import IncrementalNoteParser, IncrementalCompactParser, as_note, find_note_array, parse_compact
+from .scheduler import RequestScheduler, estimate_tokens, get_default_scheduler, chat_completion_within
+from .hedging import Hedger, get_default_hedger
+from .coalescing import get_default_single_flight
+from .breaker import CircuitBreaker, CircuitOpenError, get_default_breaker
+from .inventory import ExerciseInventory
+from .procedural import generate_procedural_exercise
+from .constants import (
+    MISTRAL_API_URL,
+    ENGINES,
+    DEFAULT_ENGINE,
+    PROCEDURAL_LEVELS,
+    WIRE_FORMATS,
+    DEFAULT_WIRE_FORMAT,
+    WIRE_FORMAT_TOKENS_PER_NOTE,
+    WIRE_FORMAT_TOKENS_PER_MEASURE,
+    MAX_TOKENS_OVERHEAD,
+)
 
 # Default API settings
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
 MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY", "bPj0wARXs5dk2L1ipFOdoqHMmQnXuMNv")
 
 
-def scale_json_durations(json_data: List[Dict[str, Any]], target_units: int) -> List[Dict[str, Any]]:
+def scale_json_durations(json_data: List[Dict[str, Any]], target_units: int,
+                         units_per_measure: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Scales durations so that their sum is exactly target_units (8th notes).
     
+    Uses largest-remainder rounding, so every note keeps at least one unit
+    and the total is exact. ``[note, duration]`` pairs are returned as
+    pairs. Notes beyond target_units are dropped. See durations.py for
+    scaling many exercises at once.
+    
     Args:
         json_data: List of objects with note, duration, and cumulative_duration properties
         target_units: Target total duration in 8th note units
+        units_per_measure: Units in one measure to snap notes to barlines (optional)
         
     Returns:
         Scaled list of objects with note, duration, and cumulative_duration properties
     """
-    # Handle legacy format if needed
-    if json_data and isinstance(json_data[0], list):
-        # Convert from [note, duration] pairs to objects
-        new_data = []
-        for note, duration in json_data:
-            new_data.append({"note": note, "duration": duration, "cumulative_duration": 0})
-        json_data = new_data
-    
-    durations = [int(item["duration"]) for item in json_data]
-    total = sum(durations)
-    if total == 0:
-        return json_data
-
-    # Calculate proportional scaling with integer arithmetic
-    scaled = []
-    remainder = target_units
-    cumulative = 0
-    
-    for i, item in enumerate(json_data):
-        if i < len(json_data) - 1:
-            # Proportional allocation
-            portion = max(1, round(item["duration"] * target_units / total))
-            cumulative += portion
-            scaled.append({"note": item["note"], "duration": portion, "cumulative_duration": cumulative})
-            remainder -= portion
-        else:
-            # Last note gets all remaining units
-            portion = max(1, remainder)
-            cumulative += portion
-            scaled.append({"note": item["note"], "duration": portion, "cumulative_duration": cumulative})
-
-    return scaled
+    if not json_data:
+        return []
+    return scale_exercises([json_data], target_units, units_per_measure)[0]
 
 
 def safe_parse_json(text: str) -> Optional[List]:
     """
     Safely parse JSON from LLM outputs, handling common formatting issues.
     
+    Finds the first array of note objects or ``[note, duration]`` pairs,
+    tolerating code fences, surrounding prose and single-quoted strings.
+    Runs in linear time on any input (see parsing.find_note_array).
+    
     Args:
         text: JSON string to parse
         
     Returns:
         Parsed JSON data or None if parsing fails
     """
-    try:
-        text = text.replace("'", '"')
-        # Try to match array of objects format first
-        match = re.search(r"\[(\s*\{.*?\}\s*,?)*\]", text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-        # Fall back to array of arrays format for backward compatibility
-        match = re.search(r"\[(\s*\[.*?\]\s*,?)*\]", text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-        return json.loads(text)
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}\nRaw text: {text}")
-        return None
+    parsed = find_note_array(text)
+    if parsed is None:
+        preview = text if len(text) <= 200 else text[:200] + "..."
+        print(f"JSON parsing error: no array of notes found\nRaw text: {preview}")
+    return parsed
 
 
-def get_style_based_on_level(level: str) -> str:
+def get_style_based_on_level(level: str, rng: Optional[random.Random] = None) -> str:
     """
     Get a random musical style appropriate for the given difficulty level.
     
     Args:
         level: Difficulty level (Beginner, Intermediate, Advanced)
+        rng: Optional random generator (uses the global one if not provided)
         
     Returns:
         A style description string
@@ -104,15 +98,16 @@ def get_style_based_on_level(level: str) -> str:
         "Intermediate": ["jazzy", "bluesy", "march-like", "syncopated"],
         "Advanced": ["technical", "chromatic", "fast arpeggios", "wide intervals"],
     }
-    return random.choice(styles.get(level, ["technical"]))
+    return (rng or random).choice(styles.get(level, ["technical"]))
 
 
-def get_technique_based_on_level(level: str) -> str:
+def get_technique_based_on_level(level: str, rng: Optional[random.Random] = None) -> str:
     """
     Get a random technique appropriate for the given difficulty level.
     
     Args:
         level: Difficulty level (Beginner, Intermediate, Advanced)
+        rng: Optional random generator (uses the global one if not provided)
         
     Returns:
         A technique description string
@@ -122,68 +117,78 @@ def get_technique_based_on_level(level: str) -> str:
         "Intermediate": ["with slurs", "with accents", "using triplets"],
         "Advanced": ["with double tonguing", "with extreme registers", "complex rhythms"],
     }
-    return random.choice(techniques.get(level, ["with slurs"]))
+    return (rng or random).choice(techniques.get(level, ["with slurs"]))
 
 
 def get_fallback_exercise(instrument: str, level: str, key: str,
-                          time_sig: str, measures: int) -> str:
+                          time_sig: str, measures: int, seed: Optional[int] = None) -> str:
     """
     Generate a fallback exercise when LLM generation fails.
     
+    Uses the offline procedural engine (see procedural.py).
+    
     Args:
         instrument: Target instrument
         level: Difficulty level
         key: Musical key
         time_sig: Time signature (e.g., "4/4")
         measures: Number of measures
+        seed: Optional seed making the exercise reproducible
         
     Returns:
         JSON string with fallback exercise
     """
-    instrument_patterns = {
-        "Trumpet": ["C4", "D4", "E4", "G4", "E4", "C4"],
-        "Piano": ["C4", "E4", "G4", "C5", "G4", "E4"],
-        "Violin": ["G4", "A4", "B4", "D5", "B4", "G4"],
-        "Clarinet": ["E4", "F4", "G4", "Bb4", "G4", "E4"],
-        "Flute": ["A4", "B4", "C5", "E5", "C5", "A4"],
-    }
-    pattern = instrument_patterns.get(instrument, instrument_patterns["Trumpet"])
-    numerator, denominator = map(int, time_sig.split('/'))
+    return json.dumps(generate_procedural_exercise(instrument, level, key, time_sig, measures, seed))
+
 
-    # Calculate units based on 8th notes
-    units_per_measure = numerator * (8 // denominator)  # 8th notes per measure
-    target_units = measures * units_per_measure
-    notes, durs = [], []
-    i = 0
-
-    # Use quarter notes (2 units) as base duration
-    while sum(durs) < target_units:
-        notes.append(pattern[i % len(pattern)])
-        # Use quarter notes (2 units) by default
-        durs.append(2)
-        i += 1
-
-    # Adjust last duration to match total exactly
-    total_units = sum(durs)
-    if total_units > target_units:
-        durs[-1] = durs[-1] - (total_units - target_units)
-    elif total_units < target_units:
-        durs[-1] = durs[-1] + (target_units - total_units)
+def uses_procedural_engine(engine: str, level: str, custom_prompt: str = "") -> bool:
+    """
+    Decide whether an exercise is generated locally instead of by the LLM.
     
-    # Create objects with cumulative_duration
-    result = []
-    cumulative = 0
-    for n, d in zip(notes, durs):
-        cumulative += d
-        result.append({"note": n, "duration": d, "cumulative_duration": cumulative})
+    Args:
+        engine: "llm", "procedural", or "auto" (procedural for PROCEDURAL_LEVELS
+            without a custom prompt, the LLM otherwise)
+        level: Difficulty level
+        custom_prompt: Optional custom prompt (only the LLM can follow one)
+        
+    Returns:
+        True if the procedural engine should be used
+        
+    Raises:
+        ValueError: If the engine is unknown
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine} (expected one of {', '.join(ENGINES)})")
+    if engine == "auto":
+        return level in PROCEDURAL_LEVELS and not custom_prompt.strip()
+    return engine == "procedural"
 
-    return json.dumps(result)
+
+def max_output_tokens(time_sig: str, measures: int, wire_format: str = DEFAULT_WIRE_FORMAT) -> int:
+    """
+    Size the completion budget so even an exercise of only 8th notes fits.
+    
+    Args:
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+        wire_format: "json" or "compact"
+        
+    Returns:
+        max_tokens for the request
+    """
+    numerator, denominator = map(int, time_sig.split('/'))
+    max_notes = measures * numerator * (8 // denominator)
+    tokens = max_notes * WIRE_FORMAT_TOKENS_PER_NOTE[wire_format] + MAX_TOKENS_OVERHEAD
+    if wire_format == "compact":
+        tokens += measures * WIRE_FORMAT_TOKENS_PER_MEASURE
+    return tokens
 
 
-def query_mistral(prompt: str, instrument: str, level: str, key: str,
-                  time_sig: str, measures: int, api_key: Optional[str] = None) -> str:
+def build_mistral_payload(prompt: str, instrument: str, level: str, key: str,
+                          time_sig: str, measures: int, seed: Optional[int] = None,
+                          wire_format: str = DEFAULT_WIRE_FORMAT) -> Dict[str, Any]:
     """
-    Query Mistral API to generate a music exercise.
+    Build the chat-completions request body for a music exercise.
     
     Args:
         prompt: Custom prompt or empty string for default
@@ -192,22 +197,18 @@ def query_mistral(prompt: str, instrument: str, level: str, key: str,
         key: Musical key
         time_sig: Time signature (e.g., "4/4")
         measures: Number of measures
-        api_key: Optional API key (uses env var if not provided)
+        seed: Optional seed making the prompt and the model's sampling reproducible
+        wire_format: "json" for note objects, or "compact" for ``C4:2 E4:2 G4:4 |``
+            text (about a sixth of the output tokens)
         
     Returns:
-        JSON string with generated exercise
+        Request payload dictionary
         
     Raises:
-        Exception: If API call fails and fallback is used
+        ValueError: If the wire format is unknown
     """
-    api_key = api_key or MISTRAL_API_KEY
-    if not api_key:
-        raise ValueError("No Mistral API key provided. Set MISTRAL_API_KEY environment variable.")
-        
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+    if wire_format not in WIRE_FORMATS:
+        raise ValueError(f"Unknown wire format: {wire_format} (expected one of {', '.join(WIRE_FORMATS)})")
     numerator, denominator = map(int, time_sig.split('/'))
 
     # Calculate total required 8th notes
@@ -225,7 +226,24 @@ def query_mistral(prompt: str, instrument: str, level: str, key: str,
         "Create customized exercises using INTEGER durations representing 8th notes."
     )
 
-    if prompt.strip():
+    if wire_format == "compact":
+        output_rules = (
+            "Output ONLY the notes as NOTE:DURATION separated by spaces, with | after every measure. "
+            "Use standard note names (e.g., Bb4, F#5). Monophonic only. "
+            "Durations: 1=8th, 2=quarter, 4=half, 8=whole. No JSON, no prose.\n\n"
+            "Example format:\nC4:2 E4:2 G4:4 | C5:8 |"
+        )
+        if prompt.strip():
+            user_prompt = f"{prompt} {duration_constraint} {output_rules}"
+        else:
+            rng = random.Random(seed) if seed is not None else None
+            style = get_style_based_on_level(level, rng)
+            technique = get_technique_based_on_level(level, rng)
+            user_prompt = (
+                f"Create a {style} {instrument.lower()} exercise in {key} with {time_sig} time signature "
+                f"{technique} for a {level.lower()} player. {duration_constraint} {output_rules}"
+            )
+    elif prompt.strip():
         user_prompt = (
             f"{prompt} {duration_constraint} Output ONLY a JSON array of objects with note, duration, and cumulative_duration properties.\n\n"
             "Example format:\n"
@@ -235,8 +253,9 @@ def query_mistral(prompt: str, instrument: str, level: str, key: str,
             "{\"note\": \"C5\", \"duration\": 8, \"cumulative_duration\": 16}\n]"
         )
     else:
-        style = get_style_based_on_level(level)
-        technique = get_technique_based_on_level(level)
+        rng = random.Random(seed) if seed is not None else None
+        style = get_style_based_on_level(level, rng)
+        technique = get_technique_based_on_level(level, rng)
         user_prompt = (
             f"Create a {style} {instrument.lower()} exercise in {key} with {time_sig} time signature "
             f"{technique} for a {level.lower()} player. {duration_constraint} "
@@ -279,34 +298,442 @@ def query_mistral(prompt: str, instrument: str, level: str, key: str,
             {"role": "user", "content": user_prompt},
         ],
         "temperature": 0.7 if level == "Advanced" else 0.5,
-        "max_tokens": 1000,
+        "max_tokens": max_output_tokens(time_sig, measures, wire_format),
         "top_p": 0.95,
         "frequency_penalty": 0.2,
         "presence_penalty": 0.2,
-        "response_format": json_schema
     }
+    if wire_format == "json":
+        payload["response_format"] = json_schema
+    if seed is not None:
+        payload["random_seed"] = seed
+    return payload
 
-    try:
-        response = requests.post(MISTRAL_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        return content.replace("```json", "").replace("```", "").strip()
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 429:
+
+def _strip_code_fences(content: str) -> str:
+    """Remove markdown code fences the model sometimes wraps around its output."""
+    return content.replace("```json", "").replace("```", "").strip()
+
+
+def _decode_content(content: str, wire_format: str) -> str:
+    """Convert compact output to a JSON note array; JSON output (or undecodable text) is returned as-is."""
+    if wire_format == "compact":
+        notes = parse_compact(content)
+        if notes:
+            return json.dumps(notes)
+    return content
+
+
+def _fallback_for_error(error: Exception, instrument: str, level: str, key: str,
+                        time_sig: str, measures: int) -> str:
+    """
+    Report a failed Mistral query and return a fallback exercise instead.
+    
+    Args:
+        error: Exception raised while querying the API
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+        
+    Returns:
+        JSON string with fallback exercise
+    """
+    if isinstance(error, CircuitOpenError):
+        print("Mistral API circuit breaker is open. Using fallback exercise.")
+    elif isinstance(error, requests.exceptions.HTTPError):
+        if error.response is not None and error.response.status_code == 429:
             print(f"Rate limit exceeded for Mistral API. Using fallback exercise.")
         else:
-            print(f"Error querying Mistral API: {e}")
-        return get_fallback_exercise(instrument, level, key, time_sig, measures)
-    except requests.exceptions.RequestException as e:
-        print(f"Network error querying Mistral API: {e}")
-        return get_fallback_exercise(instrument, level, key, time_sig, measures)
-    except (KeyError, IndexError) as e:
-        print(f"Error parsing Mistral API response: {e}")
-        return get_fallback_exercise(instrument, level, key, time_sig, measures)
+            print(f"Error querying Mistral API: {error}")
+    elif isinstance(error, requests.exceptions.RequestException):
+        print(f"Network error querying Mistral API: {error}")
+    else:
+        print(f"Error parsing Mistral API response: {error}")
+    return get_fallback_exercise(instrument, level, key, time_sig, measures)
+
+
+# Errors after which query_mistral falls back to a local exercise
+QUERY_ERRORS = (requests.exceptions.RequestException, KeyError, IndexError)
+
+
+def _cache_key(payload: Dict[str, Any], prompt: str, instrument: str, level: str, key: str,
+               time_sig: str, measures: int, seed: Optional[int]) -> str:
+    """Build the response-cache key for a request payload."""
+    return ExerciseCache.make_key(instrument, level, key, time_sig, measures, prompt,
+                                  payload["model"], payload["temperature"], seed)
+
+
+def _response_cache(cache: Optional[ExerciseCache], seed: Optional[int]) -> Optional[ExerciseCache]:
+    """
+    Return the cache a request may use.
+
+    Only seeded requests are reproducible; an unseeded request asks for a
+    new exercise, so it is never answered from (or written to) the cache.
+    """
+    if seed is None:
+        return None
+    return cache or get_default_cache()
+
+
+def _store_in_cache(cache: ExerciseCache, cache_key: str, content: str) -> None:
+    """Cache a completion, skipping output that does not parse as an exercise."""
+    if safe_parse_json(content):
+        cache.put(cache_key, content)
+
+
+def query_mistral(prompt: str, instrument: str, level: str, key: str,
+                  time_sig: str, measures: int, api_key: Optional[str] = None,
+                  client: Optional[Union[MistralClient, RequestScheduler, Hedger]] = None, seed: Optional[int] = None,
+                  cache: Optional[ExerciseCache] = None, hedge: bool = False,
+                  wire_format: str = DEFAULT_WIRE_FORMAT,
+                  breaker: Optional[CircuitBreaker] = None,
+                  deadline: Optional[float] = None) -> str:
+    """
+    Query Mistral API to generate a music exercise.
+    
+    Args:
+        prompt: Custom prompt or empty string for default
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+        api_key: Optional API key (uses env var if not provided)
+        client: Optional HTTP client, scheduler or hedger (uses the shared rate-limited scheduler if not provided)
+        seed: Optional seed for reproducible prompts and sampling
+        cache: Optional response cache (uses the shared cache if not provided;
+            only seeded requests are cached)
+        hedge: Send a backup request when the answer is slow (uses the shared hedger if no client is provided)
+        wire_format: Format the model answers in ("json" or "compact"); compact
+            answers are decoded locally, so a JSON string is returned either way
+        breaker: Optional circuit breaker (the shared breaker guards the default
+            backend when no client is provided); while it is open the fallback
+            exercise is returned without calling the API
+        deadline: Optional seconds the caller can wait for the API (including
+            queueing and retries); the fallback exercise is returned once it passes
+        
+    Returns:
+        JSON string with generated exercise
+        
+    Raises:
+        Exception: If API call fails and fallback is used
+    """
+    api_key = api_key or MISTRAL_API_KEY
+    if not api_key:
+        raise ValueError("No Mistral API key provided. Set MISTRAL_API_KEY environment variable.")
+
+    payload = build_mistral_payload(prompt, instrument, level, key, time_sig, measures, seed, wire_format)
+    cache = _response_cache(cache, seed)
+    if cache is not None:
+        cache_key = _cache_key(payload, prompt, instrument, level, key, time_sig, measures, seed)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+    if breaker is None and client is None:
+        breaker = get_default_breaker()
+    client = client or (get_default_hedger() if hedge else get_default_scheduler())
+
+    def send() -> str:
+        return chat_completion_within(client, payload, api_key, deadline)
+
+    try:
+        content = _decode_content(_strip_code_fences(breaker.call(send, deadline) if breaker else send()),
+                                  wire_format)
+    except QUERY_ERRORS as e:
+        return _fallback_for_error(e, instrument, level, key, time_sig, measures)
+    if cache is not None:
+        _store_in_cache(cache, cache_key, content)
+    return content
+
+
+async def query_mistral_async(prompt: str, instrument: str, level: str, key: str,
+                              time_sig: str, measures: int, client: AsyncMistralClient,
+                              api_key: Optional[str] = None, seed: Optional[int] = None,
+                              cache: Optional[ExerciseCache] = None,
+                              scheduler: Optional[RequestScheduler] = None,
+                              hedger: Optional[Hedger] = None,
+                              wire_format: str = DEFAULT_WIRE_FORMAT,
+                              breaker: Optional[CircuitBreaker] = None) -> str:
+    """
+    Query Mistral API from an asyncio event loop.
+    
+    Behaves like query_mistral, including the fallback exercise on errors.
+    
+    Args:
+        prompt: Custom prompt or empty string for default
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+        client: Async HTTP client owned by the running event loop
+        api_key: Optional API key (uses env var if not provided)
+        seed: Optional seed for reproducible prompts and sampling
+        cache: Optional response cache (uses the shared cache if not provided;
+            only seeded requests are cached)
+        scheduler: Optional request scheduler (uses the shared scheduler if not provided)
+        hedger: Optional hedger sending a backup request when the answer is slow
+        wire_format: Format the model answers in ("json" or "compact")
+        breaker: Optional circuit breaker; while it is open the fallback exercise
+            is returned without calling the API
+        
+    Returns:
+        JSON string with generated exercise
+    """
+    api_key = api_key or MISTRAL_API_KEY
+    if not api_key:
+        raise ValueError("No Mistral API key provided. Set MISTRAL_API_KEY environment variable.")
+
+    payload = build_mistral_payload(prompt, instrument, level, key, time_sig, measures, seed, wire_format)
+    cache = _response_cache(cache, seed)
+    if cache is not None:
+        cache_key = _cache_key(payload, prompt, instrument, level, key, time_sig, measures, seed)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    scheduler = scheduler or get_default_scheduler()
+
+    def send():
+        return scheduler.execute_async(lambda: client.chat_completion(payload, api_key), estimate_tokens(payload))
+
+    def attempt():
+        return hedger.run_async(send) if hedger else send()
+
+    try:
+        content = _decode_content(_strip_code_fences(await (breaker.call_async(attempt) if breaker else attempt())),
+                                  wire_format)
+    except QUERY_ERRORS as e:
+        return _fallback_for_error(e, instrument, level, key, time_sig, measures)
+    if cache is not None:
+        _store_in_cache(cache, cache_key, content)
+    return content
+
+
+def _note_from_element(item: Any) -> Optional[Dict[str, Any]]:
+    """Convert one parsed array element into a note object, or None if it is malformed."""
+    from .theory import clean_note_string
+    note = as_note(item)
+    if note is None:
+        return None
+    return {"note": clean_note_string(note.note), "duration": max(1, note.duration)}
+
+
+def _stream_elements(deltas: Iterator[str],
+                     parser: Union[IncrementalNoteParser, IncrementalCompactParser]) -> Iterator[Any]:
+    """Feed streamed text to the parser, yielding elements until the output ends or turns invalid."""
+    for delta in deltas:
+        yield from parser.feed(delta)
+        if parser.done or parser.invalid:
+            return
+    yield from parser.close()
+
+
+def stream_exercise(prompt: str, instrument: str, level: str, key: str,
+                    time_sig: str, measures: int, api_key: Optional[str] = None,
+                    client: Optional[MistralClient] = None,
+                    scheduler: Optional[RequestScheduler] = None,
+                    seed: Optional[int] = None,
+                    cache: Optional[ExerciseCache] = None,
+                    wire_format: str = DEFAULT_WIRE_FORMAT,
+                    breaker: Optional[CircuitBreaker] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream an exercise from Mistral, yielding each note as soon as it arrives.
+    
+    The completion is consumed as a server-sent event stream and parsed
+    incrementally. The stream is aborted as soon as the running duration
+    reaches the required total (the last note is shortened to fit) or the
+    output stops being a valid JSON array (or compact note list). If nothing usable arrives, the
+    fallback exercise is yielded instead. A stream that ends short of the
+    required total is passed through as-is.
+    
+    Args:
+        prompt: Custom prompt or empty string for default
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+        api_key: Optional API key (uses env var if not provided)
+        client: Optional HTTP client (uses the scheduler's client if not provided)
+        scheduler: Optional request scheduler (uses the shared scheduler if not provided)
+        seed: Optional seed for reproducible prompts and sampling
+        cache: Optional response cache (uses the shared cache if not provided;
+            only seeded requests are cached)
+        wire_format: Format the model answers in ("json" or "compact")
+        breaker: Optional circuit breaker guarding the stream request (the shared
+            breaker is used when neither client nor scheduler is provided)
+        
+    Yields:
+        Objects with note, duration, and cumulative_duration properties
+    """
+    api_key = api_key or MISTRAL_API_KEY
+    if not api_key:
+        raise ValueError("No Mistral API key provided. Set MISTRAL_API_KEY environment variable.")
+
+    numerator, denominator = map(int, time_sig.split('/'))
+    required_total = measures * numerator * (8 // denominator)
+    payload = build_mistral_payload(prompt, instrument, level, key, time_sig, measures, seed, wire_format)
+
+    cache = _response_cache(cache, seed)
+    if cache is not None:
+        cache_key = _cache_key(payload, prompt, instrument, level, key, time_sig, measures, seed)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            yield from finalize_exercise(cached, instrument, level, key, time_sig, measures)
+            return
+
+    if breaker is None and client is None and scheduler is None:
+        breaker = get_default_breaker()
+    scheduler = scheduler or get_default_scheduler()
+    client = client or scheduler.client
+    parser = IncrementalCompactParser() if wire_format == "compact" else IncrementalNoteParser()
+    notes: List[Dict[str, Any]] = []
+    cumulative = 0
+
+    try:
+        def open_stream():
+            return scheduler.execute(
+                lambda remaining: client.open_stream(payload, api_key, timeout=scheduler.request_timeout(remaining)),
+                estimate_tokens(payload))
+
+        response = breaker.call(open_stream) if breaker else open_stream()
+        deltas = iter_stream_content(response)
+        try:
+            for item in _stream_elements(deltas, parser):
+                note = _note_from_element(item)
+                if note is None:
+                    parser.invalid = True
+                    break
+                note["duration"] = min(note["duration"], required_total - cumulative)
+                cumulative += note["duration"]
+                note["cumulative_duration"] = cumulative
+                notes.append(note)
+                yield note
+                if cumulative >= required_total:
+                    break
+        finally:
+            deltas.close()  # Closing the stream stops token generation upstream
+    except QUERY_ERRORS as e:
+        if notes:
+            print(f"Mistral stream interrupted after {len(notes)} notes: {e}")
+            return
+        yield from json.loads(_fallback_for_error(e, instrument, level, key, time_sig, measures))
+        return
+
+    if parser.invalid:
+        print(f"Invalid output in Mistral stream, stopped after {len(notes)} notes")
+    if not notes:
+        print("Mistral stream produced no notes, using fallback")
+        yield from json.loads(get_fallback_exercise(instrument, level, key, time_sig, measures))
+    elif cache is not None and cumulative == required_total:
+        cache.put(cache_key, json.dumps(notes))
+
+
+def finalize_exercise(output: str, instrument: str, level: str, key: str,
+                      time_signature: str, measures: int) -> List[Dict[str, Any]]:
+    """
+    Turn raw LLM output into a cleaned exercise with exact measure totals.
+    
+    Falls back to a local exercise if the output cannot be parsed.
+    
+    Args:
+        output: Text returned by query_mistral
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_signature: Time signature (e.g., "4/4")
+        measures: Number of measures
+        
+    Returns:
+        List of objects with note, duration, and cumulative_duration properties
+    """
+    parsed = safe_parse_json(output)
+    
+    if not parsed:
+        print("Primary parsing failed, using fallback")
+        fallback_str = get_fallback_exercise(instrument, level, key, time_signature, measures)
+        parsed = safe_parse_json(fallback_str)
+        if not parsed:
+            print("Fallback parsing failed, using ultimate fallback")
+            # Ultimate fallback: simple scale based on selected key
+            key_notes = {
+                "C Major": ["C4", "D4", "E4", "F4", "G4", "A4", "B4", "C5"],
+                "G Major": ["G3", "A3", "B3", "C4", "D4", "E4", "F#4", "G4"],
+                "D Major": ["D4", "E4", "F#4", "G4", "A4", "B4", "C#5", "D5"],
+                "F Major": ["F3", "G3", "A3", "Bb3", "C4", "D4", "E4", "F4"],
+                "Bb Major": ["Bb3", "C4", "D4", "Eb4", "F4", "G4", "A4", "Bb4"],
+                "A Minor": ["A3", "B3", "C4", "D4", "E4", "F4", "G4", "A4"],
+                "E Minor": ["E3", "F#3", "G3", "A3", "B3", "C4", "D4", "E4"],
+            }
+            notes = key_notes.get(key, key_notes["C Major"])
+            numerator, denominator = map(int, time_signature.split('/'))
+            units_per_measure = numerator * (8 // denominator)
+            target_units = measures * units_per_measure
+            note_duration = max(1, target_units / len(notes))
+            
+            # Create objects with cumulative_duration
+            parsed = []
+            cumulative = 0
+            for note in notes:
+                duration = int(note_duration)
+                cumulative += duration
+                parsed.append({"note": note, "duration": duration, "cumulative_duration": cumulative})
+            
+            # Adjust last note to match total duration
+            total = sum(item["duration"] for item in parsed)
+            if total < target_units:
+                parsed[-1]["duration"] += target_units - total
+                parsed[-1]["cumulative_duration"] += target_units - total
+            elif total > target_units:
+                parsed[-1]["duration"] -= total - target_units
+                parsed[-1]["cumulative_duration"] -= total - target_units
+
+    # Handle potential legacy format ([note, duration] pairs)
+    if parsed and isinstance(parsed[0], list):
+        # Convert from [note, duration] pairs to objects with cumulative_duration
+        new_parsed = []
+        cumulative = 0
+        for note, duration in parsed:
+            cumulative += duration
+            new_parsed.append({"note": note, "duration": duration, "cumulative_duration": cumulative})
+        parsed = new_parsed
+
+    # Clean note strings to remove ornamentation
+    from .theory import clean_note_string
+    for item in parsed:
+        item["note"] = clean_note_string(item["note"])
+
+    # Calculate total required 8th notes
+    numerator, denominator = map(int, time_signature.split('/'))
+    units_per_measure = numerator * (8 // denominator)
+    total_units = measures * units_per_measure
+
+    # Strict scaling
+    parsed_scaled = scale_json_durations(parsed, total_units)
+    
+    return parsed_scaled
+
+
+def _request_key(instrument: str, level: str, key: str, time_signature: str, measures: int,
+                 custom_prompt: str, api_key: Optional[str], seed: Optional[int],
+                 wire_format: str) -> Tuple[Any, ...]:
+    """Identity of an LLM exercise request; identical in-flight requests are coalesced."""
+    return (instrument, level, key, time_signature, measures, custom_prompt.strip(),
+            api_key or MISTRAL_API_KEY, seed, wire_format)
 
 
 def generate_exercise(instrument: str, level: str, key: str, time_signature: str,
-                      measures: int, custom_prompt: str = "", api_key: Optional[str] = None) -> List[Dict[str, Any]]:
+                      measures: int, custom_prompt: str = "", api_key: Optional[str] = None,
+                      client: Optional[Union[MistralClient, RequestScheduler, Hedger]] = None,
+                      seed: Optional[int] = None, hedge: bool = False,
+                      inventory: Optional[ExerciseInventory] = None,
+                      engine: str = DEFAULT_ENGINE,
+                      wire_format: str = DEFAULT_WIRE_FORMAT,
+                      coalesce: bool = True,
+                      deadline: Optional[float] = None) -> List[Dict[str, Any]]:
     """
     Generate a music exercise with proper error handling.
     
@@ -318,6 +745,18 @@ def generate_exercise(instrument: str, level: str, key: str, time_signature: str
         measures: Number of measures
         custom_prompt: Optional custom prompt
         api_key: Optional API key
+        client: Optional HTTP client, scheduler or hedger shared across calls
+        seed: Optional seed for reproducible generation
+        hedge: Send a backup request when the LLM answer is slow
+        inventory: Optional pool of pre-generated exercises to serve from first
+            (not used with a custom prompt or a seed)
+        engine: "llm", "procedural" (offline, ignores custom_prompt) or "auto"
+            (see uses_procedural_engine)
+        wire_format: Format the LLM answers in ("json" or the token-efficient "compact")
+        coalesce: Share the result of an identical LLM request already in flight
+            (from another thread or task) instead of sending a new one
+        deadline: Optional seconds allowed for the LLM answer; the fallback
+            exercise is used when it passes
         
     Returns:
         List of objects with note, duration, and cumulative_duration properties
@@ -325,74 +764,94 @@ def generate_exercise(instrument: str, level: str, key: str, time_signature: str
     Raises:
         ValueError: If parameters are invalid
     """
-    try:
+    if uses_procedural_engine(engine, level, custom_prompt):
+        return generate_procedural_exercise(instrument, level, key, time_signature, measures, seed)
+    if inventory is not None and not custom_prompt.strip() and seed is None:
+        exercise = inventory.take(instrument, level, key, time_signature, measures)
+        if exercise is not None:
+            return exercise
+
+    def generate() -> List[Dict[str, Any]]:
         # Query LLM for exercise
-        output = query_mistral(custom_prompt, instrument, level, key, time_signature, measures, api_key)
-        parsed = safe_parse_json(output)
-        
-        if not parsed:
-            print("Primary parsing failed, using fallback")
-            fallback_str = get_fallback_exercise(instrument, level, key, time_signature, measures)
-            parsed = safe_parse_json(fallback_str)
-            if not parsed:
-                print("Fallback parsing failed, using ultimate fallback")
-                # Ultimate fallback: simple scale based on selected key
-                key_notes = {
-                    "C Major": ["C4", "D4", "E4", "F4", "G4", "A4", "B4", "C5"],
-                    "G Major": ["G3", "A3", "B3", "C4", "D4", "E4", "F#4", "G4"],
-                    "D Major": ["D4", "E4", "F#4", "G4", "A4", "B4", "C#5", "D5"],
-                    "F Major": ["F3", "G3", "A3", "Bb3", "C4", "D4", "E4", "F4"],
-                    "Bb Major": ["Bb3", "C4", "D4", "Eb4", "F4", "G4", "A4", "Bb4"],
-                    "A Minor": ["A3", "B3", "C4", "D4", "E4", "F4", "G4", "A4"],
-                    "E Minor": ["E3", "F#3", "G3", "A3", "B3", "C4", "D4", "E4"],
-                }
-                notes = key_notes.get(key, key_notes["C Major"])
-                numerator, denominator = map(int, time_signature.split('/'))
-                units_per_measure = numerator * (8 // denominator)
-                target_units = measures * units_per_measure
-                note_duration = max(1, target_units / len(notes))
-                
-                # Create objects with cumulative_duration
-                parsed = []
-                cumulative = 0
-                for note in notes:
-                    duration = int(note_duration)
-                    cumulative += duration
-                    parsed.append({"note": note, "duration": duration, "cumulative_duration": cumulative})
-                
-                # Adjust last note to match total duration
-                total = sum(item["duration"] for item in parsed)
-                if total < target_units:
-                    parsed[-1]["duration"] += target_units - total
-                    parsed[-1]["cumulative_duration"] += target_units - total
-                elif total > target_units:
-                    parsed[-1]["duration"] -= total - target_units
-                    parsed[-1]["cumulative_duration"] -= total - target_units
-
-        # Handle potential legacy format ([note, duration] pairs)
-        if parsed and isinstance(parsed[0], list):
-            # Convert from [note, duration] pairs to objects with cumulative_duration
-            new_parsed = []
-            cumulative = 0
-            for note, duration in parsed:
-                cumulative += duration
-                new_parsed.append({"note": note, "duration": duration, "cumulative_duration": cumulative})
-            parsed = new_parsed
+        output = query_mistral(custom_prompt, instrument, level, key, time_signature, measures, api_key,
+                               client=client, seed=seed, hedge=hedge, wire_format=wire_format,
+                               deadline=deadline)
+        return finalize_exercise(output, instrument, level, key, time_signature, measures)
 
-        # Clean note strings to remove ornamentation
-        from .theory import clean_note_string
-        for item in parsed:
-            item["note"] = clean_note_string(item["note"])
+    try:
+        if not coalesce:
+            return generate()
+        request_key = _request_key(instrument, level, key, time_signature, measures, custom_prompt,
+                                   api_key, seed, wire_format)
+        try:
+            return get_default_single_flight().do(request_key, generate, timeout=deadline)
+        except TimeoutError:
+            # An identical request is still in flight but this caller's budget ran out
+            print("Deadline passed while waiting for an identical request. Using fallback exercise.")
+            fallback = get_fallback_exercise(instrument, level, key, time_signature, measures)
+            return finalize_exercise(fallback, instrument, level, key, time_signature, measures)
+    except Exception as e:
+        print(f"Error generating exercise: {e}")
+        raise
 
-        # Calculate total required 8th notes
-        numerator, denominator = map(int, time_signature.split('/'))
-        units_per_measure = numerator * (8 // denominator)
-        total_units = measures * units_per_measure
 
-        # Strict scaling
-        parsed_scaled = scale_json_durations(parsed, total_units)
+async def generate_exercise_async(instrument: str, level: str, key: str, time_signature: str,
+                                  measures: int, custom_prompt: str = "", api_key: Optional[str] = None,
+                                  client: Optional[AsyncMistralClient] = None,
+                                  seed: Optional[int] = None, hedge: bool = False,
+                                  engine: str = DEFAULT_ENGINE,
+                                  wire_format: str = DEFAULT_WIRE_FORMAT,
+                                  coalesce: bool = True,
+                                  breaker: Optional[CircuitBreaker] = None) -> List[Dict[str, Any]]:
+    """
+    Generate a music exercise from an asyncio event loop.
+    
+    Args:
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_signature: Time signature (e.g., "4/4")
+        measures: Number of measures
+        custom_prompt: Optional custom prompt
+        api_key: Optional API key
+        client: Optional async HTTP client (a temporary one is opened if not provided)
+        seed: Optional seed for reproducible generation
+        hedge: Send a backup request when the LLM answer is slow (uses the shared hedger)
+        engine: "llm", "procedural" (offline, ignores custom_prompt) or "auto"
+            (see uses_procedural_engine)
+        wire_format: Format the LLM answers in ("json" or the token-efficient "compact")
+        coalesce: Share the result of an identical LLM request already in flight
+            (from another task or thread) instead of sending a new one
+        breaker: Optional circuit breaker (the shared breaker guards the default
+            backend when no client is provided)
         
-        return parsed_scaled
+    Returns:
+        List of objects with note, duration, and cumulative_duration properties
+    """
+    if uses_procedural_engine(engine, level, custom_prompt):
+        return generate_procedural_exercise(instrument, level, key, time_signature, measures, seed)
+    hedger = get_default_hedger() if hedge else None
+    if breaker is None and client is None:
+        breaker = get_default_breaker()
+
+    async def generate() -> List[Dict[str, Any]]:
+        if client is None:
+            async with AsyncMistralClient() as own_client:
+                output = await query_mistral_async(custom_prompt, instrument, level, key, time_signature,
+                                                   measures, own_client, api_key, seed, hedger=hedger,
+                                                   wire_format=wire_format, breaker=breaker)
+        else:
+            output = await query_mistral_async(custom_prompt, instrument, level, key, time_signature,
+                                               measures, client, api_key, seed, hedger=hedger,
+                                               wire_format=wire_format, breaker=breaker)
+        return finalize_exercise(output, instrument, level, key, time_signature, measures)
+
+    try:
+        if not coalesce:
+            return await generate()
+        request_key = _request_key(instrument, level, key, time_signature, measures, custom_prompt,
+                                   api_key, seed, wire_format)
+        return await get_default_single_flight().do_async(request_key, generate)
     except Exception as e:
         print(f"Error generating exercise: {e}")
-        raise
\ No newline at end of file
+        raise
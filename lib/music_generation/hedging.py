@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+"""
+Request Hedging
+=============
+Tail-latency hedging for Mistral API requests.
+
+When a request has not answered within a percentile of recently observed
+latencies, a second identical request is sent and whichever answers first
+wins. A cap on extra in-flight requests keeps hedging from amplifying load
+when the upstream is slow for everyone.
+"""
+
+import time
+import queue
+import asyncio
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+
+from .scheduler import RequestScheduler, get_default_scheduler, chat_completion_within
+from .constants import (
+    HEDGE_PERCENTILE,
+    HEDGE_WINDOW,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_INITIAL_DELAY,
+    HEDGE_MIN_DELAY,
+    HEDGE_MAX_EXTRA_IN_FLIGHT,
+)
+
+
+class LatencyTracker:
+    """Thread-safe sliding window of recent request latencies."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        """Add one latency sample in seconds."""
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Return a percentile of the window (nearest-rank).
+
+        Args:
+            percent: Percentile between 0 and 100
+
+        Returns:
+            Latency in seconds, or None if no samples were recorded
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = min(len(samples) - 1, max(0, int(round(percent / 100.0 * len(samples))) - 1))
+        return samples[rank]
+
+
+class Hedger:
+    """
+    Sends a backup copy of slow requests and keeps the first answer.
+
+    Exposes the same ``chat_completion`` method as the client and the
+    scheduler, so it can be passed anywhere a client is accepted. Each copy
+    goes through the wrapped client, so hedges still respect the scheduler's
+    rate limits.
+
+    On the asyncio path the losing request is cancelled. On the blocking
+    path a request already sent cannot be interrupted, so the loser is
+    bounded instead: both copies share the request's deadline, and a loser
+    still queued in the scheduler or waiting to retry is abandoned without
+    being sent. Its answer, if any, is discarded.
+    """
+
+    def __init__(self, client: Optional[Any] = None,
+                 percentile: float = HEDGE_PERCENTILE,
+                 window: int = HEDGE_WINDOW,
+                 min_samples: int = HEDGE_MIN_SAMPLES,
+                 initial_delay: float = HEDGE_INITIAL_DELAY,
+                 min_delay: float = HEDGE_MIN_DELAY,
+                 max_extra_in_flight: int = HEDGE_MAX_EXTRA_IN_FLIGHT):
+        """
+        Create a hedger.
+
+        Args:
+            client: Client or scheduler to send requests with (uses the shared scheduler if not provided)
+            percentile: Latency percentile after which a hedge is sent
+            window: Number of recent latencies considered
+            min_samples: Samples needed before the percentile is trusted
+            initial_delay: Hedge delay in seconds until min_samples latencies were seen
+            min_delay: Lower bound of the hedge delay in seconds
+            max_extra_in_flight: Maximum hedge requests outstanding at once
+        """
+        self._client = client
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_extra_in_flight = max_extra_in_flight
+        self.latencies = LatencyTracker(window)
+        self._lock = threading.Lock()
+        self._extra_in_flight = 0
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._hedges_skipped = 0
+
+    @property
+    def client(self) -> Any:
+        return self._client or get_default_scheduler()
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first answer before sending a hedge."""
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _try_acquire_extra(self) -> bool:
+        """Reserve a hedge slot; counts the hedge or the skip."""
+        with self._lock:
+            if self._extra_in_flight >= self.max_extra_in_flight:
+                self._hedges_skipped += 1
+                return False
+            self._extra_in_flight += 1
+            self._hedged += 1
+            return True
+
+    def _release_extra(self) -> None:
+        with self._lock:
+            self._extra_in_flight -= 1
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+
+    def _count_win(self) -> None:
+        with self._lock:
+            self._hedge_wins += 1
+
+    # -------------------------------------------------------------------------
+    # Execution
+    # -------------------------------------------------------------------------
+    def run(self, call: Callable[[], Any], cancel: Optional[threading.Event] = None) -> Any:
+        """
+        Run a blocking call, hedging it if it is slower than the hedge delay.
+
+        Args:
+            call: Function sending the request; called once per copy
+            cancel: Optional event set when run returns, telling a copy that
+                is still running to give up
+
+        Returns:
+            Result of the first copy that succeeds
+
+        Raises:
+            Exception: The first error if every copy failed
+        """
+        try:
+            return self._run(call)
+        finally:
+            if cancel is not None:
+                cancel.set()
+
+    def _run(self, call: Callable[[], Any]) -> Any:
+        self._count_request()
+        outcomes = queue.Queue()
+
+        def attempt(index: int) -> None:
+            start = time.monotonic()
+            try:
+                value = call()
+            except Exception as e:
+                outcomes.put((index, None, e))
+            else:
+                self.latencies.record(time.monotonic() - start)
+                outcomes.put((index, value, None))
+            finally:
+                if index > 0:
+                    self._release_extra()
+
+        threading.Thread(target=attempt, args=(0,), daemon=True).start()
+        launched = 1
+        try:
+            outcome = outcomes.get(timeout=self.hedge_delay())
+        except queue.Empty:
+            outcome = None
+            if self._try_acquire_extra():
+                threading.Thread(target=attempt, args=(1,), daemon=True).start()
+                launched = 2
+
+        errors: List[Exception] = []
+        for _ in range(launched):
+            index, value, error = outcome if outcome is not None else outcomes.get()
+            outcome = None
+            if error is None:
+                if index > 0:
+                    self._count_win()
+                return value
+            errors.append(error)
+        raise errors[0]
+
+    async def run_async(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        asyncio counterpart of run; the losing copy is cancelled.
+
+        Args:
+            call: Coroutine function sending the request; called once per copy
+
+        Returns:
+            Result of the first copy that succeeds
+
+        Raises:
+            Exception: The primary's error if every copy failed
+        """
+        self._count_request()
+
+        async def attempt() -> Any:
+            start = time.monotonic()
+            value = await call()
+            self.latencies.record(time.monotonic() - start)
+            return value
+
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        hedge = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if not done and self._try_acquire_extra():
+                hedge = asyncio.ensure_future(attempt())
+                hedge.add_done_callback(lambda _: self._release_extra())
+                pending.add(hedge)
+
+            errors: Dict[asyncio.Future, BaseException] = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count_win()
+                        return task.result()
+                    errors[task] = task.exception()
+            raise errors.get(primary) or next(iter(errors.values()))
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def chat_completion(self, payload: Dict[str, Any], api_key: str,
+                        deadline: Optional[float] = None) -> str:
+        """
+        Run a chat completion, hedging it if it is slow.
+
+        Both copies share one deadline, so the loser never outlives the
+        request, and it is cancelled if the scheduler has not sent it yet.
+
+        Args:
+            payload: Request body
+            api_key: Mistral API key
+            deadline: Seconds allowed for the request, or None for the client's default
+
+        Returns:
+            Content of the first choice's message
+        """
+        client = self.client
+        if deadline is None and isinstance(client, RequestScheduler):
+            deadline = client.deadline
+        deadline_at = None if deadline is None else time.monotonic() + deadline
+        cancel = threading.Event()
+
+        def call() -> str:
+            remaining = None if deadline_at is None else deadline_at - time.monotonic()
+            return chat_completion_within(client, payload, api_key, remaining, cancel)
+
+        return self.run(call, cancel)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hedging counters.
+
+        Returns:
+            Dictionary with requests, hedged, hedge_wins, hedges_skipped,
+            hedge_rate, win_rate, extra_in_flight and the current hedge_delay
+        """
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "hedged": self._hedged,
+                "hedge_wins": self._hedge_wins,
+                "hedges_skipped": self._hedges_skipped,
+                "hedge_rate": self._hedged / self._requests if self._requests else 0.0,
+                "win_rate": self._hedge_wins / self._hedged if self._hedged else 0.0,
+                "extra_in_flight": self._extra_in_flight,
+                "hedge_delay": delay,
+            }
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared hedger
+# -----------------------------------------------------------------------------
+_default_hedger: Optional[Hedger] = None
+_default_hedger_lock = threading.Lock()
+
+
+def get_default_hedger() -> Hedger:
+    """
+    Return the process-wide hedger, creating it on first use.
+
+    Returns:
+        Shared Hedger wrapping the shared scheduler
+    """
+    global _default_hedger
+    if _default_hedger is None:
+        with _default_hedger_lock:
+            if _default_hedger is None:
+                _default_hedger = Hedger()
+    return _default_hedger
+
+
+def set_default_hedger(hedger: Optional[Hedger]) -> Optional[Hedger]:
+    """
+    Replace the process-wide hedger.
+
+    Args:
+        hedger: New shared hedger, or None to recreate the default lazily
+
+    Returns:
+        The previously installed hedger, if any
+    """
+    global _default_hedger
+    with _default_hedger_lock:
+        previous = _default_hedger
+        _default_hedger = hedger
+    return previous
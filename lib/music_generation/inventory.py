@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+"""
+Exercise Inventory
+================
+Pool of ready-made exercises so interactive requests never wait on the LLM.
+
+Exercises are kept in one bucket per (instrument, level, key, time signature,
+measures) combination. Taking an exercise is an O(1) pop; a background
+refiller tops up every bucket that falls below the low-water mark, serving
+buckets that were recently asked for first. The pool is saved to a JSON
+file so it survives restarts.
+"""
+
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable, Deque
+
+from .cache import atomic_write
+from .constants import (
+    INSTRUMENTS,
+    LEVELS,
+    KEYS,
+    TIME_SIGNATURES,
+    MIN_MEASURES,
+    MAX_MEASURES,
+    INVENTORY_PATH,
+    INVENTORY_LOW_WATER,
+    INVENTORY_TARGET,
+    INVENTORY_REFILL_WORKERS,
+    INVENTORY_REFILL_INTERVAL,
+    INVENTORY_SAVE_INTERVAL,
+)
+
+Combination = Tuple[str, str, str, str, int]
+Exercise = List[Dict[str, Any]]
+
+
+def all_combinations() -> List[Combination]:
+    """
+    Return every combination of the supported exercise parameters.
+
+    Returns:
+        (instrument, level, key, time signature, measures) tuples
+    """
+    return list(itertools.product(INSTRUMENTS, LEVELS, KEYS, TIME_SIGNATURES,
+                                  range(MIN_MEASURES, MAX_MEASURES + 1)))
+
+
+def _bucket_name(combination: Combination) -> str:
+    return "|".join(str(part) for part in combination)
+
+
+def _parse_bucket_name(name: str) -> Combination:
+    instrument, level, key, time_sig, measures = name.split("|")
+    return instrument, level, key, time_sig, int(measures)
+
+
+def generate_for_inventory(instrument: str, level: str, key: str,
+                           time_sig: str, measures: int) -> Exercise:
+    """
+    Generate one exercise from the LLM, raising instead of falling back.
+
+    Fallback exercises are never stored in the inventory, so errors are
+    propagated and the bucket is retried on a later pass.
+
+    Args:
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+
+    Returns:
+        List of objects with note, duration, and cumulative_duration properties
+
+    Raises:
+        requests.exceptions.RequestException: On API errors (CircuitOpenError while the breaker is open)
+        ValueError: If the LLM output is not a valid exercise
+    """
+    from .generator import (MISTRAL_API_KEY, build_mistral_payload, finalize_exercise,
+                            safe_parse_json, _strip_code_fences)
+    from .scheduler import get_default_scheduler
+    from .breaker import get_default_breaker
+
+    payload = build_mistral_payload("", instrument, level, key, time_sig, measures)
+    content = _strip_code_fences(get_default_breaker().call(
+        lambda: get_default_scheduler().chat_completion(payload, MISTRAL_API_KEY)))
+    if not safe_parse_json(content):
+        raise ValueError("LLM output is not a valid exercise")
+    return finalize_exercise(content, instrument, level, key, time_sig, measures)
+
+
+class ExerciseInventory:
+    """
+    Buckets of pre-generated exercises with a background refiller.
+
+    All methods are thread-safe. take() never blocks on the network: an
+    empty bucket is a miss, and the caller generates the exercise itself.
+    """
+
+    def __init__(self, path: Optional[str] = INVENTORY_PATH,
+                 combinations: Optional[Iterable[Combination]] = None,
+                 low_water: int = INVENTORY_LOW_WATER,
+                 target: int = INVENTORY_TARGET,
+                 workers: int = INVENTORY_REFILL_WORKERS,
+                 refill_interval: float = INVENTORY_REFILL_INTERVAL,
+                 save_interval: float = INVENTORY_SAVE_INTERVAL,
+                 generate: Optional[Callable[..., Exercise]] = None):
+        """
+        Create an inventory, loading any exercises saved at path.
+
+        Args:
+            path: JSON file the pool is saved to (None keeps it in memory only)
+            combinations: Combinations to stock (defaults to all supported ones)
+            low_water: A bucket holding fewer exercises than this is refilled
+            target: Exercises per bucket after a refill
+            workers: Concurrent generations during a refill
+            refill_interval: Seconds between background refill passes
+            save_interval: Minimum seconds between saves of a changed pool
+            generate: Function producing one exercise for a combination
+                (defaults to generate_for_inventory)
+        """
+        if target < low_water:
+            raise ValueError("target must be at least low_water")
+        self.path = path
+        self.low_water = low_water
+        self.target = target
+        self.workers = workers
+        self.refill_interval = refill_interval
+        self.save_interval = save_interval
+        self._generate = generate or generate_for_inventory
+        self._lock = threading.Lock()
+        self._buckets: Dict[Combination, Deque[Exercise]] = {
+            tuple(combination): deque() for combination in (combinations or all_combinations())
+        }
+        self._demanded: Dict[Combination, float] = {}  # Last request time of buckets that were asked for
+        self._in_progress: Dict[Combination, int] = {}
+        self._dirty = False
+        self._last_save = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.served = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        if path:
+            self.load()
+
+    # -------------------------------------------------------------------------
+    # Serving
+    # -------------------------------------------------------------------------
+    def take(self, instrument: str, level: str, key: str, time_sig: str,
+             measures: int) -> Optional[Exercise]:
+        """
+        Remove and return a ready exercise, waking the refiller.
+
+        Args:
+            instrument: Target instrument
+            level: Difficulty level
+            key: Musical key
+            time_sig: Time signature (e.g., "4/4")
+            measures: Number of measures
+
+        Returns:
+            An exercise, or None if the bucket is empty or not stocked
+        """
+        combination = (instrument, level, key, time_sig, int(measures))
+        with self._lock:
+            bucket = self._buckets.get(combination)
+            if bucket is None:
+                self.misses += 1
+                return None
+            self._demanded[combination] = time.monotonic()
+            if not bucket:
+                self.misses += 1
+                self._wake.set()
+                return None
+            exercise = bucket.popleft()
+            self.served += 1
+            self._dirty = True
+            if len(bucket) < self.low_water:
+                self._wake.set()
+        return exercise
+
+    def put(self, combination: Combination, exercise: Exercise) -> bool:
+        """
+        Add an exercise to its bucket.
+
+        Args:
+            combination: (instrument, level, key, time signature, measures)
+            exercise: Exercise to store
+
+        Returns:
+            True if stored, False if the combination is not stocked
+        """
+        combination = tuple(combination[:4]) + (int(combination[4]),)
+        with self._lock:
+            bucket = self._buckets.get(combination)
+            if bucket is None:
+                return False
+            bucket.append(exercise)
+            self._dirty = True
+        return True
+
+    def size(self, combination: Optional[Combination] = None) -> int:
+        """Number of exercises in one bucket, or in the whole pool."""
+        with self._lock:
+            if combination is not None:
+                return len(self._buckets.get(tuple(combination), ()))
+            return sum(len(bucket) for bucket in self._buckets.values())
+
+    # -------------------------------------------------------------------------
+    # Refilling
+    # -------------------------------------------------------------------------
+    def refill_plan(self) -> List[Combination]:
+        """
+        List the generations needed to bring every low bucket back to target.
+
+        Buckets that were asked for come first (most recent first), then
+        the emptiest ones. Generations already in progress are subtracted.
+
+        Returns:
+            One combination per exercise to generate
+        """
+        with self._lock:
+            low = []
+            for combination, bucket in self._buckets.items():
+                stocked = len(bucket) + self._in_progress.get(combination, 0)
+                if len(bucket) < self.low_water and stocked < self.target:
+                    low.append((combination, self.target - stocked))
+            low.sort(key=lambda item: (-self._demanded.get(item[0], float("-inf")), -item[1]))
+        plan = []
+        for combination, missing in low:
+            plan.extend([combination] * missing)
+        return plan
+
+    def refill(self, limit: Optional[int] = None) -> int:
+        """
+        Top up low buckets now, blocking until the generations finish.
+
+        A pass stops scheduling new work after the first failure, so an
+        unavailable API is not hammered; the rest is retried next pass.
+
+        Args:
+            limit: Maximum exercises to generate in this pass
+
+        Returns:
+            Number of exercises added
+        """
+        plan = self.refill_plan()[:limit]
+        if not plan:
+            return 0
+        with self._lock:
+            for combination in plan:
+                self._in_progress[combination] = self._in_progress.get(combination, 0) + 1
+        failed = threading.Event()
+        added = 0
+
+        def produce(combination: Combination) -> bool:
+            try:
+                if failed.is_set() or self._stop.is_set():
+                    return False
+                try:
+                    exercise = self._generate(*combination)
+                except Exception as e:
+                    failed.set()
+                    with self._lock:
+                        self.failures += 1
+                    print(f"Inventory refill failed for {_bucket_name(combination)}: {e}")
+                    return False
+                self.put(combination, exercise)
+                with self._lock:
+                    self.generated += 1
+                return True
+            finally:
+                with self._lock:
+                    self._in_progress[combination] -= 1
+                    if not self._in_progress[combination]:
+                        del self._in_progress[combination]
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for stored in executor.map(produce, plan):
+                added += stored
+        return added
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            self.refill()
+            self.save_if_dirty()
+            self._wake.wait(self.refill_interval)
+        self.save_if_dirty(force=True)
+
+    def start(self) -> "ExerciseInventory":
+        """
+        Start the background refiller thread.
+
+        Returns:
+            The inventory itself
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="exercise-inventory", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop the refiller after its current generations and save the pool.
+
+        Args:
+            timeout: Seconds to wait for the thread (None waits indefinitely)
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self.save_if_dirty(force=True)
+
+    def __enter__(self) -> "ExerciseInventory":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+    def load(self) -> int:
+        """
+        Load saved exercises for stocked combinations, replacing the current pool.
+
+        Returns:
+            Number of exercises loaded
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f).get("buckets", {})
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Warning: Could not load exercise inventory: {e}")
+            return 0
+        loaded = 0
+        with self._lock:
+            for name, exercises in saved.items():
+                try:
+                    combination = _parse_bucket_name(name)
+                except ValueError:
+                    continue
+                if combination in self._buckets:
+                    self._buckets[combination] = deque(exercises)
+                    loaded += len(exercises)
+        return loaded
+
+    def save(self) -> None:
+        """Write the pool to disk atomically."""
+        if not self.path:
+            return
+        with self._lock:
+            data = {"version": 1,
+                    "buckets": {_bucket_name(combination): list(bucket)
+                                for combination, bucket in self._buckets.items() if bucket}}
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            atomic_write(self.path, json.dumps(data).encode("utf-8"))
+        except OSError as e:
+            with self._lock:
+                self._dirty = True
+            print(f"Warning: Could not save exercise inventory: {e}")
+
+    def save_if_dirty(self, force: bool = False) -> None:
+        """Save the pool if it changed and the save interval has passed (or force is set)."""
+        with self._lock:
+            due = self._dirty and (force or time.monotonic() - self._last_save >= self.save_interval)
+        if due:
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return pool and refill counters.
+
+        Returns:
+            Dictionary with size, buckets, empty_buckets, low_buckets,
+            served, misses, generated and failures
+        """
+        with self._lock:
+            sizes = [len(bucket) for bucket in self._buckets.values()]
+            return {
+                "size": sum(sizes),
+                "buckets": len(sizes),
+                "empty_buckets": sum(1 for size in sizes if size == 0),
+                "low_buckets": sum(1 for size in sizes if size < self.low_water),
+                "served": self.served,
+                "misses": self.misses,
+                "generated": self.generated,
+                "failures": self.failures,
+            }
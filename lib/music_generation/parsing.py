@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+
+"""
+LLM Output Parsing
+================
+Scanner-based extraction of note arrays from LLM output, and the decoder
+for the compact ``C4:2 E4:2 G4:4 |`` wire format.
+"""
+
+import re
+import json
+from typing import Optional, List, Dict, Any, NamedTuple, Tuple, Iterable
+
+_VALUE_OPENERS = "[{,:"  # A single quote after one of these starts a string rather than an apostrophe
+_STRUCTURAL = re.compile(r"[\[\]\"']")
+_STRING_DELIMITERS = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+# One compact note: name, optional ornament in parentheses, colon, duration
+_COMPACT_NOTE = re.compile(r"([A-Ga-g][#b]?\d)(?:\([^()\s]*\))?:(\d+)")
+
+
+class Note(NamedTuple):
+    """One note of an exercise; duration is in 8th-note units."""
+    note: str
+    duration: int
+
+
+class IncrementalNoteParser:
+    """
+    Parse a JSON array of notes from text that arrives in pieces.
+
+    Text before the opening bracket (code fences, prose) is skipped. Each
+    element of the array - an object such as ``{"note": "C4", "duration": 2}``
+    or a legacy ``["C4", 2]`` pair - is returned by feed() as soon as its
+    closing bracket arrives. Every character is examined exactly once.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.invalid = False
+        self.error: Optional[str] = None
+        self._started = False
+        self._depth = 0  # Nesting depth inside the current element
+        self._in_string = False
+        self._quote = ""
+        self._escaped = False
+        self._element: List[str] = []
+        self._expect_value = True  # At top level: waiting for an element rather than a comma
+
+    def _fail(self, message: str) -> None:
+        self.invalid = True
+        self.error = message
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consume more text.
+
+        Args:
+            text: Next chunk of model output
+
+        Returns:
+            Elements completed by this chunk (parsed JSON values)
+        """
+        completed = []
+        if self.done or self.invalid:
+            return completed
+        element = self._element
+        for index, char in enumerate(text):
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._depth > 0:
+                element.append(char)
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == self._quote:
+                        self._in_string = False
+                elif char == '"' or char == "'":
+                    self._in_string = True
+                    self._quote = char
+                elif char == "{" or char == "[":
+                    self._depth += 1
+                elif char == "}" or char == "]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        value = _loads_element("".join(element))
+                        element.clear()
+                        if value is None:
+                            self._fail(f"Malformed array element near offset {index}")
+                            return completed
+                        completed.append(value)
+                        self._expect_value = False
+                continue
+
+            # Top level of the array
+            if char in " \t\r\n":
+                continue
+            if char == "]":
+                self.done = True
+                return completed
+            if char == ",":
+                if self._expect_value:
+                    self._fail(f"Unexpected ',' near offset {index}")
+                    return completed
+                self._expect_value = True
+                continue
+            if (char == "{" or char == "[") and self._expect_value:
+                self._depth = 1
+                element.append(char)
+                continue
+            self._fail(f"Unexpected {char!r} near offset {index}")
+            return completed
+        return completed
+
+    def close(self) -> List[Any]:
+        """
+        Finish the stream.
+
+        Returns:
+            Nothing: every element is returned by feed() when its bracket closes
+        """
+        return []
+
+
+def _loads_element(text: str) -> Optional[Any]:
+    """Decode one array element, accepting single-quoted strings as a fallback."""
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, RecursionError):
+        pass
+    try:
+        return json.loads(_swap_quotes(text))
+    except (json.JSONDecodeError, RecursionError):
+        return None
+
+
+def _swap_quotes(text: str) -> str:
+    """Convert single-quoted strings to double-quoted ones, leaving apostrophes inside double quotes alone."""
+    out = []
+    quote = ""
+    escaped = False
+    for char in text:
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = ""
+                out.append('"')
+                continue
+            elif char == '"' and quote == "'":
+                out.append('\\"')
+                continue
+        elif char == '"' or char == "'":
+            quote = char
+            out.append('"')
+            continue
+        out.append(char)
+    return "".join(out)
+
+
+def as_note(element: Any, coerce: bool = False) -> Optional[Note]:
+    """
+    Convert one array element (a note object or a legacy pair) to a Note.
+
+    Args:
+        element: Parsed array element
+        coerce: Also accept durations written as strings (such as "3")
+
+    Returns:
+        Note, or None if the element does not describe a note
+    """
+    if isinstance(element, dict):
+        name, duration = element.get("note"), element.get("duration")
+    elif isinstance(element, (list, tuple)) and len(element) == 2:
+        name, duration = element
+    else:
+        return None
+    if coerce and isinstance(duration, str):
+        try:
+            duration = int(duration)
+        except ValueError:
+            return None
+    if not isinstance(name, str) or isinstance(duration, bool) or not isinstance(duration, (int, float)):
+        return None
+    return Note(name, int(duration))
+
+
+def _is_note_array(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(as_note(item) is not None for item in value)
+
+
+def _scan_arrays(text: str, start: int) -> Tuple[Optional[Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    Scan from the '[' at start until it is balanced.
+
+    Returns the span of the balanced array (or None if the text ends first)
+    and the outermost arrays closed inside it, in order. Strings are only
+    tracked inside brackets, so apostrophes in surrounding prose are harmless.
+    The scan jumps between structural characters, visiting each one once.
+    """
+    closed: List[Tuple[int, int]] = []  # Outermost balanced spans seen so far
+    stack = []
+    index = start
+    while True:
+        match = _STRUCTURAL.search(text, index)
+        if match is None:
+            return None, closed
+        index = match.start()
+        char = text[index]
+        if char == "[":
+            stack.append(index)
+        elif char == "]":
+            opened = stack.pop()
+            while closed and closed[-1][0] > opened:
+                closed.pop()
+            if not stack:
+                return (opened, index + 1), closed
+            closed.append((opened, index + 1))
+        else:
+            before = index - 1
+            while before > start and text[before].isspace():
+                before -= 1
+            if char == '"' or text[before] in _VALUE_OPENERS:
+                index = _string_end(text, index + 1, char)
+                if index < 0:
+                    return None, closed
+                continue
+        index += 1
+
+
+def _string_end(text: str, index: int, quote: str) -> int:
+    """Return the index just past the closing quote of a string starting at index, or -1."""
+    pattern = _STRING_DELIMITERS[quote]
+    while True:
+        match = pattern.search(text, index)
+        if match is None:
+            return -1
+        if text[match.start()] == quote:
+            return match.start() + 1
+        index = match.start() + 2  # Skip the escaped character
+
+
+def find_note_array(text: str) -> Optional[List[Any]]:
+    """
+    Extract the first JSON array of notes from LLM output in linear time.
+
+    Code fences, prose, single-quoted strings and legacy ``[note, duration]``
+    pairs are tolerated. Balanced arrays that do not hold notes (such as a
+    ``[1]`` footnote) are skipped, and so are unbalanced brackets in prose:
+    the arrays closed inside them are tried instead. Each character is
+    scanned once and only the slice of each balanced candidate is decoded,
+    so there is no backtracking.
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        The parsed array (note objects or pairs, as written), or None if there is none
+    """
+    position = 0
+    while True:
+        start = text.find("[", position)
+        if start < 0:
+            return None
+        # Only balanced slices are decoded: decoding from start against the
+        # whole text would cost O(len(text)) per failed candidate
+        span, inner = _scan_arrays(text, start)
+        candidates = [span] + inner if span is not None else inner
+        for first, last in candidates:
+            candidate = text[first:last]
+            if '"' not in candidate and "'" not in candidate:
+                continue  # Every note has a quoted name
+            value = _loads_element(candidate)
+            if _is_note_array(value):
+                return value
+        if span is None:
+            return None
+        position = span[1]
+
+
+def parse_notes(text: str) -> Optional[List[Note]]:
+    """
+    Extract the first array of notes from LLM output as typed notes.
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        List of Note, or None if no note array was found
+    """
+    value = find_note_array(text)
+    if value is None:
+        return None
+    return [as_note(item) for item in value]
+
+
+# -----------------------------------------------------------------------------
+# Compact wire format: "C4:2 E4:2 G4:4 | C5:8 |"
+# -----------------------------------------------------------------------------
+def parse_compact(text: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Decode compact ``NOTE:DURATION`` output into note objects.
+
+    Barlines, commas, code fences and prose between the notes are ignored;
+    cumulative durations are computed locally. Durations below one unit
+    are raised to one.
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        List of objects with note, duration, and cumulative_duration
+        properties, or None if no notes were found
+    """
+    notes = []
+    cumulative = 0
+    for name, duration in _COMPACT_NOTE.findall(text):
+        duration = max(1, int(duration))
+        cumulative += duration
+        notes.append({"note": name, "duration": duration, "cumulative_duration": cumulative})
+    return notes or None
+
+
+def format_compact(notes: Iterable[Any], units_per_measure: Optional[int] = None) -> str:
+    """
+    Encode notes in the compact wire format.
+
+    Args:
+        notes: Note objects or [note, duration] pairs
+        units_per_measure: Insert a barline whenever a measure is complete (optional)
+
+    Returns:
+        Text such as ``C4:2 E4:2 G4:4 |``
+    """
+    parts = []
+    cumulative = 0
+    for element in notes:
+        note = as_note(element)
+        if note is None:
+            continue
+        parts.append(f"{note.note}:{note.duration}")
+        cumulative += note.duration
+        if units_per_measure and cumulative % units_per_measure == 0:
+            parts.append("|")
+    return " ".join(parts)
+
+
+class IncrementalCompactParser:
+    """
+    Parse compact ``NOTE:DURATION`` output that arrives in pieces.
+
+    Has the same interface as IncrementalNoteParser. feed() returns a
+    ``[note, duration]`` pair as soon as the whitespace or barline after
+    it arrives, and close() returns the last note of the stream. A token
+    that is not a note or a barline marks the output invalid once notes
+    have started; text before the first note is skipped.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.invalid = False
+        self.error: Optional[str] = None
+        self._pending = ""
+        self._started = False
+
+    def _token(self, token: str) -> Optional[List[Any]]:
+        token = token.strip(",`")
+        if not token or token == "|":
+            return None
+        match = _COMPACT_NOTE.fullmatch(token)
+        if match:
+            self._started = True
+            return [match.group(1), max(1, int(match.group(2)))]
+        if self._started:
+            self.invalid = True
+            self.error = f"Unexpected token {token!r}"
+        return None
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consume more text.
+
+        Args:
+            text: Next chunk of model output
+
+        Returns:
+            [note, duration] pairs completed by this chunk
+        """
+        completed = []
+        if self.done or self.invalid:
+            return completed
+        tokens = (self._pending + text).replace("|", " | ").split()
+        # The last token may continue in the next chunk unless whitespace follows it
+        self._pending = "" if not tokens or text[-1:].isspace() or text.endswith("|") else tokens.pop()
+        for token in tokens:
+            note = self._token(token)
+            if self.invalid:
+                break
+            if note is not None:
+                completed.append(note)
+        return completed
+
+    def close(self) -> List[Any]:
+        """
+        Finish the stream.
+
+        Returns:
+            The last note, if the stream ended right after it
+        """
+        pending, self._pending = self._pending, ""
+        self.done = True
+        note = self._token(pending) if pending and not self.invalid else None
+        return [note] if note is not None else []
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Procedural Exercise Engine
+========================
+Offline generator of music exercises built on the theory helpers.
+
+Exercises are drawn from the scale and tonic arpeggio of the requested
+key, inside the instrument's range, with a rhythm vocabulary and leap
+size chosen by level. Each measure is filled with a rhythm that sums to
+the measure exactly, and the exercise ends on a long tonic. Generation
+takes microseconds, so it serves levels that do not need the LLM and
+all traffic while the API is unavailable.
+"""
+
+import random
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple, NamedTuple
+
+from .constants import INSTRUMENT_RANGES
+from .theory import (SCALE_STEPS, key_uses_flats, midi_to_note_name, note_name_to_midi, parse_key,
+                     scale_midi_numbers)
+
+
+class LevelRules(NamedTuple):
+    """Material allowed at one difficulty level."""
+    durations: Tuple[int, ...]  # Note values in 8th-note units
+    span: int  # Scale degrees the melody may cover
+    max_leap: int  # Largest leap in scale degrees
+    figures: Tuple[str, ...]  # Melodic figures a measure is drawn from (repeats weight the choice)
+
+
+LEVEL_RULES: Dict[str, LevelRules] = {
+    "Beginner": LevelRules((2, 4, 6, 8), 8, 2, ("step", "step", "repeat", "arpeggio")),
+    "Intermediate": LevelRules((1, 2, 3, 4, 6), 12, 4, ("step", "step", "arpeggio", "leap")),
+    "Advanced": LevelRules((1, 2, 3, 4, 6), 16, 7, ("step", "arpeggio", "arpeggio", "leap", "leap")),
+}
+
+DEFAULT_INSTRUMENT = "Trumpet"
+DEFAULT_LEVEL = "Intermediate"
+DEFAULT_KEY = "C Major"
+
+
+class _Palette(NamedTuple):
+    names: Tuple[str, ...]  # Note names of the usable scale notes, low to high
+    chord_tones: Tuple[bool, ...]  # Whether each note belongs to the tonic triad
+    tonics: Tuple[int, ...]  # Indices of the tonic notes
+    start: int  # Index of the tonic the exercise starts on
+
+
+@lru_cache(maxsize=None)
+def _compositions(total: int, durations: Tuple[int, ...]) -> Tuple[Tuple[int, ...], ...]:
+    """Every ordered way of filling total units with the given note values."""
+    if total == 0:
+        return ((),)
+    result = []
+    for duration in durations:
+        if duration <= total:
+            result.extend((duration,) + rest for rest in _compositions(total - duration, durations))
+    return tuple(result)
+
+
+@lru_cache(maxsize=None)
+def measure_rhythms(level: str, units: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    List the rhythms that fill one measure at a level.
+
+    Args:
+        level: Difficulty level
+        units: 8th-note units in the measure
+
+    Returns:
+        Tuples of note values summing exactly to units
+    """
+    rhythms = _compositions(units, LEVEL_RULES[level].durations)
+    return rhythms or ((units,),)
+
+
+@lru_cache(maxsize=None)
+def _final_rhythms(level: str, units: int) -> Tuple[Tuple[int, ...], ...]:
+    """Rhythms for the last measure, ending on the longest note value that fits."""
+    final = max((d for d in LEVEL_RULES[level].durations if d <= units), default=units)
+    leading = _compositions(units - final, LEVEL_RULES[level].durations)
+    return tuple(rhythm + (final,) for rhythm in leading) or measure_rhythms(level, units)
+
+
+@lru_cache(maxsize=None)
+def _palette(instrument: str, level: str, key: str) -> _Palette:
+    low, high = (note_name_to_midi(note) for note in INSTRUMENT_RANGES[instrument])
+    pitches = scale_midi_numbers(key, low, high)
+    tonic, mode = parse_key(key)
+    triad = {(tonic + SCALE_STEPS[mode][degree]) % 12 for degree in (0, 2, 4)}
+
+    # Centre the window a little below the middle of the range so the
+    # octave above the starting tonic stays comfortable
+    middle = (low + high) // 2 - 6
+    tonic_positions = [i for i, midi in enumerate(pitches) if midi % 12 == tonic]
+    centre = min(tonic_positions, key=lambda i: abs(pitches[i] - middle))
+    span = LEVEL_RULES[level].span
+    first = min(max(0, centre - span // 4), max(0, len(pitches) - span - 1))
+    window = pitches[first:first + span + 1]
+
+    flats = key_uses_flats(key)
+    return _Palette(
+        names=tuple(midi_to_note_name(midi, flats) for midi in window),
+        chord_tones=tuple(midi % 12 in triad for midi in window),
+        tonics=tuple(i for i, midi in enumerate(window) if midi % 12 == tonic),
+        start=centre - first,
+    )
+
+
+def _next_position(rng: random.Random, figure: str, position: int, direction: int,
+                   palette: _Palette, max_leap: int) -> Tuple[int, int]:
+    """Move one note according to the figure; returns (position, direction)."""
+    top = len(palette.names) - 1
+    if figure == "repeat" and rng.random() < 0.5:
+        return position, direction
+    if figure == "arpeggio":
+        target = position + direction
+        while 0 <= target <= top and not palette.chord_tones[target]:
+            target += direction
+    elif figure == "leap":
+        target = position + direction * rng.randint(2, max(2, max_leap))
+    else:
+        target = position + direction
+    if figure == "leap":
+        direction = -direction  # Recover from a leap by step in the other direction
+    if target < 0 or target > top:
+        direction = -direction
+        target = position + direction
+    return min(max(target, 0), top), direction
+
+
+def generate_procedural_exercise(instrument: str, level: str, key: str, time_sig: str,
+                                 measures: int, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Generate an exercise locally, without the LLM.
+
+    Unknown instruments, levels and keys fall back to Trumpet,
+    Intermediate and C Major, so the generator never fails on its
+    parameters. The durations always sum to exactly measures times the
+    8th notes per measure.
+
+    Args:
+        instrument: Target instrument
+        level: Difficulty level
+        key: Musical key
+        time_sig: Time signature (e.g., "4/4")
+        measures: Number of measures
+        seed: Optional seed making the exercise reproducible
+
+    Returns:
+        List of objects with note, duration, and cumulative_duration properties
+    """
+    instrument = instrument if instrument in INSTRUMENT_RANGES else DEFAULT_INSTRUMENT
+    level = level if level in LEVEL_RULES else DEFAULT_LEVEL
+    try:
+        palette = _palette(instrument, level, key)
+    except ValueError:
+        palette = _palette(instrument, level, DEFAULT_KEY)
+    rules = LEVEL_RULES[level]
+    numerator, denominator = map(int, time_sig.split('/'))
+    units_per_measure = numerator * (8 // denominator)
+
+    rng = random.Random(seed)
+    rhythms = measure_rhythms(level, units_per_measure)
+    position = palette.start
+    direction = rng.choice((-1, 1))
+    names = palette.names
+    result = []
+    cumulative = 0
+    for measure in range(measures):
+        last = measure == measures - 1
+        rhythm = rng.choice(_final_rhythms(level, units_per_measure) if last else rhythms)
+        figure = rng.choice(rules.figures)
+        for index, duration in enumerate(rhythm):
+            if last and index == len(rhythm) - 1:
+                position = min(palette.tonics, key=lambda i: abs(i - position))
+            elif result:
+                position, direction = _next_position(rng, figure, position, direction, palette, rules.max_leap)
+            cumulative += duration
+            result.append({"note": names[position], "duration": duration, "cumulative_duration": cumulative})
+    return result
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+
+"""
+Request Scheduler
+===============
+Rate-limit-aware scheduling of Mistral API requests.
+
+Requests pass through two token buckets (requests per second and LLM tokens
+per minute), are retried on HTTP 429/5xx and network errors with jittered
+exponential backoff or the server's Retry-After, and give up once their
+deadline has passed so the caller can use the fallback exercise.
+"""
+
+import json
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+
+import requests
+
+from .client import MistralClient, get_default_client
+from .constants import (
+    MISTRAL_CONNECT_TIMEOUT,
+    MISTRAL_READ_TIMEOUT,
+    MISTRAL_REQUESTS_PER_SECOND,
+    MISTRAL_REQUEST_BURST,
+    MISTRAL_TOKENS_PER_MINUTE,
+    MISTRAL_MAX_RETRIES,
+    MISTRAL_BACKOFF_BASE,
+    MISTRAL_BACKOFF_MAX,
+    MISTRAL_REQUEST_DEADLINE,
+)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when a request cannot complete before its deadline."""
+
+
+class RequestCancelled(requests.exceptions.RequestException):
+    """Raised when a request is cancelled while it is queued or waiting to retry."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+    
+    Tokens accumulate at ``rate`` per second up to ``capacity``. A rate of
+    zero or less disables the limit.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        Take tokens if enough are available.
+        
+        Args:
+            amount: Tokens needed (capped at the bucket capacity)
+            
+        Returns:
+            0.0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def refund(self, amount: float = 1.0) -> None:
+        """Return tokens taken by a reservation that was not used."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+    @property
+    def available(self) -> float:
+        """Tokens currently available."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delay in seconds or an HTTP date).
+    
+    Args:
+        value: Header value
+        
+    Returns:
+        Seconds to wait, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """
+    Estimate the LLM tokens a request will consume (prompt plus completion budget).
+    
+    Args:
+        payload: Chat-completions request body
+        
+    Returns:
+        Estimated token count
+    """
+    prompt_chars = len(json.dumps(payload.get("messages", [])))
+    return prompt_chars // 4 + int(payload.get("max_tokens", 0))
+
+
+class RequestScheduler:
+    """
+    Sits in front of a MistralClient and schedules its requests.
+    
+    Exposes the same ``chat_completion`` method as the client, so it can be
+    passed anywhere a client is accepted.
+    """
+
+    def __init__(self, client: Optional[MistralClient] = None,
+                 requests_per_second: float = MISTRAL_REQUESTS_PER_SECOND,
+                 request_burst: float = MISTRAL_REQUEST_BURST,
+                 tokens_per_minute: float = MISTRAL_TOKENS_PER_MINUTE,
+                 max_retries: int = MISTRAL_MAX_RETRIES,
+                 backoff_base: float = MISTRAL_BACKOFF_BASE,
+                 backoff_max: float = MISTRAL_BACKOFF_MAX,
+                 deadline: float = MISTRAL_REQUEST_DEADLINE,
+                 rng: Optional[random.Random] = None):
+        """
+        Create a scheduler.
+        
+        Args:
+            client: Client to send requests with (uses the shared client if not provided)
+            requests_per_second: Sustained request rate
+            request_burst: Requests that may be sent back to back
+            tokens_per_minute: Sustained LLM token rate
+            max_retries: Maximum retries per request
+            backoff_base: Initial backoff in seconds
+            backoff_max: Backoff ceiling in seconds
+            deadline: Default per-request deadline in seconds
+            rng: Random generator for backoff jitter
+        """
+        self._client = client
+        self.request_bucket = TokenBucket(requests_per_second, request_burst)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._requests = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._deadline_exceeded = 0
+        self._cancelled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def client(self) -> MistralClient:
+        return self._client or get_default_client()
+
+    # -------------------------------------------------------------------------
+    # Scheduling decisions shared by the sync and async paths
+    # -------------------------------------------------------------------------
+    def _admission_delay(self, tokens: int) -> float:
+        """Seconds to wait before a request may be sent (0 if it may go now)."""
+        with self._lock:
+            blocked = self._blocked_until - time.monotonic()
+        if blocked > 0:
+            return blocked
+        delay = self.request_bucket.reserve(1)
+        if delay > 0:
+            return delay
+        delay = self.token_bucket.reserve(tokens)
+        if delay > 0:
+            self.request_bucket.refund(1)
+        return delay
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after error, or None if it is not retryable."""
+        if isinstance(error, requests.exceptions.HTTPError):
+            status = error.response.status_code if error.response is not None else None
+            if status == 429:
+                with self._lock:
+                    self._rate_limited += 1
+                retry_after = parse_retry_after(error.response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    # Hold back every queued request, not just this one
+                    with self._lock:
+                        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+                    return retry_after
+            elif status is not None and status < 500:
+                return None
+        elif isinstance(error, DeadlineExceeded) or not isinstance(
+                error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return None
+        return self._backoff(attempt)
+
+    def _misses_deadline(self, delay: float, deadline_at: float) -> bool:
+        """Whether waiting delay seconds would pass the deadline (counted as a give-up)."""
+        if time.monotonic() + delay < deadline_at:
+            return False
+        with self._lock:
+            self._deadline_exceeded += 1
+        return True
+
+    def _raise_if_cancelled(self, cancel: Optional[threading.Event]) -> None:
+        """Give up (counted as a cancellation) if the request was cancelled."""
+        if cancel is None or not cancel.is_set():
+            return
+        with self._lock:
+            self._cancelled += 1
+        raise RequestCancelled("Request cancelled before it was sent")
+
+    def _enter(self) -> float:
+        with self._lock:
+            self._requests += 1
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        return time.monotonic()
+
+    def _dequeue(self) -> None:
+        with self._lock:
+            self._queue_depth -= 1
+
+    def _requeue(self) -> None:
+        with self._lock:
+            self._retries += 1
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+
+    def _record_wait(self, waited: float) -> None:
+        with self._lock:
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+    # -------------------------------------------------------------------------
+    # Execution
+    # -------------------------------------------------------------------------
+    def execute(self, call: Callable[[float], Any], tokens: int = 0,
+                deadline: Optional[float] = None, cancel: Optional[threading.Event] = None) -> Any:
+        """
+        Run a request under the rate limits, retrying until it succeeds or the deadline passes.
+        
+        Args:
+            call: Function sending the request; receives the seconds left before the deadline
+            tokens: Estimated LLM tokens used by the request
+            deadline: Seconds allowed for this request (defaults to the scheduler deadline)
+            cancel: Optional event; once set, the request is abandoned instead of
+                being sent or retried (a call already sent runs to completion)
+            
+        Returns:
+            The call's result
+            
+        Raises:
+            DeadlineExceeded: If the request could not be sent before the deadline
+            RequestCancelled: If cancel was set before the request was sent
+            requests.exceptions.RequestException: The last error once retries are exhausted
+        """
+        sleep = time.sleep if cancel is None else cancel.wait
+        start = self._enter()
+        deadline_at = start + (self.deadline if deadline is None else deadline)
+        queued = True
+        waited = 0.0
+        attempt = 0
+        try:
+            while True:
+                self._raise_if_cancelled(cancel)
+                delay = self._admission_delay(tokens)
+                while delay > 0:
+                    if self._misses_deadline(delay, deadline_at):
+                        raise DeadlineExceeded(f"Request deadline exceeded while queued ({delay:.2f}s to wait)")
+                    sleep(delay)
+                    waited += delay
+                    self._raise_if_cancelled(cancel)
+                    delay = self._admission_delay(tokens)
+                self._dequeue()
+                queued = False
+                try:
+                    return call(deadline_at - time.monotonic())
+                except requests.exceptions.RequestException as e:
+                    delay = self._retry_delay(e, attempt)
+                    attempt += 1
+                    if delay is None or attempt > self.max_retries or self._misses_deadline(delay, deadline_at):
+                        raise
+                    self._requeue()
+                    queued = True
+                    sleep(delay)
+                    waited += delay
+        finally:
+            if queued:
+                self._dequeue()
+            self._record_wait(waited)
+
+    async def execute_async(self, call: Callable[[], Awaitable[Any]], tokens: int = 0,
+                            deadline: Optional[float] = None) -> Any:
+        """
+        asyncio counterpart of execute; the call is cancelled when the deadline passes.
+        
+        Args:
+            call: Coroutine function sending the request
+            tokens: Estimated LLM tokens used by the request
+            deadline: Seconds allowed for this request (defaults to the scheduler deadline)
+            
+        Returns:
+            The call's result
+            
+        Raises:
+            DeadlineExceeded: If the request could not complete before the deadline
+            requests.exceptions.RequestException: The last error once retries are exhausted
+        """
+        start = self._enter()
+        deadline_at = start + (self.deadline if deadline is None else deadline)
+        queued = True
+        waited = 0.0
+        attempt = 0
+        try:
+            while True:
+                delay = self._admission_delay(tokens)
+                while delay > 0:
+                    if self._misses_deadline(delay, deadline_at):
+                        raise DeadlineExceeded(f"Request deadline exceeded while queued ({delay:.2f}s to wait)")
+                    await asyncio.sleep(delay)
+                    waited += delay
+                    delay = self._admission_delay(tokens)
+                self._dequeue()
+                queued = False
+                try:
+                    return await asyncio.wait_for(call(), max(0.0, deadline_at - time.monotonic()))
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._deadline_exceeded += 1
+                    raise DeadlineExceeded("Request deadline exceeded while waiting for a response")
+                except requests.exceptions.RequestException as e:
+                    delay = self._retry_delay(e, attempt)
+                    attempt += 1
+                    if delay is None or attempt > self.max_retries or self._misses_deadline(delay, deadline_at):
+                        raise
+                    self._requeue()
+                    queued = True
+                    await asyncio.sleep(delay)
+                    waited += delay
+        finally:
+            if queued:
+                self._dequeue()
+            self._record_wait(waited)
+
+    def request_timeout(self, remaining: float) -> Tuple[float, float]:
+        """Client (connect, read) timeout clipped to the time left before the deadline."""
+        connect, read = getattr(self.client, "timeout", (MISTRAL_CONNECT_TIMEOUT, MISTRAL_READ_TIMEOUT))
+        remaining = max(remaining, 0.001)
+        return min(connect, remaining), min(read, remaining)
+
+    def chat_completion(self, payload: Dict[str, Any], api_key: str,
+                        deadline: Optional[float] = None, cancel: Optional[threading.Event] = None) -> str:
+        """
+        Run a chat completion through the scheduler.
+        
+        Args:
+            payload: Request body
+            api_key: Mistral API key
+            deadline: Seconds allowed for this request (defaults to the scheduler deadline)
+            cancel: Optional event abandoning the request if it has not been sent yet
+            
+        Returns:
+            Content of the first choice's message
+        """
+        client = self.client
+        return self.execute(
+            lambda remaining: client.chat_completion(payload, api_key, timeout=self.request_timeout(remaining)),
+            estimate_tokens(payload), deadline, cancel)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return queue depth, retry and wait-time statistics.
+        
+        Returns:
+            Dictionary of scheduler counters
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queue_depth,
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "retries": self._retries,
+                "rate_limited": self._rate_limited,
+                "deadline_exceeded": self._deadline_exceeded,
+                "cancelled": self._cancelled,
+                "total_wait": self._total_wait,
+                "mean_wait": self._total_wait / self._requests if self._requests else 0.0,
+                "max_wait": self._max_wait,
+            }
+
+
+def chat_completion_within(client: Any, payload: Dict[str, Any], api_key: str,
+                           deadline: Optional[float] = None, cancel: Optional[threading.Event] = None) -> str:
+    """
+    Run a chat completion on a client, scheduler or hedger within a deadline.
+
+    A plain MistralClient gets the deadline as its (connect, read) timeout;
+    schedulers and hedgers take it as their per-request deadline.
+
+    Args:
+        client: Anything with a chat_completion(payload, api_key) method
+        payload: Request body
+        api_key: Mistral API key
+        deadline: Seconds allowed for the request, or None for the client's default
+        cancel: Optional event abandoning the request while a scheduler still
+            holds it (other clients send it at once, so it has no effect there)
+
+    Returns:
+        Content of the first choice's message
+
+    Raises:
+        DeadlineExceeded: If no time is left for the request
+    """
+    options = {"cancel": cancel} if cancel is not None and isinstance(client, RequestScheduler) else {}
+    if deadline is None:
+        return client.chat_completion(payload, api_key, **options)
+    if deadline <= 0:
+        raise DeadlineExceeded("Request deadline exceeded before sending")
+    if isinstance(client, MistralClient):
+        connect, read = client.timeout
+        return client.chat_completion(payload, api_key, timeout=(min(connect, deadline), min(read, deadline)))
+    return client.chat_completion(payload, api_key, deadline=deadline, **options)
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared scheduler
+# -----------------------------------------------------------------------------
+_default_scheduler: Optional[RequestScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> RequestScheduler:
+    """
+    Return the process-wide scheduler, creating it on first use.
+    
+    Returns:
+        Shared RequestScheduler wrapping the shared client
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler()
+    return _default_scheduler
+
+
+def set_default_scheduler(scheduler: Optional[RequestScheduler]) -> Optional[RequestScheduler]:
+    """
+    Replace the process-wide scheduler.
+    
+    Args:
+        scheduler: New shared scheduler, or None to recreate the default lazily
+        
+    Returns:
+        The previously installed scheduler, if any
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        previous = _default_scheduler
+        _default_scheduler = scheduler
+    return previous
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""
+Note Sequences
+============
+Array-backed container for the notes of an exercise.
+
+A NoteSequence keeps MIDI pitches, durations and onsets (both in 8th-note
+units) in parallel NumPy arrays instead of one dict per note, plus an index
+into a small table of the note names as they were written. It is built
+once from either JSON shape (note objects or legacy ``[note, duration]``
+pairs) and then passed to every stage (MIDI, sheet music, visualization),
+so no stage has to re-check which format it was given.
+"""
+
+import json
+from typing import Optional, List, Dict, Any, Iterator, Iterable, Union
+
+import numpy as np
+
+from .parsing import Note, as_note
+from .theory import midi_to_names, names_to_midi, clean_note_string
+
+PITCH_DTYPE = np.int8
+DURATION_DTYPE = np.uint16
+ONSET_DTYPE = np.uint32
+SPELLING_DTYPE = np.uint32
+
+# Note names of every MIDI number, indexed by pitch
+_SHARP_NAMES = midi_to_names(range(128)).tolist()
+_FLAT_NAMES = midi_to_names(range(128), flats=True).tolist()
+
+
+class NoteSequence:
+    """
+    Monophonic notes stored as parallel arrays.
+
+    Attributes:
+        pitches: MIDI note numbers (int8)
+        durations: Durations in 8th-note units (uint16)
+        onsets: Start of each note in 8th-note units from the start of the
+            exercise (uint32); slices keep their absolute onsets
+        flats: Spell black keys as flats when converting back to names
+            (only used when there are no spellings)
+        spellings: Distinct note names as written (ornaments stripped), or
+            None for a sequence built from pitches alone
+        spelling_index: Index into spellings for each note (uint32), or None
+    """
+
+    __slots__ = ("pitches", "durations", "onsets", "flats", "spellings", "spelling_index")
+
+    def __init__(self, pitches: Any, durations: Any, onsets: Optional[Any] = None, flats: bool = False,
+                 spellings: Optional[List[str]] = None, spelling_index: Optional[Any] = None):
+        """
+        Wrap pitch and duration arrays (views are kept, not copied, when the dtypes match).
+
+        Args:
+            pitches: MIDI note numbers
+            durations: Durations in 8th-note units
+            onsets: Note onsets (computed from the durations if not provided)
+            flats: Spell black keys as flats when converting back to names
+            spellings: Distinct note names, as written, shared with slices
+            spelling_index: Index into spellings for each note (required with spellings)
+
+        Raises:
+            ValueError: If the arrays have different lengths
+        """
+        self.pitches = np.asarray(pitches, dtype=PITCH_DTYPE)
+        self.durations = np.asarray(durations, dtype=DURATION_DTYPE)
+        if onsets is None:
+            onsets = np.zeros(len(self.durations), dtype=ONSET_DTYPE)
+            np.cumsum(self.durations[:-1], out=onsets[1:])
+        self.onsets = np.asarray(onsets, dtype=ONSET_DTYPE)
+        if not len(self.pitches) == len(self.durations) == len(self.onsets):
+            raise ValueError("pitches, durations and onsets must have the same length")
+        self.flats = flats
+        self.spellings = spellings
+        self.spelling_index = None
+        if spellings is not None:
+            self.spelling_index = np.asarray(spelling_index, dtype=SPELLING_DTYPE)
+            if len(self.spelling_index) != len(self.pitches):
+                raise ValueError("spelling_index must have one entry per note")
+
+    # -------------------------------------------------------------------------
+    # Construction
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_json(cls, data: Union[str, Iterable[Any], "NoteSequence"]) -> "NoteSequence":
+        """
+        Build a sequence from note objects, ``[note, duration]`` pairs or a JSON string of either.
+
+        Ornaments are stripped from note names, and each name keeps the
+        spelling it was written with (F#4 stays F#4 next to a Bb4). Durations
+        written as strings are converted with int(). Elements that are not
+        notes or whose names are invalid are skipped with a warning, and
+        durations below one unit are raised to one. A NoteSequence is
+        returned as-is.
+
+        Args:
+            data: Exercise data in any supported shape
+
+        Returns:
+            NoteSequence
+
+        Raises:
+            ValueError: If data is a string that is not valid JSON, or a
+                duration does not fit in DURATION_DTYPE
+        """
+        if isinstance(data, NoteSequence):
+            return data
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid exercise JSON: {e}") from e
+            if not isinstance(data, list):
+                raise ValueError("Exercise JSON must be an array of notes")
+        written = {}  # Distinct names as written -> their index
+        name_index = []
+        durations = []
+        for element in data:
+            note = as_note(element, coerce=True)
+            if note is None:
+                print(f"Warning: Invalid note {element!r}, skipping")
+                continue
+            name_index.append(written.setdefault(note.note, len(written)))
+            durations.append(max(1, note.duration))
+        longest = max(durations, default=0)
+        if longest > np.iinfo(DURATION_DTYPE).max:
+            raise ValueError(f"Note duration {longest} exceeds the maximum of "
+                             f"{np.iinfo(DURATION_DTYPE).max} units")
+
+        # Each distinct name is converted and cleaned once
+        names = list(written)
+        name_pitches = names_to_midi(names, invalid=-1, clean=True)
+        cleaned = {}  # Cleaned spelling -> index in spellings
+        name_spellings = np.zeros(len(names), dtype=SPELLING_DTYPE)
+        for index, (name, pitch) in enumerate(zip(names, name_pitches.tolist())):
+            if pitch >= 0:
+                name_spellings[index] = cleaned.setdefault(clean_note_string(name), len(cleaned))
+        spellings = list(cleaned)
+
+        name_index = np.asarray(name_index, dtype=np.intp)
+        pitches = name_pitches[name_index]
+        durations = np.asarray(durations, dtype=DURATION_DTYPE)
+        valid = pitches >= 0
+        if not valid.all():
+            for index in np.flatnonzero(~valid).tolist():
+                print(f"Warning: Invalid note '{names[name_index[index]]}', skipping")
+            name_index, pitches, durations = name_index[valid], pitches[valid], durations[valid]
+        flats = any("b" in spelling[1:] for spelling in spellings)
+        return cls(pitches, durations, flats=flats, spellings=spellings, spelling_index=name_spellings[name_index])
+
+    # -------------------------------------------------------------------------
+    # Access
+    # -------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.pitches)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Note, "NoteSequence"]:
+        """A Note for an integer index, or a zero-copy NoteSequence view for a slice."""
+        if isinstance(index, slice):
+            spelling_index = None if self.spellings is None else self.spelling_index[index]
+            return NoteSequence(self.pitches[index], self.durations[index], self.onsets[index], self.flats,
+                                self.spellings, spelling_index)
+        if self.spellings is not None:
+            return Note(self.spellings[self.spelling_index[index]], int(self.durations[index]))
+        return Note(self.name_table()[self.pitches[index]], int(self.durations[index]))
+
+    def __iter__(self) -> Iterator[Note]:
+        for name, duration in zip(self.names, self.durations.tolist()):
+            yield Note(name, duration)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, NoteSequence):
+            return NotImplemented
+        return (np.array_equal(self.pitches, other.pitches) and np.array_equal(self.durations, other.durations)
+                and np.array_equal(self.onsets, other.onsets))
+
+    def __repr__(self) -> str:
+        return f"NoteSequence({len(self)} notes, {self.total_duration} units)"
+
+    def name_table(self) -> List[str]:
+        """Note names indexed by MIDI number, spelled for a sequence built from pitches alone."""
+        return _FLAT_NAMES if self.flats else _SHARP_NAMES
+
+    @property
+    def names(self) -> List[str]:
+        """Note names of all notes, spelled as they were written when known."""
+        if self.spellings is not None:
+            spellings = self.spellings
+            return [spellings[index] for index in self.spelling_index.tolist()]
+        names = self.name_table()
+        return [names[pitch] for pitch in self.pitches.tolist()]
+
+    @property
+    def start(self) -> int:
+        """Onset of the first note (0 unless this is a slice)."""
+        return int(self.onsets[0]) if len(self) else 0
+
+    @property
+    def end(self) -> int:
+        """Offset of the last note."""
+        return int(self.onsets[-1]) + int(self.durations[-1]) if len(self) else 0
+
+    @property
+    def total_duration(self) -> int:
+        """Sum of the durations in 8th-note units."""
+        return self.end - self.start
+
+    def measures(self, first: int, last: Optional[int], units_per_measure: int) -> "NoteSequence":
+        """
+        Zero-copy view of the notes starting in measures first..last-1.
+
+        Args:
+            first: Index of the first measure (0-based)
+            last: Index after the last measure (None for the end)
+            units_per_measure: 8th-note units per measure
+
+        Returns:
+            NoteSequence view sharing this sequence's arrays
+        """
+        low = np.searchsorted(self.onsets, first * units_per_measure, side="left")
+        high = len(self) if last is None else np.searchsorted(self.onsets, last * units_per_measure, side="left")
+        return self[low:high]
+
+    def measure(self, index: int, units_per_measure: int) -> "NoteSequence":
+        """Zero-copy view of the notes starting in one measure."""
+        return self.measures(index, index + 1, units_per_measure)
+
+    # -------------------------------------------------------------------------
+    # Conversion
+    # -------------------------------------------------------------------------
+    def to_json(self) -> List[Dict[str, Any]]:
+        """
+        Convert to note objects with cumulative durations relative to the sequence start.
+
+        Returns:
+            List of objects with note, duration, and cumulative_duration properties
+        """
+        ends = (self.onsets.astype(np.int64) + self.durations - self.start).tolist()
+        return [{"note": name, "duration": duration, "cumulative_duration": end}
+                for name, duration, end in zip(self.names, self.durations.tolist(), ends)]
+
+    def to_pairs(self) -> List[List[Any]]:
+        """Convert to legacy ``[note, duration]`` pairs."""
+        return [[name, duration] for name, duration in zip(self.names, self.durations.tolist())]
+
+    def to_json_string(self, indent: Optional[int] = None) -> str:
+        """
+        Serialize as a JSON array of note objects.
+
+        Args:
+            indent: Indentation as in json.dumps (None for a single line)
+
+        Returns:
+            JSON string
+        """
+        if indent is not None:
+            return json.dumps(self.to_json(), indent=indent)
+        names = self.names
+        quoted = {name: json.dumps(name) for name in set(names)}  # Written names may need escaping
+        ends = (self.onsets.astype(np.int64) + self.durations - self.start).tolist()
+        return "[" + ", ".join(
+            f'{{"note": {quoted[name]}, "duration": {duration}, "cumulative_duration": {end}}}'
+            for name, duration, end in zip(names, self.durations.tolist(), ends)) + "]"
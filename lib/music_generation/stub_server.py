@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+
+"""
+Mistral Stub Server
+=================
+Local Mistral-compatible chat-completions server for offline benchmarking.
+
+The server answers ``POST /v1/chat/completions`` in one of three modes:
+
+- ``synthetic``: generates a valid exercise of the requested length
+- ``record``: forwards each request to the real API and appends the
+  request/response pair to a JSONL cassette
+- ``replay``: answers from a cassette, deterministically and without network
+
+Point the generator at it by exporting ``MISTRAL_API_URL`` before starting
+Python, e.g. ``MISTRAL_API_URL=http://127.0.0.1:8089/v1/chat/completions``.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+
+import requests
+
+from .constants import (
+    MISTRAL_DEFAULT_API_URL,
+    STUB_SERVER_HOST,
+    STUB_SERVER_PORT,
+    STUB_STREAM_CHUNK_SIZE,
+)
+from .parsing import format_compact
+
+MODES = ("synthetic", "record", "replay")
+
+_TOTAL_PATTERN = re.compile(r"EXACTLY (\d+) units")
+_COMPACT_PATTERN = re.compile(r"NOTE:DURATION")
+_SYNTHETIC_NOTES = ["C4", "D4", "E4", "F4", "G4", "A4", "B4", "C5"]
+_SYNTHETIC_DURATIONS = [1, 2, 2, 4]
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    """
+    Compute the cassette key of a request.
+
+    The ``stream`` flag is ignored so streamed and blocking requests for the
+    same exercise share one recording.
+
+    Args:
+        payload: Chat-completions request body
+
+    Returns:
+        Hex SHA-256 digest of the canonical request
+    """
+    canonical = {k: v for k, v in payload.items() if k != "stream"}
+    data = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def synthetic_content(payload: Dict[str, Any]) -> str:
+    """
+    Generate a valid exercise for a request built by build_mistral_payload.
+
+    The total is read from the duration constraint in the user prompt; the
+    notes are derived from the request key, so equal requests get equal answers.
+    A prompt asking for the compact wire format gets compact text.
+
+    Args:
+        payload: Chat-completions request body
+
+    Returns:
+        JSON array of note objects (or compact ``C4:2 E4:2 |`` text) summing
+        to the requested total
+    """
+    prompt = " ".join(str(message.get("content", "")) for message in payload.get("messages", []))
+    match = _TOTAL_PATTERN.search(prompt)
+    total = int(match.group(1)) if match else 8
+    rng = random.Random(request_key(payload))
+    notes = []
+    cumulative = 0
+    while cumulative < total:
+        duration = min(rng.choice(_SYNTHETIC_DURATIONS), total - cumulative)
+        cumulative += duration
+        notes.append({"note": rng.choice(_SYNTHETIC_NOTES), "duration": duration,
+                      "cumulative_duration": cumulative})
+    if _COMPACT_PATTERN.search(prompt):
+        return format_compact(notes)
+    return json.dumps(notes)
+
+
+class Cassette:
+    """
+    JSONL file of recorded request/response pairs.
+
+    Each line holds ``key``, ``request``, ``status`` and ``content``. When a
+    request was recorded several times its responses are replayed in
+    recording order, wrapping around at the end.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a cassette, loading any existing recordings.
+
+        Args:
+            path: Path of the JSONL file
+        """
+        self.path = path
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def record(self, payload: Dict[str, Any], status: int, content: Optional[str]) -> None:
+        """
+        Append one request/response pair to the cassette.
+
+        Args:
+            payload: Request body
+            status: HTTP status returned upstream
+            content: Message content (None for error responses)
+        """
+        entry = {"key": request_key(payload), "request": payload, "status": status, "content": content}
+        with self._lock:
+            self._entries.setdefault(entry["key"], []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def lookup(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Return the next recorded response for a request.
+
+        Args:
+            payload: Request body
+
+        Returns:
+            Recorded entry, or None if the request was never recorded
+        """
+        key = request_key(payload)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return entries[index % len(entries)]
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server speaking the Mistral chat-completions protocol.
+
+    Latency and failures are injected before every answer, using a seeded
+    random generator so a benchmark run can be repeated exactly.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = STUB_SERVER_HOST, port: int = STUB_SERVER_PORT,
+                 mode: str = "synthetic", cassette: Optional[str] = None,
+                 upstream_url: str = MISTRAL_DEFAULT_API_URL, upstream_key: Optional[str] = None,
+                 latency: float = 0.0, latency_jitter: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: Optional[float] = 1.0, stream_delay: float = 0.0,
+                 seed: Optional[int] = None):
+        """
+        Create the server and bind its socket (port 0 picks a free port).
+
+        Args:
+            host: Interface to listen on
+            port: TCP port
+            mode: One of "synthetic", "record" or "replay"
+            cassette: JSONL cassette path (required for record and replay)
+            upstream_url: Real API URL used in record mode
+            upstream_key: API key used in record mode (defaults to MISTRAL_API_KEY, then to
+                the Authorization header of each incoming request)
+            latency: Mean delay in seconds before answering
+            latency_jitter: Maximum random deviation from the mean delay
+            error_rate: Fraction of requests answered with HTTP 500
+            rate_limit_rate: Fraction of requests answered with HTTP 429
+            retry_after: Retry-After seconds sent with 429 answers (None to omit)
+            stream_delay: Delay in seconds between streamed chunks
+            seed: Seed for latency and failure injection
+
+        Raises:
+            ValueError: If the mode is unknown or a cassette is missing
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown stub server mode {mode!r}; expected one of {', '.join(MODES)}")
+        if mode != "synthetic" and not cassette:
+            raise ValueError(f"A cassette path is required in {mode} mode")
+        if mode == "replay" and not os.path.exists(cassette):
+            raise ValueError(f"Cassette not found: {cassette}")
+        super().__init__((host, port), StubRequestHandler)
+        self.mode = mode
+        self.cassette = Cassette(cassette) if cassette else None
+        self.upstream_url = upstream_url
+        self.upstream_key = upstream_key or os.environ.get("MISTRAL_API_KEY")
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_delay = stream_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._upstream = None
+        self._thread = None
+        self._stats = {"requests": 0, "errors": 0, "rate_limited": 0, "replay_misses": 0}
+
+    @property
+    def url(self) -> str:
+        """Chat-completions URL to use as MISTRAL_API_URL."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _inject(self) -> Tuple[float, Optional[int]]:
+        """Draw the delay and the injected failure status (if any) for one request."""
+        with self._lock:
+            self._stats["requests"] += 1
+            delay = self.latency + self._rng.uniform(-self.latency_jitter, self.latency_jitter)
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return max(0.0, delay), 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return max(0.0, delay), 500
+        return max(0.0, delay), None
+
+    def answer(self, payload: Dict[str, Any], authorization: Optional[str] = None) -> Tuple[int, Optional[str]]:
+        """
+        Produce the status and message content for a request according to the mode.
+
+        Args:
+            payload: Request body
+            authorization: Incoming Authorization header, forwarded upstream in record
+                mode when no upstream key is configured
+
+        Returns:
+            (HTTP status, content) tuple; content is None for error statuses
+        """
+        if self.mode == "synthetic":
+            return 200, synthetic_content(payload)
+        if self.mode == "replay":
+            entry = self.cassette.lookup(payload)
+            if entry is None:
+                self._count("replay_misses")
+                return 404, None
+            return entry["status"], entry["content"]
+
+        # Record mode: ask the real API without streaming, then record the answer
+        if self.upstream_key:
+            authorization = f"Bearer {self.upstream_key}"
+        if not authorization:
+            print("Stub server: no API key to forward upstream; set MISTRAL_API_KEY or send an Authorization header")
+            return 401, None
+        if self._upstream is None:
+            self._upstream = requests.Session()
+        upstream_payload = {k: v for k, v in payload.items() if k != "stream"}
+        try:
+            response = self._upstream.post(self.upstream_url, json=upstream_payload,
+                                           headers={"Authorization": authorization},
+                                           timeout=(5.0, 120.0))
+        except requests.exceptions.RequestException as e:
+            print(f"Stub server: upstream request failed: {e}")
+            return 502, None
+        content = None
+        if response.status_code < 400:
+            try:
+                content = response.json()["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError):
+                return 502, None
+        self.cassette.record(upstream_payload, response.status_code, content)
+        return response.status_code, content
+
+    def start(self) -> "StubServer":
+        """
+        Serve requests on a background thread.
+
+        Returns:
+            The server itself
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and release the socket."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+        if self._upstream is not None:
+            self._upstream.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return request counters.
+
+        Returns:
+            Dictionary with requests, errors, rate_limited and replay_misses
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Request handler for StubServer."""
+
+    protocol_version = "HTTP/1.1"
+    server: StubServer
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"message": f"Unknown path {self.path}"})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._send_json(400, {"message": "Request body is not valid JSON"})
+            return
+
+        delay, failure = self.server._inject()
+        if delay:
+            time.sleep(delay)
+        if failure == 429:
+            self.server._count("rate_limited")
+            headers = {}
+            if self.server.retry_after is not None:
+                headers["Retry-After"] = f"{self.server.retry_after:g}"
+            self._send_json(429, {"message": "Requests rate limit exceeded"}, headers)
+            return
+        if failure == 500:
+            self.server._count("errors")
+            self._send_json(500, {"message": "Injected server error"})
+            return
+
+        status, content = self.server.answer(payload, self.headers.get("Authorization"))
+        if status >= 400 or content is None:
+            self._send_json(status, {"message": "Stub server error"})
+        elif payload.get("stream"):
+            self._send_stream(content, payload.get("model", ""))
+        else:
+            self._send_json(200, {
+                "object": "chat.completion",
+                "model": payload.get("model", ""),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            })
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, content: str, model: str) -> None:
+        """Send content as server-sent events, one chunk per event, using chunked encoding."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = []
+        for start in range(0, len(content), STUB_STREAM_CHUNK_SIZE):
+            delta = {"role": "assistant", "content": content[start:start + STUB_STREAM_CHUNK_SIZE]}
+            events.append({"object": "chat.completion.chunk", "model": model,
+                           "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        try:
+            for event in events:
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                if self.server.stream_delay:
+                    time.sleep(self.server.stream_delay)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Client aborted the stream
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
@@ -3,10 +3,18 @@
 Music Theory Helpers
 ==================
 Utility functions for music theory operations like note conversions.
+
+Note names are converted through tables built at import time, covering
+every letter, accidental (including double sharps and flats) and octave
+in the MIDI range in both upper and lower case, so the per-note helpers
+are dictionary lookups. ``names_to_midi`` and ``midi_to_names`` convert
+whole arrays at once.
 """
 
 import re
-from typing import Dict
+from typing import Dict, List, Tuple, Iterable, Optional
+
+import numpy as np
 
 # -----------------------------------------------------------------------------
 # Music theory helpers (note names ↔︎ MIDI numbers)
@@ -25,10 +33,48 @@ INSTRUMENT_PROGRAMS: Dict[str, int] = {
     "Clarinet": 71, "Flute": 73,
 }
 
+SHARP_NAMES: List[str] = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+FLAT_NAMES: List[str] = ["C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B"]
+
+# Semitone offsets of the accidentals accepted in note names
+ACCIDENTALS: Dict[str, int] = {"": 0, "#": 1, "b": -1, "##": 2, "x": 2, "bb": -2}
+
+MIDI_MIN = 0
+MIDI_MAX = 127
+
+_LETTERS: Dict[str, int] = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+# Every spelling of every note in the MIDI range -> MIDI number
+_NOTE_TABLE: Dict[str, int] = {
+    f"{case(letter)}{accidental}{octave}": midi
+    for letter, pitch_class in _LETTERS.items()
+    for case in (str.upper, str.lower)
+    for accidental, offset in ACCIDENTALS.items()
+    for octave in range(-2, 10)
+    for midi in (pitch_class + offset + (octave + 1) * 12,)
+    if MIDI_MIN <= midi <= MIDI_MAX
+}
+
+# MIDI number -> note name, in both spellings
+_SHARP_TABLE = np.array([f"{SHARP_NAMES[midi % 12]}{midi // 12 - 1}" for midi in range(MIDI_MAX + 1)], dtype=object)
+_FLAT_TABLE = np.array([f"{FLAT_NAMES[midi % 12]}{midi // 12 - 1}" for midi in range(MIDI_MAX + 1)], dtype=object)
+
+# Fallback for names with trailing text (e.g., 'C4 staccato'); the table covers clean names
+_NOTE_PATTERN = re.compile(r"([A-Ga-g])(##|bb|x|#|b)?(-?\d+)")
+
+# Ornament markers and stray parentheses, removed in one pass by clean_note_string
+_ORNAMENT_PATTERN = re.compile(r"\((?:grace|turn|mordent|trill|appoggiatura|double-grace|fermata)\)|[()]")
+
+# Semitones above the tonic of each scale degree
+SCALE_STEPS: Dict[str, List[int]] = {
+    "MAJOR": [0, 2, 4, 5, 7, 9, 11],
+    "MINOR": [0, 2, 3, 5, 7, 8, 10],  # Natural minor
+}
+
 
 def note_name_to_midi(note: str) -> int:
     """
-    Convert a note name (e.g., 'C4', 'F#3') to MIDI note number.
+    Convert a note name (e.g., 'C4', 'F#3', 'Bbb2', 'c#10') to MIDI note number.
     
     Args:
         note: String representation of a note (e.g., 'C4', 'F#3')
@@ -37,33 +83,147 @@ def note_name_to_midi(note: str) -> int:
         MIDI note number
         
     Raises:
-        ValueError: If the note format is invalid
+        ValueError: If the note format is invalid or the note is outside the MIDI range
     """
-    match = re.match(r"([A-Ga-g][#b]?)(\d)", note)
+    midi = _NOTE_TABLE.get(note)
+    if midi is not None:
+        return midi
+    match = _NOTE_PATTERN.match(note)
     if not match:
         raise ValueError(f"Invalid note: {note}")
-    pitch, octave = match.groups()
-    pitch = pitch.upper().replace('b', 'B')
-    if pitch not in NOTE_MAP:
-        raise ValueError(f"Invalid pitch: {pitch}")
-    return NOTE_MAP[pitch] + (int(octave) + 1) * 12
+    letter, accidental, octave = match.groups()
+    midi = _LETTERS[letter.upper()] + ACCIDENTALS[accidental or ""] + (int(octave) + 1) * 12
+    if not MIDI_MIN <= midi <= MIDI_MAX:
+        raise ValueError(f"Note outside the MIDI range: {note}")
+    return midi
 
 
-def midi_to_note_name(midi_num: int) -> str:
+def midi_to_note_name(midi_num: int, flats: bool = False) -> str:
     """
     Convert a MIDI note number to note name (e.g., 'C4').
     
     Args:
         midi_num: MIDI note number
+        flats: Spell black keys as flats (e.g., 'Bb3') instead of sharps
         
     Returns:
         Note name string (e.g., 'C4')
     """
-    notes = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+    if MIDI_MIN <= midi_num <= MIDI_MAX:
+        return (_FLAT_TABLE if flats else _SHARP_TABLE)[midi_num]
+    notes = FLAT_NAMES if flats else SHARP_NAMES
     octave = (midi_num // 12) - 1
     return f"{notes[midi_num % 12]}{octave}"
 
 
+def names_to_midi(names: Iterable[str], invalid: Optional[int] = None, clean: bool = False) -> np.ndarray:
+    """
+    Convert many note names to MIDI numbers at once.
+    
+    Args:
+        names: Note names (list or array)
+        invalid: Value stored for invalid names; None raises instead
+        clean: Strip ornamentation from the names first
+        
+    Returns:
+        int16 array of MIDI numbers, aligned with names
+        
+    Raises:
+        ValueError: If a name is invalid and invalid is None
+    """
+    names = names.tolist() if isinstance(names, np.ndarray) else list(names)
+    table = _NOTE_TABLE
+    result = np.fromiter((table.get(name, -1) for name in names), dtype=np.int16, count=len(names))
+    # Only names missing from the table (ornaments, trailing text, errors) take the slow path
+    for index in np.flatnonzero(result < 0).tolist():
+        name = names[index]
+        try:
+            result[index] = note_name_to_midi(clean_note_string(name) if clean else name)
+        except (TypeError, ValueError):
+            if invalid is None:
+                raise ValueError(f"Invalid note: {name}")
+            result[index] = invalid
+    return result
+
+
+def midi_to_names(midi_numbers: Iterable[int], flats: bool = False) -> np.ndarray:
+    """
+    Convert many MIDI numbers to note names at once.
+    
+    Args:
+        midi_numbers: MIDI note numbers (list or array)
+        flats: Spell black keys as flats instead of sharps
+        
+    Returns:
+        Object array of note names, aligned with midi_numbers
+        
+    Raises:
+        ValueError: If a number is outside the MIDI range
+    """
+    midi_numbers = np.asarray(midi_numbers)
+    if midi_numbers.size and (midi_numbers.min() < MIDI_MIN or midi_numbers.max() > MIDI_MAX):
+        raise ValueError("MIDI numbers must be between 0 and 127")
+    return (_FLAT_TABLE if flats else _SHARP_TABLE).take(midi_numbers.astype(np.intp, copy=False))
+
+
+def parse_key(key: str) -> Tuple[int, str]:
+    """
+    Split a key name (e.g., 'Bb Major', 'A Minor') into tonic and mode.
+    
+    Args:
+        key: Key name with tonic and mode
+        
+    Returns:
+        Tuple of (tonic pitch class 0-11, 'MAJOR' or 'MINOR')
+        
+    Raises:
+        ValueError: If the key format is invalid
+    """
+    parts = key.split()
+    if len(parts) != 2 or parts[1].upper() not in SCALE_STEPS:
+        raise ValueError(f"Invalid key: {key}")
+    tonic = parts[0].upper()
+    if tonic not in NOTE_MAP:
+        raise ValueError(f"Invalid key: {key}")
+    return NOTE_MAP[tonic], parts[1].upper()
+
+
+def key_uses_flats(key: str) -> bool:
+    """
+    Whether a key's signature is written with flats (e.g., F Major, D Minor).
+    
+    Args:
+        key: Key name with tonic and mode
+        
+    Returns:
+        True for flat keys, False for sharp keys and C Major / A Minor
+    """
+    tonic, mode = parse_key(key)
+    accidental = key.split()[0][1:]
+    if accidental:
+        return accidental == "b"
+    # Natural tonics: flat keys are one to five fifths below the relative major's C
+    major_tonic = tonic if mode == "MAJOR" else (tonic + 3) % 12
+    return (major_tonic * 7) % 12 > 6
+
+
+def scale_midi_numbers(key: str, low: int, high: int) -> List[int]:
+    """
+    List the MIDI numbers of a key's scale between two notes.
+    
+    Args:
+        key: Key name with tonic and mode
+        low: Lowest MIDI number (inclusive)
+        high: Highest MIDI number (inclusive)
+        
+    Returns:
+        Ascending MIDI numbers of the scale notes in range
+    """
+    tonic, mode = parse_key(key)
+    pitch_classes = {(tonic + step) % 12 for step in SCALE_STEPS[mode]}
+    return [midi for midi in range(low, high + 1) if midi % 12 in pitch_classes]
+
+
 def clean_note_string(note_str: str) -> str:
     """
     Clean note strings by removing ornamentation symbols that cause parsing errors.
@@ -74,20 +234,16 @@ def clean_note_string(note_str: str) -> str:
     Returns:
         Cleaned note string
     """
-    # Remove common ornamentation patterns
-    patterns_to_remove = [
-        r'\(grace\)', r'\(turn\)', r'\(mordent\)', r'\(trill\)',
-        r'\(appoggiatura\)', r'\(double-grace\)', r'\(fermata\)'
-    ]
-
-    for pattern in patterns_to_remove:
-        note_str = re.sub(pattern, '', note_str)
+    if note_str in _NOTE_TABLE:
+        return note_str
 
-    # If multiple notes are present (like in ornaments), take the first one
-    if '-' in note_str:
-        note_str = note_str.split('-')[0]
+    # Remove ornamentation and any remaining parentheses in one pass
+    note_str = _ORNAMENT_PATTERN.sub('', note_str)
 
-    # Remove any remaining parentheses or special characters
-    note_str = re.sub(r'[\(\)]', '', note_str).strip()
+    # If multiple notes are present (like in ornaments), take the first one;
+    # a dash followed by a digit is a negative octave (e.g., 'C-1')
+    head, dash, tail = note_str.partition('-')
+    if dash and not tail[:1].isdigit():
+        note_str = head
 
-    return note_str
\ No newline at end of file
+    return note_str.strip()
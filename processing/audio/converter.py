@@ -4,26 +4,53 @@
 Audio Converter
 ==============
 Functions for converting MIDI to audio formats.
+
+Audio is rendered as a stream of fixed-size PCM blocks that are piped into
+ffmpeg as they are synthesized, so memory stays flat however long the
+exercise is, and the first MP3 bytes exist after the first block. Finished
+renders go into the audio cache, so the same exercise is only rendered once.
 """
 
+import io
 import os
+import time
 import uuid
-import shutil
+import functools
 import tempfile
+import threading
+import contextlib
 import subprocess
 import requests
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union, Iterable, Iterator, Dict, List
 
+import numpy as np
 from mido import MidiFile
-from lib.music_generation.constants import SOUNDFONT_URLS, TICKS_PER_BEAT, SAMPLE_RATE
-
-
-def get_soundfont(instrument: str) -> Optional[str]:
+from lib.music_generation.constants import (
+    SOUNDFONT_URLS,
+    SAMPLE_RATE,
+    AUDIO_FILTERS,
+    RAM_DIR,
+    AUDIO_STREAM_BLOCK_FRAMES,
+    FALLBACK_WAVETABLE_SIZE,
+    FALLBACK_BLOCK_FRAMES,
+    FALLBACK_ATTACK_SECONDS,
+    FALLBACK_DECAY_SECONDS,
+    FALLBACK_SUSTAIN_LEVEL,
+    FALLBACK_RELEASE_SECONDS,
+    SYNTH_TAIL_SECONDS,
+)
+from .synth import get_default_synth_pool
+from .render_cache import get_default_audio_cache, soundfont_checksum
+from ..capabilities import AUDIO_BACKENDS, get_default_capabilities
+
+
+def get_soundfont(instrument: str, download: bool = True) -> Optional[str]:
     """
     Download or retrieve a soundfont for the specified instrument.
     
     Args:
         instrument: Instrument name
+        download: Whether to download the soundfont if it is not cached locally
         
     Returns:
         Path to soundfont file or None if download fails
@@ -34,6 +61,8 @@ def get_soundfont(instrument: str) -> Optional[str]:
     # If soundfont already exists, return its path
     if os.path.exists(sf2_path) and os.path.getsize(sf2_path) > 10240:  # At least 10KB
         return sf2_path
+    if not download:
+        return None
     
     # Alternative URLs for common instruments if primary source fails
     alternative_urls = {
@@ -128,25 +157,466 @@ def get_soundfont(instrument: str) -> Optional[str]:
     return None
 
 
-def midi_to_mp3(midi_obj: MidiFile, instrument: str = "Piano", force_fallback: bool = False) -> Tuple[Optional[str], float]:
+def synth_available(instrument: str) -> bool:
+    """
+    Check whether FluidSynth can render an instrument without downloading anything.
+    
+    Args:
+        instrument: Instrument name
+        
+    Returns:
+        True if pyFluidSynth or the fluidsynth binary, and a cached soundfont
+        (or the Piano one), are present
+    """
+    if get_default_capabilities().first_available(AUDIO_BACKENDS) is None:
+        return False
+    return bool(get_soundfont(instrument, download=False) or get_soundfont("Piano", download=False))
+
+
+@contextlib.contextmanager
+def memory_file(data: bytes = b"", name: str = "audio") -> Iterator[Tuple[int, str]]:
+    """
+    Hold data in an anonymous in-memory file that child processes can open by path.
+    
+    Uses memfd_create where available (Linux); elsewhere falls back to a
+    temporary file in RAM_DIR. Pass the descriptor to subprocess.run with
+    pass_fds so the path stays valid in the child.
+    
+    Args:
+        data: Initial contents
+        name: Name shown for the file in /proc (debugging only)
+        
+    Yields:
+        Tuple of (file descriptor, path)
+    """
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create(name)
+        path = f"/proc/self/fd/{fd}"
+    else:
+        fd, path = tempfile.mkstemp(dir=RAM_DIR if os.path.isdir(RAM_DIR) else None)
+    try:
+        if data:
+            with open(fd, "wb", closefd=False) as f:
+                f.write(data)
+        yield fd, path
+    finally:
+        os.close(fd)
+        if not path.startswith("/proc/self/fd/"):
+            os.remove(path)
+
+
+def midi_to_bytes(midi_obj: Union[MidiFile, bytes]) -> bytes:
+    """Serialize a MidiFile in memory (bytes, e.g. from json_to_midi_bytes, pass through)."""
+    if isinstance(midi_obj, (bytes, bytearray)):
+        return bytes(midi_obj)
+    buffer = io.BytesIO()
+    midi_obj.save(file=buffer)
+    return buffer.getvalue()
+
+
+def render_midi_pcm(midi_obj: Union[MidiFile, bytes], sf2_path: str, sample_rate: int = SAMPLE_RATE,
+                    timeout: Optional[float] = None) -> np.ndarray:
+    """
+    Render MIDI to PCM with FluidSynth without writing to disk.
+    
+    The MIDI data and the raw output both live in in-memory files.
+    
+    Args:
+        midi_obj: MidiFile or Standard MIDI File bytes
+        sf2_path: Soundfont to render with
+        sample_rate: Output sample rate in Hz
+        timeout: Optional seconds allowed for FluidSynth
+        
+    Returns:
+        int16 array of shape (frames, 2)
+        
+    Raises:
+        subprocess.SubprocessError: If FluidSynth fails or times out
+    """
+    fluidsynth = get_default_capabilities().path("fluidsynth") or "fluidsynth"
+    with memory_file(midi_to_bytes(midi_obj), "exercise.mid") as (midi_fd, midi_path), \
+            memory_file(name="exercise.raw") as (pcm_fd, pcm_path):
+        subprocess.run([
+            fluidsynth, '-ni', '-T', 'raw', '-O', 's16', '-E', 'little', '-F', pcm_path,
+            '-r', str(sample_rate), '-g', '1.0', sf2_path, midi_path
+        ], check=True, capture_output=True, timeout=timeout, pass_fds=(midi_fd, pcm_fd))
+        os.lseek(pcm_fd, 0, os.SEEK_SET)
+        with open(pcm_fd, "rb", closefd=False) as f:
+            data = f.read()
+    data = data[:len(data) - len(data) % 4]  # Whole stereo frames only
+    return np.frombuffer(data, dtype='<i2').reshape(-1, 2)
+
+
+@contextlib.contextmanager
+def _kill_after(process: subprocess.Popen, timeout: Optional[float]) -> Iterator[threading.Event]:
+    """
+    Give a process until timeout seconds to finish the block; the event is set if it was killed.
+    
+    The process is waited for when the block completes, and killed at once if the
+    block raises (or a generator using it is closed).
+    """
+    expired = threading.Event()
+
+    def expire() -> None:
+        expired.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, expire) if timeout is not None else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        yield expired
+        process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if timer:
+            timer.cancel()
+
+
+def _process_error(process: subprocess.Popen, command: List[str], log_fd: int) -> subprocess.CalledProcessError:
+    """Build the error for a failed process from the log it wrote into a memory file."""
+    os.lseek(log_fd, 0, os.SEEK_SET)
+    with open(log_fd, "rb", closefd=False) as f:
+        return subprocess.CalledProcessError(process.returncode, command, stderr=f.read())
+
+
+def stream_midi_pcm(midi_obj: Union[MidiFile, bytes], sf2_path: str, sample_rate: int = SAMPLE_RATE,
+                    timeout: Optional[float] = None,
+                    block_frames: int = AUDIO_STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Render MIDI to PCM blocks with the fluidsynth CLI, as it produces them.
+    
+    FluidSynth writes its raw output into a pipe, read one block at a time,
+    so the first block is available long before the render finishes.
+    Where pipes cannot be opened by path (no /proc), the whole render is
+    made with render_midi_pcm and then split into blocks.
+    
+    Args:
+        midi_obj: MidiFile or Standard MIDI File bytes
+        sf2_path: Soundfont to render with
+        sample_rate: Output sample rate in Hz
+        timeout: Optional seconds allowed for FluidSynth
+        block_frames: Frames per block
+        
+    Yields:
+        int16 arrays of shape (block_frames, 2); the last may be shorter
+        
+    Raises:
+        subprocess.SubprocessError: If FluidSynth fails or times out
+    """
+    if not os.path.isdir("/proc/self/fd"):
+        pcm = render_midi_pcm(midi_obj, sf2_path, sample_rate, timeout)
+        for start in range(0, len(pcm), block_frames):
+            yield pcm[start:start + block_frames]
+        return
+
+    fluidsynth = get_default_capabilities().path("fluidsynth") or "fluidsynth"
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, "rb") as pipe, \
+            memory_file(midi_to_bytes(midi_obj), "exercise.mid") as (midi_fd, midi_path), \
+            memory_file(name="fluidsynth.log") as (log_fd, _):
+        try:
+            command = [
+                fluidsynth, '-ni', '-T', 'raw', '-O', 's16', '-E', 'little', '-F', f'/proc/self/fd/{write_fd}',
+                '-r', str(sample_rate), '-g', '1.0', sf2_path, midi_path
+            ]
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log_fd, stderr=log_fd,
+                                       pass_fds=(midi_fd, write_fd))
+        finally:
+            os.close(write_fd)  # The pipe reaches EOF when FluidSynth exits
+        with _kill_after(process, timeout) as expired:
+            while True:
+                data = pipe.read(4 * block_frames)
+                data = data[:len(data) - len(data) % 4]  # Whole stereo frames only
+                if not data:
+                    break
+                yield np.frombuffer(data, dtype='<i2').reshape(-1, 2)
+        if expired.is_set():
+            raise subprocess.TimeoutExpired(command, timeout)
+        if process.returncode:
+            raise _process_error(process, command, log_fd)
+
+
+def synthesize_pcm(midi_obj: Union[MidiFile, bytes], sf2_path: str, instrument: str = "Piano",
+                   timeout: Optional[float] = None) -> np.ndarray:
+    """
+    Render MIDI to PCM with FluidSynth, in-process if possible.
+    
+    Uses the shared pool of pyFluidSynth engines, or the fluidsynth CLI when
+    pyFluidSynth is not installed.
+    
+    Args:
+        midi_obj: MidiFile or Standard MIDI File bytes
+        sf2_path: Soundfont to render with
+        instrument: Instrument whose preset is selected
+        timeout: Optional seconds allowed for synthesis (including any wait
+            for a busy engine pool)
+        
+    Returns:
+        int16 array of shape (frames, 2) at SAMPLE_RATE
+        
+    Raises:
+        FileNotFoundError: If neither pyFluidSynth nor the fluidsynth CLI is available
+        TimeoutError, subprocess.SubprocessError: If synthesis fails or times out
+    """
+    try:
+        return get_default_synth_pool().render(midi_obj, sf2_path, instrument, timeout)
+    except ImportError:
+        if not get_default_capabilities().available("fluidsynth"):
+            raise FileNotFoundError("FluidSynth not available")
+        return render_midi_pcm(midi_obj, sf2_path, SAMPLE_RATE, timeout)
+
+
+def _primed(first: np.ndarray, blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    """Yield a block already taken from a stream, then the rest of the stream."""
+    try:
+        yield first
+        yield from blocks
+    finally:
+        blocks.close()
+
+
+def synthesize_pcm_blocks(midi_obj: Union[MidiFile, bytes], sf2_path: str, instrument: str = "Piano",
+                          timeout: Optional[float] = None,
+                          block_frames: int = AUDIO_STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Stream MIDI rendered by FluidSynth, in-process if possible.
+    
+    Like synthesize_pcm, but PCM is produced block by block. The first block
+    is rendered before this returns, so a missing synthesizer or a busy
+    engine pool is reported here rather than in the middle of the stream.
+    
+    Args:
+        midi_obj: MidiFile or Standard MIDI File bytes
+        sf2_path: Soundfont to render with
+        instrument: Instrument whose preset is selected
+        timeout: Optional seconds allowed for synthesis (including any wait
+            for a busy engine pool)
+        block_frames: Frames per block
+        
+    Returns:
+        Iterator of int16 arrays of shape (block_frames, 2) at SAMPLE_RATE;
+        the last may be shorter
+        
+    Raises:
+        FileNotFoundError: If neither pyFluidSynth nor the fluidsynth CLI is available
+        TimeoutError, subprocess.SubprocessError: If synthesis fails or times out
+    """
+    try:
+        blocks = get_default_synth_pool().stream(midi_obj, sf2_path, instrument, timeout, block_frames)
+        first = next(blocks, None)
+    except ImportError:
+        if not get_default_capabilities().available("fluidsynth"):
+            raise FileNotFoundError("FluidSynth not available")
+        blocks = stream_midi_pcm(midi_obj, sf2_path, SAMPLE_RATE, timeout, block_frames)
+        first = next(blocks, None)
+    if first is None:
+        return iter(())
+    return _primed(first, blocks)
+
+
+def _ffmpeg_command(ffmpeg: str, sample_rate: int, channels: int, audio_filter: Optional[str],
+                    output: str) -> List[str]:
+    """ffmpeg arguments encoding raw s16le PCM from stdin to MP3."""
+    command = [ffmpeg, '-loglevel', 'error', '-y', '-f', 's16le', '-ar', str(sample_rate),
+               '-ac', str(channels), '-i', 'pipe:0']
+    if audio_filter:
+        command += ['-af', audio_filter]
+    return command + ['-f', 'mp3', output]
+
+
+def encode_mp3(pcm: np.ndarray, sample_rate: int, output_path: str, audio_filter: Optional[str] = None,
+               timeout: Optional[float] = None) -> None:
+    """
+    Encode PCM straight to an MP3 file by piping it into ffmpeg.
+    
+    Args:
+        pcm: int16 samples, shape (frames,) for mono or (frames, channels)
+        sample_rate: Sample rate in Hz
+        output_path: Final location of the MP3
+        audio_filter: Optional ffmpeg audio filter (e.g. "highpass=f=200")
+        timeout: Optional seconds allowed for encoding
+        
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed
+        subprocess.SubprocessError: If encoding fails or times out
+    """
+    ffmpeg = get_default_capabilities().path("ffmpeg")
+    if ffmpeg is None:
+        raise FileNotFoundError("ffmpeg not found")
+    channels = 1 if pcm.ndim == 1 else pcm.shape[1]
+    command = _ffmpeg_command(ffmpeg, sample_rate, channels, audio_filter, output_path)
+    try:
+        subprocess.run(command, input=np.ascontiguousarray(pcm, dtype='<i2').tobytes(),
+                       check=True, capture_output=True, timeout=timeout)
+    except BaseException:
+        # Do not leave a partial MP3 at the final location
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def stream_mp3(blocks: Iterable[np.ndarray], sample_rate: int, audio_filter: Optional[str] = None,
+               timeout: Optional[float] = None) -> Iterator[bytes]:
+    """
+    Encode a stream of PCM blocks to MP3 incrementally.
+    
+    A single ffmpeg process encodes the whole stream. A feeder thread pulls
+    blocks (and so drives the synthesizer) and writes them to ffmpeg's
+    stdin, while MP3 data is yielded as soon as ffmpeg emits it. The audio
+    filter runs inside that one ffmpeg process, so its state carries over
+    from block to block with no seams.
+    
+    Args:
+        blocks: int16 PCM blocks, shape (frames,) for mono or (frames, channels);
+            the first block sets the channel count
+        sample_rate: Sample rate in Hz
+        audio_filter: Optional ffmpeg audio filter (e.g. "highpass=f=200")
+        timeout: Optional seconds allowed for the whole stream
+        
+    Yields:
+        Chunks of MP3 data
+        
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed
+        subprocess.SubprocessError: If encoding fails or times out
+        Any exception raised while producing the blocks
+    """
+    ffmpeg = get_default_capabilities().path("ffmpeg")
+    if ffmpeg is None:
+        raise FileNotFoundError("ffmpeg not found")
+    blocks = iter(blocks)
+    first = next(blocks, None)
+    if first is None:
+        return
+    channels = 1 if first.ndim == 1 else first.shape[1]
+    command = _ffmpeg_command(ffmpeg, sample_rate, channels, audio_filter, 'pipe:1')
+    command[-3:-3] = ['-flush_packets', '1']  # Hand each MP3 frame over as soon as it is encoded
+    errors: List[BaseException] = []
+
+    with memory_file(name="ffmpeg.log") as (log_fd, _):
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=log_fd)
+
+        def feed() -> None:
+            block = first
+            try:
+                while block is not None:
+                    try:
+                        process.stdin.write(np.ascontiguousarray(block, dtype='<i2').tobytes())
+                    except BrokenPipeError:
+                        break  # ffmpeg stopped early (or was stopped); its exit status says why
+                    block = next(blocks, None)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                if hasattr(blocks, "close"):
+                    blocks.close()
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        feeder = threading.Thread(target=feed, name="mp3-feeder", daemon=True)
+        try:
+            with _kill_after(process, timeout) as expired:
+                feeder.start()
+                while True:
+                    data = process.stdout.read1(1 << 16)
+                    if not data:
+                        break
+                    yield data
+        finally:
+            feeder.join()
+            process.stdout.close()
+        if expired.is_set():
+            raise subprocess.TimeoutExpired(command, timeout)
+        if errors:
+            raise errors[0]
+        if process.returncode:
+            raise _process_error(process, command, log_fd)
+
+
+def encode_mp3_stream(blocks: Iterable[np.ndarray], sample_rate: int, output_path: str,
+                      audio_filter: Optional[str] = None, timeout: Optional[float] = None) -> int:
+    """
+    Encode a stream of PCM blocks into an MP3 file as they arrive.
+    
+    MP3 data is written (and flushed) as ffmpeg produces it, so the file is
+    playable from its start while later blocks are still being rendered.
+    
+    Args:
+        blocks: int16 PCM blocks (see stream_mp3)
+        sample_rate: Sample rate in Hz
+        output_path: Final location of the MP3
+        audio_filter: Optional ffmpeg audio filter
+        timeout: Optional seconds allowed for the whole stream
+        
+    Returns:
+        Number of PCM frames encoded
+        
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed
+        subprocess.SubprocessError: If encoding fails or times out
+        Any exception raised while producing the blocks
+    """
+    frames = 0
+
+    def counted() -> Iterator[np.ndarray]:
+        nonlocal frames
+        try:
+            for block in blocks:
+                frames += len(block)
+                yield block
+        finally:
+            if hasattr(blocks, "close"):
+                blocks.close()
+
+    try:
+        with open(output_path, "wb") as f:
+            for data in stream_mp3(counted(), sample_rate, audio_filter, timeout):
+                f.write(data)
+                f.flush()
+    except BaseException:
+        # Do not leave a partial MP3 at the final location
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return frames
+
+
+def static_mp3_path(prefix: str = "exercise") -> str:
+    """Return a fresh MP3 path in the static directory."""
+    os.makedirs("static", exist_ok=True)
+    return os.path.join('static', f'{prefix}_{uuid.uuid4().hex}.mp3')
+
+
+def midi_to_mp3(midi_obj: Union[MidiFile, bytes], instrument: str = "Piano", force_fallback: bool = False,
+                timeout: Optional[float] = None) -> Tuple[Optional[str], float]:
     """
     Convert a MIDI object to MP3 audio file.
     
+    PCM blocks from synthesize_pcm_blocks are encoded as they are rendered,
+    straight into an MP3 in the static directory, so memory stays flat and
+    the start of the file is playable before the render ends. A render of
+    the same MIDI with the same soundfont and filters is copied from the
+    audio cache instead, without starting the synth.
+    
     Args:
-        midi_obj: MidiFile object to convert
+        midi_obj: MidiFile object (or Standard MIDI File bytes) to convert
         instrument: Instrument name for soundfont selection
         force_fallback: Whether to force using fallback audio generation
+        timeout: Optional seconds allowed for synthesis; soundfonts are then
+            not downloaded, and a FluidSynth run that takes longer (or a
+            wait for a busy engine pool) falls back to the sine-wave audio
         
     Returns:
         Tuple of (path to MP3 file, duration in seconds) or (None, 0) if conversion fails
     """
-    os.makedirs("static", exist_ok=True)
-    os.makedirs("temp_audio", exist_ok=True)
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mid") as mid_file:
-        midi_obj.save(mid_file.name)
-        wav_path = mid_file.name.replace(".mid", ".wav")
-        mp3_path = mid_file.name.replace(".mid", ".mp3")
+    mp3_path = static_mp3_path()
+    expires_at = None if timeout is None else time.monotonic() + timeout
 
     # Use fallback if requested
     if force_fallback:
@@ -157,149 +627,270 @@ def midi_to_mp3(midi_obj: MidiFile, instrument: str = "Piano", force_fallback: b
     sf2_path = None
     
     # First try the requested instrument
-    sf2_path = get_soundfont(instrument)
+    download = timeout is None
+    sf2_path = get_soundfont(instrument, download)
         
     # If that fails and instrument is not Piano, try Piano as a fallback instrument
     if not sf2_path and instrument != "Piano":
         print(f"No valid soundfont available for {instrument}, trying Piano instead...")
-        sf2_path = get_soundfont("Piano")
+        sf2_path = get_soundfont("Piano", download)
         
     # If still no soundfont, use fallback audio generation
     if not sf2_path:
         print(f"No valid soundfont available, using fallback audio generation")
         return generate_fallback_audio(midi_obj, mp3_path)
 
+    # Reuse an earlier render of the same MIDI, soundfont and filters
+    cache = get_default_audio_cache()
+    key = None
+    if cache is not None:
+        midi_obj = midi_to_bytes(midi_obj)  # Hashed for the key, then rendered as is
+        try:
+            renderer = f"fluidsynth:{soundfont_checksum(sf2_path)}:{SYNTH_TAIL_SECONDS}"
+            key = cache.make_key(midi_obj, instrument, renderer, SAMPLE_RATE, AUDIO_FILTERS.get(instrument))
+        except OSError as e:
+            print(f"Could not checksum soundfont {sf2_path}: {e}")
+        duration = None if key is None else cache.fetch(key, mp3_path)
+        if duration is not None:
+            return mp3_path, duration
+
     try:
-        # Check if fluidsynth is available
+        # Start the synth; it renders each block as the encoder asks for it
         try:
-            subprocess.run(['fluidsynth', '--version'], check=True, capture_output=True, text=True)
-        except (subprocess.SubprocessError, FileNotFoundError):
+            blocks = synthesize_pcm_blocks(midi_obj, sf2_path, instrument, timeout)
+        except FileNotFoundError:
             print("FluidSynth not available, using fallback audio generation")
             return generate_fallback_audio(midi_obj, mp3_path)
-            
-        # Try using fluidsynth command
-        result = subprocess.run([
-            'fluidsynth', '-ni', sf2_path, mid_file.name,
-            '-F', wav_path, '-r', '44100', '-g', '1.0'
-        ], check=True, capture_output=True, text=True)
-
-        # Check if WAV file was created successfully
-        if not os.path.exists(wav_path) or os.path.getsize(wav_path) < 1024:
-            print(f"FluidSynth did not generate a valid WAV file for {instrument}, using fallback")
-            return generate_fallback_audio(midi_obj, mp3_path)
 
-        # Convert to MP3
+        # Encode to MP3 (with instrument-specific filters) while rendering
         try:
-            from pydub import AudioSegment
-            sound = AudioSegment.from_wav(wav_path)
-            
-            # Apply instrument-specific filters
-            if instrument == "Trumpet":
-                sound = sound.high_pass_filter(200)
-            elif instrument == "Violin":
-                sound = sound.low_pass_filter(5000)
-                
-            sound.export(mp3_path, format="mp3")
-            
-            # Check if MP3 file was created successfully
-            if not os.path.exists(mp3_path) or os.path.getsize(mp3_path) < 1024:
-                print(f"Failed to create MP3 file for {instrument}, using fallback")
-                return generate_fallback_audio(midi_obj, mp3_path)
-                
-            # Move to static directory
-            static_mp3_path = os.path.join('static', f'exercise_{uuid.uuid4().hex}.mp3')
-            shutil.move(mp3_path, static_mp3_path)
-            return static_mp3_path, sound.duration_seconds
-        except ImportError as e:
+            remaining = None if expires_at is None else max(0.001, expires_at - time.monotonic())
+            frames = encode_mp3_stream(blocks, SAMPLE_RATE, mp3_path, AUDIO_FILTERS.get(instrument), remaining)
+        except FileNotFoundError as e:
             print(f"Required audio libraries not available: {e}, using fallback")
             return generate_fallback_audio(midi_obj, mp3_path)
-        except Exception as e:
-            print(f"MP3 conversion failed: {e}, using fallback")
+        if frames < 256:
+            print(f"FluidSynth did not generate valid audio for {instrument}, using fallback")
             return generate_fallback_audio(midi_obj, mp3_path)
+        if key is not None:
+            cache.put(key, mp3_path, frames / SAMPLE_RATE)
+        return mp3_path, frames / SAMPLE_RATE
+    except (subprocess.TimeoutExpired, TimeoutError):
+        limit = f" within {timeout:.2f}s" if timeout is not None else ""
+        print(f"Audio rendering did not finish{limit}, using fallback")
+        return generate_fallback_audio(midi_obj, mp3_path)
     except subprocess.SubprocessError as e:
-        print(f"FluidSynth process error: {e}, using fallback")
+        print(f"Audio process error: {e}, using fallback")
         return generate_fallback_audio(midi_obj, mp3_path)
     except Exception as e:
-        print(f"FluidSynth failed: {e}, using fallback")
+        print(f"Audio rendering failed: {e}, using fallback")
         return generate_fallback_audio(midi_obj, mp3_path)
-    finally:
-        # Clean up temporary files
-        for f in [mid_file.name, wav_path]:
-            try:
-                os.remove(f)
-            except FileNotFoundError:
-                pass
 
 
-def generate_fallback_audio(midi_obj: MidiFile, output_path: str) -> Tuple[Optional[str], float]:
+def midi_notes(midi_obj: Union[MidiFile, bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Extract the notes of a MIDI file, with its tempo changes applied.
+    
+    Each note_off (or zero-velocity note_on) ends the earliest sounding note
+    of the same pitch and channel; notes never released end with the file.
+    
+    Args:
+        midi_obj: MidiFile object or Standard MIDI File bytes
+        
+    Returns:
+        Tuple of (MIDI pitches, velocities, start times, end times), times in seconds
+    """
+    if isinstance(midi_obj, (bytes, bytearray)):
+        midi_obj = MidiFile(file=io.BytesIO(midi_obj))
+    sounding: Dict[Tuple[int, int], List[Tuple[float, int]]] = {}
+    notes = []
+    now = 0.0
+    for msg in midi_obj:  # Tracks merged, times in seconds since the previous message
+        now += msg.time
+        if msg.type == 'note_on' and msg.velocity > 0:
+            sounding.setdefault((msg.channel, msg.note), []).append((now, msg.velocity))
+        elif msg.type in ('note_on', 'note_off') and sounding.get((msg.channel, msg.note)):
+            start, velocity = sounding[(msg.channel, msg.note)].pop(0)
+            notes.append((msg.note, velocity, start, now))
+    for (_, note), started in sounding.items():
+        notes.extend((note, velocity, start, now) for start, velocity in started)
+    if not notes:
+        return (np.empty(0, dtype=np.int16), np.empty(0, dtype=np.float32),
+                np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64))
+    pitches, velocities, starts, ends = zip(*notes)
+    return (np.array(pitches, dtype=np.int16), np.array(velocities, dtype=np.float32),
+            np.array(starts, dtype=np.float64), np.array(ends, dtype=np.float64))
+
+
+# One cycle of a sine wave; every fallback note is read from it
+_WAVETABLE = np.sin(np.arange(FALLBACK_WAVETABLE_SIZE) * (2 * np.pi / FALLBACK_WAVETABLE_SIZE)).astype(np.float32)
+# Phases are 32-bit fixed point (a full cycle is 2**32); the top bits index the table
+_PHASE_SHIFT = 32 - (FALLBACK_WAVETABLE_SIZE.bit_length() - 1)
+# Names the fallback synth and its settings in audio cache keys (bump the version when its sound changes)
+_FALLBACK_RENDERER = (f"wavetable-v1:{FALLBACK_WAVETABLE_SIZE}:{FALLBACK_ATTACK_SECONDS}:{FALLBACK_DECAY_SECONDS}:"
+                      f"{FALLBACK_SUSTAIN_LEVEL}:{FALLBACK_RELEASE_SECONDS}")
+
+
+@functools.lru_cache(maxsize=64)
+def _adsr_envelope(note_frames: int, sample_rate: int) -> np.ndarray:
+    """Envelope of a note held for note_frames, followed by its release (float32, read-only)."""
+    attack = max(1, int(round(FALLBACK_ATTACK_SECONDS * sample_rate)))
+    decay = max(1, int(round(FALLBACK_DECAY_SECONDS * sample_rate)))
+    release = int(round(FALLBACK_RELEASE_SECONDS * sample_rate))
+    envelope = np.empty(note_frames + release, dtype=np.float32)
+    envelope[:note_frames] = np.interp(np.arange(note_frames), [0, attack, attack + decay],
+                                       [0.0, 1.0, FALLBACK_SUSTAIN_LEVEL])
+    level = envelope[note_frames - 1] if note_frames else 0.0
+    envelope[note_frames:] = np.linspace(level, 0.0, release, endpoint=False)
+    envelope.flags.writeable = False  # Shared by every note of this length
+    return envelope
+
+
+def _fallback_voices(midi_obj: Union[MidiFile, bytes], sample_rate: int) -> Tuple[np.ndarray, ...]:
+    """
+    Sample spans and oscillator settings of each note, ordered by start.
+    
+    Returns:
+        Tuple of (first frames, held lengths, frames including the release,
+        phase steps, amplitudes)
+    """
+    pitches, velocities, starts, ends = midi_notes(midi_obj)
+    order = np.argsort(starts, kind="stable")
+    release = int(round(FALLBACK_RELEASE_SECONDS * sample_rate))
+    first = np.rint(starts[order] * sample_rate).astype(np.int64)
+    lengths = np.maximum(np.rint(ends[order] * sample_rate).astype(np.int64) - first, 1)
+    phase_steps = np.rint(440.0 * 2.0 ** ((pitches[order] - 69) / 12.0) / sample_rate * 2.0 ** 32).astype(np.uint32)
+    return first, lengths, lengths + release, phase_steps, velocities[order] / 127.0
+
+
+def _fallback_blocks(voices: Tuple[np.ndarray, ...], sample_rate: int, block_frames: int) -> Iterator[np.ndarray]:
+    """
+    Mix the wavetable voices one block at a time (float32, unscaled).
+    
+    Each block holds the notes sounding in it: their phases are 32-bit fixed
+    point counters (so a note resumes exactly where the previous block left
+    it), looked up in the wavetable and shaped by the ADSR envelope, which
+    is shared by all notes of the same length.
+    """
+    first, lengths, spans, phase_steps, amplitudes = voices
+    if not len(first):
+        return
+    total = int((first + spans).max())
+    first, lengths, spans, amplitudes = first.tolist(), lengths.tolist(), spans.tolist(), amplitudes.tolist()
+    upcoming = 0
+    sounding: List[int] = []
+    for block_start in range(0, total, block_frames):
+        block_end = min(block_start + block_frames, total)
+        while upcoming < len(first) and first[upcoming] < block_end:
+            sounding.append(upcoming)
+            upcoming += 1
+        out = np.zeros(block_end - block_start, dtype=np.float32)
+        for note in sounding:
+            lo = max(block_start - first[note], 0)
+            hi = min(block_end - first[note], spans[note])
+            phase = np.arange(lo, hi, dtype=np.uint32) * phase_steps[note]  # wraps around modulo 2**32
+            phase >>= _PHASE_SHIFT
+            voice = _WAVETABLE[phase]
+            voice *= _adsr_envelope(lengths[note], sample_rate)[lo:hi]
+            voice *= amplitudes[note]
+            out[first[note] + lo - block_start:first[note] + hi - block_start] += voice
+        sounding = [note for note in sounding if first[note] + spans[note] > block_end]
+        yield out
+
+
+def render_fallback_pcm(midi_obj: Union[MidiFile, bytes], sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Render MIDI with the wavetable sine synthesizer.
+    
+    Notes are timed from their note_off events and the tempo in the file,
+    synthesized from a sine wavetable with integer phase accumulation and
+    shaped by an ADSR envelope, all in float32. The whole mix is then
+    normalized to full scale.
+    
+    Args:
+        midi_obj: MidiFile object or Standard MIDI File bytes
+        sample_rate: Output sample rate in Hz
+        
+    Returns:
+        Mono int16 array, normalized to full scale
+    """
+    voices = _fallback_voices(midi_obj, sample_rate)
+    first, _, spans, _, _ = voices
+    if not len(first):
+        return np.zeros(0, dtype=np.int16)
+    out = np.empty(int((first + spans).max()), dtype=np.float32)
+    filled = 0
+    for block in _fallback_blocks(voices, sample_rate, FALLBACK_BLOCK_FRAMES):
+        out[filled:filled + len(block)] = block
+        filled += len(block)
+    peak = max(out.max(), -out.min())  # Without an abs() copy of the mix
+    if peak > 0:
+        out *= 32767 / peak
+    return out.astype(np.int16)
+
+
+def stream_fallback_pcm(midi_obj: Union[MidiFile, bytes], sample_rate: int = SAMPLE_RATE,
+                        block_frames: int = AUDIO_STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Render MIDI with the wavetable sine synthesizer, block by block.
+    
+    The same synthesis as render_fallback_pcm, but without the whole mix to
+    normalize, the gain is set up front from the loudest moment possible:
+    the largest sum of the amplitudes of notes sounding together (releases
+    included). Blocks therefore never clip, and a single line of notes
+    still reaches full scale.
+    
+    Args:
+        midi_obj: MidiFile object or Standard MIDI File bytes
+        sample_rate: Output sample rate in Hz
+        block_frames: Frames per block
+        
+    Yields:
+        Mono int16 arrays of block_frames samples; the last may be shorter
+    """
+    voices = _fallback_voices(midi_obj, sample_rate)
+    first, _, spans, _, amplitudes = voices
+    if not len(first):
+        return
+    # Walk the note starts and ends in time order (ends first at equal times)
+    times = np.concatenate([first, first + spans])
+    changes = np.concatenate([amplitudes, -amplitudes])
+    order = np.lexsort((changes, times))
+    gain = 32767 / max(float(np.cumsum(changes[order]).max()), 1e-9)
+    for block in _fallback_blocks(voices, sample_rate, block_frames):
+        block *= gain
+        yield block.astype(np.int16)
+
+
+def generate_fallback_audio(midi_obj: Union[MidiFile, bytes], output_path: Optional[str] = None) -> Tuple[Optional[str], float]:
     """
     Generate simple audio using sine waves as fallback when FluidSynth is unavailable.
     
+    The wavetable synth is streamed into the encoder block by block. It only
+    plays the notes (programs and controllers are ignored), so its renders
+    are cached by the note events alone and shared by all instruments.
+    
     Args:
-        midi_obj: MidiFile object to convert
-        output_path: Path to save the output MP3
+        midi_obj: MidiFile object (or Standard MIDI File bytes) to convert
+        output_path: Where to write the MP3 (a new file in the static directory if not provided)
         
     Returns:
         Tuple of (path to MP3 file, duration in seconds) or (None, 0) if generation fails
     """
     try:
-        import numpy as np
-        from scipy.io import wavfile
-        from pydub import AudioSegment
-
-        # Parse MIDI to get notes and timing
-        notes = []
-        current_time = 0
-        for track in midi_obj.tracks:
-            for msg in track:
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    notes.append((msg.note, current_time, msg.time))
-                current_time += msg.time
-
-        # Generate simple sine wave audio
-        sample_rate = SAMPLE_RATE
-        total_ticks = sum(msg.time for track in midi_obj.tracks for msg in track)
-        total_seconds = total_ticks * (0.5 / TICKS_PER_BEAT)  # Assuming 120 BPM
-        audio_data = np.zeros(int(sample_rate * total_seconds) + sample_rate)  # Add 1 second buffer
-
-        position = 0
-        for note, start_time, duration in notes:
-            # Convert MIDI note to frequency
-            freq = 440 * (2 ** ((note - 69) / 12))
-            # Convert ticks to seconds
-            start_sec = start_time * (0.5 / TICKS_PER_BEAT)
-            duration_sec = duration * (0.5 / TICKS_PER_BEAT)
-
-            # Generate sine wave
-            t = np.linspace(0, duration_sec, int(sample_rate * duration_sec), endpoint=False)
-            wave = 0.5 * np.sin(2 * np.pi * freq * t)
-
-            # Add to audio data
-            start_sample = int(start_sec * sample_rate)
-            end_sample = start_sample + len(wave)
-            if end_sample < len(audio_data):
-                audio_data[start_sample:end_sample] += wave
-
-        # Normalize and convert to 16-bit PCM
-        max_val = np.max(np.abs(audio_data))
-        if max_val > 0:
-            audio_data = np.int16(audio_data / max_val * 32767)
-        else:
-            audio_data = np.int16(audio_data)
-
-        # Save as WAV then convert to MP3
-        wav_path = output_path.replace('.mp3', '.wav')
-        wavfile.write(wav_path, sample_rate, audio_data)
-
-        sound = AudioSegment.from_wav(wav_path)
-        sound.export(output_path, format="mp3")
-
-        # Move to static directory
-        static_mp3_path = os.path.join('static', f'exercise_{uuid.uuid4().hex}.mp3')
-        shutil.move(output_path, static_mp3_path)
-
-        return static_mp3_path, sound.duration_seconds
-    except ImportError as e:
+        output_path = output_path or static_mp3_path()
+        cache = get_default_audio_cache()
+        if cache is not None:
+            events = b"".join(array.tobytes() for array in midi_notes(midi_obj))
+            key = cache.make_key(events, None, _FALLBACK_RENDERER, SAMPLE_RATE, None)
+            duration = cache.fetch(key, output_path)
+            if duration is not None:
+                return output_path, duration
+        frames = encode_mp3_stream(stream_fallback_pcm(midi_obj, SAMPLE_RATE), SAMPLE_RATE, output_path)
+        if cache is not None and frames:
+            cache.put(key, output_path, frames / SAMPLE_RATE)
+        return output_path, frames / SAMPLE_RATE
+    except FileNotFoundError as e:
         print(f"Required packages not available for fallback audio: {e}")
         return None, 0
     except Exception as e:
@@ -323,8 +914,6 @@ def create_metronome_audio(tempo: int, time_sig: str, measures: int) -> Optional
         from pydub import AudioSegment
         from pydub.generators import Sine
         
-        os.makedirs("static", exist_ok=True)
-        
         numerator, denominator = map(int, time_sig.split('/'))
         
         # Create metronome clicks with pydub
@@ -345,17 +934,10 @@ def create_metronome_audio(tempo: int, time_sig: str, measures: int) -> Optional
             click = strong_click if beat % beats_per_measure == 0 else weak_click
             metronome_audio += click + AudioSegment.silent(duration=silence_duration)
 
-        # Export to MP3
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            mp3_path = temp_file.name
-            
+        # Export straight to the static directory
+        mp3_path = static_mp3_path("metronome")
         metronome_audio.export(mp3_path, format="mp3")
-
-        # Move to static directory
-        static_mp3_path = os.path.join('static', f'metronome_{uuid.uuid4().hex}.mp3')
-        shutil.move(mp3_path, static_mp3_path)
-
-        return static_mp3_path
+        return mp3_path
     except ImportError as e:
         print(f"Metronome requires pydub: {e}")
         return None
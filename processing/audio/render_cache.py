@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+"""
+Audio Render Cache
+================
+Content-addressed cache of rendered MP3 files.
+
+An entry is keyed by a hash of everything that determines the audio: the
+MIDI bytes, the instrument, the synthesizer (the soundfont's checksum, or
+the fallback synth's settings), the sample rate, the ffmpeg filter chain
+and the output codec. Rendering the same exercise again then costs a file
+copy instead of a synth run and an encode.
+
+Files are sharded by the first two hex digits of their key and written
+atomically. A SQLite index next to them records each entry's size, duration
+and last use, so lookups are a single indexed query and eviction (least
+recently used first, down to a total byte budget) never scans the tree.
+SQLite's file locking lets several processes share one cache directory.
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import functools
+import threading
+from typing import Optional, Dict, Any, Tuple
+
+from lib.music_generation.cache import atomic_write
+from lib.music_generation.constants import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES
+
+INDEX_NAME = "index.sqlite"
+
+
+@functools.lru_cache(maxsize=32)
+def _file_checksum(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def soundfont_checksum(sf2_path: str) -> str:
+    """
+    Return the SHA-256 of a soundfont's contents.
+
+    Soundfonts are large, so the checksum is computed once per process for
+    each version of the file (same size and modification time).
+
+    Args:
+        sf2_path: Path of the .sf2 file
+
+    Returns:
+        Hex digest
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    stat = os.stat(sf2_path)
+    return _file_checksum(os.path.abspath(sf2_path), stat.st_size, stat.st_mtime_ns)
+
+
+class AudioCache:
+    """
+    Content-addressed cache of rendered audio files with a SQLite index.
+
+    Entries are files sharded by the first two hex digits of their key;
+    the index holds their size, duration and recency. Writes are atomic,
+    and entries whose file has gone missing are dropped on lookup.
+    """
+
+    def __init__(self, cache_dir: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        """
+        Create a cache rooted at cache_dir.
+
+        Args:
+            cache_dir: Directory holding the cache entries and their index
+            max_bytes: Total size above which least recently used entries are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def make_key(midi_bytes: bytes, instrument: Optional[str], renderer: str, sample_rate: int,
+                 audio_filter: Optional[str], codec: str = "mp3") -> str:
+        """
+        Build the cache key for a render.
+
+        Args:
+            midi_bytes: Standard MIDI File bytes being rendered (or just the
+                note events, for a renderer that ignores everything else)
+            instrument: Instrument whose preset is selected (None if the
+                renderer ignores it)
+            renderer: Soundfont checksum, or a description of the synth settings
+            sample_rate: Output sample rate in Hz
+            audio_filter: ffmpeg filter chain applied when encoding
+            codec: Output codec
+
+        Returns:
+            Hex SHA-256 digest identifying the render
+        """
+        digest = hashlib.sha256(midi_bytes)
+        digest.update(json.dumps([instrument, renderer, int(sample_rate), audio_filter or "", codec],
+                                 separators=(",", ":")).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str, codec: str = "mp3") -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{codec}")
+
+    def _index(self) -> sqlite3.Connection:
+        """Open the index on first use (callers hold self._lock)."""
+        if self._db is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.cache_dir, INDEX_NAME), timeout=10.0,
+                                 isolation_level=None, check_same_thread=False)
+            db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, codec TEXT NOT NULL, "
+                       "size INTEGER NOT NULL, duration REAL NOT NULL, created REAL NOT NULL, "
+                       "last_used REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_by_last_used ON entries (last_used)")
+            self._db = db
+        return self._db
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Look up a cached render and mark it as recently used.
+
+        Args:
+            key: Key returned by make_key
+
+        Returns:
+            Tuple of (path of the cached file, duration in seconds), or None on a miss
+        """
+        with self._lock:
+            try:
+                db = self._index()
+                row = db.execute("SELECT codec, duration FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None and not os.path.exists(self._path(key, row[0])):
+                    db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                print(f"Warning: Audio cache index unavailable: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._path(key, row[0]), row[1]
+
+    def fetch(self, key: str, output_path: str) -> Optional[float]:
+        """
+        Copy a cached render to output_path.
+
+        The caller gets its own file, which it may move or delete without
+        touching the cache.
+
+        Args:
+            key: Key returned by make_key
+            output_path: Where to put the copy
+
+        Returns:
+            Duration in seconds, or None on a miss
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        path, duration = entry
+        try:
+            shutil.copyfile(path, output_path)
+        except FileNotFoundError:  # Evicted by another process in the meantime
+            return None
+        return duration
+
+    def put(self, key: str, source_path: str, duration: float, codec: str = "mp3") -> None:
+        """
+        Store a copy of a rendered file, evicting old entries if the cache grows too large.
+
+        Args:
+            key: Key returned by make_key
+            source_path: Rendered file to store
+            duration: Its duration in seconds
+            codec: Output codec (the entry's file extension)
+        """
+        path = self._path(key, codec)
+        try:
+            with open(source_path, "rb") as f:
+                data = f.read()
+            atomic_write(path, data)
+            now = time.time()
+            with self._lock:
+                self._index().execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                      (key, codec, len(data), float(duration), now, now))
+                self.writes += 1
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not write audio cache entry: {e}")
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove least recently used entries until the cache is within max_bytes.
+
+        Returns:
+            Number of entries removed
+        """
+        removed = 0
+        with self._lock:
+            try:
+                db = self._index()
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total <= self.max_bytes:
+                    return 0
+                victims = []
+                for key, codec, size in db.execute("SELECT key, codec, size FROM entries ORDER BY last_used"):
+                    if total <= self.max_bytes:
+                        break
+                    victims.append((key, self._path(key, codec)))
+                    total -= size
+                db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+            except sqlite3.Error as e:
+                print(f"Warning: Could not evict audio cache entries: {e}")
+                return 0
+            for _, path in victims:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                removed += 1
+            self.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        """Remove every cache entry."""
+        with self._lock:
+            db = self._index()
+            paths = [self._path(key, codec) for key, codec in db.execute("SELECT key, codec FROM entries")]
+            db.execute("DELETE FROM entries")
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        """Close the index; it is reopened if the cache is used again."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters for this process and the size of the cache.
+
+        Returns:
+            Dictionary with hits, misses, writes, evictions, hit_rate, and the
+            entries and bytes currently in the index
+        """
+        with self._lock:
+            try:
+                entries, total = self._index().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            except sqlite3.Error:
+                entries, total = 0, 0
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": total,
+            }
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared cache
+# -----------------------------------------------------------------------------
+_UNSET = object()
+_default_audio_cache: Any = _UNSET
+_default_audio_cache_lock = threading.Lock()
+
+
+def get_default_audio_cache() -> Optional[AudioCache]:
+    """
+    Return the process-wide audio cache, or None if caching is disabled.
+
+    Returns:
+        Shared AudioCache instance or None
+    """
+    global _default_audio_cache
+    if _default_audio_cache is _UNSET:
+        with _default_audio_cache_lock:
+            if _default_audio_cache is _UNSET:
+                _default_audio_cache = AudioCache()
+    return _default_audio_cache
+
+
+def set_default_audio_cache(cache: Optional[AudioCache]) -> Optional[AudioCache]:
+    """
+    Replace the process-wide audio cache.
+
+    Args:
+        cache: New shared cache, or None to disable caching
+
+    Returns:
+        The previously installed cache, if any
+    """
+    global _default_audio_cache
+    with _default_audio_cache_lock:
+        previous = _default_audio_cache
+        _default_audio_cache = cache
+    return None if previous is _UNSET else previous
+
+
+def configure_audio_cache(cache_dir: Optional[str] = None, enabled: bool = True) -> Optional[AudioCache]:
+    """
+    Enable or disable the process-wide audio cache, optionally at a custom location.
+
+    Args:
+        cache_dir: Cache directory (defaults to AUDIO_CACHE_DIR)
+        enabled: Whether midi_to_mp3 should use the cache
+
+    Returns:
+        The installed cache, or None if disabled
+    """
+    cache = AudioCache(cache_dir or AUDIO_CACHE_DIR) if enabled else None
+    set_default_audio_cache(cache)
+    return cache
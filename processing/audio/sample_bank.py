@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+
+"""
+Sample Bank
+==========
+Pre-rendered notes for concatenative audio rendering.
+
+Exercises draw on a small vocabulary: one instrument, a few octaves of
+pitches and a handful of note values at the exercise tempo. A SampleBank
+holds every (pitch, duration) note of one instrument at one tempo, rendered
+once through the regular FluidSynth path and stored as a float32 array that
+is memory-mapped when loaded. An exercise is then rendered by overlap-adding
+bank entries at the note onsets, which costs a few NumPy copies instead of a
+synth pass.
+
+Each bank is a pair of files in SAMPLE_BANK_DIR: ``<name>.npy`` with the
+samples of all entries back to back, shape (frames, 2), and ``<name>.json``
+with the entry offsets and what the bank was rendered from. The index is
+written last, so a bank without one is incomplete and ignored.
+"""
+
+import os
+import json
+import math
+import threading
+import subprocess
+from typing import Optional, Dict, List, Any, Tuple, Union, Iterable, Callable, Sequence
+
+import mido
+import numpy as np
+from mido import MidiFile, MidiTrack, Message, MetaMessage
+
+from lib.music_generation.cache import atomic_write
+from lib.music_generation.constants import (
+    SAMPLE_RATE,
+    TICKS_PER_BEAT,
+    TICKS_PER_8TH,
+    INSTRUMENT_PROGRAMS,
+    INSTRUMENT_RANGES,
+    AUDIO_FILTERS,
+    SAMPLE_BANK_DIR,
+    SAMPLE_BANK_DURATIONS,
+    SAMPLE_BANK_VELOCITY,
+    SAMPLE_BANK_RELEASE_SECONDS,
+    SAMPLE_BANK_SILENCE,
+    SAMPLE_BANK_CROSSFADE_SECONDS,
+)
+from lib.music_generation.sequence import NoteSequence
+from lib.music_generation.theory import names_to_midi
+from .converter import get_soundfont, synthesize_pcm, encode_mp3, static_mp3_path
+from ..capabilities import AUDIO_BACKENDS, get_default_capabilities
+from ..midi.converter import note_velocities
+
+SAMPLE_BANK_FORMAT = 1  # bumped when the file layout changes; older banks are rebuilt
+
+# Silence between the banked notes while rendering, on top of the release
+_GAP_SECONDS = 0.1
+
+
+def sample_bank_name(instrument: str, tempo: int, sample_rate: int = SAMPLE_RATE) -> str:
+    """File name (without extension) of a bank."""
+    return f"{instrument}-{tempo}bpm-{sample_rate}hz"
+
+
+def _soundfont_fingerprint(sf2_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not sf2_path:
+        return None
+    stat = os.stat(sf2_path)
+    return {"path": sf2_path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _bank_midi(instrument: str, tempo: int, notes: Sequence[Tuple[int, int, int]]) -> MidiFile:
+    """MIDI with each (pitch, duration, onset) note on its own, onsets in 8th-note units."""
+    mid = MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    track = MidiTrack()
+    mid.tracks.append(track)
+    track.append(MetaMessage('set_tempo', tempo=mido.bpm2tempo(tempo), time=0))
+    track.append(Message('program_change', program=INSTRUMENT_PROGRAMS.get(instrument, 56), time=0))
+    now = 0
+    for pitch, duration, onset in notes:
+        track.append(Message('note_on', note=pitch, velocity=SAMPLE_BANK_VELOCITY,
+                             time=(onset - now) * TICKS_PER_8TH))
+        track.append(Message('note_off', note=pitch, velocity=SAMPLE_BANK_VELOCITY,
+                             time=duration * TICKS_PER_8TH))
+        now = onset + duration
+    return mid
+
+
+class SampleBank:
+    """
+    Rendered notes of one instrument at one tempo.
+
+    Attributes:
+        samples: float32 array (frames, 2), usually memory-mapped
+        entries: (pitch, duration) -> (offset, length) in frames
+        tempo: Tempo in BPM the notes were rendered at
+        sample_rate: Sample rate in Hz
+        instrument: Instrument name
+    """
+
+    def __init__(self, samples: np.ndarray, entries: Dict[Tuple[int, int], Tuple[int, int]], tempo: int,
+                 sample_rate: int = SAMPLE_RATE, instrument: Optional[str] = None):
+        self.samples = samples
+        self.entries = entries
+        self.tempo = tempo
+        self.sample_rate = sample_rate
+        self.instrument = instrument
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self.entries
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the samples in bytes."""
+        return self.samples.nbytes
+
+    @classmethod
+    def load(cls, path: str, sf2_path: Optional[str] = None) -> Optional["SampleBank"]:
+        """
+        Memory-map a bank from disk.
+
+        Args:
+            path: Bank path without extension
+            sf2_path: Soundfont the bank should have been rendered from; a
+                bank rendered from another (or a changed) file is stale
+
+        Returns:
+            SampleBank, or None if the bank is missing, incomplete or stale
+        """
+        try:
+            with open(path + ".json", "r") as f:
+                index = json.load(f)
+            if index.get("format") != SAMPLE_BANK_FORMAT:
+                return None
+            if sf2_path and index.get("soundfont") != _soundfont_fingerprint(sf2_path):
+                return None
+            samples = np.load(path + ".npy", mmap_mode="r")
+            entries = {(pitch, duration): (offset, length) for pitch, duration, offset, length in index["entries"]}
+            return cls(samples, entries, index["tempo"], index["sample_rate"], index.get("instrument"))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def covers(self, sequence: Union[NoteSequence, List[Any]]) -> bool:
+        """Whether every note of an exercise has an entry."""
+        sequence = NoteSequence.from_json(sequence)
+        return all((pitch, duration) in self.entries
+                   for pitch, duration in zip(sequence.pitches.tolist(), sequence.durations.tolist()))
+
+    def sample(self, pitch: int, duration: int) -> np.ndarray:
+        """
+        Return the rendered note (a view into the bank).
+
+        Raises:
+            KeyError: If the bank has no such note
+        """
+        offset, length = self.entries[(pitch, duration)]
+        return self.samples[offset:offset + length]
+
+    def render(self, sequence: Union[NoteSequence, List[Any]],
+               velocities: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Render an exercise by overlap-adding bank entries at the note onsets.
+
+        Args:
+            sequence: NoteSequence or exercise JSON
+            velocities: Optional velocity per note; entries are scaled by
+                velocity / SAMPLE_BANK_VELOCITY
+
+        Returns:
+            int16 array of shape (frames, 2)
+
+        Raises:
+            KeyError: If a note has no entry (see covers)
+        """
+        sequence = NoteSequence.from_json(sequence)
+        if not len(sequence):
+            return np.zeros((0, 2), dtype=np.int16)
+        frames_per_unit = 30.0 / self.tempo * self.sample_rate  # an 8th note is half a beat
+        starts = np.rint((sequence.onsets - sequence.start) * frames_per_unit).astype(np.int64)
+        spans = np.array([self.entries[key] for key in zip(sequence.pitches.tolist(),
+                                                           sequence.durations.tolist())], dtype=np.int64)
+        offsets, lengths = spans[:, 0], spans[:, 1]
+        if velocities is None:
+            gains = np.ones(len(sequence), dtype=np.float32)
+        else:
+            gains = np.asarray(velocities, dtype=np.float32) / SAMPLE_BANK_VELOCITY
+
+        out = np.zeros((int((starts + lengths).max()), 2), dtype=np.float32)
+        for start, offset, length, gain in zip(starts.tolist(), offsets.tolist(), lengths.tolist(),
+                                               gains.tolist()):
+            note = self.samples[offset:offset + length]
+            if gain == 1.0:
+                out[start:start + length] += note
+            else:
+                out[start:start + length] += note * gain
+        np.multiply(out, 32767, out=out)
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype(np.int16)
+
+
+def build_sample_bank(instrument: str, tempo: int, sf2_path: Optional[str] = None,
+                      directory: str = SAMPLE_BANK_DIR, pitches: Optional[Iterable[int]] = None,
+                      durations: Iterable[int] = SAMPLE_BANK_DURATIONS, sample_rate: int = SAMPLE_RATE,
+                      render: Optional[Callable[[MidiFile], np.ndarray]] = None) -> SampleBank:
+    """
+    Render every (pitch, duration) note of an instrument at a tempo and save the bank.
+
+    All notes are rendered in one synth pass, spaced so that each release
+    dies away before the next note starts, and then cut apart. Each entry
+    keeps the note and up to SAMPLE_BANK_RELEASE_SECONDS of release (less
+    when it falls silent sooner) and ends in a short fade-out.
+
+    Args:
+        instrument: Instrument name
+        tempo: Tempo in BPM
+        sf2_path: Soundfont to render with (the instrument's, else Piano's)
+        directory: Directory the bank files are written to
+        pitches: MIDI pitches to bank (the instrument's INSTRUMENT_RANGES if not provided)
+        durations: Note values to bank, in 8th-note units
+        sample_rate: Sample rate in Hz of the rendered PCM
+        render: Function rendering MIDI to int16 (frames, 2) PCM
+            (synthesize_pcm with sf2_path if not provided)
+
+    Returns:
+        The new bank, memory-mapped from disk
+
+    Raises:
+        FileNotFoundError: If no soundfont or FluidSynth is available
+    """
+    if pitches is None:
+        low, high = names_to_midi(INSTRUMENT_RANGES.get(instrument, ("C3", "C6"))).tolist()
+        pitches = range(low, high + 1)
+    if render is None:
+        if get_default_capabilities().first_available(AUDIO_BACKENDS) is None:
+            raise FileNotFoundError("FluidSynth not available")
+        sf2_path = sf2_path or get_soundfont(instrument) or get_soundfont("Piano")
+        if not sf2_path:
+            raise FileNotFoundError(f"No soundfont available for {instrument}")
+
+        def render(midi: MidiFile) -> np.ndarray:
+            return synthesize_pcm(midi, sf2_path, instrument)
+
+    seconds_per_unit = 30.0 / tempo
+    gap_units = math.ceil((SAMPLE_BANK_RELEASE_SECONDS + _GAP_SECONDS) / seconds_per_unit)
+    notes = []
+    onset = 0
+    for pitch in pitches:
+        for duration in durations:
+            notes.append((int(pitch), int(duration), onset))
+            onset += duration + gap_units
+    pcm = render(_bank_midi(instrument, tempo, notes))
+
+    # Cut each note (plus the audible part of its release) out of the render
+    frames_per_unit = seconds_per_unit * sample_rate
+    release_frames = int(round(SAMPLE_BANK_RELEASE_SECONDS * sample_rate))
+    fade_frames = max(1, int(round(SAMPLE_BANK_CROSSFADE_SECONDS * sample_rate)))
+    threshold = SAMPLE_BANK_SILENCE * 32768
+    cuts = []
+    for pitch, duration, onset in notes:
+        start = int(round(onset * frames_per_unit))
+        note_frames = int(round(duration * frames_per_unit))
+        tail = pcm[start + note_frames:start + note_frames + release_frames].astype(np.int32)
+        tail = np.abs(tail).max(axis=1, initial=0)
+        audible = np.flatnonzero(tail > threshold)
+        length = note_frames + (int(audible[-1]) + 1 if len(audible) else 0)
+        cuts.append((pitch, duration, start, max(length, fade_frames)))
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, sample_bank_name(instrument, tempo, sample_rate))
+    temp_path = f"{path}.{os.getpid()}.tmp.npy"
+    total = sum(length for _, _, _, length in cuts)
+    samples = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=(total, 2))
+    fade = np.linspace(1.0, 0.0, fade_frames, dtype=np.float32)[:, None]
+    entries = []
+    offset = 0
+    try:
+        for pitch, duration, start, length in cuts:
+            note = pcm[start:start + length]
+            target = samples[offset:offset + length]
+            target[:len(note)] = note / 32768.0
+            target[len(note):] = 0.0  # render ended early
+            target[-fade_frames:] *= fade
+            entries.append([pitch, duration, offset, length])
+            offset += length
+        samples.flush()
+        del samples
+        os.replace(temp_path, path + ".npy")
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    index = {
+        "format": SAMPLE_BANK_FORMAT,
+        "instrument": instrument,
+        "tempo": tempo,
+        "sample_rate": sample_rate,
+        "velocity": SAMPLE_BANK_VELOCITY,
+        "soundfont": _soundfont_fingerprint(sf2_path),
+        "entries": entries,
+    }
+    atomic_write(path + ".json", json.dumps(index).encode("utf-8"))
+    return SampleBank.load(path)
+
+
+# -----------------------------------------------------------------------------
+# Process-wide bank cache
+# -----------------------------------------------------------------------------
+_banks: Dict[Tuple[str, str, int], SampleBank] = {}
+_banks_lock = threading.Lock()
+
+
+def get_sample_bank(instrument: str, tempo: int, build: bool = False,
+                    directory: str = SAMPLE_BANK_DIR) -> Optional[SampleBank]:
+    """
+    Return the bank of an instrument at a tempo, loading it once per process.
+
+    Args:
+        instrument: Instrument name
+        tempo: Tempo in BPM
+        build: Build (and download the soundfont for) a bank that is
+            missing or stale, instead of returning None
+        directory: Directory the banks are kept in
+
+    Returns:
+        SampleBank, or None if there is no up-to-date bank (and build is False)
+
+    Raises:
+        FileNotFoundError: If build is True and no soundfont or FluidSynth is available
+    """
+    key = (os.path.abspath(directory), instrument, tempo)
+    with _banks_lock:
+        bank = _banks.get(key)
+    if bank is not None:
+        return bank
+    sf2_path = get_soundfont(instrument, download=build) or get_soundfont("Piano", download=build)
+    bank = SampleBank.load(os.path.join(directory, sample_bank_name(instrument, tempo)), sf2_path)
+    if bank is None and build:
+        bank = build_sample_bank(instrument, tempo, sf2_path, directory)
+    if bank is not None:
+        with _banks_lock:
+            bank = _banks.setdefault(key, bank)
+    return bank
+
+
+def sample_bank_to_mp3(sequence: Union[NoteSequence, List[Any]], instrument: str, tempo: int,
+                       timeout: Optional[float] = None) -> Tuple[Optional[str], float]:
+    """
+    Render an exercise to MP3 from an existing sample bank.
+
+    Notes get the same velocities json_to_midi gives them, so the exercise
+    sounds the same as when it is synthesized.
+
+    Args:
+        sequence: NoteSequence or exercise JSON
+        instrument: Instrument name
+        tempo: Tempo in BPM
+        timeout: Optional seconds allowed for encoding
+
+    Returns:
+        Tuple of (path to MP3 file, duration in seconds), or (None, 0) if no
+        bank covers the exercise or encoding fails (callers then synthesize)
+    """
+    sequence = NoteSequence.from_json(sequence)
+    bank = get_sample_bank(instrument, tempo)
+    if bank is None or not bank.covers(sequence):
+        return None, 0
+    pcm = bank.render(sequence, velocities=note_velocities(sequence))
+    mp3_path = static_mp3_path()
+    try:
+        encode_mp3(pcm, bank.sample_rate, mp3_path, AUDIO_FILTERS.get(instrument), timeout)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Encoding sample bank audio failed: {e}")
+        return None, 0
+    return mp3_path, len(pcm) / bank.sample_rate
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+
+"""
+Synth Engine Pool
+===============
+Long-lived in-process FluidSynth engines for rendering MIDI to PCM.
+
+Spawning the fluidsynth CLI for every exercise costs a process start and a
+soundfont load per render. A SynthEngine keeps one pyFluidSynth synth
+alive, loads each soundfont once and renders MIDI events straight into a
+NumPy buffer (as fast as the CPU allows, without an audio driver), either
+all at once or as a stream of fixed-size blocks. A SynthPool lends engines
+to callers one at a time, so renders from several threads reuse a bounded
+set of engines.
+
+pyFluidSynth is optional: creating an engine raises ImportError when it
+(or the FluidSynth library it wraps) is not installed, and callers fall
+back to the fluidsynth CLI.
+"""
+
+import io
+import queue
+import threading
+import contextlib
+from typing import Optional, Dict, List, Any, Union, Callable, Iterable, Iterator
+
+import numpy as np
+from mido import MidiFile
+
+from lib.music_generation.constants import (
+    SAMPLE_RATE,
+    AUDIO_STREAM_BLOCK_FRAMES,
+    INSTRUMENT_PROGRAMS,
+    SYNTH_GAIN,
+    SYNTH_POOL_SIZE,
+    SYNTH_TAIL_SECONDS,
+)
+
+# MIDI controllers sent between renders so no note rings into the next one
+ALL_SOUND_OFF = 120
+RESET_CONTROLLERS = 121
+ALL_NOTES_OFF = 123
+
+
+class SynthEngine:
+    """
+    One pyFluidSynth synth with its loaded soundfonts.
+
+    An engine is not thread-safe; share engines through a SynthPool.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, gain: float = SYNTH_GAIN, synth: Optional[Any] = None):
+        """
+        Start a synth.
+
+        Args:
+            sample_rate: Output sample rate in Hz
+            gain: Master gain (1.0 matches the fluidsynth CLI renders)
+            synth: Existing fluidsynth.Synth to wrap (created if not provided)
+
+        Raises:
+            ImportError: If pyFluidSynth or the FluidSynth library is not installed
+        """
+        if synth is None:
+            import fluidsynth
+            synth = fluidsynth.Synth(gain=gain, samplerate=sample_rate)
+        self.sample_rate = sample_rate
+        self._synth = synth
+        self._soundfonts: Dict[str, int] = {}
+
+    def load(self, sf2_path: str) -> int:
+        """
+        Load a soundfont unless it is already loaded.
+
+        Args:
+            sf2_path: Path of the .sf2 file
+
+        Returns:
+            FluidSynth soundfont id
+
+        Raises:
+            ValueError: If FluidSynth cannot load the file
+        """
+        sfid = self._soundfonts.get(sf2_path)
+        if sfid is None:
+            sfid = self._synth.sfload(sf2_path)
+            if sfid < 0:
+                raise ValueError(f"FluidSynth could not load soundfont {sf2_path}")
+            self._soundfonts[sf2_path] = sfid
+        return sfid
+
+    def _select(self, channel: int, sfid: int, program: int) -> None:
+        # Instrument-specific soundfonts often hold a single preset 0
+        if self._synth.program_select(channel, sfid, 0, program) < 0:
+            self._synth.program_select(channel, sfid, 0, 0)
+
+    def _silence(self) -> None:
+        for channel in range(16):
+            self._synth.cc(channel, ALL_NOTES_OFF, 0)
+            self._synth.cc(channel, ALL_SOUND_OFF, 0)
+            self._synth.cc(channel, RESET_CONTROLLERS, 0)
+
+    def stream(self, midi_obj: Union[MidiFile, bytes], sf2_path: str, instrument: str = "Piano",
+               tail: float = SYNTH_TAIL_SECONDS, block_frames: int = AUDIO_STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+        """
+        Render MIDI to PCM, block by block.
+
+        Each block is synthesized when the caller asks for it, so memory does
+        not grow with the length of the exercise. The engine is silenced
+        again when the stream ends, even if the caller stops early.
+
+        Args:
+            midi_obj: MidiFile or Standard MIDI File bytes
+            sf2_path: Soundfont to render with (loaded on first use)
+            instrument: Instrument whose INSTRUMENT_PROGRAMS preset is selected
+                (program changes in the MIDI still apply)
+            tail: Seconds rendered after the last event, for note releases
+            block_frames: Frames per block (the last block may be shorter)
+
+        Yields:
+            int16 arrays of shape (block_frames, 2)
+        """
+        if isinstance(midi_obj, (bytes, bytearray)):
+            midi_obj = MidiFile(file=io.BytesIO(midi_obj))
+        sfid = self.load(sf2_path)
+        self._silence()
+        program = INSTRUMENT_PROGRAMS.get(instrument, 56)  # Default to trumpet if not found
+        for channel in range(16):
+            self._select(channel, sfid, program)
+
+        block = np.empty((block_frames, 2), dtype=np.int16)
+        filled = 0
+        rendered = 0
+
+        def render_until(frame: int) -> Iterator[np.ndarray]:
+            nonlocal block, filled, rendered
+            while rendered < frame:
+                count = min(frame - rendered, block_frames - filled)
+                block[filled:filled + count] = np.reshape(self._synth.get_samples(count), (-1, 2))
+                filled += count
+                rendered += count
+                if filled == block_frames:
+                    yield block
+                    block = np.empty((block_frames, 2), dtype=np.int16)
+                    filled = 0
+
+        try:
+            now = 0.0
+            for msg in midi_obj:  # Times are seconds since the previous message, tempo applied
+                now += msg.time
+                if msg.is_meta:
+                    continue
+                yield from render_until(int(round(now * self.sample_rate)))
+                if msg.type == 'note_on' and msg.velocity > 0:
+                    self._synth.noteon(msg.channel, msg.note, msg.velocity)
+                elif msg.type in ('note_on', 'note_off'):
+                    self._synth.noteoff(msg.channel, msg.note)
+                elif msg.type == 'program_change':
+                    self._select(msg.channel, sfid, msg.program)
+                elif msg.type == 'control_change':
+                    self._synth.cc(msg.channel, msg.control, msg.value)
+                elif msg.type == 'pitchwheel':
+                    self._synth.pitch_bend(msg.channel, msg.pitch)
+            yield from render_until(rendered + int(round(tail * self.sample_rate)))
+            if filled:
+                yield block[:filled]
+        finally:
+            self._silence()
+
+    def render(self, midi_obj: Union[MidiFile, bytes], sf2_path: str, instrument: str = "Piano",
+               tail: float = SYNTH_TAIL_SECONDS) -> np.ndarray:
+        """
+        Render MIDI to PCM.
+
+        Args:
+            midi_obj: MidiFile or Standard MIDI File bytes
+            sf2_path: Soundfont to render with (loaded on first use)
+            instrument: Instrument whose INSTRUMENT_PROGRAMS preset is selected
+                (program changes in the MIDI still apply)
+            tail: Seconds rendered after the last event, for note releases
+
+        Returns:
+            int16 array of shape (frames, 2)
+        """
+        blocks = list(self.stream(midi_obj, sf2_path, instrument, tail, block_frames=1 << 16))
+        if not blocks:
+            return np.zeros((0, 2), dtype=np.int16)
+        return np.concatenate(blocks)
+
+    def close(self) -> None:
+        """Free the synth and its soundfonts."""
+        self._synth.delete()
+        self._soundfonts.clear()
+
+
+class SynthPool:
+    """
+    Thread-safe pool of SynthEngines, created on demand up to a maximum size.
+
+    A caller borrows an engine for one render and gives it back; when all
+    engines are busy and the pool is full, callers wait for one.
+    """
+
+    def __init__(self, size: int = SYNTH_POOL_SIZE,
+                 engine_factory: Callable[[], SynthEngine] = SynthEngine):
+        """
+        Create an empty pool.
+
+        Args:
+            size: Maximum number of engines
+            engine_factory: Function creating an engine
+        """
+        self.size = size
+        self.engine_factory = engine_factory
+        self._idle: "queue.LifoQueue[SynthEngine]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._engines = 0
+        self._renders = 0
+        self._waits = 0
+        self._failures = 0
+        self._preload: List[str] = []
+        self._unavailable: Optional[str] = None  # why engines cannot be created
+
+    def _acquire(self, timeout: Optional[float]) -> SynthEngine:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._unavailable is not None:
+                raise ImportError(self._unavailable)
+            create = self._engines < self.size
+            if create:
+                self._engines += 1
+            else:
+                self._waits += 1
+            preload = list(self._preload)
+        if not create:
+            try:
+                return self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("No synth engine became free in time")
+        try:
+            engine = self.engine_factory()
+            for sf2_path in preload:
+                engine.load(sf2_path)
+            return engine
+        except BaseException as e:
+            with self._lock:
+                self._engines -= 1
+                if isinstance(e, ImportError):
+                    # Remember it so later renders go straight to the CLI
+                    self._unavailable = str(e)
+            raise
+
+    @contextlib.contextmanager
+    def engine(self, timeout: Optional[float] = None) -> Iterator[SynthEngine]:
+        """
+        Borrow an engine; an engine whose render raised is closed instead of reused.
+
+        A stream closed early by its caller (GeneratorExit) is not a failure:
+        the engine goes back to the pool.
+
+        Args:
+            timeout: Seconds to wait for a busy pool (None waits indefinitely)
+
+        Yields:
+            SynthEngine for the caller's exclusive use
+
+        Raises:
+            TimeoutError: If no engine became free within timeout
+            ImportError: If a new engine is needed and pyFluidSynth is missing
+        """
+        engine = self._acquire(timeout)
+        try:
+            yield engine
+        except GeneratorExit:
+            self._idle.put(engine)
+            raise
+        except BaseException:
+            with self._lock:
+                self._engines -= 1
+                self._failures += 1
+            try:
+                engine.close()
+            except Exception:
+                pass
+            raise
+        self._idle.put(engine)
+
+    def render(self, midi_obj: Union[MidiFile, bytes], sf2_path: str, instrument: str = "Piano",
+               timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Render MIDI to PCM on a pooled engine.
+
+        Args:
+            midi_obj: MidiFile or Standard MIDI File bytes
+            sf2_path: Soundfont to render with
+            instrument: Instrument whose preset is selected
+            timeout: Seconds to wait for a free engine
+
+        Returns:
+            int16 array of shape (frames, 2)
+        """
+        with self.engine(timeout) as engine:
+            pcm = engine.render(midi_obj, sf2_path, instrument)
+        with self._lock:
+            self._renders += 1
+        return pcm
+
+    def stream(self, midi_obj: Union[MidiFile, bytes], sf2_path: str, instrument: str = "Piano",
+               timeout: Optional[float] = None, block_frames: int = AUDIO_STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+        """
+        Render MIDI to PCM blocks on a pooled engine.
+
+        The engine is borrowed when the first block is requested and held
+        until the stream is exhausted or closed.
+
+        Args:
+            midi_obj: MidiFile or Standard MIDI File bytes
+            sf2_path: Soundfont to render with
+            instrument: Instrument whose preset is selected
+            timeout: Seconds to wait for a free engine
+            block_frames: Frames per block
+
+        Yields:
+            int16 arrays of shape (block_frames, 2); the last may be shorter
+        """
+        with self.engine(timeout) as engine:
+            yield from engine.stream(midi_obj, sf2_path, instrument, block_frames=block_frames)
+        with self._lock:
+            self._renders += 1
+
+    def preload(self, sf2_paths: Iterable[str]) -> None:
+        """
+        Load soundfonts into every current engine and into engines created later.
+
+        Args:
+            sf2_paths: Soundfont files to keep loaded
+        """
+        sf2_paths = list(sf2_paths)
+        with self._lock:
+            self._preload.extend(path for path in sf2_paths if path not in self._preload)
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for engine in idle:
+                for sf2_path in sf2_paths:
+                    engine.load(sf2_path)
+        finally:
+            for engine in idle:
+                self._idle.put(engine)
+
+    def close(self) -> None:
+        """Close the idle engines; engines currently lent out return to the pool as usual."""
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            engine.close()
+            with self._lock:
+                self._engines -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return pool counters.
+
+        Returns:
+            Dictionary with engines (alive), idle, renders, waits (callers that
+            found the pool full) and failures (engines discarded after an error)
+        """
+        with self._lock:
+            return {
+                "engines": self._engines,
+                "idle": self._idle.qsize(),
+                "renders": self._renders,
+                "waits": self._waits,
+                "failures": self._failures,
+            }
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared pool
+# -----------------------------------------------------------------------------
+_default_synth_pool: Optional[SynthPool] = None
+_default_synth_pool_lock = threading.Lock()
+
+
+def get_default_synth_pool() -> SynthPool:
+    """
+    Return the process-wide synth pool, creating it on first use.
+
+    Returns:
+        Shared SynthPool with up to SYNTH_POOL_SIZE engines
+    """
+    global _default_synth_pool
+    if _default_synth_pool is None:
+        with _default_synth_pool_lock:
+            if _default_synth_pool is None:
+                _default_synth_pool = SynthPool()
+    return _default_synth_pool
+
+
+def set_default_synth_pool(pool: Optional[SynthPool]) -> Optional[SynthPool]:
+    """
+    Replace the process-wide synth pool.
+
+    Args:
+        pool: New shared pool, or None to recreate the default lazily
+
+    Returns:
+        The previously installed pool, if any
+    """
+    global _default_synth_pool
+    with _default_synth_pool_lock:
+        previous = _default_synth_pool
+        _default_synth_pool = pool
+    return previous
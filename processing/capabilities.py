@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+"""
+Tool Capabilities
+===============
+One-time discovery of the external tools the renderers can use.
+
+The audio and notation renderers hand work to FluidSynth, MuseScore,
+LilyPond, ffmpeg and ImageMagick when they are installed. Finding out by
+trying costs a process spawn per render, and a missing tool is found
+missing again on every render. A CapabilityRegistry probes each tool once
+per process (it locates the executable on PATH and asks for its version),
+and the renderers ask the registry which backend to use.
+
+Probe results are saved to a small JSON manifest. A later process trusts a
+saved result while it is younger than CAPABILITIES_TTL and the tool still
+resolves to the same executable with the same modification time, so it
+starts without running any version command.
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import importlib
+import subprocess
+from typing import Optional, Dict, Any, List, Tuple, Iterable, NamedTuple
+
+from lib.music_generation.cache import atomic_write
+from lib.music_generation.constants import CAPABILITIES_PATH, CAPABILITIES_TTL, CAPABILITY_PROBE_TIMEOUT
+
+
+class Tool(NamedTuple):
+    """How to find one external tool."""
+    description: str
+    commands: Tuple[str, ...] = ()  # executables tried in order
+    version_args: Tuple[str, ...] = ("--version",)
+    module: Optional[str] = None  # Python module providing the tool instead of an executable
+
+
+class Capability(NamedTuple):
+    """Probe result for one tool."""
+    name: str
+    available: bool
+    path: Optional[str] = None  # executable (or module file) found
+    version: Optional[str] = None  # first line of the version output
+    error: Optional[str] = None  # why the tool is unavailable
+
+
+TOOLS: Dict[str, Tool] = {
+    "pyfluidsynth": Tool("FluidSynth Python bindings (in-process audio)", module="fluidsynth"),
+    "fluidsynth": Tool("FluidSynth CLI (MIDI to audio)", ("fluidsynth",)),
+    "ffmpeg": Tool("ffmpeg (MP3 encoding)", ("ffmpeg", "avconv"), ("-version",)),
+    "mscore": Tool("MuseScore (PDF engraving)", ("mscore", "musescore")),
+    "lilypond": Tool("LilyPond (PDF engraving)", ("lilypond",)),
+    "imagemagick": Tool("ImageMagick (PNG to PDF)", ("magick", "convert"), ("-version",)),
+    "reportlab": Tool("reportlab (quick PDF)", module="reportlab"),
+}
+
+# Backends in the order the renderers try them
+AUDIO_BACKENDS = ("pyfluidsynth", "fluidsynth")
+PDF_BACKENDS = ("mscore", "lilypond", "reportlab")
+
+
+def _fingerprint(tool: Tool) -> List[Any]:
+    """Where each candidate executable resolves to, and its mtime (no process is started)."""
+    fingerprint = []
+    for command in tool.commands:
+        path = shutil.which(command)
+        try:
+            mtime = os.stat(path).st_mtime if path else None
+        except OSError:
+            mtime = None
+        fingerprint.append([command, path, mtime])
+    return fingerprint
+
+
+def probe_tool(name: str, tool: Tool, timeout: float = CAPABILITY_PROBE_TIMEOUT) -> Capability:
+    """
+    Find a tool and ask it for its version.
+
+    Args:
+        name: Tool name
+        tool: How to find it
+        timeout: Seconds allowed for each version command
+
+    Returns:
+        Capability describing the first candidate that works
+    """
+    if tool.module:
+        try:
+            module = importlib.import_module(tool.module)
+        except (ImportError, OSError) as e:  # OSError: bindings present, native library missing
+            return Capability(name, False, error=str(e))
+        version = getattr(module, "__version__", None) or getattr(module, "Version", None)
+        return Capability(name, True, getattr(module, "__file__", None), str(version) if version else None)
+
+    # MuseScore is a Qt application; without this it may wait for a display
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    error = "not found on PATH"
+    for command in tool.commands:
+        path = shutil.which(command)
+        if path is None:
+            continue
+        try:
+            result = subprocess.run([path, *tool.version_args], capture_output=True, text=True,
+                                    errors="replace", stdin=subprocess.DEVNULL, env=env, timeout=timeout)
+        except (OSError, subprocess.SubprocessError) as e:
+            error = f"{command}: {e}"
+            continue
+        if result.returncode != 0:
+            error = f"{command} {' '.join(tool.version_args)} exited with status {result.returncode}"
+            continue
+        output = (result.stdout.strip() or result.stderr.strip()).splitlines()
+        return Capability(name, True, path, output[0].strip() if output else None)
+    return Capability(name, False, error=error)
+
+
+class CapabilityRegistry:
+    """
+    Thread-safe, memoized view of which external tools work.
+
+    Each tool is probed on first use; later lookups are dictionary reads.
+    """
+
+    def __init__(self, manifest_path: Optional[str] = CAPABILITIES_PATH, ttl: float = CAPABILITIES_TTL,
+                 probe_timeout: float = CAPABILITY_PROBE_TIMEOUT, tools: Optional[Dict[str, Tool]] = None):
+        """
+        Create a registry, reading saved probe results from manifest_path if present.
+
+        Args:
+            manifest_path: JSON file probe results are saved to (None keeps them in memory only)
+            ttl: Seconds a saved result is trusted
+            probe_timeout: Seconds allowed for each version command
+            tools: Tools to know about (TOOLS if not provided)
+        """
+        self.manifest_path = manifest_path
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self.tools = dict(TOOLS if tools is None else tools)
+        self._lock = threading.RLock()
+        self._results: Dict[str, Capability] = {}
+        self._probes = 0
+        self._manifest_hits = 0
+        self._manifest = self._load()
+
+    # -------------------------------------------------------------------------
+    # Manifest
+    # -------------------------------------------------------------------------
+    def _load(self) -> Dict[str, Any]:
+        if not self.manifest_path:
+            return {}
+        try:
+            with open(self.manifest_path, "r") as f:
+                saved = json.load(f)
+            return saved if isinstance(saved, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        if not self.manifest_path:
+            return
+        try:
+            atomic_write(self.manifest_path, json.dumps(self._manifest, indent=2).encode("utf-8"))
+        except OSError as e:
+            print(f"Warning: could not save tool capabilities: {e}")
+
+    def _from_manifest(self, name: str, fingerprint: List[Any]) -> Optional[Capability]:
+        entry = self._manifest.get(name)
+        try:
+            if (entry["fingerprint"] != fingerprint
+                    or not 0 <= time.time() - float(entry["probed_at"]) < self.ttl):
+                return None
+            return Capability(name, bool(entry["available"]), entry.get("path"),
+                              entry.get("version"), entry.get("error"))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+    def get(self, name: str, refresh: bool = False) -> Capability:
+        """
+        Return the capability of a tool, probing it on first use.
+
+        Args:
+            name: Tool name (a key of TOOLS)
+            refresh: Probe again even if a result is known
+
+        Returns:
+            Capability of the tool
+
+        Raises:
+            KeyError: If the tool is unknown
+        """
+        tool = self.tools[name]
+        with self._lock:
+            if not refresh and name in self._results:
+                return self._results[name]
+            fingerprint = _fingerprint(tool)
+            capability = None
+            # Python modules are checked in-process: the import is the probe
+            if not refresh and not tool.module:
+                capability = self._from_manifest(name, fingerprint)
+                if capability is not None:
+                    self._manifest_hits += 1
+            if capability is None:
+                capability = probe_tool(name, tool, self.probe_timeout)
+                self._probes += 1
+                if not tool.module:
+                    self._manifest[name] = dict(capability._asdict(), fingerprint=fingerprint,
+                                                probed_at=time.time())
+                    self._save()
+            self._results[name] = capability
+            return capability
+
+    def available(self, name: str) -> bool:
+        """Whether a tool works."""
+        return self.get(name).available
+
+    def path(self, name: str) -> Optional[str]:
+        """Executable of a tool, or None if it is unavailable."""
+        capability = self.get(name)
+        return capability.path if capability.available else None
+
+    def first_available(self, names: Iterable[str]) -> Optional[str]:
+        """
+        Return the first working tool, probing only as far as needed.
+
+        Args:
+            names: Tool names in order of preference
+
+        Returns:
+            Name of the first available tool, or None
+        """
+        for name in names:
+            if self.available(name):
+                return name
+        return None
+
+    def mark_unavailable(self, name: str, error: str) -> None:
+        """
+        Record that a tool failed to start, so this process stops trying it.
+
+        Only the in-memory result changes; the next process probes again.
+
+        Args:
+            name: Tool name
+            error: Why the tool is unusable
+        """
+        with self._lock:
+            self._results[name] = Capability(name, False, error=error)
+
+    def probe_all(self, refresh: bool = False) -> Dict[str, Capability]:
+        """
+        Return the capability of every known tool.
+
+        Args:
+            refresh: Probe every tool again instead of trusting saved results
+
+        Returns:
+            Dictionary of tool name to Capability, in TOOLS order
+        """
+        return {name: self.get(name, refresh) for name in self.tools}
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return registry counters.
+
+        Returns:
+            Dictionary with known (tools with a result), probes (version
+            commands or imports run) and manifest_hits (results reused from
+            the manifest)
+        """
+        with self._lock:
+            return {"known": len(self._results), "probes": self._probes, "manifest_hits": self._manifest_hits}
+
+
+# -----------------------------------------------------------------------------
+# Process-wide shared registry
+# -----------------------------------------------------------------------------
+_default_capabilities: Optional[CapabilityRegistry] = None
+_default_capabilities_lock = threading.Lock()
+
+
+def get_default_capabilities() -> CapabilityRegistry:
+    """
+    Return the process-wide capability registry, creating it on first use.
+
+    Returns:
+        Shared CapabilityRegistry backed by CAPABILITIES_PATH
+    """
+    global _default_capabilities
+    if _default_capabilities is None:
+        with _default_capabilities_lock:
+            if _default_capabilities is None:
+                _default_capabilities = CapabilityRegistry()
+    return _default_capabilities
+
+
+def set_default_capabilities(registry: Optional[CapabilityRegistry]) -> Optional[CapabilityRegistry]:
+    """
+    Replace the process-wide capability registry.
+
+    Args:
+        registry: New shared registry, or None to recreate the default lazily
+
+    Returns:
+        The previously installed registry, if any
+    """
+    global _default_capabilities
+    with _default_capabilities_lock:
+        previous = _default_capabilities
+        _default_capabilities = registry
+    return previous
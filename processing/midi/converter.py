@@ -6,23 +6,42 @@ MIDI Converter
 Functions for converting between JSON and MIDI formats.
 """
 
+import zlib
 import mido
+import numpy as np
 from mido import Message, MidiFile, MidiTrack, MetaMessage
-import random
-from typing import List, Any, Tuple
+from typing import List, Any, Tuple, Union
 
 from lib.music_generation.constants import TICKS_PER_BEAT, TICKS_PER_8TH, INSTRUMENT_PROGRAMS
-from lib.music_generation.theory import note_name_to_midi
+from lib.music_generation.sequence import NoteSequence
 
 
-def json_to_midi(json_data: List[Any], instrument: str, tempo: int, 
+def note_velocities(sequence: NoteSequence) -> np.ndarray:
+    """
+    Velocities given to the notes of a sequence.
+    
+    They vary between 60 and 100 for a more natural sound, drawn from a
+    generator seeded by the notes themselves: the same exercise always gets
+    the same MIDI, so its rendered audio can be reused.
+    
+    Args:
+        sequence: Notes to play
+        
+    Returns:
+        uint8 array with one velocity per note
+    """
+    seed = zlib.crc32(sequence.pitches.astype(np.int16).tobytes() + sequence.durations.astype(np.uint32).tobytes())
+    return np.random.default_rng(seed).integers(60, 101, len(sequence), dtype=np.uint8)
+
+
+def json_to_midi(json_data: Union[List[Any], NoteSequence], instrument: str, tempo: int,
                  time_signature: str, measures: int) -> MidiFile:
     """
     Convert JSON note data to a MIDI file.
     
     Args:
-        json_data: List of objects with 'note', 'duration', and 'cumulative_duration' properties,
-                  or legacy format of [note, duration] pairs
+        json_data: NoteSequence, or list of objects with 'note', 'duration', and 'cumulative_duration'
+                  properties, or legacy format of [note, duration] pairs (invalid notes are skipped)
         instrument: Instrument name
         tempo: Tempo in BPM
         time_signature: Time signature (e.g., "4/4")
@@ -45,25 +64,12 @@ def json_to_midi(json_data: List[Any], instrument: str, tempo: int,
     track.append(MetaMessage('set_tempo', tempo=mido.bpm2tempo(tempo), time=0))
     track.append(Message('program_change', program=program, time=0))
 
-    for note_item in json_data:
-        try:
-            # Handle both object format and legacy array format
-            if isinstance(note_item, dict):
-                note_name = note_item['note']
-                duration_units = note_item['duration']
-            else:
-                # Legacy format [note, duration]
-                note_name, duration_units = note_item
-                
-            note_num = note_name_to_midi(note_name)
-            ticks = int(duration_units * TICKS_PER_8TH)  # Convert 8th note units to ticks
-            ticks = max(ticks, 1)  # Ensure at least 1 tick
-            velocity = random.randint(60, 100)  # Random velocity for more natural sound
-            track.append(Message('note_on', note=note_num, velocity=velocity, time=0))
-            track.append(Message('note_off', note=note_num, velocity=velocity, time=ticks))
-        except Exception as e:
-            print(f"Error parsing note {note_name if 'note_name' in locals() else 'unknown'}: {e}")
-            # Continue with next note instead of failing completely
+    sequence = NoteSequence.from_json(json_data)
+    for note_num, duration_units, velocity in zip(sequence.pitches.tolist(), sequence.durations.tolist(),
+                                                  note_velocities(sequence).tolist()):
+        ticks = duration_units * TICKS_PER_8TH  # Convert 8th note units to ticks
+        track.append(Message('note_on', note=note_num, velocity=velocity, time=0))
+        track.append(Message('note_off', note=note_num, velocity=velocity, time=ticks))
     return mid
 
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+MIDI Writer
+==========
+Direct Standard MIDI File encoding for note sequences.
+
+json_to_midi builds a mido Message per note event and serializes them with
+MidiFile.save. For batch export that allocation dominates, so this module
+encodes the track straight from the NoteSequence arrays into bytes: delta
+times as variable-length quantities, channel events with running status.
+The output is byte-identical to saving the MidiFile from json_to_midi with
+the same velocities.
+"""
+
+import io
+import struct
+from typing import List, Any, Union, Optional, Sequence
+
+import mido
+import numpy as np
+
+from lib.music_generation.constants import TICKS_PER_BEAT, TICKS_PER_8TH, INSTRUMENT_PROGRAMS
+from lib.music_generation.sequence import NoteSequence
+from .converter import note_velocities
+
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+PROGRAM_CHANGE = 0xC0
+END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def encode_events(deltas: np.ndarray, statuses: np.ndarray, data1: np.ndarray, data2: np.ndarray,
+                  running_status: Optional[int] = None) -> np.ndarray:
+    """
+    Encode three-byte channel events (note on/off, control change, ...) with running status.
+
+    The status byte of an event is left out when it equals the previous
+    event's status, as mido does when saving.
+
+    Args:
+        deltas: Delta time of each event in ticks (below 2**28)
+        statuses: Status byte of each event (0x80-0xEF)
+        data1: First data byte of each event
+        data2: Second data byte of each event
+        running_status: Status byte in effect before the first event, or
+            None after a meta event
+
+    Returns:
+        uint8 array with the encoded events
+    """
+    deltas = np.asarray(deltas, dtype=np.uint32)
+    statuses = np.asarray(statuses, dtype=np.uint8)
+    count = len(deltas)
+    if not count:
+        return np.empty(0, dtype=np.uint8)
+    if deltas.max() >= 1 << 28:
+        raise ValueError("MIDI delta time must be below 2**28 ticks")
+
+    vlq_lengths = (1 + (deltas >= 1 << 7).astype(np.int64) + (deltas >= 1 << 14) + (deltas >= 1 << 21))
+    previous = np.empty(count, dtype=np.int16)
+    previous[0] = -1 if running_status is None else running_status
+    previous[1:] = statuses[:-1]
+    with_status = statuses != previous
+
+    sizes = vlq_lengths + with_status + 2
+    ends = np.cumsum(sizes)
+    out = np.empty(int(ends[-1]), dtype=np.uint8)
+    position = ends - sizes
+
+    # Delta times, most significant group first; every group but the last has the high bit set
+    for shift in (21, 14, 7):
+        longer = vlq_lengths > shift // 7
+        out[position[longer]] = ((deltas[longer] >> shift) & 0x7F) | 0x80
+        position += longer
+    out[position] = deltas & 0x7F
+    position += 1
+
+    out[position[with_status]] = statuses[with_status]
+    position += with_status
+    out[position] = data1
+    out[position + 1] = data2
+    return out
+
+
+def _track_header(instrument: str, tempo: int, time_signature: str) -> bytes:
+    """Time signature, tempo and program change events that start the track."""
+    numerator, denominator = map(int, time_signature.split('/'))
+    tempo_value = mido.bpm2tempo(tempo)
+    program = INSTRUMENT_PROGRAMS.get(instrument, 56)  # Default to trumpet if not found
+    return (bytes([0x00, 0xFF, 0x58, 0x04, numerator, denominator.bit_length() - 1, 24, 8])
+            + b"\x00\xff\x51\x03" + tempo_value.to_bytes(3, "big")
+            + bytes([0x00, PROGRAM_CHANGE, program]))
+
+
+def json_to_midi_bytes(json_data: Union[List[Any], NoteSequence], instrument: str, tempo: int,
+                       time_signature: str, measures: int,
+                       velocities: Optional[Sequence[int]] = None) -> bytes:
+    """
+    Encode note data as a Standard MIDI File without building mido messages.
+
+    Args:
+        json_data: NoteSequence, or note data accepted by NoteSequence.from_json
+        instrument: Instrument name
+        tempo: Tempo in BPM
+        time_signature: Time signature (e.g., "4/4")
+        measures: Number of measures (kept for parity with json_to_midi)
+        velocities: Velocity of each note; the ones json_to_midi gives
+            (note_velocities) if not provided
+
+    Returns:
+        Bytes of a type 1 MIDI file with one track
+    """
+    sequence = NoteSequence.from_json(json_data)
+    count = len(sequence)
+    if velocities is None:
+        velocities = note_velocities(sequence)
+    velocities = np.asarray(velocities, dtype=np.uint8)
+    if len(velocities) != count:
+        raise ValueError(f"Expected {count} velocities, got {len(velocities)}")
+
+    # Interleave note_on (delta 0) and note_off (delta = note length) events
+    deltas = np.zeros(2 * count, dtype=np.uint32)
+    deltas[1::2] = sequence.durations.astype(np.uint32) * TICKS_PER_8TH
+    statuses = np.empty(2 * count, dtype=np.uint8)
+    statuses[0::2] = NOTE_ON
+    statuses[1::2] = NOTE_OFF
+    pitches = np.repeat(sequence.pitches.astype(np.uint8), 2)
+    velocities = np.repeat(velocities, 2)
+
+    data = b"".join((
+        _track_header(instrument, tempo, time_signature),
+        encode_events(deltas, statuses, pitches, velocities, running_status=PROGRAM_CHANGE).tobytes(),
+        END_OF_TRACK,
+    ))
+    return b"".join((
+        b"MThd", struct.pack(">Lhhh", 6, 1, 1, TICKS_PER_BEAT),
+        b"MTrk", struct.pack(">L", len(data)), data,
+    ))
+
+
+def json_to_midi_buffer(json_data: Union[List[Any], NoteSequence], instrument: str, tempo: int,
+                        time_signature: str, measures: int,
+                        velocities: Optional[Sequence[int]] = None) -> io.BytesIO:
+    """
+    Encode note data as a Standard MIDI File in an in-memory file.
+
+    Args:
+        Same as json_to_midi_bytes
+
+    Returns:
+        BytesIO positioned at the start of the MIDI data
+    """
+    return io.BytesIO(json_to_midi_bytes(json_data, instrument, tempo, time_signature, measures, velocities))
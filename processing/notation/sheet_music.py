@@ -4,7 +4,7 @@
 
 import os
 import uuid
-import json
+import time
 import shutil
 import tempfile
 import subprocess
@@ -13,7 +13,9 @@ from typing import Optional, List, Dict, Any, Tuple
 import music21
 from music21 import stream, note, instrument, meter, tempo, key, metadata
 
-from lib.music_generation.theory import note_name_to_midi, clean_note_string
+from lib.music_generation.sequence import NoteSequence
+from lib.music_generation.constants import DEADLINE_ENGRAVING_SECONDS
+from processing.capabilities import get_default_capabilities
 from .constants import (
     INSTRUMENT_CLEFS,
     DURATION_MAP,
@@ -100,15 +102,13 @@ def json_to_music21_score(
     tempo_bpm: int,
     measures: int
 ) -> Optional[music21.stream.Score]:
-    """Convert JSON note data to a music21 Score object."""
+    """Convert note data (NoteSequence, note objects or pairs, or a JSON string) to a music21 Score object."""
     try:
-        # Parse JSON if it's a string
-        if isinstance(json_data, str):
-            try:
-                json_data = json.loads(json_data)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSON string: {e}")
-                return None
+        try:
+            sequence = NoteSequence.from_json(json_data)
+        except ValueError as e:
+            print(f"Error parsing JSON string: {e}")
+            return None
         
         # Create score and part
         score = music21.stream.Score()
@@ -135,37 +135,13 @@ def json_to_music21_score(
         tempo_marking = tempo.MetronomeMark(number=tempo_bpm)
         part.append(tempo_marking)
         
-        # Add notes from JSON data
-        for note_item in json_data:
+        # Add notes (names are already cleaned and validated by NoteSequence)
+        for note_name, duration_units in zip(sequence.names, sequence.durations.tolist()):
             try:
-                # Handle both object format and legacy array format
-                if isinstance(note_item, dict):
-                    note_name = note_item.get('note', 'C4')
-                    duration_units = int(note_item.get('duration', 2))
-                else:
-                    # Legacy format [note, duration]
-                    note_name, duration_units = note_item
-                    duration_units = int(duration_units)
-                
-                # Clean note string (remove ornamentation)
-                note_name = clean_note_string(str(note_name))
-                
-                # Validate note name
-                try:
-                    note_name_to_midi(note_name)
-                except ValueError:
-                    print(f"Warning: Invalid note '{note_name}', skipping")
-                    continue
-                
-                # Convert duration
                 quarter_length = duration_units_to_quarter_length(duration_units)
-                
-                # Create and add note
-                note_obj = note.Note(note_name, quarterLength=quarter_length)
-                part.append(note_obj)
-                
+                part.append(note.Note(note_name, quarterLength=quarter_length))
             except Exception as e:
-                print(f"Warning: Error processing note {note_item}: {e}")
+                print(f"Warning: Error processing note {note_name}: {e}")
                 continue
         
         # Add part to score
@@ -187,9 +163,25 @@ def render_score_to_pdf(
     score: music21.stream.Score,
     output_path: Optional[str] = None,
     use_lilypond: bool = True,
-    dpi: int = 300
+    dpi: int = 300,
+    timeout: Optional[float] = None
 ) -> Optional[str]:
-    """Render music21 Score to PDF (MuseScore→LilyPond→reportlab fallback)."""
+    """Render music21 Score to PDF (MuseScore→LilyPond→reportlab fallback).
+
+    With a timeout, the engravers only run while at least
+    DEADLINE_ENGRAVING_SECONDS are left (their subprocesses are clipped to the
+    time left) and the slow PNG route is skipped, so a short budget goes
+    straight to the quick reportlab PDF. Engravers the capability registry
+    knows to be missing are skipped without starting a process.
+    """
+    capabilities = get_default_capabilities()
+    expires_at = None if timeout is None else time.monotonic() + timeout
+
+    def time_left(default: float) -> float:
+        if expires_at is None:
+            return default
+        return min(default, max(0.0, expires_at - time.monotonic()))
+
     try:
         # If no output path provided, create a temporary file
         if output_path is None:
@@ -203,99 +195,104 @@ def render_score_to_pdf(
         if not output_path.endswith('.pdf'):
             output_path = output_path.rsplit('.', 1)[0] + '.pdf'
         
+        engrave = time_left(DEADLINE_ENGRAVING_SECONDS) >= DEADLINE_ENGRAVING_SECONDS
+
         # Try MuseScore first (most common on Mac)
-        try:
-            print("Attempting to render PDF via MuseScore...")
-            result = subprocess.run(
-                ['mscore', '-o', output_path, '-F', '-'],
-                input=score.write('musicxml'),
-                capture_output=True,
-                timeout=10,
-                text=True
-            )
-            if result.returncode == 0 and os.path.exists(output_path):
-                print(f"✓ PDF successfully created via MuseScore: {output_path}")
-                return output_path
-        except (FileNotFoundError, subprocess.TimeoutExpired, Exception):
-            pass
+        if engrave and capabilities.available('mscore'):
+            try:
+                print("Attempting to render PDF via MuseScore...")
+                result = subprocess.run(
+                    [capabilities.path('mscore'), '-o', output_path, '-F', '-'],
+                    input=score.write('musicxml'),
+                    capture_output=True,
+                    timeout=time_left(10),
+                    text=True
+                )
+                if result.returncode == 0 and os.path.exists(output_path):
+                    print(f"✓ PDF successfully created via MuseScore: {output_path}")
+                    return output_path
+            except OSError as e:
+                capabilities.mark_unavailable('mscore', str(e))
+            except (subprocess.TimeoutExpired, Exception):
+                pass
         
         # Try LilyPond backend second (best quality alternative)
-        if use_lilypond:
+        # (re-checked under a deadline, since a failed MuseScore run used up time)
+        if (use_lilypond and engrave and capabilities.available('lilypond')
+                and time_left(DEADLINE_ENGRAVING_SECONDS) >= DEADLINE_ENGRAVING_SECONDS):
             try:
-                # Check if LilyPond is available
-                result = subprocess.run(
-                    ['lilypond', '--version'],
+                print("Attempting to render PDF via LilyPond...")
+                temp_ly = tempfile.NamedTemporaryFile(suffix='.ly', delete=False)
+                temp_ly.close()
+                
+                score.write('lily', fp=temp_ly.name)
+                
+                # Compile LilyPond to PDF
+                subprocess.run(
+                    [capabilities.path('lilypond'), '-o', output_path.rsplit('.', 1)[0], temp_ly.name],
                     capture_output=True,
-                    timeout=5
+                    timeout=time_left(30)
                 )
-                if result.returncode == 0:
-                    print("Attempting to render PDF via LilyPond...")
-                    temp_ly = tempfile.NamedTemporaryFile(suffix='.ly', delete=False)
-                    temp_ly.close()
-                    
-                    score.write('lily', fp=temp_ly.name)
-                    
-                    # Compile LilyPond to PDF
-                    subprocess.run(
-                        ['lilypond', '-o', output_path.rsplit('.', 1)[0], temp_ly.name],
-                        capture_output=True,
-                        timeout=30
-                    )
-                    
-                    if os.path.exists(output_path):
-                        print(f"✓ PDF successfully created via LilyPond: {output_path}")
-                        try:
-                            os.remove(temp_ly.name)
-                        except:
-                            pass
-                        return output_path
+                
+                if os.path.exists(output_path):
+                    print(f"✓ PDF successfully created via LilyPond: {output_path}")
+                    try:
+                        os.remove(temp_ly.name)
+                    except:
+                        pass
+                    return output_path
             except (FileNotFoundError, subprocess.TimeoutExpired, Exception) as e:
                 print(f"LilyPond rendering not available: {e}")
         
         # Fallback: Generate PNG and convert to PDF using PIL
-        print("Falling back to PNG → PDF conversion...")
-        try:
-            # Generate PNG first
-            png_path = output_path.rsplit('.', 1)[0] + '_temp.png'
-            png_result = render_score_to_image(score, png_path, format='png', dpi=dpi)
+        # (skipped under a deadline: music21's PNG export runs MuseScore too)
+        if expires_at is None:
+            try:
+                print("Falling back to PNG → PDF conversion...")
+                # Generate PNG first
+                png_path = output_path.rsplit('.', 1)[0] + '_temp.png'
+                png_result = render_score_to_image(score, png_path, format='png', dpi=dpi)
             
-            if png_result and os.path.exists(png_result):
-                try:
-                    # Try PIL first
-                    from PIL import Image
+                if png_result and os.path.exists(png_result):
+                    try:
+                        # Try PIL first
+                        from PIL import Image
                     
-                    img = Image.open(png_result).convert('RGB')
-                    img.save(output_path, 'PDF')
+                        img = Image.open(png_result).convert('RGB')
+                        img.save(output_path, 'PDF')
                     
-                    # Clean up temp PNG
-                    try:
-                        os.remove(png_result)
-                    except:
-                        pass
+                        # Clean up temp PNG
+                        try:
+                            os.remove(png_result)
+                        except:
+                            pass
                     
-                    if os.path.exists(output_path) and os.path.getsize(output_path) > 100:
-                        print(f"✓ PDF successfully created via PNG conversion: {output_path}")
-                        return output_path
-                except Exception as pil_error:
-                    print(f"PIL conversion failed: {pil_error}, trying ImageMagick...")
-                    # Try ImageMagick as fallback
-                    try:
-                        subprocess.run(
-                            ['convert', png_result, output_path],
-                            capture_output=True,
-                            timeout=10
-                        )
-                        if os.path.exists(output_path):
-                            try:
-                                os.remove(png_result)
-                            except:
-                                pass
-                            print(f"✓ PDF successfully created via ImageMagick: {output_path}")
+                        if os.path.exists(output_path) and os.path.getsize(output_path) > 100:
+                            print(f"✓ PDF successfully created via PNG conversion: {output_path}")
                             return output_path
-                    except Exception as im_error:
-                        print(f"ImageMagick conversion failed: {im_error}")
-        except Exception as e:
-            print(f"PNG to PDF conversion failed: {e}")
+                    except Exception as pil_error:
+                        print(f"PIL conversion failed: {pil_error}, trying ImageMagick...")
+                        # Try ImageMagick as fallback
+                        try:
+                            if not capabilities.available('imagemagick'):
+                                raise FileNotFoundError("ImageMagick not installed")
+                            subprocess.run(
+                                [capabilities.path('imagemagick'), png_result, output_path],
+                                capture_output=True,
+                                timeout=10
+                            )
+                            if os.path.exists(output_path):
+                                try:
+                                    os.remove(png_result)
+                                except:
+                                    pass
+                                print(f"✓ PDF successfully created via ImageMagick: {output_path}")
+                                return output_path
+                        except Exception as im_error:
+                            print(f"ImageMagick conversion failed: {im_error}")
+            except Exception as e:
+                print(f"PNG to PDF conversion failed: {e}")
+        
         
         # Last resort: Create a professional-looking PDF with reportlab
         print("Creating professional PDF with reportlab...")
@@ -418,9 +415,10 @@ def render_score_to_image(
     score: music21.stream.Score,
     output_path: Optional[str] = None,
     format: str = 'png',
-    dpi: int = 300
+    dpi: int = 300,
+    timeout: Optional[float] = None
 ) -> Optional[str]:
-    """Render music21 Score to PNG or SVG image."""
+    """Render music21 Score to PNG or SVG image (timeout bounds the PDF fallback)."""
     try:
         # If no output path provided, create a temporary file
         if output_path is None:
@@ -448,7 +446,7 @@ def render_score_to_image(
                 print("Falling back to PDF...")
                 # Fallback to PDF when SVG unavailable
                 pdf_output = output_path.replace('.svg', '') + '.pdf'
-                return render_score_to_pdf(score, pdf_output, dpi=dpi)
+                return render_score_to_pdf(score, pdf_output, dpi=dpi, timeout=timeout)
         
         if format.lower() == 'png':
             try:
@@ -478,7 +476,7 @@ def render_score_to_image(
                     print("Falling back to PDF...")
                     # Fallback to PDF when PNG unavailable
                     pdf_output = output_path.replace('.png', '') + '.pdf'
-                    return render_score_to_pdf(score, pdf_output, dpi=dpi)
+                    return render_score_to_pdf(score, pdf_output, dpi=dpi, timeout=timeout)
         
         print(f"Warning: Image rendering failed for format {format}")
         return None
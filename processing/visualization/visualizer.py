@@ -8,74 +8,51 @@ Functions for creating visual representations of music exercises.
 
 import os
 import uuid
-import json
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Union
 
-from lib.music_generation.theory import note_name_to_midi, midi_to_note_name
+from lib.music_generation.sequence import NoteSequence
 
 
-def create_visualization(json_data: str, time_sig: str) -> Optional[str]:
+def create_visualization(json_data: Union[str, List[Any], NoteSequence], time_sig: str) -> Optional[str]:
     """
     Create a piano roll visualization of the exercise.
     
     Args:
-        json_data: JSON string containing [note, duration] pairs
+        json_data: NoteSequence, or note objects / [note, duration] pairs
+            (as a list or a JSON string)
         time_sig: Time signature (e.g., "4/4")
         
     Returns:
         Path to the generated image file or None if visualization fails
     """
     try:
-        if not json_data or "Error" in json_data:
+        if json_data is None or (isinstance(json_data, str) and (not json_data or "Error" in json_data)):
             return None
 
-        parsed = json.loads(json_data)
-        if not isinstance(parsed, list) or len(parsed) == 0:
+        sequence = NoteSequence.from_json(json_data)
+        if not len(sequence):
             return None
-
-        # Extract notes and durations
-        notes = []
-        durations = []
-        for note_item in parsed:
-            try:
-                # Handle both object format and legacy array format
-                if isinstance(note_item, dict):
-                    note_name = note_item['note']
-                    dur = note_item['duration']
-                else:
-                    # Legacy format [note, duration]
-                    note_name, dur = note_item
-                    
-                midi_note = note_name_to_midi(note_name)
-                notes.append(midi_note)
-                durations.append(dur)
-            except ValueError:
-                notes.append(60)  # Default to middle C if parsing fails
-                durations.append(dur if 'dur' in locals() else 1)
+        notes = sequence.pitches.tolist()
+        durations = sequence.durations.tolist()
+        time_positions = (sequence.onsets - sequence.start).tolist()
 
         # Create piano roll visualization
         import matplotlib.pyplot as plt
-        import numpy as np
 
         fig, ax = plt.subplots(figsize=(12, 6))
 
-        # Calculate time positions
-        time_positions = [0]
-        for dur in durations[:-1]:
-            time_positions.append(time_positions[-1] + dur)
-
         # Plot notes as rectangles
-        for i, (note, dur, pos) in enumerate(zip(notes, durations, time_positions)):
+        for note, name, dur, pos in zip(notes, sequence.names, durations, time_positions):
             rect = plt.Rectangle((pos, note - 0.4), dur, 0.8, color='blue', alpha=0.7)
             ax.add_patch(rect)
             # Add note name
-            ax.text(pos + dur / 2, note + 0.5, midi_to_note_name(note),
+            ax.text(pos + dur / 2, note + 0.5, name,
                     ha='center', va='bottom', fontsize=8)
 
         # Add measure lines
         numerator, denominator = map(int, time_sig.split('/'))
         units_per_measure = numerator * (8 // denominator)
-        max_time = time_positions[-1] + durations[-1]
+        max_time = sequence.total_duration
         for measure in range(1, int(max_time / units_per_measure) + 1):
             measure_pos = measure * units_per_measure
             if measure_pos <= max_time:
@@ -0,0 +1,116 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import ExerciseCache, set_default_cache
+from lib.music_generation.client import AsyncMistralClient
+from lib.music_generation.scheduler import RequestScheduler, set_default_scheduler
+from lib.music_generation.batch import ExerciseSpec, generate_exercises_async, generate_exercises
+
+EXERCISE = [["C4", 2], ["D4", 2], ["E4", 4]]
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Chat-completions stand-in that tracks how many requests overlap."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        data = json.dumps({"choices": [{"message": {"content": json.dumps(EXERCISE)}}]}).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestBatchGeneration(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+        self.previous_scheduler = set_default_scheduler(
+            RequestScheduler(requests_per_second=0, max_retries=2, backoff_base=0.01, deadline=2.0))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.delay = 0.05
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        self.spec = ExerciseSpec("Trumpet", "Beginner", "C Major", "4/4", 2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        set_default_cache(self.previous_cache)
+        set_default_scheduler(self.previous_scheduler)
+
+    def collect(self, specs, max_concurrency):
+        async def run():
+            async with AsyncMistralClient(api_url=self.url) as client:
+                return [result async for result in generate_exercises_async(
+                    specs, max_concurrency=max_concurrency, api_key="key", client=client)]
+        return asyncio.run(run())
+
+    def test_bounded_concurrency(self):
+        results = self.collect([self.spec] * 12, max_concurrency=4)
+        self.assertEqual(len(results), 12)
+        self.assertEqual(sorted(result.index for result in results), list(range(12)))
+        self.assertEqual(self.server.max_in_flight, 4)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(sum(item["duration"] for item in result.exercise), 16)
+
+    def test_unseeded_specs_are_generated_separately(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ExerciseCache(cache_dir)
+            set_default_cache(cache)
+            results = self.collect([self.spec] * 6, max_concurrency=2)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(self.server.requests, 6)
+        self.assertEqual(cache.stats()["hits"], 0)
+
+    def test_accepts_dict_specs(self):
+        specs = [{"instrument": "Violin", "level": "Advanced", "key": "G Major",
+                  "time_signature": "3/4", "measures": 1}]
+        results = self.collect(specs, max_concurrency=2)
+        self.assertEqual(results[0].spec.instrument, "Violin")
+        self.assertEqual(sum(item["duration"] for item in results[0].exercise), 6)
+
+    def test_fallback_per_job(self):
+        self.server.status = 429
+        results = self.collect([self.spec] * 3, max_concurrency=2)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(sum(item["duration"] for item in result.exercise), 16)
+
+    def test_blocking_wrapper_orders_results(self):
+        with patch("lib.music_generation.batch.AsyncMistralClient",
+                   lambda **kwargs: AsyncMistralClient(api_url=self.url, **kwargs)):
+            results = generate_exercises([self.spec] * 5, max_concurrency=5, api_key="key")
+        self.assertEqual([result.index for result in results], list(range(5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+
+import requests
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from lib.music_generation.generator import query_mistral
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise requests.exceptions.ConnectionError("connection refused")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4, open_duration=30.0,
+                                      half_open_probes=2, clock=self.clock)
+
+    def trip(self):
+        for _ in range(4):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.breaker.call(fail)
+
+    def test_opens_on_error_rate(self):
+        self.breaker.call(lambda: "ok")
+        self.breaker.call(lambda: "ok")
+        self.breaker.call(lambda: "ok")
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CLOSED)
+        for _ in range(2):  # 3 of the last 6 calls failed
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, OPEN)
+        calls = []
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: calls.append(1))
+        self.assertEqual(calls, [])
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    def test_other_errors_count_as_success(self):
+        for _ in range(6):
+            with self.assertRaises(KeyError):
+                self.breaker.call(lambda: {}["choices"])
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker(window=4, min_calls=2, slow_call_duration=0.01)
+        breaker.call(lambda: time.sleep(0.02))
+        breaker.call(lambda: time.sleep(0.02))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.stats()["slow_calls"], 2)
+
+    def test_half_open_probes_close_the_breaker(self):
+        self.trip()
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # Only half_open_probes calls are let through at once
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.clock.now += 30
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.stats()["trips"], 2)
+        self.assertAlmostEqual(self.breaker.stats()["retry_in"], 30.0)
+
+    def test_cancelled_probe_releases_its_slot(self):
+        self.trip()
+        self.clock.now += 30
+
+        async def main():
+            task = asyncio.ensure_future(self.breaker.call_async(lambda: asyncio.sleep(1)))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(main())
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_state_is_saved(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "breaker.json")
+            breaker = CircuitBreaker(window=4, min_calls=2, state_path=path, clock=self.clock)
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    breaker.call(fail)
+            with open(path) as f:
+                self.assertEqual(json.load(f)["state"], OPEN)
+            restored = CircuitBreaker(state_path=path, clock=self.clock)
+            self.assertEqual(restored.state, OPEN)
+            restored.reset()
+            self.assertEqual(CircuitBreaker(state_path=path, clock=self.clock).state, CLOSED)
+
+    def test_open_breaker_serves_fallback_fast(self):
+        self.trip()
+        start = time.perf_counter()
+        output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 4, api_key="key",
+                               cache=None, breaker=self.breaker)
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(sum(note["duration"] for note in json.loads(output)), 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from unittest.mock import MagicMock
+
+import requests
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import ExerciseCache, atomic_write
+from lib.music_generation.generator import query_mistral
+
+EXERCISE = json.dumps([{"note": "C4", "duration": 8, "cumulative_duration": 8}])
+
+
+class TestExerciseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ExerciseCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def key(self, **overrides):
+        params = dict(instrument="Trumpet", level="Beginner", key="C Major", time_sig="4/4",
+                      measures=4, prompt="", model="mistral-medium", temperature=0.5, seed=None)
+        params.update(overrides)
+        return ExerciseCache.make_key(**params)
+
+    def test_key_normalization(self):
+        self.assertEqual(self.key(), self.key(instrument="trumpet", key="C  Major", time_sig="4 / 4"))
+        self.assertNotEqual(self.key(), self.key(measures=8))
+        self.assertNotEqual(self.key(), self.key(seed=1))
+        self.assertNotEqual(self.key(), self.key(temperature=0.7))
+        self.assertNotEqual(self.key(), self.key(prompt="swing"))
+
+    def test_get_put_and_counters(self):
+        key = self.key()
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, EXERCISE)
+        self.assertEqual(self.cache.get(key), EXERCISE)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["writes"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+        # A second instance sharing the directory sees the entry
+        self.assertEqual(ExerciseCache(self.cache_dir).get(key), EXERCISE)
+
+    def test_ttl_expiry(self):
+        cache = ExerciseCache(self.cache_dir, ttl=0.05)
+        key = self.key()
+        cache.put(key, EXERCISE)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(os.path.exists(cache._path(key)))
+
+    def test_lru_eviction(self):
+        keys = [self.key(measures=m) for m in range(1, 11)]
+        base = time.time() - 100
+        for i, key in enumerate(keys):
+            self.cache.put(key, "x" * 150)
+            os.utime(self.cache._path(key), (base + i, base + i))
+        # Reading the oldest entry makes it the most recently used
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.cache.max_bytes = 1000
+        self.cache.evict()
+        remaining = [key for key in keys if os.path.exists(self.cache._path(key))]
+        self.assertIn(keys[0], remaining)
+        self.assertNotIn(keys[1], remaining)
+        self.assertIn(keys[-1], remaining)
+        self.assertLessEqual(sum(os.path.getsize(self.cache._path(key)) for key in remaining), 1000)
+        self.assertGreater(self.cache.stats()["evictions"], 0)
+
+    def test_atomic_concurrent_writes(self):
+        path = os.path.join(self.cache_dir, "ab", "entry.json")
+        payloads = [json.dumps({"writer": i, "data": "y" * 20000}).encode() for i in range(8)]
+        errors = []
+
+        def writer(data):
+            for _ in range(20):
+                atomic_write(path, data)
+
+        def reader():
+            for _ in range(200):
+                try:
+                    with open(path, "rb") as f:
+                        json.loads(f.read())
+                except FileNotFoundError:
+                    pass
+                except ValueError as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(p,)) for p in payloads]
+        threads.append(threading.Thread(target=reader))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["entry.json"])
+
+
+class TestQueryMistralCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ExerciseCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_hit_skips_api(self):
+        client = MagicMock()
+        client.chat_completion.return_value = "```json\n" + EXERCISE + "\n```"
+        for _ in range(3):
+            output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                                   api_key="key", client=client, seed=1, cache=self.cache)
+            self.assertEqual(output, EXERCISE)
+        self.assertEqual(client.chat_completion.call_count, 1)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_unseeded_requests_bypass_cache(self):
+        client = MagicMock()
+        client.chat_completion.return_value = EXERCISE
+        for _ in range(3):
+            query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                          api_key="key", client=client, cache=self.cache)
+        self.assertEqual(client.chat_completion.call_count, 3)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["writes"]), (0, 0, 0))
+
+    def test_seed_is_part_of_key(self):
+        client = MagicMock()
+        client.chat_completion.return_value = EXERCISE
+        query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1, api_key="key",
+                      client=client, seed=1, cache=self.cache)
+        query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1, api_key="key",
+                      client=client, seed=2, cache=self.cache)
+        self.assertEqual(client.chat_completion.call_count, 2)
+        self.assertEqual(client.chat_completion.call_args[0][0]["random_seed"], 2)
+
+    def test_fallback_not_cached(self):
+        client = MagicMock()
+        client.chat_completion.side_effect = requests.exceptions.ConnectionError("down")
+        query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                      api_key="key", client=client, seed=1, cache=self.cache)
+        self.assertEqual(self.cache.stats()["writes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import set_default_cache
+from lib.music_generation.client import MistralClient, AsyncMistralClient, get_default_client, set_default_client
+from lib.music_generation.generator import query_mistral, query_mistral_async
+
+EXERCISE = [{"note": "C4", "duration": 4, "cumulative_duration": 4},
+            {"note": "E4", "duration": 4, "cumulative_duration": 8}]
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    """Chat-completions stand-in that counts TCP connections and requests."""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests.append(json.loads(body))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        content = json.dumps(EXERCISE)
+        data = self.server.body or json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestMistralClient(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.requests = []
+        self.server.status = 200
+        self.server.delay = 0
+        self.server.body = None
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        set_default_cache(self.previous_cache)
+
+    def test_connection_reuse(self):
+        with MistralClient(api_url=self.url) as client:
+            for _ in range(5):
+                content = client.chat_completion({"model": "test"}, "key")
+                self.assertEqual(json.loads(content), EXERCISE)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_query_mistral_uses_client(self):
+        with MistralClient(api_url=self.url) as client:
+            for _ in range(3):
+                output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                                       api_key="key", client=client)
+                self.assertEqual(json.loads(output), EXERCISE)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests[0]["model"], "mistral-medium")
+
+    def test_read_timeout_falls_back(self):
+        self.server.delay = 0.5
+        with MistralClient(api_url=self.url, read_timeout=0.05) as client:
+            output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                                   api_key="key", client=client)
+        parsed = json.loads(output)
+        self.assertNotEqual(parsed, EXERCISE)
+        self.assertEqual(sum(item["duration"] for item in parsed), 8)
+
+    def test_http_error_falls_back(self):
+        self.server.status = 500
+        with MistralClient(api_url=self.url) as client:
+            output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                                   api_key="key", client=client)
+        self.assertEqual(sum(item["duration"] for item in json.loads(output)), 8)
+
+    def test_malformed_body_falls_back(self):
+        async def query_async():
+            async with AsyncMistralClient(api_url=self.url) as client:
+                return await query_mistral_async("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                                                 client, api_key="key")
+
+        for body in (b"<html>Bad gateway</html>", b'["not", "a", "completion"]', b'{"choices": []}'):
+            self.server.body = body
+            with MistralClient(api_url=self.url) as client:
+                output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                                       api_key="key", client=client)
+            self.assertEqual(sum(item["duration"] for item in json.loads(output)), 8, body)
+            output = asyncio.run(query_async())
+            self.assertEqual(sum(item["duration"] for item in json.loads(output)), 8, body)
+
+    def test_default_client_is_shared(self):
+        previous = set_default_client(None)
+        try:
+            self.assertIs(get_default_client(), get_default_client())
+            custom = MistralClient(api_url=self.url)
+            set_default_client(custom)
+            self.assertIs(get_default_client(), custom)
+            custom.close()
+        finally:
+            set_default_client(previous)
+
+
+if __name__ == "__main__":
+    unittest.main()
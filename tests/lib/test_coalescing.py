@@ -0,0 +1,176 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.coalescing import SingleFlight, set_default_single_flight
+from lib.music_generation.generator import generate_exercise
+
+EXERCISE = [{"note": "C4", "duration": 4, "cumulative_duration": 4},
+            {"note": "E4", "duration": 4, "cumulative_duration": 8}]
+
+
+class CountingCall:
+    """Slow blocking call that records how often it ran."""
+
+    def __init__(self, delay=0.1, error=None):
+        self.delay = delay
+        self.error = error
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.count += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [dict(note) for note in EXERCISE]
+
+
+def run_threads(target, count):
+    results = [None] * count
+
+    def worker(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_threads_share_one_call(self):
+        flight = SingleFlight()
+        call = CountingCall()
+        results = run_threads(lambda: flight.do("key", call), 8)
+        self.assertEqual(call.count, 1)
+        self.assertTrue(all(result == EXERCISE for result in results))
+        # Every caller gets its own copy
+        self.assertEqual(len({id(result) for result in results}), 8)
+        stats = flight.stats()
+        self.assertEqual((stats["calls"], stats["executions"], stats["coalesced"]), (8, 1, 7))
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_different_keys_and_later_calls_run_separately(self):
+        flight = SingleFlight()
+        call = CountingCall(delay=0.05)
+        run_threads(lambda: flight.do(threading.current_thread().name, call), 3)
+        flight.do("key", call)
+        flight.do("key", call)
+        self.assertEqual(call.count, 5)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+        call = CountingCall(error=ValueError("upstream failed"))
+        results = run_threads(lambda: flight.do("key", call), 4)
+        self.assertEqual(call.count, 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_asyncio_tasks_and_threads_share_one_call(self):
+        flight = SingleFlight()
+        call = CountingCall(delay=0.2)
+
+        async def slow():
+            return await asyncio.get_running_loop().run_in_executor(None, call)
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do_async("key", slow))
+            await asyncio.sleep(0.05)
+            thread_results = []
+            thread = threading.Thread(target=lambda: thread_results.append(flight.do("key", call)))
+            thread.start()
+            results = await asyncio.gather(leader, *(flight.do_async("key", slow) for _ in range(4)))
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+            return results + thread_results
+
+        results = asyncio.run(main())
+        self.assertEqual(call.count, 1)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(result == EXERCISE for result in results))
+
+    def test_cancelled_leader_hands_over(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return "done"
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do_async("key", slow))
+            await asyncio.sleep(0.05)
+            waiter = asyncio.ensure_future(flight.do_async("key", slow))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            return await waiter
+
+        self.assertEqual(asyncio.run(main()), "done")
+        self.assertEqual(len(calls), 2)
+
+    def test_cancelled_waiter_leaves_call_running(self):
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "done"
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do_async("key", slow))
+            await asyncio.sleep(0.02)
+            waiter = asyncio.ensure_future(flight.do_async("key", slow))
+            await asyncio.sleep(0.02)
+            waiter.cancel()
+            return await leader
+
+        self.assertEqual(asyncio.run(main()), "done")
+
+
+class TestGenerateExerciseCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.previous = set_default_single_flight(self.flight)
+        self.calls = CountingCall()
+
+    def tearDown(self):
+        set_default_single_flight(self.previous)
+
+    def query(self, *args, **kwargs):
+        self.calls()
+        return json.dumps(EXERCISE)
+
+    def generate(self, **kwargs):
+        return generate_exercise("Trumpet", "Beginner", "C Major", "4/4", 1, **kwargs)
+
+    def test_identical_requests_are_coalesced(self):
+        with patch("lib.music_generation.generator.query_mistral", self.query):
+            results = run_threads(self.generate, 6)
+        self.assertEqual(self.calls.count, 1)
+        self.assertTrue(all(sum(note["duration"] for note in result) == 8 for result in results))
+        self.assertEqual(self.flight.stats()["coalesced"], 5)
+
+    def test_opt_out_and_distinct_seeds(self):
+        with patch("lib.music_generation.generator.query_mistral", self.query):
+            run_threads(lambda: self.generate(coalesce=False), 3)
+            self.assertEqual(self.calls.count, 3)
+            seeds = iter(range(3))
+            run_threads(lambda: self.generate(seed=next(seeds)), 3)
+        self.assertEqual(self.calls.count, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
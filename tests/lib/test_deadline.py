@@ -0,0 +1,108 @@
+import unittest
+import sys
+import os
+import json
+import math
+import time
+import threading
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.deadline import Deadline
+from lib.music_generation.cache import set_default_cache
+from lib.music_generation.client import MistralClient
+from lib.music_generation.scheduler import RequestScheduler, DeadlineExceeded, chat_completion_within
+from lib.music_generation.breaker import CircuitBreaker
+from lib.music_generation.coalescing import SingleFlight, set_default_single_flight
+from lib.music_generation.generator import query_mistral, generate_exercise
+from lib.music_generation.stub_server import StubServer
+
+
+class TestDeadline(unittest.TestCase):
+    def test_unbounded(self):
+        deadline = Deadline()
+        self.assertFalse(deadline.bounded)
+        self.assertEqual(deadline.remaining(), math.inf)
+        self.assertIsNone(deadline.timeout(5))
+        self.assertTrue(deadline.allows(1000))
+
+    def test_remaining_and_reserve(self):
+        deadline = Deadline.from_ms(2000)
+        self.assertTrue(deadline.bounded)
+        self.assertAlmostEqual(deadline.remaining(), 2.0, delta=0.05)
+        self.assertAlmostEqual(deadline.timeout(0.5), 1.5, delta=0.05)
+        self.assertTrue(deadline.allows(1.0, reserve=0.5))
+        self.assertFalse(deadline.allows(1.0, reserve=1.5))
+        self.assertEqual(deadline.remaining(reserve=5), 0.0)
+
+    def test_expires(self):
+        deadline = Deadline(0.01)
+        time.sleep(0.02)
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertFalse(deadline.allows(0.001))
+
+
+class TestChatCompletionWithin(unittest.TestCase):
+    def test_client_gets_clipped_timeout(self):
+        client = MistralClient()
+        with patch.object(client, "chat_completion", return_value="[]") as call:
+            chat_completion_within(client, {}, "key", 0.25)
+        self.assertEqual(call.call_args.kwargs["timeout"], (0.25, 0.25))
+        client.close()
+
+    def test_spent_deadline_is_not_sent(self):
+        with self.assertRaises(DeadlineExceeded):
+            chat_completion_within(MistralClient(), {}, "key", 0.0)
+
+
+class TestQueryMistralDeadline(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+
+    def tearDown(self):
+        set_default_cache(self.previous_cache)
+
+    def test_slow_backend_falls_back_within_budget(self):
+        with StubServer(port=0, latency=2.0) as server, MistralClient(api_url=server.url) as client:
+            scheduler = RequestScheduler(client=client, requests_per_second=0, max_retries=0)
+            breaker = CircuitBreaker(window=4, min_calls=1)
+            start = time.perf_counter()
+            output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 4, api_key="key",
+                                   client=scheduler, breaker=breaker, deadline=0.3)
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(sum(note["duration"] for note in json.loads(output)), 32)
+        # A timeout caused by the caller's short budget does not trip the breaker
+        self.assertEqual(breaker.stats()["failures"], 0)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_coalesced_waiter_keeps_its_own_deadline(self):
+        flight = SingleFlight()
+        previous = set_default_single_flight(flight)
+        release = threading.Event()
+
+        def slow_query(*args, **kwargs):
+            release.wait(2)
+            return json.dumps([{"note": "C4", "duration": 8}])
+
+        try:
+            with patch("lib.music_generation.generator.query_mistral", slow_query):
+                leader = threading.Thread(target=generate_exercise,
+                                          args=("Trumpet", "Beginner", "C Major", "4/4", 1))
+                leader.start()
+                time.sleep(0.05)
+                start = time.perf_counter()
+                exercise = generate_exercise("Trumpet", "Beginner", "C Major", "4/4", 1, deadline=0.1)
+                elapsed = time.perf_counter() - start
+                release.set()
+                leader.join()
+        finally:
+            set_default_single_flight(previous)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(sum(note["duration"] for note in exercise), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
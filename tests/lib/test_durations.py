@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.durations import apportion, scale_durations, scale_durations_flat, scale_exercises
+from lib.music_generation.generator import scale_json_durations
+
+
+class TestApportion(unittest.TestCase):
+    def test_largest_remainder(self):
+        # Quotas after the reserved unit: 1.25, 1.25, 2.5 -> the largest remainder gets the spare unit
+        self.assertEqual(apportion(np.array([1, 1, 2]), [3], 8).tolist(), [2, 2, 4])
+        self.assertEqual(apportion(np.array([1, 1, 1]), [3], 7).tolist(), [3, 2, 2])
+
+    def test_every_note_keeps_a_unit(self):
+        # The old loop rounded the long note up and left the last note at max(1, negative)
+        self.assertEqual(apportion(np.array([1, 100, 1]), [3], 4).tolist(), [1, 2, 1])
+
+    def test_zero_negative_and_fractional_durations(self):
+        self.assertEqual(apportion(np.array([0, 0]), [2], 4).tolist(), [2, 2])
+        self.assertEqual(apportion(np.array([-3, 1]), [2], 5).tolist(), [1, 4])
+        self.assertEqual(apportion(np.array([1.5, 0.5]), [2], 6).tolist(), [4, 2])
+
+    def test_ragged_batch(self):
+        lengths = [2, 0, 3]
+        scaled = apportion(np.array([1, 3, 2, 2, 4]), lengths, [8, 0, 16])
+        self.assertEqual(scaled.tolist(), [3, 5, 4, 4, 8])
+
+    def test_invalid_targets(self):
+        with self.assertRaises(ValueError):
+            apportion(np.array([1, 1, 1]), [3], 2)
+        with self.assertRaises(ValueError):
+            apportion(np.array([1, 1]), [3], 8)
+
+    def test_random_batches_are_exact(self):
+        rng = np.random.default_rng(7)
+        batch = [rng.integers(0, 9, rng.integers(1, 40)) for _ in range(500)]
+        targets = np.maximum(rng.integers(1, 64, len(batch)), [len(durations) for durations in batch])
+        for durations, target in zip(scale_durations(batch, targets), targets):
+            self.assertEqual(durations.sum(), target)
+            self.assertGreaterEqual(durations.min(), 1)
+
+
+class TestMeasureSnapping(unittest.TestCase):
+    def test_notes_snap_to_barlines(self):
+        durations = np.array([3, 3, 3, 3, 4])
+        plain = scale_durations_flat(durations, [5], 16).tolist()
+        snapped = scale_durations_flat(durations, [5], 16, units_per_measure=8).tolist()
+        self.assertNotIn(8, np.cumsum(plain).tolist())
+        self.assertIn(8, np.cumsum(snapped).tolist())
+        self.assertEqual(sum(snapped), 16)
+
+    def test_note_spanning_a_measure_is_not_snapped(self):
+        durations = np.array([1, 6, 1])
+        self.assertEqual(scale_durations_flat(durations, [3], 16, units_per_measure=8).tolist(),
+                         scale_durations_flat(durations, [3], 16).tolist())
+
+    def test_target_must_be_whole_measures(self):
+        with self.assertRaises(ValueError):
+            scale_durations([[1, 1]], 12, units_per_measure=8)
+
+
+class TestScaleExercises(unittest.TestCase):
+    def test_formats_are_preserved(self):
+        pairs, objects = scale_exercises([[["C4", 1], ["D4", 1]],
+                                          [{"note": "E4", "duration": 3}, {"note": "F4", "duration": 1}]], 8)
+        self.assertEqual(pairs, [["C4", 4], ["D4", 4]])
+        self.assertEqual(objects, [{"note": "E4", "duration": 6, "cumulative_duration": 6},
+                                   {"note": "F4", "duration": 2, "cumulative_duration": 8}])
+
+    def test_malformed_durations_count_as_zero(self):
+        scaled = scale_exercises([[{"note": "C4", "duration": None}, {"note": "D4", "duration": "3"}]], 8)[0]
+        self.assertEqual([item["duration"] for item in scaled], [1, 7])
+
+    def test_extra_notes_are_dropped(self):
+        scaled = scale_json_durations([["C4", 1], ["D4", 1], ["E4", 1]], 2)
+        self.assertEqual(scaled, [["C4", 1], ["D4", 1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
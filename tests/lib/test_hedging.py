@@ -0,0 +1,190 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+
+import requests
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import set_default_cache
+from lib.music_generation.hedging import Hedger, LatencyTracker, set_default_hedger
+from lib.music_generation.scheduler import RequestScheduler
+from lib.music_generation.generator import query_mistral
+
+EXERCISE = [{"note": "C4", "duration": 4, "cumulative_duration": 4},
+            {"note": "E4", "duration": 4, "cumulative_duration": 8}]
+
+
+class ScriptedClient:
+    """Client whose n-th call sleeps delays[n] seconds, then answers or raises."""
+
+    def __init__(self, delays, errors=()):
+        self.delays = list(delays)
+        self.errors = set(errors)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def chat_completion(self, payload, api_key, timeout=None):
+        with self.lock:
+            index = self.calls
+            self.calls += 1
+        time.sleep(self.delays[index])
+        if index in self.errors:
+            raise requests.exceptions.ConnectionError(f"call {index} failed")
+        return json.dumps(EXERCISE) if index == 0 else json.dumps(EXERCISE[:1] * 2)
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_percentile(self):
+        tracker = LatencyTracker(window=100)
+        self.assertIsNone(tracker.percentile(95))
+        for ms in range(1, 101):
+            tracker.record(ms / 1000.0)
+        self.assertAlmostEqual(tracker.percentile(50), 0.05)
+        self.assertAlmostEqual(tracker.percentile(95), 0.095)
+        self.assertAlmostEqual(tracker.percentile(100), 0.1)
+
+    def test_window_slides(self):
+        tracker = LatencyTracker(window=3)
+        for latency in (10.0, 1.0, 1.0, 1.0):
+            tracker.record(latency)
+        self.assertEqual(tracker.percentile(100), 1.0)
+
+
+class TestHedger(unittest.TestCase):
+    def hedger(self, client, **options):
+        options.setdefault("initial_delay", 0.05)
+        return Hedger(client=client, **options)
+
+    def test_fast_answer_is_not_hedged(self):
+        client = ScriptedClient([0.0])
+        hedger = self.hedger(client)
+        self.assertEqual(json.loads(hedger.chat_completion({}, "key")), EXERCISE)
+        stats = hedger.stats()
+        self.assertEqual((stats["requests"], stats["hedged"]), (1, 0))
+        self.assertEqual(client.calls, 1)
+
+    def test_hedge_wins_when_primary_is_slow(self):
+        hedger = self.hedger(ScriptedClient([1.0, 0.0]))
+        start = time.monotonic()
+        output = hedger.chat_completion({}, "key")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(json.loads(output)), 2)
+        stats = hedger.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+        self.assertEqual(stats["hedge_rate"], 1.0)
+
+    def test_primary_can_still_win(self):
+        hedger = self.hedger(ScriptedClient([0.1, 1.0]))
+        self.assertEqual(json.loads(hedger.chat_completion({}, "key")), EXERCISE)
+        stats = hedger.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 0))
+
+    def test_failed_copy_waits_for_the_other(self):
+        hedger = self.hedger(ScriptedClient([0.1, 0.2], errors={0}))
+        self.assertEqual(len(json.loads(hedger.chat_completion({}, "key"))), 2)
+
+    def test_error_is_raised_when_all_copies_fail(self):
+        hedger = self.hedger(ScriptedClient([0.1, 0.1], errors={0, 1}))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            hedger.chat_completion({}, "key")
+
+    def test_fast_error_is_not_hedged(self):
+        client = ScriptedClient([0.0], errors={0})
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.hedger(client).chat_completion({}, "key")
+        self.assertEqual(client.calls, 1)
+
+    def test_extra_in_flight_cap(self):
+        client = ScriptedClient([0.2] * 4)
+        hedger = self.hedger(client, max_extra_in_flight=1)
+        threads = [threading.Thread(target=hedger.chat_completion, args=({}, "key")) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = hedger.stats()
+        self.assertEqual((stats["hedged"], stats["hedges_skipped"]), (1, 1))
+        self.assertEqual(client.calls, 3)
+        time.sleep(0.3)  # The losing hedge finishes in the background and frees its slot
+        self.assertEqual(hedger.stats()["extra_in_flight"], 0)
+
+    def test_queued_loser_is_never_sent(self):
+        client = ScriptedClient([0.2, 0.0])
+        # One request per two seconds: the hedge waits in the scheduler's queue
+        scheduler = RequestScheduler(client, requests_per_second=0.5, request_burst=1, deadline=5)
+        hedger = self.hedger(scheduler)
+        start = time.monotonic()
+        self.assertEqual(json.loads(hedger.chat_completion({}, "key")), EXERCISE)
+        self.assertLess(time.monotonic() - start, 1)
+        time.sleep(0.1)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(scheduler.stats()["cancelled"], 1)
+        self.assertEqual(hedger.stats()["extra_in_flight"], 0)
+
+    def test_copies_share_the_deadline(self):
+        deadlines = []
+
+        class DeadlineClient:
+            def chat_completion(self, payload, api_key, deadline=None):
+                deadlines.append(deadline)
+                time.sleep(0.2 if len(deadlines) == 1 else 0.0)
+                return json.dumps(EXERCISE)
+
+        self.hedger(DeadlineClient()).chat_completion({}, "key", deadline=2.0)
+        self.assertEqual(len(deadlines), 2)
+        self.assertAlmostEqual(deadlines[0], 2.0, delta=0.02)
+        # The hedge only gets what is left of the request's deadline
+        self.assertAlmostEqual(deadlines[1], 2.0 - 0.05, delta=0.03)
+
+    def test_delay_follows_recent_latency(self):
+        hedger = self.hedger(ScriptedClient([]), min_samples=5, percentile=80, min_delay=0.01)
+        self.assertEqual(hedger.hedge_delay(), 0.05)
+        for latency in (0.1, 0.2, 0.3, 0.4, 5.0):
+            hedger.latencies.record(latency)
+        self.assertAlmostEqual(hedger.hedge_delay(), 0.4)
+
+    def test_async_hedge_cancels_the_loser(self):
+        cancelled = []
+
+        async def call(delays=[1.0, 0.0]):
+            delay = delays.pop(0)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        hedger = self.hedger(None)
+        self.assertEqual(asyncio.run(hedger.run_async(call)), 0.0)
+        self.assertEqual(cancelled, [1.0])
+        self.assertEqual(hedger.stats()["hedge_wins"], 1)
+        self.assertEqual(hedger.stats()["extra_in_flight"], 0)
+
+
+class TestQueryMistralHedging(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+
+    def tearDown(self):
+        set_default_cache(self.previous_cache)
+
+    def test_hedge_flag_uses_shared_hedger(self):
+        hedger = Hedger(client=ScriptedClient([1.0, 0.0]), initial_delay=0.05)
+        previous = set_default_hedger(hedger)
+        try:
+            output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1, api_key="key", hedge=True)
+        finally:
+            set_default_hedger(previous)
+        self.assertEqual(len(json.loads(output)), 2)
+        self.assertEqual(hedger.stats()["hedge_wins"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
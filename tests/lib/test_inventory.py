@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+import time
+import tempfile
+import threading
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.constants import INSTRUMENTS, LEVELS, KEYS, TIME_SIGNATURES
+from lib.music_generation.inventory import ExerciseInventory, all_combinations
+from lib.music_generation.generator import generate_exercise
+
+TRUMPET = ("Trumpet", "Beginner", "C Major", "4/4", 2)
+VIOLIN = ("Violin", "Advanced", "G Major", "3/4", 1)
+
+
+class CountingGenerator:
+    """Generates a labelled one-note exercise per call, optionally failing."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def __call__(self, instrument, level, key, time_sig, measures):
+        with self.lock:
+            self.calls.append((instrument, level, key, time_sig, measures))
+            number = len(self.calls)
+        if self.fail:
+            raise ValueError("upstream unavailable")
+        return [{"note": "C4", "duration": 8, "cumulative_duration": 8, "id": number}]
+
+
+class TestExerciseInventory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "inventory.json")
+        self.generate = CountingGenerator()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def inventory(self, **options):
+        options.setdefault("combinations", [TRUMPET, VIOLIN])
+        options.setdefault("low_water", 1)
+        options.setdefault("target", 2)
+        options.setdefault("generate", self.generate)
+        return ExerciseInventory(path=self.path, **options)
+
+    def test_combinations_cover_cli_options(self):
+        combinations = all_combinations()
+        self.assertEqual(len(combinations), len(INSTRUMENTS) * len(LEVELS) * len(KEYS) * len(TIME_SIGNATURES) * 16)
+        self.assertIn(TRUMPET, combinations)
+
+    def test_refill_and_take(self):
+        inventory = self.inventory()
+        self.assertIsNone(inventory.take(*TRUMPET))
+        self.assertEqual(inventory.refill(), 4)
+        self.assertEqual(inventory.size(TRUMPET), 2)
+        first = inventory.take(*TRUMPET)
+        second = inventory.take(*TRUMPET)
+        self.assertNotEqual(first[0]["id"], second[0]["id"])
+        self.assertIsNone(inventory.take(*TRUMPET))
+        stats = inventory.stats()
+        self.assertEqual((stats["served"], stats["misses"], stats["generated"]), (2, 2, 4))
+
+    def test_unstocked_combination_is_a_miss(self):
+        inventory = self.inventory()
+        self.assertIsNone(inventory.take("Flute", "Beginner", "C Major", "4/4", 9))
+
+    def test_demanded_buckets_are_refilled_first(self):
+        inventory = self.inventory()
+        inventory.take(*VIOLIN)
+        inventory.refill(limit=1)
+        self.assertEqual(self.generate.calls, [VIOLIN])
+
+    def test_refill_only_below_low_water(self):
+        inventory = self.inventory(low_water=1, target=3)
+        inventory.refill()
+        inventory.take(*TRUMPET)
+        self.assertEqual(inventory.refill_plan(), [])
+
+    def test_failures_stop_the_pass(self):
+        self.generate.fail = True
+        inventory = self.inventory(workers=1)
+        self.assertEqual(inventory.refill(), 0)
+        self.assertEqual(len(self.generate.calls), 1)
+        self.assertEqual(inventory.stats()["failures"], 1)
+        self.assertEqual(len(inventory.refill_plan()), 4)
+
+    def test_persists_across_restarts(self):
+        inventory = self.inventory()
+        inventory.refill()
+        inventory.take(*VIOLIN)
+        inventory.save()
+
+        restarted = self.inventory()
+        self.assertEqual(restarted.size(TRUMPET), 2)
+        self.assertEqual(restarted.size(VIOLIN), 1)
+        self.assertEqual(restarted.take(*VIOLIN)[0]["id"], inventory.take(*VIOLIN)[0]["id"])
+
+    def test_background_refiller_replaces_taken_exercises(self):
+        inventory = self.inventory(refill_interval=60, save_interval=0)
+        with inventory:
+            deadline = time.time() + 5
+            while inventory.size() < 4 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(inventory.size(), 4)
+            inventory.take(*TRUMPET)
+            inventory.take(*TRUMPET)
+            deadline = time.time() + 5
+            while inventory.size(TRUMPET) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(inventory.size(TRUMPET), 2)
+        self.assertEqual(self.inventory(generate=None).size(), 4)
+
+
+class TestGenerateFromInventory(unittest.TestCase):
+    def setUp(self):
+        self.inventory = ExerciseInventory(path=None, combinations=[TRUMPET], generate=CountingGenerator())
+        self.inventory.refill()
+
+    def test_served_without_querying(self):
+        with patch("lib.music_generation.generator.query_mistral") as query:
+            exercise = generate_exercise(*TRUMPET, inventory=self.inventory)
+        query.assert_not_called()
+        self.assertEqual(exercise[0]["id"], 1)
+
+    def test_custom_prompt_bypasses_inventory(self):
+        with patch("lib.music_generation.generator.query_mistral",
+                   return_value='[{"note": "D4", "duration": 8, "cumulative_duration": 8}]') as query:
+            exercise = generate_exercise(*TRUMPET, custom_prompt="scales", inventory=self.inventory)
+        query.assert_called_once()
+        self.assertEqual(sum(item["duration"] for item in exercise), 16)
+        self.assertEqual(self.inventory.size(TRUMPET), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
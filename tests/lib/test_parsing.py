@@ -0,0 +1,123 @@
+import unittest
+import sys
+import os
+import time
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.parsing import (Note, find_note_array, parse_notes, parse_compact, format_compact,
+                                          IncrementalCompactParser)
+from lib.music_generation.generator import safe_parse_json, build_mistral_payload, max_output_tokens
+
+
+class TestFindNoteArray(unittest.TestCase):
+    def test_code_fences_and_prose(self):
+        text = 'Here\'s your exercise:\n```json\n[{"note": "C4", "duration": 2}]\n```\nEnjoy, it\'s fun!'
+        self.assertEqual(find_note_array(text), [{"note": "C4", "duration": 2}])
+
+    def test_single_quotes(self):
+        self.assertEqual(find_note_array("[['C4', 2], {'note': 'D4', 'duration': 4}]"),
+                         [["C4", 2], {"note": "D4", "duration": 4}])
+
+    def test_apostrophes_inside_strings_are_preserved(self):
+        text = '[{"note": "C4", "duration": 2, "hint": "don\'t rush"}]'
+        self.assertEqual(find_note_array(text)[0]["hint"], "don't rush")
+
+    def test_skips_arrays_that_are_not_notes(self):
+        text = 'See note [1] and [] first. [["C4", 2], ["D4", 4]]'
+        self.assertEqual(find_note_array(text), [["C4", 2], ["D4", 4]])
+
+    def test_unbalanced_bracket_in_prose(self):
+        text = '[Draft: here it is [{"note": "E4", "duration": 8}] good luck'
+        self.assertEqual(find_note_array(text), [{"note": "E4", "duration": 8}])
+
+    def test_array_inside_object(self):
+        text = '{"exercise": [{"note": "G4", "duration": 4, "cumulative_duration": 4}]}'
+        self.assertEqual(find_note_array(text), [{"note": "G4", "duration": 4, "cumulative_duration": 4}])
+
+    def test_brackets_inside_strings(self):
+        text = '[{"note": "C4", "duration": 2, "text": "a ] b ["}]'
+        self.assertEqual(len(find_note_array(text)), 1)
+
+    def test_no_array(self):
+        self.assertIsNone(find_note_array("This is not JSON"))
+        self.assertIsNone(find_note_array('[{"note": "C4"'))
+        self.assertIsNone(find_note_array('[{"pitch": "C4"}]'))
+
+    def test_typed_notes(self):
+        self.assertEqual(parse_notes('[["C4", 2.0], {"note": "D4", "duration": 4}]'),
+                         [Note("C4", 2), Note("D4", 4)])
+        self.assertIsNone(parse_notes("nothing here"))
+
+    def test_safe_parse_json_uses_scanner(self):
+        self.assertEqual(safe_parse_json('```json\n[{"note": "C4", "duration": 2}]\n```'),
+                         [{"note": "C4", "duration": 2}])
+
+    def test_pathological_inputs_scale_linearly(self):
+        patterns = [
+            lambda n: "[" + "{}," * n,
+            lambda n: "[" * n,
+            lambda n: "[{" * n,
+            lambda n: "[" + '{"note": "C4", ' * n,
+            lambda n: "'[" * n + "]",
+            lambda n: "[" * n + "]" * n,
+            lambda n: "[1]," * n,
+            lambda n: "[x] " * n,
+            lambda n: "It's [1] and don't " * n,
+        ]
+
+        def timed(text):
+            best = float("inf")
+            for _ in range(3):
+                start = time.perf_counter()
+                self.assertIsNone(find_note_array(text))
+                best = min(best, time.perf_counter() - start)
+            return best
+
+        for pattern in patterns:
+            small, large = timed(pattern(20_000)), timed(pattern(80_000))
+            # Four times the input: about 4x for a linear parser, 16x for a quadratic one
+            self.assertLess(large, 8 * small + 0.02, pattern(2))
+
+
+class TestCompactWireFormat(unittest.TestCase):
+    def test_decode(self):
+        notes = parse_compact("```\nC4:2 E4:2 G4(trill):4 | Bb4:8 |\n```")
+        self.assertEqual(notes, [{"note": "C4", "duration": 2, "cumulative_duration": 2},
+                                 {"note": "E4", "duration": 2, "cumulative_duration": 4},
+                                 {"note": "G4", "duration": 4, "cumulative_duration": 8},
+                                 {"note": "Bb4", "duration": 8, "cumulative_duration": 16}])
+        self.assertEqual(parse_compact("C4:0"), [{"note": "C4", "duration": 1, "cumulative_duration": 1}])
+        self.assertIsNone(parse_compact("I cannot write music"))
+
+    def test_round_trip(self):
+        text = format_compact([["C4", 2], {"note": "D4", "duration": 6}, ["E4", 8]], units_per_measure=8)
+        self.assertEqual(text, "C4:2 D4:6 | E4:8 |")
+        self.assertEqual([note["duration"] for note in parse_compact(text)], [2, 6, 8])
+
+    def test_incremental(self):
+        parser = IncrementalCompactParser()
+        notes = []
+        for chunk in ["Here: C", "4:2 E4", ":2 G4:4|", "C5:8"]:
+            notes.extend(parser.feed(chunk))
+        self.assertEqual(notes, [["C4", 2], ["E4", 2], ["G4", 4]])
+        self.assertEqual(parser.close(), [["C5", 8]])
+        parser = IncrementalCompactParser()
+        self.assertEqual(parser.feed("C4:2 oops D4:2 "), [["C4", 2]])
+        self.assertTrue(parser.invalid)
+
+    def test_payload_and_token_budget(self):
+        compact = build_mistral_payload("", "Trumpet", "Beginner", "C Major", "4/4", 16, wire_format="compact")
+        verbose = build_mistral_payload("", "Trumpet", "Beginner", "C Major", "4/4", 16)
+        self.assertNotIn("response_format", compact)
+        self.assertIn("NOTE:DURATION", compact["messages"][1]["content"])
+        self.assertGreater(verbose["max_tokens"], 128 * 40)  # 16 measures of 8th notes fit
+        self.assertLess(compact["max_tokens"], verbose["max_tokens"] / 5)
+        self.assertLess(max_output_tokens("4/4", 1), max_output_tokens("4/4", 2))
+        with self.assertRaises(ValueError):
+            build_mistral_payload("", "Trumpet", "Beginner", "C Major", "4/4", 1, wire_format="xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
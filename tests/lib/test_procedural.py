@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import json
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.constants import INSTRUMENTS, LEVELS, KEYS, TIME_SIGNATURES, INSTRUMENT_RANGES
+from lib.music_generation.procedural import generate_procedural_exercise, measure_rhythms, LEVEL_RULES
+from lib.music_generation.generator import (generate_exercise, get_fallback_exercise,
+                                            uses_procedural_engine)
+from lib.music_generation.theory import note_name_to_midi, parse_key, scale_midi_numbers
+
+
+class TestProceduralEngine(unittest.TestCase):
+    def test_exact_measures_for_every_combination(self):
+        for instrument in INSTRUMENTS:
+            low, high = (note_name_to_midi(note) for note in INSTRUMENT_RANGES[instrument])
+            for level in LEVELS:
+                for key in KEYS:
+                    tonic, _ = parse_key(key)
+                    scale = set(scale_midi_numbers(key, low, high))
+                    for time_sig in TIME_SIGNATURES:
+                        units = int(time_sig[0]) * 2
+                        exercise = generate_procedural_exercise(instrument, level, key, time_sig, 5, seed=3)
+                        self.assertEqual(exercise[-1]["cumulative_duration"], 5 * units)
+                        self.assertEqual(sum(item["duration"] for item in exercise), 5 * units)
+                        midis = [note_name_to_midi(item["note"]) for item in exercise]
+                        self.assertTrue(all(midi in scale for midi in midis))
+                        self.assertEqual(midis[-1] % 12, tonic)
+
+    def test_no_note_crosses_a_barline(self):
+        exercise = generate_procedural_exercise("Violin", "Advanced", "D Major", "3/4", 8, seed=11)
+        boundaries = {item["cumulative_duration"] for item in exercise}
+        self.assertTrue(all(6 * measure in boundaries for measure in range(1, 9)))
+
+    def test_level_rhythm_vocabulary(self):
+        exercise = generate_procedural_exercise("Piano", "Beginner", "C Major", "4/4", 16, seed=5)
+        self.assertTrue({item["duration"] for item in exercise} <= set(LEVEL_RULES["Beginner"].durations))
+        self.assertIn((2, 2, 4), measure_rhythms("Beginner", 8))
+
+    def test_flat_keys_are_spelled_with_flats(self):
+        exercise = generate_procedural_exercise("Clarinet", "Advanced", "Bb Major", "4/4", 16, seed=2)
+        self.assertFalse(any("#" in item["note"] for item in exercise))
+
+    def test_seeded_and_unknown_parameters(self):
+        first = generate_procedural_exercise("Flute", "Intermediate", "E Minor", "4/4", 4, seed=42)
+        self.assertEqual(first, generate_procedural_exercise("Flute", "Intermediate", "E Minor", "4/4", 4, seed=42))
+        exercise = generate_procedural_exercise("Tuba", "Expert", "H Major", "4/4", 2, seed=1)
+        self.assertEqual(exercise[-1]["cumulative_duration"], 16)
+
+    def test_fallback_uses_engine(self):
+        exercise = json.loads(get_fallback_exercise("Trumpet", "Beginner", "G Major", "3/4", 3, seed=9))
+        self.assertEqual(exercise, generate_procedural_exercise("Trumpet", "Beginner", "G Major", "3/4", 3, seed=9))
+
+
+class TestEngineSelection(unittest.TestCase):
+    def test_engine_rules(self):
+        self.assertFalse(uses_procedural_engine("llm", "Beginner"))
+        self.assertTrue(uses_procedural_engine("procedural", "Advanced", "scales please"))
+        self.assertTrue(uses_procedural_engine("auto", "Beginner"))
+        self.assertFalse(uses_procedural_engine("auto", "Beginner", "scales please"))
+        self.assertFalse(uses_procedural_engine("auto", "Advanced"))
+        with self.assertRaises(ValueError):
+            uses_procedural_engine("gpt", "Beginner")
+
+    @patch("lib.music_generation.generator.query_mistral")
+    def test_auto_engine_skips_the_api_for_beginners(self, query):
+        exercise = generate_exercise("Piano", "Beginner", "F Major", "4/4", 2, engine="auto", seed=1)
+        query.assert_not_called()
+        self.assertEqual(exercise[-1]["cumulative_duration"], 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+import sys
+import os
+import json
+import time
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import set_default_cache
+from lib.music_generation.client import MistralClient
+from lib.music_generation.generator import query_mistral
+from lib.music_generation.scheduler import (
+    TokenBucket, RequestScheduler, DeadlineExceeded, RequestCancelled, parse_retry_after, estimate_tokens,
+)
+
+EXERCISE = [{"note": "G4", "duration": 8, "cumulative_duration": 8}]
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    """Stand-in that answers the first `limited` requests with HTTP 429."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.calls += 1
+            limited = self.server.calls <= self.server.limited
+        if limited:
+            body = b'{"message": "Requests rate limit exceeded"}'
+            self.send_response(429)
+            if self.server.retry_after is not None:
+                self.send_header("Retry-After", self.server.retry_after)
+        else:
+            body = json.dumps({"choices": [{"message": {"content": json.dumps(EXERCISE)}}]}).encode()
+            self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=10, capacity=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        delay = bucket.reserve()
+        self.assertGreater(delay, 0)
+        self.assertLessEqual(delay, 0.1)
+        time.sleep(delay + 0.01)
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_oversized_request_is_capped(self):
+        bucket = TokenBucket(rate=100, capacity=50)
+        self.assertEqual(bucket.reserve(500), 0.0)
+        self.assertGreater(bucket.reserve(1), 0)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(rate=0, capacity=0)
+        self.assertEqual(bucket.reserve(1000), 0.0)
+
+
+class TestHelpers(unittest.TestCase):
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("0.25"), 0.25)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        delay = parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+        self.assertTrue(25 <= delay <= 31)
+
+    def test_estimate_tokens(self):
+        payload = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+        self.assertGreater(estimate_tokens(payload), 200)
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedHandler)
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.limited = 0
+        self.server.retry_after = None
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = MistralClient(api_url=f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        set_default_cache(self.previous_cache)
+
+    def test_honors_retry_after(self):
+        self.server.limited = 2
+        self.server.retry_after = "0.2"
+        scheduler = RequestScheduler(self.client, deadline=5)
+        start = time.monotonic()
+        content = scheduler.chat_completion({"messages": [], "max_tokens": 10}, "key")
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(json.loads(content), EXERCISE)
+        stats = scheduler.stats()
+        self.assertEqual(stats["rate_limited"], 2)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreaterEqual(stats["max_wait"], 0.4)
+
+    def test_backoff_without_retry_after(self):
+        self.server.limited = 3
+        scheduler = RequestScheduler(self.client, backoff_base=0.01, deadline=5)
+        content = scheduler.chat_completion({"messages": []}, "key")
+        self.assertEqual(json.loads(content), EXERCISE)
+        self.assertEqual(self.server.calls, 4)
+
+    def test_deadline_triggers_fallback(self):
+        self.server.limited = 1000
+        self.server.retry_after = "5"
+        scheduler = RequestScheduler(self.client, deadline=0.5)
+        start = time.monotonic()
+        output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 1,
+                               api_key="key", client=scheduler)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertNotEqual(json.loads(output), EXERCISE)
+        self.assertEqual(sum(item["duration"] for item in json.loads(output)), 8)
+        self.assertEqual(scheduler.stats()["deadline_exceeded"], 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.status = 400
+        scheduler = RequestScheduler(self.client, backoff_base=0.01)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            scheduler.chat_completion({"messages": []}, "key")
+        self.assertEqual(self.server.calls, 1)
+
+    def test_queue_depth_under_rate_limit(self):
+        scheduler = RequestScheduler(self.client, requests_per_second=20, request_burst=1, deadline=5)
+        threads = [threading.Thread(target=scheduler.chat_completion, args=({"messages": []}, "key"))
+                   for _ in range(5)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        stats = scheduler.stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertGreater(stats["max_queue_depth"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_queue_deadline(self):
+        scheduler = RequestScheduler(self.client, requests_per_second=0.1, request_burst=1, deadline=0.2)
+        scheduler.chat_completion({"messages": []}, "key")
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.chat_completion({"messages": []}, "key")
+        self.assertEqual(scheduler.stats()["queue_depth"], 0)
+
+    def test_cancel_while_queued(self):
+        scheduler = RequestScheduler(self.client, requests_per_second=0.1, request_burst=1, deadline=30)
+        scheduler.chat_completion({"messages": []}, "key")
+        cancel = threading.Event()
+        threading.Timer(0.1, cancel.set).start()
+        start = time.monotonic()
+        with self.assertRaises(RequestCancelled):
+            scheduler.chat_completion({"messages": []}, "key", cancel=cancel)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.server.calls, 1)
+        stats = scheduler.stats()
+        self.assertEqual((stats["cancelled"], stats["queue_depth"]), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+import json
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.parsing import Note
+from lib.music_generation.sequence import NoteSequence
+
+
+class TestNoteSequence(unittest.TestCase):
+    def setUp(self):
+        self.objects = [{"note": "C4", "duration": 2, "cumulative_duration": 2},
+                        {"note": "E4(trill)", "duration": 2, "cumulative_duration": 4},
+                        {"note": "G4", "duration": 4, "cumulative_duration": 8},
+                        {"note": "C5", "duration": 8, "cumulative_duration": 16}]
+        self.pairs = [["C4", 2], ["E4", 2], ["G4", 4], ["C5", 8]]
+
+    def test_both_json_shapes(self):
+        from_objects = NoteSequence.from_json(self.objects)
+        from_pairs = NoteSequence.from_json(json.dumps(self.pairs))
+        self.assertEqual(from_objects, from_pairs)
+        self.assertEqual(from_objects.pitches.tolist(), [60, 64, 67, 72])
+        self.assertEqual(from_objects.onsets.tolist(), [0, 2, 4, 8])
+        self.assertEqual(from_objects.total_duration, 16)
+        self.assertIs(NoteSequence.from_json(from_objects), from_objects)
+
+    def test_dtypes(self):
+        sequence = NoteSequence.from_json(self.pairs)
+        self.assertEqual(sequence.pitches.dtype, np.int8)
+        self.assertEqual(sequence.durations.dtype, np.uint16)
+        self.assertEqual(sequence.onsets.dtype, np.uint32)
+        with self.assertRaises(AttributeError):
+            sequence.extra = 1
+
+    def test_invalid_input(self):
+        sequence = NoteSequence.from_json([["C4", 2], ["H9", 2], "junk", ["D4", 0]])
+        self.assertEqual(sequence.to_pairs(), [["C4", 2], ["D4", 1]])
+        with self.assertRaises(ValueError):
+            NoteSequence.from_json("not json")
+        with self.assertRaises(ValueError):
+            NoteSequence.from_json('{"note": "C4"}')
+
+    def test_slices_are_views(self):
+        sequence = NoteSequence.from_json(self.pairs)
+        view = sequence[1:3]
+        self.assertTrue(np.shares_memory(view.pitches, sequence.pitches))
+        self.assertEqual(view.names, ["E4", "G4"])
+        self.assertEqual((view.start, view.end, view.total_duration), (2, 8, 6))
+        self.assertEqual(sequence[0], Note("C4", 2))
+        self.assertEqual(list(view), [Note("E4", 2), Note("G4", 4)])
+
+    def test_measure_slicing(self):
+        sequence = NoteSequence.from_json(self.pairs)
+        self.assertEqual(sequence.measure(0, 8).names, ["C4", "E4", "G4"])
+        self.assertEqual(sequence.measure(1, 8).names, ["C5"])
+        self.assertEqual(len(sequence.measure(2, 8)), 0)
+        self.assertEqual(len(sequence.measures(0, None, 8)), 4)
+        self.assertTrue(np.shares_memory(sequence.measure(1, 8).durations, sequence.durations))
+
+    def test_json_round_trip(self):
+        sequence = NoteSequence.from_json(self.objects)
+        expected = [dict(item, note=item["note"].split("(")[0]) for item in self.objects]
+        self.assertEqual(sequence.to_json(), expected)
+        self.assertEqual(json.loads(sequence.to_json_string()), expected)
+        self.assertEqual(NoteSequence.from_json(sequence.to_json_string(indent=2)), sequence)
+        # Cumulative durations of a slice restart from its first note
+        self.assertEqual([item["cumulative_duration"] for item in sequence[2:].to_json()], [4, 12])
+
+    def test_flat_spelling(self):
+        sequence = NoteSequence.from_json([["Bb4", 2], ["Eb5", 2]])
+        self.assertTrue(sequence.flats)
+        self.assertEqual(sequence.names, ["Bb4", "Eb5"])
+        self.assertEqual(NoteSequence.from_json([["A#4", 2]]).names, ["A#4"])
+
+    def test_written_spellings_are_kept(self):
+        sequence = NoteSequence.from_json([["F#4", 2], ["Bb4", 2], ["E#4", 2], ["Cb5", 2], ["F#4(trill)", 2]])
+        self.assertEqual(sequence.names, ["F#4", "Bb4", "E#4", "Cb5", "F#4"])
+        self.assertEqual(sequence.pitches.tolist(), [66, 70, 65, 71, 66])
+        self.assertEqual(sequence.spellings, ["F#4", "Bb4", "E#4", "Cb5"])
+        self.assertEqual(sequence[1:3].names, ["Bb4", "E#4"])
+        self.assertEqual(sequence[3], ("Cb5", 2))
+        self.assertEqual([item["note"] for item in json.loads(sequence.to_json_string())], sequence.names)
+        self.assertEqual(NoteSequence(sequence.pitches, sequence.durations).names,
+                         ["F#4", "A#4", "F4", "B4", "F#4"])
+
+    def test_duration_coercion_and_limits(self):
+        sequence = NoteSequence.from_json([["C4", "3"], {"note": "D4", "duration": "2"}, ["E4", "long"]])
+        self.assertEqual(sequence.to_pairs(), [["C4", 3], ["D4", 2]])
+        self.assertEqual(NoteSequence.from_json([["C4", 65535]]).total_duration, 65535)
+        with self.assertRaises(ValueError):
+            NoteSequence.from_json([["C4", 2], ["D4", 65536]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import sys
+import os
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import ExerciseCache, set_default_cache
+from lib.music_generation.client import MistralClient
+from lib.music_generation.parsing import IncrementalNoteParser
+from lib.music_generation.scheduler import RequestScheduler
+from lib.music_generation.generator import stream_exercise
+
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    """Chat-completions stand-in that streams server.chunks as SSE deltas."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for chunk in self.server.chunks:
+                event = {"choices": [{"delta": {"content": chunk}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+                self.server.sent += 1
+                time.sleep(self.server.delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.server.completed = True
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.disconnected = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def note_chunks(count):
+    """Split a JSON array of count quarter notes into small fragments."""
+    text = "```json\n" + json.dumps([{"note": "C4", "duration": 2}] * count) + "\n```"
+    return [text[i:i + 7] for i in range(0, len(text), 7)]
+
+
+class TestIncrementalNoteParser(unittest.TestCase):
+    def test_skips_prose_and_splits_across_chunks(self):
+        parser = IncrementalNoteParser()
+        self.assertEqual(parser.feed('Here you go:\n```json\n[{"note": "C'), [])
+        self.assertEqual(parser.feed('4", "duration": 2}, {"no'), [{"note": "C4", "duration": 2}])
+        self.assertEqual(parser.feed('te": "D4", "duration": 6}]\n```'), [{"note": "D4", "duration": 6}])
+        self.assertTrue(parser.done)
+        self.assertFalse(parser.invalid)
+
+    def test_pairs_and_single_quotes(self):
+        parser = IncrementalNoteParser()
+        self.assertEqual(parser.feed("[['C4', 2], {'note': 'E4', 'duration': 4}]"),
+                         [["C4", 2], {"note": "E4", "duration": 4}])
+
+    def test_brackets_inside_strings(self):
+        parser = IncrementalNoteParser()
+        self.assertEqual(parser.feed('[{"note": "C4]", "duration": 2}]'), [{"note": "C4]", "duration": 2}])
+
+    def test_invalid_json(self):
+        parser = IncrementalNoteParser()
+        self.assertEqual(parser.feed('[{"note": "C4", "duration": 2}, oops'), [{"note": "C4", "duration": 2}])
+        self.assertTrue(parser.invalid)
+        self.assertEqual(parser.feed('{"note": "D4", "duration": 2}]'), [])
+
+
+class TestStreamExercise(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StreamingHandler)
+        self.server.requests = []
+        self.server.chunks = []
+        self.server.delay = 0.002
+        self.server.sent = 0
+        self.server.completed = False
+        self.server.disconnected = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        self.client = MistralClient(api_url=url)
+        self.scheduler = RequestScheduler(client=self.client, requests_per_second=0, max_retries=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        set_default_cache(self.previous_cache)
+
+    def stream(self, measures=1, **kwargs):
+        return stream_exercise("", "Trumpet", "Beginner", "C Major", "4/4", measures,
+                               api_key="key", scheduler=self.scheduler, **kwargs)
+
+    def test_yields_notes_incrementally(self):
+        self.server.chunks = note_chunks(4)
+        stream = self.stream()
+        first = next(stream)
+        self.assertEqual(first, {"note": "C4", "duration": 2, "cumulative_duration": 2})
+        self.assertFalse(self.server.completed)
+        rest = list(stream)
+        self.assertEqual([note["cumulative_duration"] for note in rest], [4, 6, 8])
+        self.assertTrue(self.server.requests[0]["stream"])
+
+    def test_aborts_once_total_is_reached(self):
+        self.server.chunks = note_chunks(400)
+        notes = list(self.stream())
+        self.assertEqual(sum(note["duration"] for note in notes), 8)
+        deadline = time.time() + 5
+        while not self.server.disconnected and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.server.disconnected)
+        self.assertLess(self.server.sent, len(self.server.chunks))
+
+    def test_clips_last_note(self):
+        self.server.chunks = ['[{"note": "C4", "duration": 6}, {"note": "D4(trill)", "duration": 6}]']
+        notes = list(self.stream())
+        self.assertEqual(notes[-1], {"note": "D4", "duration": 2, "cumulative_duration": 8})
+
+    def test_invalid_output_uses_fallback(self):
+        self.server.chunks = ["I cannot write music, sorry."]
+        notes = list(self.stream())
+        self.assertEqual(sum(note["duration"] for note in notes), 8)
+
+    def test_invalid_mid_stream_keeps_received_notes(self):
+        self.server.chunks = ['[{"note": "C4", "duration": 2},', ' garbage', '{"note": "D4", "duration": 2}]']
+        notes = list(self.stream())
+        self.assertEqual(notes, [{"note": "C4", "duration": 2, "cumulative_duration": 2}])
+
+    def test_complete_stream_is_cached(self):
+        self.server.chunks = note_chunks(4)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ExerciseCache(cache_dir=cache_dir)
+            first = list(self.stream(cache=cache, seed=1))
+            second = list(self.stream(cache=cache, seed=1))
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import subprocess
+from unittest.mock import patch
+
+import requests
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.cache import set_default_cache
+from lib.music_generation.client import MistralClient
+from lib.music_generation.scheduler import RequestScheduler
+from lib.music_generation.generator import build_mistral_payload, query_mistral, stream_exercise
+from lib.music_generation.stub_server import StubServer, request_key
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+
+class TestStubServer(unittest.TestCase):
+    def setUp(self):
+        self.previous_cache = set_default_cache(None)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cassette = os.path.join(self.tmp.name, "cassette.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        set_default_cache(self.previous_cache)
+
+    def query(self, server, measures=2, seed=None, **scheduler_options):
+        with MistralClient(api_url=server.url) as client:
+            scheduler = RequestScheduler(client=client, requests_per_second=0, **scheduler_options)
+            return query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", measures,
+                                 api_key="key", client=scheduler, seed=seed)
+
+    def test_synthetic_exercise_has_requested_length(self):
+        with StubServer(port=0) as server:
+            parsed = json.loads(self.query(server, measures=3, seed=1))
+            self.assertEqual(parsed[-1]["cumulative_duration"], 24)
+            self.assertEqual(sum(item["duration"] for item in parsed), 24)
+            self.assertEqual(self.query(server, measures=3, seed=1), json.dumps(parsed))
+
+    def test_compact_wire_format(self):
+        with StubServer(port=0) as server, MistralClient(api_url=server.url) as client:
+            scheduler = RequestScheduler(client=client, requests_per_second=0)
+            output = query_mistral("", "Trumpet", "Beginner", "C Major", "4/4", 3, api_key="key",
+                                   client=scheduler, seed=1, wire_format="compact")
+            notes = list(stream_exercise("", "Piano", "Advanced", "G Major", "3/4", 2, api_key="key",
+                                         scheduler=scheduler, seed=5, wire_format="compact"))
+            _, answer = server.answer(build_mistral_payload("", "Trumpet", "Beginner", "C Major", "4/4", 3,
+                                                            seed=1, wire_format="compact"))
+        self.assertEqual(json.loads(output)[-1]["cumulative_duration"], 24)
+        self.assertEqual(notes[-1]["cumulative_duration"], 12)
+        self.assertNotIn("{", answer)
+
+    def test_streaming(self):
+        with StubServer(port=0) as server, MistralClient(api_url=server.url) as client:
+            scheduler = RequestScheduler(client=client, requests_per_second=0)
+            notes = list(stream_exercise("", "Piano", "Advanced", "G Major", "3/4", 2,
+                                         api_key="key", scheduler=scheduler, seed=5))
+        self.assertEqual(notes[-1]["cumulative_duration"], 12)
+
+    def test_injected_rate_limits_are_retried(self):
+        with StubServer(port=0, rate_limit_rate=0.5, retry_after=0.01, seed=3) as server:
+            for seed in range(6):
+                parsed = json.loads(self.query(server, seed=seed, max_retries=10, backoff_base=0.01))
+                self.assertEqual(sum(item["duration"] for item in parsed), 16)
+            stats = server.stats()
+        self.assertGreater(stats["rate_limited"], 0)
+        self.assertEqual(stats["requests"], stats["rate_limited"] + 6)
+
+    def test_injected_errors_fall_back(self):
+        with StubServer(port=0, error_rate=1.0) as server:
+            parsed = json.loads(self.query(server, max_retries=0))
+        self.assertEqual(sum(item["duration"] for item in parsed), 16)
+
+    def test_record_then_replay(self):
+        with StubServer(port=0) as upstream:
+            with StubServer(port=0, mode="record", cassette=self.cassette,
+                            upstream_url=upstream.url, upstream_key="key") as recorder:
+                recorded = [self.query(recorder, seed=seed) for seed in range(3)]
+            self.assertEqual(upstream.stats()["requests"], 3)
+
+        with open(self.cassette) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 3)
+        payload = build_mistral_payload("", "Trumpet", "Beginner", "C Major", "4/4", 2, seed=0)
+        self.assertEqual(entries[0]["key"], request_key(payload))
+
+        with StubServer(port=0, mode="replay", cassette=self.cassette) as replayer:
+            replayed = [self.query(replayer, seed=seed) for seed in range(3)]
+            self.assertEqual(replayed, recorded)
+            self.assertEqual(replayer.stats()["replay_misses"], 0)
+
+    @patch.dict(os.environ, {}, clear=False)
+    def test_record_forwards_authorization(self):
+        os.environ.pop("MISTRAL_API_KEY", None)
+        received = []
+
+        class Upstream(StubServer):
+            def answer(self, payload, authorization=None):
+                received.append(authorization)
+                return super().answer(payload, authorization)
+
+        with Upstream(port=0) as upstream:
+            with StubServer(port=0, mode="record", cassette=self.cassette,
+                            upstream_url=upstream.url) as recorder:
+                self.query(recorder, seed=0)
+                response = requests.post(recorder.url, json={"model": "x", "messages": []})
+                self.assertEqual(response.status_code, 401)
+            with StubServer(port=0, mode="record", cassette=self.cassette,
+                            upstream_url=upstream.url, upstream_key="upstream") as recorder:
+                self.query(recorder, seed=1)
+        self.assertEqual(received, ["Bearer key", "Bearer upstream"])
+
+        with open(self.cassette) as f:
+            self.assertEqual([json.loads(line)["status"] for line in f], [200, 200])
+
+    def test_replay_miss_returns_404(self):
+        open(self.cassette, "w").close()
+        with StubServer(port=0, mode="replay", cassette=self.cassette) as server:
+            response = requests.post(server.url, json={"model": "x", "messages": []})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(server.stats()["replay_misses"], 1)
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(ValueError):
+            StubServer(port=0, mode="tape")
+        with self.assertRaises(ValueError):
+            StubServer(port=0, mode="replay", cassette=os.path.join(self.tmp.name, "missing.jsonl"))
+
+    def test_api_url_from_environment(self):
+        env = dict(os.environ, MISTRAL_API_URL="http://127.0.0.1:1/v1/chat/completions")
+        output = subprocess.check_output(
+            [sys.executable, "-c", "from lib.music_generation.client import MistralClient; print(MistralClient().api_url)"],
+            cwd=PROJECT_ROOT, env=env, text=True)
+        self.assertEqual(output.strip(), env["MISTRAL_API_URL"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,7 +5,8 @@ import os
 # Add the parent directory to the path so we can import our modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from lib.music_generation.theory import note_name_to_midi, midi_to_note_name, clean_note_string
+from lib.music_generation.theory import (note_name_to_midi, midi_to_note_name, clean_note_string, parse_key,
+                                         key_uses_flats, scale_midi_numbers, names_to_midi, midi_to_names)
 
 
 class TestTheory(unittest.TestCase):
@@ -21,17 +22,57 @@ class TestTheory(unittest.TestCase):
         with self.assertRaises(ValueError):
             note_name_to_midi("C")   # Missing octave
 
+    def test_all_spellings(self):
+        self.assertEqual(note_name_to_midi("c4"), 60)
+        self.assertEqual(note_name_to_midi("bb4"), 70)
+        self.assertEqual(note_name_to_midi("Bbb4"), 69)
+        self.assertEqual(note_name_to_midi("F##4"), 67)
+        self.assertEqual(note_name_to_midi("Fx4"), 67)
+        self.assertEqual(note_name_to_midi("Cb4"), 59)
+        self.assertEqual(note_name_to_midi("B#3"), 60)
+        self.assertEqual(note_name_to_midi("C-1"), 0)
+        self.assertEqual(note_name_to_midi("G9"), 127)
+        self.assertEqual(note_name_to_midi("C4 staccato"), 60)
+        with self.assertRaises(ValueError):
+            note_name_to_midi("C10")  # Two-digit octave above the MIDI range
+        with self.assertRaises(ValueError):
+            note_name_to_midi("G#9")
+
     def test_midi_to_note_name(self):
         self.assertEqual(midi_to_note_name(60), "C4")
         self.assertEqual(midi_to_note_name(69), "A4")
         self.assertEqual(midi_to_note_name(56), "G#3")
         self.assertEqual(midi_to_note_name(82), "A#5")
+        self.assertEqual(midi_to_note_name(82, flats=True), "Bb5")
+
+    def test_keys_and_scales(self):
+        self.assertEqual(parse_key("Bb Major"), (10, "MAJOR"))
+        self.assertEqual(parse_key("E Minor"), (4, "MINOR"))
+        with self.assertRaises(ValueError):
+            parse_key("H Major")
+        self.assertTrue(key_uses_flats("F Major"))
+        self.assertTrue(key_uses_flats("D Minor"))
+        self.assertFalse(key_uses_flats("E Minor"))
+        self.assertEqual(scale_midi_numbers("G Major", 60, 67), [60, 62, 64, 66, 67])
 
     def test_clean_note_string(self):
         self.assertEqual(clean_note_string("C4(trill)"), "C4")
         self.assertEqual(clean_note_string("D5(grace)"), "D5")
         self.assertEqual(clean_note_string("G3-A3"), "G3")
         self.assertEqual(clean_note_string("F#4(mordent)"), "F#4")
+        self.assertEqual(clean_note_string("E4(double-grace)"), "E4")
+        self.assertEqual(clean_note_string("A4(staccato)"), "A4staccato")
+        self.assertEqual(clean_note_string("C-1"), "C-1")
+
+    def test_batch_conversion(self):
+        midi = names_to_midi(["C4", "Eb4", "G4(trill)", "H4"], invalid=-1, clean=True)
+        self.assertEqual(midi.tolist(), [60, 63, 67, -1])
+        with self.assertRaises(ValueError):
+            names_to_midi(["C4", "H4"])
+        self.assertEqual(midi_to_names([60, 63, 70]).tolist(), ["C4", "D#4", "A#4"])
+        self.assertEqual(midi_to_names([63, 70], flats=True).tolist(), ["Eb4", "Bb4"])
+        with self.assertRaises(ValueError):
+            midi_to_names([128])
 
 
 if __name__ == "__main__":
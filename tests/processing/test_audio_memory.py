@@ -0,0 +1,112 @@
+import unittest
+import sys
+import os
+import json
+import stat
+import tempfile
+import subprocess
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from processing.capabilities import CapabilityRegistry, set_default_capabilities
+from processing.audio.render_cache import set_default_audio_cache
+from processing.audio.converter import memory_file, render_midi_pcm, midi_to_mp3, generate_fallback_audio
+from processing.midi.converter import create_metronome_midi
+from processing.midi.writer import json_to_midi_bytes
+
+# Stand-in for the fluidsynth CLI: checks the MIDI it is given and renders ten
+# stereo frames per byte of it
+FAKE_FLUIDSYNTH = """#!{python}
+import sys
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("FluidSynth runtime version 2.3.0")
+    sys.exit(0)
+midi = open(args[-1], "rb").read()
+assert midi.startswith(b"MThd"), midi[:4]
+with open(args[args.index("-F") + 1], "wb") as f:
+    f.write(bytes(range(4)) * 10 * len(midi))
+"""
+
+# Stand-in for ffmpeg: records its arguments and "encodes" stdin verbatim
+FAKE_FFMPEG = """#!{python}
+import sys, json
+if sys.argv[1:] == ["-version"]:
+    print("ffmpeg version 6.0")
+    sys.exit(0)
+json.dump(sys.argv[1:], open("ffmpeg_args.json", "w"))
+with (sys.stdout.buffer if sys.argv[-1] == "pipe:1" else open(sys.argv[-1], "wb")) as f:
+    f.write(sys.stdin.buffer.read())
+"""
+
+
+class TestInMemoryAudio(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        bin_dir = os.path.join(self.tmp.name, "bin")
+        os.makedirs(bin_dir)
+        for name, script in (("fluidsynth", FAKE_FLUIDSYNTH), ("ffmpeg", FAKE_FFMPEG)):
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as f:
+                f.write(script.format(python=sys.executable))
+            os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        self.env = patch.dict(os.environ, {"PATH": bin_dir + os.pathsep + os.environ.get("PATH", "")})
+        self.env.start()
+        # Tools are looked up again with the fake ones on PATH
+        self.previous_capabilities = set_default_capabilities(CapabilityRegistry(manifest_path=None))
+        self.previous_audio_cache = set_default_audio_cache(None)
+        self.midi = create_metronome_midi(60, "4/4", 1)
+
+    def tearDown(self):
+        set_default_capabilities(self.previous_capabilities)
+        set_default_audio_cache(self.previous_audio_cache)
+        self.env.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.tmp.name)
+                      for root, _, names in os.walk(self.tmp.name) for name in names
+                      if not root.endswith("bin"))
+
+    def test_memory_file_is_readable_by_child(self):
+        with memory_file(b"MThd data") as (fd, path):
+            output = subprocess.run(["cat", path], capture_output=True, pass_fds=(fd,)).stdout
+        self.assertEqual(output, b"MThd data")
+
+    def test_render_midi_pcm(self):
+        midi_bytes = json_to_midi_bytes([["C4", 2], ["E4", 2]], "Piano", 60, "4/4", 1)
+        pcm = render_midi_pcm(midi_bytes, "Piano.sf2")
+        self.assertEqual(pcm.shape, (10 * len(midi_bytes), 2))
+        self.assertEqual(pcm[0].tolist(), [0x0100, 0x0302])
+
+    def test_midi_to_mp3_writes_only_the_final_file(self):
+        with patch("processing.audio.converter.get_soundfont", return_value="Trumpet.sf2"):
+            mp3_path, duration = midi_to_mp3(self.midi, "Trumpet")
+        self.assertEqual(self.files(), ["ffmpeg_args.json", mp3_path])
+        self.assertTrue(mp3_path.startswith("static" + os.sep))
+        with open(mp3_path, "rb") as f:
+            frames = len(f.read()) // 4
+        self.assertAlmostEqual(duration, frames / 44100)
+        with open("ffmpeg_args.json") as f:
+            args = json.load(f)
+        self.assertEqual(args[args.index("-ac") + 1], "2")
+        self.assertEqual(args[args.index("-af") + 1], "highpass=f=200:poles=1")
+
+    def test_fallback_audio_from_bytes(self):
+        midi_bytes = json_to_midi_bytes([["A4", 4]], "Piano", 120, "4/4", 1)
+        mp3_path, duration = generate_fallback_audio(midi_bytes)
+        with open(mp3_path, "rb") as f:
+            samples = np.frombuffer(f.read(), dtype="<i2")
+        self.assertEqual(len(samples), round(duration * 44100))
+        self.assertEqual(self.files(), ["ffmpeg_args.json", mp3_path])
+
+
+if __name__ == "__main__":
+    unittest.main()
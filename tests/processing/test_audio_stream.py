@@ -0,0 +1,164 @@
+import unittest
+import sys
+import os
+import json
+import stat
+import tempfile
+import threading
+import subprocess
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.constants import AUDIO_STREAM_BLOCK_FRAMES
+from processing.capabilities import CapabilityRegistry, set_default_capabilities
+from processing.audio.render_cache import set_default_audio_cache
+from processing.audio.converter import (
+    midi_to_mp3,
+    stream_midi_pcm,
+    render_midi_pcm,
+    stream_mp3,
+    encode_mp3_stream,
+    stream_fallback_pcm,
+    render_fallback_pcm,
+    generate_fallback_audio,
+)
+from processing.midi.writer import json_to_midi_bytes
+
+# Stand-in for the fluidsynth CLI: renders ten stereo frames per byte of MIDI,
+# fails on a "broken.sf2" soundfont and hangs on a "slow.sf2" one
+FAKE_FLUIDSYNTH = """#!{python}
+import sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("FluidSynth runtime version 2.3.0")
+    sys.exit(0)
+if args[-2] == "broken.sf2":
+    sys.stderr.write("fluidsynth: error: Failed to load SoundFont")
+    sys.exit(1)
+if args[-2] == "slow.sf2":
+    time.sleep(30)
+midi = open(args[-1], "rb").read()
+with open(args[args.index("-F") + 1], "wb") as f:
+    f.write(bytes(range(4)) * 10 * len(midi))
+"""
+
+# Stand-in for ffmpeg: records its arguments and passes stdin through as it arrives
+FAKE_FFMPEG = """#!{python}
+import os, sys, json
+if sys.argv[1:] == ["-version"]:
+    print("ffmpeg version 6.0")
+    sys.exit(0)
+json.dump(sys.argv[1:], open("ffmpeg_args.json", "w"))
+while True:
+    data = os.read(0, 65536)
+    if not data:
+        break
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+"""
+
+
+class TestAudioStreaming(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        bin_dir = os.path.join(self.tmp.name, "bin")
+        os.makedirs(bin_dir)
+        for name, script in (("fluidsynth", FAKE_FLUIDSYNTH), ("ffmpeg", FAKE_FFMPEG)):
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as f:
+                f.write(script.format(python=sys.executable))
+            os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        self.env = patch.dict(os.environ, {"PATH": bin_dir + os.pathsep + os.environ.get("PATH", "")})
+        self.env.start()
+        self.previous_capabilities = set_default_capabilities(CapabilityRegistry(manifest_path=None))
+        self.previous_audio_cache = set_default_audio_cache(None)
+        self.midi = json_to_midi_bytes([["C4", 2], ["E4", 2], ["G4", 4]], "Piano", 120, "4/4", 1,
+                                       velocities=[80, 80, 80])
+
+    def tearDown(self):
+        set_default_capabilities(self.previous_capabilities)
+        set_default_audio_cache(self.previous_audio_cache)
+        self.env.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_cli_stream_matches_whole_render(self):
+        blocks = list(stream_midi_pcm(self.midi, "Piano.sf2", block_frames=100))
+        self.assertEqual({len(block) for block in blocks[:-1]}, {100})
+        np.testing.assert_array_equal(np.concatenate(blocks), render_midi_pcm(self.midi, "Piano.sf2"))
+
+    def test_cli_stream_errors(self):
+        with self.assertRaises(subprocess.CalledProcessError) as failure:
+            list(stream_midi_pcm(self.midi, "broken.sf2"))
+        self.assertIn(b"Failed to load SoundFont", failure.exception.stderr)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            list(stream_midi_pcm(self.midi, "slow.sf2", timeout=0.5))
+
+    def test_mp3_bytes_arrive_before_the_render_ends(self):
+        release = threading.Event()
+
+        def blocks():
+            yield np.full((AUDIO_STREAM_BLOCK_FRAMES, 2), 1, dtype=np.int16)
+            release.wait(10)  # The rest of the exercise is still being rendered
+            yield np.full((10, 2), 2, dtype=np.int16)
+
+        stream = stream_mp3(blocks(), 44100, "lowpass=f=5000:poles=1")
+        first = next(stream)
+        self.assertFalse(release.is_set())
+        release.set()
+        data = first + b"".join(stream)
+        self.assertEqual(len(data), 4 * (AUDIO_STREAM_BLOCK_FRAMES + 10))
+        with open("ffmpeg_args.json") as f:
+            args = json.load(f)
+        self.assertEqual(args[args.index("-ac") + 1], "2")
+        self.assertEqual(args[args.index("-af") + 1], "lowpass=f=5000:poles=1")
+        self.assertEqual(args[-1], "pipe:1")
+
+    def test_failed_render_leaves_no_file(self):
+        def blocks():
+            yield np.zeros(1000, dtype=np.int16)
+            raise ValueError("synth crashed")
+
+        with self.assertRaises(ValueError):
+            encode_mp3_stream(blocks(), 44100, "exercise.mp3")
+        self.assertFalse(os.path.exists("exercise.mp3"))
+
+    def test_fallback_stream_never_clips(self):
+        midi = json_to_midi_bytes([["A4", 2], ["C5", 1], ["E5", 1], ["A5", 4]], "Piano", 90, "4/4", 1,
+                                  velocities=[100, 60, 80, 127])
+        blocks = list(stream_fallback_pcm(midi, block_frames=1000))
+        self.assertEqual({len(block) for block in blocks[:-1]}, {1000})
+        streamed = np.concatenate(blocks).astype(np.float64)
+        whole = render_fallback_pcm(midi).astype(np.float64)
+        self.assertEqual(len(streamed), len(whole))
+        # The same audio, at a gain fixed before rendering instead of normalized afterwards
+        self.assertGreater(np.corrcoef(streamed, whole)[0, 1], 0.9999)
+        self.assertLessEqual(np.abs(streamed).max(), 32767)
+        self.assertGreater(np.abs(streamed).max(), 16000)
+
+    def test_timeout_without_a_limit_falls_back(self):
+        # A tool timing out on its own must reach the fallback even when no timeout was given
+        with patch("processing.audio.converter.get_soundfont", return_value="Piano.sf2"), \
+                patch("processing.audio.converter.encode_mp3_stream",
+                      side_effect=subprocess.TimeoutExpired("ffmpeg", 5)), \
+                patch("processing.audio.converter.generate_fallback_audio",
+                      return_value=("fallback.mp3", 4.0)) as fallback:
+            self.assertEqual(midi_to_mp3(self.midi, "Piano"), ("fallback.mp3", 4.0))
+        fallback.assert_called_once()
+
+    def test_fallback_audio_is_streamed(self):
+        with patch("processing.audio.converter.render_fallback_pcm") as render:
+            mp3_path, duration = generate_fallback_audio(self.midi, "fallback.mp3")
+        render.assert_not_called()
+        with open(mp3_path, "rb") as f:
+            self.assertEqual(len(f.read()), 2 * round(duration * 44100))
+
+
+if __name__ == "__main__":
+    unittest.main()
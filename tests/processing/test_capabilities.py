@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+import stat
+import tempfile
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from processing.capabilities import Tool, CapabilityRegistry, set_default_capabilities
+from processing.notation.sheet_music import json_to_music21_score, render_score_to_pdf
+
+# Stand-in tool: logs each run to probes.log and prints a version
+FAKE_TOOL = """#!{python}
+import sys
+with open({log!r}, "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+print("{name} version {version}")
+sys.exit({status})
+"""
+
+
+class TestCapabilityRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.bin_dir = os.path.join(self.tmp.name, "bin")
+        os.makedirs(self.bin_dir)
+        self.log = os.path.join(self.tmp.name, "probes.log")
+        self.manifest = os.path.join(self.tmp.name, "capabilities.json")
+        self.env = patch.dict(os.environ, {"PATH": self.bin_dir})
+        self.env.start()
+        self.tools = {
+            "synth": Tool("Fake synth", ("fakesynth",)),
+            "engraver": Tool("Fake engraver", ("fake-engraver-4", "fake-engraver"), ("-version",)),
+            "missing": Tool("Not installed", ("no-such-tool",)),
+        }
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def install(self, name, version="1.0", status=0):
+        path = os.path.join(self.bin_dir, name)
+        with open(path, "w") as f:
+            f.write(FAKE_TOOL.format(python=sys.executable, log=self.log, name=name,
+                                     version=version, status=status))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return path
+
+    def probes(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return f.read().splitlines()
+
+    def registry(self):
+        return CapabilityRegistry(manifest_path=self.manifest, tools=self.tools)
+
+    def test_probes_once_per_process(self):
+        path = self.install("fakesynth", "2.3")
+        registry = self.registry()
+        for _ in range(3):
+            self.assertTrue(registry.available("synth"))
+        capability = registry.get("synth")
+        self.assertEqual(capability.path, path)
+        self.assertEqual(capability.version, "fakesynth version 2.3")
+        self.assertEqual(self.probes(), ["--version"])
+
+    def test_missing_and_failing_tools(self):
+        self.install("fake-engraver-4", status=1)
+        path = self.install("fake-engraver")
+        registry = self.registry()
+        self.assertFalse(registry.available("missing"))
+        self.assertIsNone(registry.path("missing"))
+        self.assertEqual(registry.get("missing").error, "not found on PATH")
+        # The first candidate fails its version check, the second works
+        self.assertEqual(registry.path("engraver"), path)
+        self.assertEqual(registry.first_available(["missing", "engraver", "synth"]), "engraver")
+
+    def test_manifest_reused_by_next_process(self):
+        self.install("fakesynth")
+        self.registry().probe_all()
+        self.assertEqual(len(self.probes()), 1)
+
+        registry = self.registry()
+        self.assertTrue(registry.available("synth"))
+        self.assertFalse(registry.available("missing"))
+        self.assertEqual(len(self.probes()), 1)
+        self.assertEqual(registry.stats()["manifest_hits"], 2)
+
+    def test_manifest_invalidated_by_changes(self):
+        self.registry().probe_all()
+        # Installing a tool changes where it resolves, so it is probed again
+        self.install("fakesynth")
+        self.assertTrue(self.registry().available("synth"))
+        # So does replacing it
+        path = self.install("fakesynth", "2.0")
+        os.utime(path, (1, 1))
+        self.assertEqual(self.registry().get("synth").version, "fakesynth version 2.0")
+        # And an expired entry
+        registry = CapabilityRegistry(manifest_path=self.manifest, tools=self.tools, ttl=0)
+        registry.get("synth")
+        self.assertEqual(len(self.probes()), 3)
+
+    def test_mark_unavailable(self):
+        self.install("fakesynth")
+        registry = self.registry()
+        registry.mark_unavailable("synth", "crashed")
+        self.assertFalse(registry.available("synth"))
+        self.assertTrue(registry.get("synth", refresh=True).available)
+
+    def test_module_tools(self):
+        registry = CapabilityRegistry(manifest_path=None, tools={
+            "numpy": Tool("NumPy", module="numpy"),
+            "absent": Tool("Absent", module="no_such_module_here"),
+        })
+        self.assertTrue(registry.available("numpy"))
+        self.assertIsNotNone(registry.get("numpy").version)
+        self.assertFalse(registry.available("absent"))
+
+
+class TestRenderersUseRegistry(unittest.TestCase):
+    def test_pdf_skips_missing_engravers(self):
+        registry = CapabilityRegistry(manifest_path=None)
+        for name in ("mscore", "lilypond"):
+            registry.mark_unavailable(name, "not installed")
+        previous = set_default_capabilities(registry)
+        score = json_to_music21_score('[{"note": "C4", "duration": 8}]', "Trumpet", "C Major", "4/4", 120, 1)
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir, \
+                    patch('processing.notation.sheet_music.subprocess.run') as mock_run, \
+                    patch('processing.notation.sheet_music.render_score_to_image', return_value=None):
+                pdf_path = render_score_to_pdf(score, os.path.join(temp_dir, "score.pdf"))
+                self.assertIsNotNone(pdf_path)
+        finally:
+            set_default_capabilities(previous)
+        mock_run.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+import time
+
+import numpy as np
+from mido import MidiFile, MidiTrack, Message
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.constants import FALLBACK_RELEASE_SECONDS
+from lib.music_generation.procedural import generate_procedural_exercise
+from processing.audio.converter import midi_notes, render_fallback_pcm
+from processing.midi.converter import json_to_midi
+from processing.midi.writer import json_to_midi_bytes
+
+RATE = 44100
+
+
+def dominant_frequency(pcm):
+    spectrum = np.abs(np.fft.rfft(pcm.astype(np.float64)))
+    return np.fft.rfftfreq(len(pcm), 1 / RATE)[np.argmax(spectrum)]
+
+
+class TestMidiNotes(unittest.TestCase):
+    def test_tempo_is_read_from_the_file(self):
+        for tempo, seconds in ((60, 1.0), (120, 0.5), (90, 2 / 3)):
+            pitches, velocities, starts, ends = midi_notes(
+                json_to_midi_bytes([["A4", 2], ["C5", 2]], "Piano", tempo, "4/4", 1, velocities=[90, 70]))
+            self.assertEqual(pitches.tolist(), [69, 72])
+            self.assertEqual(velocities.tolist(), [90, 70])
+            # Tempo is stored in whole microseconds per beat
+            np.testing.assert_allclose(starts, [0, seconds], atol=1e-6)
+            np.testing.assert_allclose(ends, [seconds, 2 * seconds], atol=1e-6)
+
+    def test_overlapping_and_unreleased_notes(self):
+        mid = MidiFile(ticks_per_beat=480)
+        track = MidiTrack()
+        mid.tracks.append(track)
+        track.append(Message('note_on', note=60, velocity=80, time=0))
+        track.append(Message('note_on', note=64, velocity=80, time=240))
+        track.append(Message('note_off', note=60, velocity=0, time=240))
+        track.append(Message('note_on', note=67, velocity=0, time=0))  # Never started: ignored
+        track.append(Message('note_on', note=67, velocity=80, time=480))
+        pitches, _, starts, ends = midi_notes(mid)
+        self.assertEqual(pitches.tolist(), [60, 64, 67])
+        # At the default 120 BPM a beat is half a second; unreleased notes end with the file
+        np.testing.assert_allclose(starts, [0, 0.25, 1.0])
+        np.testing.assert_allclose(ends, [0.5, 1.0, 1.0])
+
+
+class TestRenderFallbackPcm(unittest.TestCase):
+    def test_notes_sound_for_their_duration(self):
+        pcm = render_fallback_pcm(json_to_midi_bytes([["A4", 4], ["E5", 4]], "Piano", 60, "4/4", 1,
+                                                     velocities=[80, 80]))
+        self.assertEqual(pcm.dtype, np.int16)
+        self.assertEqual(len(pcm), 4 * RATE + int(round(FALLBACK_RELEASE_SECONDS * RATE)))
+        self.assertEqual(np.abs(pcm).max(), 32767)
+        # Each half of the audio carries its own pitch, at the tempo of the file
+        self.assertAlmostEqual(dominant_frequency(pcm[RATE // 2:3 * RATE // 2]), 440, delta=2)
+        self.assertAlmostEqual(dominant_frequency(pcm[5 * RATE // 2:7 * RATE // 2]), 659.3, delta=2)
+
+    def test_envelope_shapes_each_note(self):
+        pcm = render_fallback_pcm(json_to_midi_bytes([["A4", 2]], "Piano", 120, "4/4", 1, velocities=[80]))
+        self.assertLess(np.abs(pcm[:20]).max(), 2000)  # Attack starts from silence
+        self.assertLess(np.abs(pcm[-20:]).max(), 500)  # Release dies away
+        held = np.abs(pcm[RATE // 5:RATE // 5 + 200]).max()
+        self.assertGreater(held, 0.6 * 32767)
+
+    def test_last_note_is_not_dropped(self):
+        notes = [["C4", 1]] * 7 + [["G4", 8]]
+        pcm = render_fallback_pcm(json_to_midi_bytes(notes, "Piano", 100, "4/4", 2, velocities=[80] * 8))
+        end = int(round(15 * 0.3 * RATE))
+        self.assertGreater(np.abs(pcm[end - RATE // 2:end]).max(), 10000)
+
+    def test_chord_mixes_both_notes(self):
+        mid = MidiFile(ticks_per_beat=480)
+        track = MidiTrack()
+        mid.tracks.append(track)
+        for note in (60, 67):
+            track.append(Message('note_on', note=note, velocity=80, time=0))
+        for note in (60, 67):
+            track.append(Message('note_off', note=note, velocity=0, time=960 if note == 60 else 0))
+        spectrum = np.abs(np.fft.rfft(render_fallback_pcm(mid)[:RATE].astype(np.float64)))
+        frequencies = np.fft.rfftfreq(RATE, 1 / RATE)
+        peaks = sorted(frequencies[np.argsort(spectrum)[-2:]].tolist())
+        self.assertAlmostEqual(peaks[0], 261.6, delta=2)
+        self.assertAlmostEqual(peaks[1], 392.0, delta=2)
+
+    def test_long_exercise_renders_quickly(self):
+        exercise = generate_procedural_exercise("Violin", "Advanced", "D Major", "4/4", 16, 3)
+        midi = json_to_midi(exercise, "Violin", 60, "4/4", 16)
+        start = time.perf_counter()
+        pcm = render_fallback_pcm(midi)
+        elapsed = time.perf_counter() - start
+        self.assertAlmostEqual(len(pcm) / RATE, 64 + FALLBACK_RELEASE_SECONDS, delta=0.01)
+        self.assertLess(elapsed, 0.5)
+
+    def test_empty_midi(self):
+        self.assertEqual(len(render_fallback_pcm(MidiFile())), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import sys
+import os
+import io
+
+import mido
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from processing.midi.converter import json_to_midi
+from processing.midi.writer import json_to_midi_bytes, json_to_midi_buffer, encode_events
+from lib.music_generation.procedural import generate_procedural_exercise
+
+
+def mido_bytes(json_data, instrument, tempo, time_signature, measures):
+    buffer = io.BytesIO()
+    json_to_midi(json_data, instrument, tempo, time_signature, measures).save(file=buffer)
+    return buffer.getvalue()
+
+
+class TestMidiWriter(unittest.TestCase):
+    def test_byte_identical_to_mido(self):
+        for seed, time_signature in enumerate(["4/4", "3/4", "6/8", "2/2"]):
+            exercise = generate_procedural_exercise("Trumpet", "Advanced", "Bb Major", time_signature, 8, seed)
+            expected = mido_bytes(exercise, "Clarinet", 96, time_signature, 8)
+            self.assertEqual(json_to_midi_bytes(exercise, "Clarinet", 96, time_signature, 8), expected)
+
+    def test_deterministic_output(self):
+        exercise = generate_procedural_exercise("Piano", "Intermediate", "D Minor", "3/4", 4, 11)
+        self.assertEqual(mido_bytes(exercise, "Piano", 72, "3/4", 4), mido_bytes(exercise, "Piano", 72, "3/4", 4))
+
+    def test_long_notes_and_empty_sequence(self):
+        # 60000 eighths need a four-byte delta time
+        exercise = [{"note": "C2", "duration": 60000}, {"note": "G#7", "duration": 1}]
+        for data in (exercise, []):
+            expected = mido_bytes(data, "Piano", 60, "4/4", 1)
+            self.assertEqual(json_to_midi_bytes(data, "Piano", 60, "4/4", 1), expected)
+
+    def test_buffer_reads_back(self):
+        exercise = [["C4", 2], ["D4", 2], ["E4", 4]]
+        midi = mido.MidiFile(file=json_to_midi_buffer(exercise, "Piano", 60, "4/4", 1,
+                                                      velocities=[70, 80, 90]))
+        notes = [(msg.type, msg.note, msg.velocity, msg.time) for msg in midi.tracks[0]
+                 if msg.type in ("note_on", "note_off")]
+        self.assertEqual(notes[:2], [("note_on", 60, 70, 0), ("note_off", 60, 70, 480)])
+        self.assertEqual(notes[-1], ("note_off", 64, 90, 960))
+        with self.assertRaises(ValueError):
+            json_to_midi_bytes(exercise, "Piano", 60, "4/4", 1, velocities=[70])
+
+    def test_running_status(self):
+        encoded = encode_events([0, 200, 0], [0x90, 0x90, 0x80], [60, 62, 62], [100, 0, 64],
+                                running_status=0x90)
+        # Repeated statuses are left out; 200 ticks is a two-byte delta
+        self.assertEqual(encoded.tobytes(), bytes([0x00, 60, 100, 0x81, 0x48, 62, 0, 0x00, 0x80, 62, 64]))
+        self.assertEqual(encode_events([], [], [], []).size, 0)
+        with self.assertRaises(ValueError):
+            encode_events(np.array([1 << 28]), [0x90], [60], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
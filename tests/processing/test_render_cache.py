@@ -0,0 +1,180 @@
+import unittest
+import sys
+import os
+import time
+import stat
+import tempfile
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from processing.capabilities import CapabilityRegistry, set_default_capabilities
+from processing.audio.render_cache import AudioCache, soundfont_checksum, set_default_audio_cache
+from processing.audio.converter import midi_to_mp3, generate_fallback_audio
+from processing.midi.converter import json_to_midi
+from processing.midi.writer import json_to_midi_bytes
+
+# Stand-ins for fluidsynth and ffmpeg that log each run to runs.log
+FAKE_FLUIDSYNTH = """#!{python}
+import sys
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("FluidSynth runtime version 2.3.0")
+    sys.exit(0)
+open({log!r}, "a").write("fluidsynth\\n")
+midi = open(args[-1], "rb").read()
+with open(args[args.index("-F") + 1], "wb") as f:
+    f.write(bytes(range(4)) * 100 * len(midi))
+"""
+
+FAKE_FFMPEG = """#!{python}
+import sys
+if sys.argv[1:] == ["-version"]:
+    print("ffmpeg version 6.0")
+    sys.exit(0)
+open({log!r}, "a").write("ffmpeg\\n")
+sys.stdout.buffer.write(sys.stdin.buffer.read())
+"""
+
+
+class TestAudioCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = AudioCache(os.path.join(self.tmp.name, "audio"))
+        self.midi = json_to_midi_bytes([["C4", 2], ["E4", 2]], "Piano", 60, "4/4", 1)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def render(self, name, size=1000):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_key_covers_every_input(self):
+        base = dict(midi_bytes=self.midi, instrument="Piano", renderer="abc", sample_rate=44100,
+                    audio_filter=None, codec="mp3")
+        key = AudioCache.make_key(**base)
+        self.assertEqual(key, AudioCache.make_key(**dict(base, audio_filter="")))
+        for change in (dict(midi_bytes=self.midi + b"\0"), dict(instrument="Violin"), dict(renderer="abd"),
+                       dict(sample_rate=48000), dict(audio_filter="lowpass=f=5000"), dict(codec="ogg")):
+            self.assertNotEqual(key, AudioCache.make_key(**dict(base, **change)), change)
+
+    def test_put_fetch_and_shared_index(self):
+        key = AudioCache.make_key(self.midi, "Piano", "abc", 44100, None)
+        output = os.path.join(self.tmp.name, "out.mp3")
+        self.assertIsNone(self.cache.fetch(key, output))
+        source = self.render("render.mp3")
+        self.cache.put(key, source, 2.5)
+        self.assertEqual(self.cache.fetch(key, output), 2.5)
+        with open(source, "rb") as a, open(output, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+        # Entries are sharded by key, and the copy handed out is the caller's own
+        self.assertEqual(os.path.dirname(self.cache.get(key)[0]), os.path.join(self.cache.cache_dir, key[:2]))
+        os.remove(output)
+        other = AudioCache(self.cache.cache_dir)
+        self.assertEqual(other.fetch(key, output), 2.5)
+        other.close()
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["writes"]), (2, 1, 1))
+        self.assertEqual((stats["entries"], stats["bytes"]), (1, 1000))
+
+    def test_missing_file_is_a_miss(self):
+        key = AudioCache.make_key(self.midi, "Piano", "abc", 44100, None)
+        self.cache.put(key, self.render("render.mp3"), 1.0)
+        os.remove(self.cache.get(key)[0])
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_lru_eviction_by_bytes(self):
+        keys = [AudioCache.make_key(self.midi, "Piano", str(i), 44100, None) for i in range(5)]
+        for key in keys:
+            self.cache.put(key, self.render("render.mp3", 300), 1.0)
+            time.sleep(0.01)
+        self.assertIsNotNone(self.cache.get(keys[0]))  # Now the most recently used
+        self.cache.max_bytes = 1000
+        self.assertEqual(self.cache.evict(), 2)
+        self.assertFalse(os.path.exists(self.cache._path(keys[1])))
+        self.assertFalse(os.path.exists(self.cache._path(keys[2])))
+        remaining = [key for key in keys if self.cache.get(key)]
+        self.assertEqual(remaining, [keys[0], keys[3], keys[4]])
+        # New entries evict on their own
+        self.cache.put(AudioCache.make_key(self.midi, "Piano", "new", 44100, None), self.render("new.mp3", 300), 1.0)
+        self.assertLessEqual(self.cache.stats()["bytes"], 1000)
+        self.assertEqual(self.cache.stats()["evictions"], 3)
+
+    def test_soundfont_checksum(self):
+        path = self.render("Piano.sf2", 5000)
+        checksum = soundfont_checksum(path)
+        self.assertEqual(soundfont_checksum(path), checksum)
+        with open(path, "ab") as f:
+            f.write(b"changed")
+        self.assertNotEqual(soundfont_checksum(path), checksum)
+
+
+class TestMidiToMp3Cache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.log = os.path.join(self.tmp.name, "runs.log")
+        bin_dir = os.path.join(self.tmp.name, "bin")
+        os.makedirs(bin_dir)
+        for name, script in (("fluidsynth", FAKE_FLUIDSYNTH), ("ffmpeg", FAKE_FFMPEG)):
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as f:
+                f.write(script.format(python=sys.executable, log=self.log))
+            os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        with open("Trumpet.sf2", "wb") as f:
+            f.write(b"sfbk" * 5000)
+        self.env = patch.dict(os.environ, {"PATH": bin_dir + os.pathsep + os.environ.get("PATH", "")})
+        self.env.start()
+        self.previous_capabilities = set_default_capabilities(CapabilityRegistry(manifest_path=None))
+        self.cache = AudioCache("audio-cache")
+        self.previous_audio_cache = set_default_audio_cache(self.cache)
+
+    def tearDown(self):
+        set_default_audio_cache(self.previous_audio_cache)
+        self.cache.close()
+        set_default_capabilities(self.previous_capabilities)
+        self.env.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def runs(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return f.read().splitlines()
+
+    def test_identical_exercise_is_rendered_once(self):
+        exercise = [["C4", 2], ["E4", 2], ["G4", 4]]
+        with patch("processing.audio.converter.get_soundfont", return_value="Trumpet.sf2"):
+            first_path, first_duration = midi_to_mp3(json_to_midi(exercise, "Trumpet", 60, "4/4", 1), "Trumpet")
+            self.assertEqual(self.runs(), ["fluidsynth", "ffmpeg"])
+            # json_to_midi gives the same exercise the same MIDI, so the render is reused
+            path, duration = midi_to_mp3(json_to_midi(exercise, "Trumpet", 60, "4/4", 1), "Trumpet")
+            self.assertEqual(self.runs(), ["fluidsynth", "ffmpeg"])
+            self.assertNotEqual(path, first_path)
+            self.assertEqual(duration, first_duration)
+            with open(path, "rb") as a, open(first_path, "rb") as b:
+                self.assertEqual(a.read(), b.read())
+            # A different instrument (so a different filter chain) is rendered anew
+            midi_to_mp3(json_to_midi(exercise, "Trumpet", 60, "4/4", 1), "Violin")
+            self.assertEqual(len(self.runs()), 4)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_fallback_renders_shared_across_instruments(self):
+        midi = json_to_midi([["A4", 4]], "Piano", 120, "4/4", 1)
+        path, duration = generate_fallback_audio(midi)
+        self.assertEqual(self.runs(), ["ffmpeg"])
+        self.assertEqual(midi_to_mp3(json_to_midi([["A4", 4]], "Flute", 120, "4/4", 1), "Flute",
+                                     force_fallback=True)[1], duration)
+        self.assertEqual(self.runs(), ["ffmpeg"])
+
+
+if __name__ == "__main__":
+    unittest.main()
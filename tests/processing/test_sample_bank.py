@@ -0,0 +1,125 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+from mido import MidiFile
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from lib.music_generation.sequence import NoteSequence
+from processing.audio.sample_bank import SampleBank, build_sample_bank, get_sample_bank, sample_bank_to_mp3
+from processing.midi.converter import note_velocities
+from processing.midi.writer import json_to_midi_bytes
+
+RATE = 44100
+RELEASE = 0.2
+
+
+def linear_synth(midi):
+    """Sine voices with a linear release: notes sound independently, like overlap-adding."""
+    if not isinstance(midi, MidiFile):
+        midi = MidiFile(file=io.BytesIO(midi))
+    now = 0.0
+    started = {}
+    notes = []
+    for msg in midi:
+        now += msg.time
+        if msg.type == 'note_on' and msg.velocity > 0:
+            started[msg.note] = (now, msg.velocity)
+        elif msg.type in ('note_on', 'note_off'):
+            start, velocity = started.pop(msg.note)
+            notes.append((msg.note, start, now, velocity))
+    release = int(RELEASE * RATE)
+    out = np.zeros(int(now * RATE) + release + 1)
+    for pitch, start, end, velocity in notes:
+        first, last = int(round(start * RATE)), int(round(end * RATE))
+        envelope = np.ones(last - first + release)
+        envelope[last - first:] = np.linspace(1, 0, release)
+        t = np.arange(len(envelope)) / RATE
+        out[first:first + len(envelope)] += (0.2 * velocity / 127 * envelope
+                                             * np.sin(2 * np.pi * 440 * 2 ** ((pitch - 69) / 12) * t))
+    pcm = np.int16(np.round(out * 32767))
+    return np.stack([pcm, pcm], axis=1)
+
+
+class TestSampleBank(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.bank = build_sample_bank("Piano", 120, directory=self.tmp.name, pitches=[60, 64, 67],
+                                      durations=(1, 2, 4), render=linear_synth)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bank_is_memory_mapped(self):
+        self.assertEqual(len(self.bank), 9)
+        self.assertIsInstance(self.bank.samples, np.memmap)
+        self.assertEqual(self.bank.samples.dtype, np.float32)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["Piano-120bpm-44100hz.json", "Piano-120bpm-44100hz.npy"])
+
+    def test_entries_keep_audible_release(self):
+        # A quarter note at 120 BPM is half a second; the fake release lasts 0.2s
+        sample = self.bank.sample(64, 2)
+        self.assertAlmostEqual(len(sample) / RATE, 0.5 + RELEASE, delta=0.01)
+        self.assertEqual(sample[-1].tolist(), [0.0, 0.0])
+        self.assertGreater(np.abs(sample[:RATE // 4]).max(), 0.05)
+
+    def test_render_matches_full_synth_pass(self):
+        notes = [["C4", 2], ["E4", 1], ["G4", 1], ["C4", 4], ["G4", 2], ["E4", 2]]
+        expected = linear_synth(json_to_midi_bytes(notes, "Piano", 120, "4/4", 2, velocities=[80] * 6))
+        rendered = self.bank.render(NoteSequence.from_json(notes))
+        self.assertEqual(rendered.dtype, np.int16)
+        # The bank drops the last, inaudible samples of each release
+        self.assertAlmostEqual(len(rendered), len(expected), delta=RATE // 1000)
+        frames = min(len(rendered), len(expected))
+        difference = np.abs(rendered[:frames].astype(np.int32) - expected[:frames]).max()
+        self.assertLess(difference, 0.01 * 32767)
+
+    def test_velocity_scales_entries(self):
+        quiet = self.bank.render([["C4", 2]], velocities=[40])
+        loud = self.bank.render([["C4", 2]])
+        np.testing.assert_allclose(quiet, loud / 2, atol=1)
+
+    def test_uncovered_notes(self):
+        self.assertTrue(self.bank.covers([["C4", 1], ["G4", 4]]))
+        self.assertFalse(self.bank.covers([["D4", 1]]))
+        self.assertFalse(self.bank.covers([["C4", 3]]))
+        with self.assertRaises(KeyError):
+            self.bank.render([["C4", 3]])
+
+    def test_load_rejects_incomplete_and_stale_banks(self):
+        path = os.path.join(self.tmp.name, "Piano-120bpm-44100hz")
+        self.assertIsNotNone(SampleBank.load(path))
+        soundfont = os.path.join(self.tmp.name, "Piano.sf2")
+        with open(soundfont, "wb") as f:
+            f.write(b"sfbk")
+        self.assertIsNone(SampleBank.load(path, soundfont))
+        os.remove(path + ".json")
+        self.assertIsNone(SampleBank.load(path))
+
+    def test_shared_bank_and_mp3(self):
+        with patch("processing.audio.sample_bank.get_soundfont", return_value=None):
+            bank = get_sample_bank("Piano", 120, directory=self.tmp.name)
+            self.assertIs(get_sample_bank("Piano", 120, directory=self.tmp.name), bank)
+            self.assertIsNone(get_sample_bank("Violin", 120, directory=self.tmp.name))
+            with patch("processing.audio.sample_bank.get_sample_bank", return_value=bank), \
+                    patch("processing.audio.sample_bank.encode_mp3") as encode:
+                mp3_path, duration = sample_bank_to_mp3([["C4", 2], ["E4", 2]], "Piano", 120)
+                self.assertEqual(sample_bank_to_mp3([["D4", 2]], "Piano", 120), (None, 0))
+        pcm = encode.call_args.args[0]
+        self.assertEqual(encode.call_args.args[2], mp3_path)
+        self.assertAlmostEqual(duration, len(pcm) / RATE)
+        self.assertAlmostEqual(duration, 1.0 + RELEASE, delta=0.01)
+        # Notes are as loud as json_to_midi makes them for the synth
+        sequence = NoteSequence.from_json([["C4", 2], ["E4", 2]])
+        np.testing.assert_array_equal(pcm, bank.render(sequence, velocities=note_velocities(sequence)))
+        self.assertFalse(np.array_equal(pcm, bank.render(sequence)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,7 @@ import json
 import os
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 from music21 import stream, note, meter, tempo, key
 
 from processing.notation.sheet_music import (
@@ -147,6 +148,19 @@ class TestJsonToMusic21Score(unittest.TestCase):
         # Should skip invalid notes and continue
         self.assertIsNotNone(score)
 
+    def test_notes_keep_their_spelling(self):
+        """Test that a chromatic flat does not respell the sharps around it"""
+        score = json_to_music21_score(
+            [["F#4", 2], ["Bb4", 2], ["E#4", 2], ["C#5", "2"]],
+            instrument_name="Trumpet",
+            key_sig="D Major",
+            time_signature="4/4",
+            tempo_bpm=120,
+            measures=1
+        )
+        names = [n.nameWithOctave for n in score.recurse().notes]
+        self.assertEqual(names, ["F#4", "B-4", "E#4", "C#5"])
+
 
 class TestHelperFunctions(unittest.TestCase):
     """Test helper functions"""
@@ -247,6 +261,25 @@ class TestRenderScoreToPdf(unittest.TestCase):
         if score is not None:
             pdf_path = render_score_to_pdf(score, None, dpi=150)
             self.assertIsNotNone(pdf_path)
+    
+    def test_short_timeout_skips_engravers(self):
+        """Test that a short budget goes straight to the quick PDF"""
+        score = json_to_music21_score(
+            self.sample_json,
+            instrument_name="Trumpet",
+            key_sig="C Major",
+            time_signature="4/4",
+            tempo_bpm=120,
+            measures=1
+        )
+        
+        if score is not None:
+            with patch('processing.notation.sheet_music.subprocess.run') as mock_run, \
+                    patch('processing.notation.sheet_music.render_score_to_image') as mock_image:
+                pdf_path = render_score_to_pdf(score, os.path.join(self.temp_dir, "quick.pdf"), timeout=1.0)
+            mock_run.assert_not_called()
+            mock_image.assert_not_called()
+            self.assertIsNotNone(pdf_path)
 
 
 class TestRenderScoreToImage(unittest.TestCase):
@@ -0,0 +1,208 @@
+import unittest
+import sys
+import os
+import time
+import threading
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from processing.audio.synth import SynthEngine, SynthPool, set_default_synth_pool
+from processing.audio.converter import midi_to_mp3
+from processing.audio.render_cache import set_default_audio_cache
+from processing.midi.writer import json_to_midi_bytes
+
+
+class FakeSynth:
+    """Records the calls pyFluidSynth would get, with the frame each happened at."""
+
+    def __init__(self, presets=(0,)):
+        self.presets = presets
+        self.frame = 0
+        self.calls = []
+        self.loaded = []
+        self.deleted = False
+
+    def sfload(self, path):
+        self.loaded.append(path)
+        return -1 if path.endswith("broken.sf2") else len(self.loaded)
+
+    def program_select(self, channel, sfid, bank, preset):
+        if channel == 0:
+            self.calls.append(("select", self.frame, preset))
+        return 0 if preset in self.presets else -1
+
+    def noteon(self, channel, note, velocity):
+        self.calls.append(("on", self.frame, note))
+
+    def noteoff(self, channel, note):
+        self.calls.append(("off", self.frame, note))
+
+    def cc(self, channel, control, value):
+        pass
+
+    def get_samples(self, frames):
+        self.frame += frames
+        return np.full(2 * frames, 7, dtype=np.int16)
+
+    def delete(self):
+        self.deleted = True
+
+
+class TestSynthEngine(unittest.TestCase):
+    def test_renders_events_at_their_times(self):
+        synth = FakeSynth()
+        engine = SynthEngine(sample_rate=1000, synth=synth)
+        # 120 BPM: a duration of 2 eighths is half a second
+        midi = json_to_midi_bytes([["C4", 2], ["E4", 4]], "Piano", 120, "4/4", 1, velocities=[80, 80])
+        pcm = engine.render(midi, "Piano.sf2", "Piano", tail=0.25)
+        notes = [call for call in synth.calls if call[0] in ("on", "off")]
+        self.assertEqual(notes, [("on", 0, 60), ("off", 500, 60), ("on", 500, 64), ("off", 1500, 64)])
+        self.assertEqual(pcm.shape, (1750, 2))
+        self.assertEqual(pcm.dtype, np.int16)
+
+    def test_soundfont_loaded_once(self):
+        synth = FakeSynth()
+        engine = SynthEngine(synth=synth)
+        midi = json_to_midi_bytes([["C4", 1]], "Piano", 120, "4/4", 1, velocities=[80])
+        engine.render(midi, "Piano.sf2", tail=0)
+        engine.render(midi, "Piano.sf2", tail=0)
+        self.assertEqual(synth.loaded, ["Piano.sf2"])
+        with self.assertRaises(ValueError):
+            engine.load("broken.sf2")
+
+    def test_missing_preset_falls_back_to_first(self):
+        synth = FakeSynth(presets=(0,))
+        engine = SynthEngine(synth=synth)
+        midi = json_to_midi_bytes([["C4", 1]], "Trumpet", 120, "4/4", 1, velocities=[80])
+        engine.render(midi, "Trumpet.sf2", "Trumpet", tail=0)
+        self.assertEqual([call[2] for call in synth.calls if call[0] == "select"][:2], [56, 0])
+
+    def test_stream_yields_fixed_size_blocks(self):
+        midi = json_to_midi_bytes([["C4", 2], ["E4", 4]], "Piano", 120, "4/4", 1, velocities=[80, 80])
+        blocks = list(SynthEngine(sample_rate=1000, synth=FakeSynth()).stream(
+            midi, "Piano.sf2", tail=0.25, block_frames=256))
+        self.assertEqual([len(block) for block in blocks], [256] * 6 + [214])
+        whole = SynthEngine(sample_rate=1000, synth=FakeSynth()).render(midi, "Piano.sf2", tail=0.25)
+        np.testing.assert_array_equal(np.concatenate(blocks), whole)
+
+    def test_stream_renders_lazily_and_silences_when_closed(self):
+        synth = FakeSynth()
+        midi = json_to_midi_bytes([["C4", 8]] * 4, "Piano", 120, "4/4", 4, velocities=[80] * 4)
+        with patch.object(SynthEngine, "_silence") as silence:
+            stream = SynthEngine(sample_rate=1000, synth=synth).stream(midi, "Piano.sf2", block_frames=100)
+            next(stream)
+            self.assertEqual(synth.frame, 100)
+            stream.close()
+        self.assertEqual(silence.call_count, 2)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.loaded = []
+        self.closed = False
+
+    def load(self, sf2_path):
+        self.loaded.append(sf2_path)
+
+    def render(self, midi_obj, sf2_path, instrument="Piano"):
+        if sf2_path == "fail.sf2":
+            raise RuntimeError("synth crashed")
+        time.sleep(0.02)
+        return np.zeros((10, 2), dtype=np.int16)
+
+    def stream(self, midi_obj, sf2_path, instrument="Piano", block_frames=4096):
+        pcm = self.render(midi_obj, sf2_path, instrument)
+        for start in range(0, len(pcm), block_frames):
+            yield pcm[start:start + block_frames]
+
+    def close(self):
+        self.closed = True
+
+
+class TestSynthPool(unittest.TestCase):
+    def test_engines_bounded_and_reused(self):
+        created = []
+
+        def factory():
+            created.append(FakeEngine())
+            return created[-1]
+
+        pool = SynthPool(size=2, engine_factory=factory)
+        threads = [threading.Thread(target=pool.render, args=(b"", "Piano.sf2")) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(len(created), 2)
+        stats = pool.stats()
+        self.assertEqual(stats["renders"], 8)
+        self.assertEqual(stats["engines"], stats["idle"])
+
+    def test_failed_engine_is_discarded(self):
+        engines = []
+        pool = SynthPool(size=1, engine_factory=lambda: engines.append(FakeEngine()) or engines[-1])
+        with self.assertRaises(RuntimeError):
+            pool.render(b"", "fail.sf2")
+        self.assertTrue(engines[0].closed)
+        pool.render(b"", "Piano.sf2")
+        self.assertEqual(len(engines), 2)
+        self.assertEqual(pool.stats()["failures"], 1)
+
+    def test_busy_pool_times_out(self):
+        pool = SynthPool(size=1, engine_factory=FakeEngine)
+        with pool.engine():
+            with self.assertRaises(TimeoutError):
+                pool.render(b"", "Piano.sf2", timeout=0.01)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_closed_stream_returns_its_engine(self):
+        pool = SynthPool(size=1, engine_factory=lambda: SynthEngine(synth=FakeSynth()))
+        midi = json_to_midi_bytes([["C4", 8]], "Piano", 120, "4/4", 1, velocities=[80])
+        stream = pool.stream(midi, "Piano.sf2", block_frames=1000)
+        next(stream)
+        self.assertEqual(pool.stats()["idle"], 0)
+        stream.close()
+        self.assertEqual(pool.stats(), {"engines": 1, "idle": 1, "renders": 0, "waits": 0, "failures": 0})
+        # A whole note at 120 BPM, then the one-second tail
+        self.assertEqual(sum(len(block) for block in pool.stream(midi, "Piano.sf2")), 3 * 44100)
+        self.assertEqual(pool.stats()["renders"], 1)
+
+    def test_preload_reaches_new_engines(self):
+        pool = SynthPool(size=2, engine_factory=FakeEngine)
+        with pool.engine() as first:
+            pass
+        pool.preload(["Violin.sf2"])
+        self.assertEqual(first.loaded, ["Violin.sf2"])
+        with pool.engine() as again, pool.engine() as second:
+            self.assertIs(again, first)
+            self.assertEqual(second.loaded, ["Violin.sf2"])
+
+
+class TestMidiToMp3WithPool(unittest.TestCase):
+    def test_pool_replaces_the_fluidsynth_process(self):
+        pool = SynthPool(size=1, engine_factory=FakeEngine)
+        previous = set_default_synth_pool(pool)
+        previous_cache = set_default_audio_cache(None)
+        midi = json_to_midi_bytes([["C4", 8]], "Piano", 120, "4/4", 1, velocities=[80])
+        try:
+            with patch("processing.audio.converter.get_soundfont", return_value="Piano.sf2"), \
+                 patch.object(FakeEngine, "render", return_value=np.zeros((44100, 2), dtype=np.int16)), \
+                 patch("processing.audio.converter.subprocess.run") as run, \
+                 patch("processing.audio.converter.encode_mp3_stream",
+                       side_effect=lambda blocks, *args: sum(len(block) for block in blocks)) as encode:
+                mp3_path, duration = midi_to_mp3(midi, "Piano")
+        finally:
+            set_default_synth_pool(previous)
+            set_default_audio_cache(previous_cache)
+        run.assert_not_called()
+        self.assertEqual(encode.call_args.args[2], mp3_path)
+        self.assertAlmostEqual(duration, 1.0)
+        self.assertEqual(pool.stats()["renders"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
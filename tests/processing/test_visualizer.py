@@ -2,6 +2,7 @@ import unittest
 import sys
 import os
 import json
+import tempfile
 from unittest.mock import patch, MagicMock
 
 # Add the parent directory to the path so we can import our modules
@@ -11,6 +12,16 @@ from processing.visualization.visualizer import create_visualization
 
 
 class TestVisualizer(unittest.TestCase):
+    def setUp(self):
+        # create_visualization writes into ./static, so run in a scratch directory
+        self.previous_cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        self.tmp.cleanup()
+
     @patch('processing.visualization.visualizer.plt')
     @patch('processing.visualization.visualizer.note_name_to_midi')
     def test_create_visualization(self, mock_note_to_midi, mock_plt):